@@ -59,6 +59,7 @@ describe('APIClientImpl', () => {
           method: 'POST',
           headers: expect.objectContaining({
             'Content-Type': 'application/json',
+            'Idempotency-Key': expect.any(String),
           }),
           body: JSON.stringify({
             session_id: 'test-session',
@@ -275,4 +275,65 @@ describe('SSEClient', () => {
       expect(mockOnError).toHaveBeenCalled();
     });
   });
+
+  describe('断线恢复', () => {
+    // 构造只返回指定SSE文本的流式响应
+    const streamResponse = (body: string) => ({
+      ok: true,
+      body: new ReadableStream({
+        start(controller) {
+          controller.enqueue(new TextEncoder().encode(body));
+          controller.close();
+        },
+      }),
+    });
+
+    it('连接中断后应该带 Last-Event-ID 恢复而不是重新发送消息', async () => {
+      mockFetch
+        .mockResolvedValueOnce(streamResponse(
+          'data: {"session_id": "test-session", "type": "session"}\n\n' +
+          'id: 1\ndata: {"message": "第一块", "type": "chunk"}\n\n'
+        ))
+        .mockResolvedValueOnce(streamResponse(
+          ': heartbeat\n\n' +
+          'id: 2\ndata: {"message": "第二块", "type": "chunk"}\n\n' +
+          'id: 3\ndata: {"type": "done"}\n\n'
+        ));
+
+      const client = new SSEClient({ retryInterval: 10, maxRetries: 2 });
+      client.startStream('test-session', '你好', mockOnData, mockOnComplete, mockOnError);
+      await new Promise(resolve => setTimeout(resolve, 50));
+
+      expect(mockFetch).toHaveBeenCalledTimes(2);
+      const [url, init] = mockFetch.mock.calls[1];
+      expect(url).toContain('/api/v1/sessions/test-session/stream');
+      expect(init.method).toBe('GET');
+      expect(init.headers['Last-Event-ID']).toBe('1');
+      expect(mockOnData.mock.calls.map(call => call[0])).toEqual(['第一块', '第二块']);
+      expect(mockOnComplete).toHaveBeenCalledTimes(1);
+      expect(mockOnError).not.toHaveBeenCalled();
+    });
+
+    it('收到会话事件前重试应该沿用同一个 Idempotency-Key', async () => {
+      mockFetch
+        .mockRejectedValueOnce(new Error('网络错误'))
+        .mockResolvedValueOnce(streamResponse(
+          'data: {"session_id": "test-session", "type": "session"}\n\n' +
+          'id: 1\ndata: {"type": "done"}\n\n'
+        ));
+
+      const client = new SSEClient({ retryInterval: 10, maxRetries: 2 });
+      client.startStream('test-session', '你好', mockOnData, mockOnComplete, mockOnError);
+      await new Promise(resolve => setTimeout(resolve, 50));
+
+      expect(mockFetch).toHaveBeenCalledTimes(2);
+      const [firstUrl, firstInit] = mockFetch.mock.calls[0];
+      const [secondUrl, secondInit] = mockFetch.mock.calls[1];
+      expect(firstUrl).toBe(secondUrl);
+      expect(secondInit.method).toBe('POST');
+      expect(firstInit.headers['Idempotency-Key']).toBeTruthy();
+      expect(secondInit.headers['Idempotency-Key']).toBe(firstInit.headers['Idempotency-Key']);
+      expect(mockOnComplete).toHaveBeenCalledTimes(1);
+    });
+  });
 });
\ No newline at end of file
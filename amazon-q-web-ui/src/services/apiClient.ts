@@ -12,6 +12,17 @@ import {
   SystemStatus,
 } from '@/types';
 
+/**
+ * 生成幂等键（Idempotency-Key）
+ * 同一条消息的所有重试使用同一个键，服务端只执行一次，重复请求直接得到第一次的结果
+ */
+export function createIdempotencyKey(): string {
+  if (typeof crypto !== 'undefined' && typeof crypto.randomUUID === 'function') {
+    return crypto.randomUUID();
+  }
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+}
+
 /**
  * API 客户端实现
  */
@@ -161,6 +172,7 @@ export class APIClientImpl implements APIClient {
   async sendMessage(sessionId: string, message: string): Promise<ChatResponse> {
     return this.request<ChatResponse>('/api/v1/chat', {
       method: 'POST',
+      headers: { 'Idempotency-Key': createIdempotencyKey() },
       body: { session_id: sessionId, message },
       timeout: 650000, // 长时间任务专用超时时间
     });
@@ -1,5 +1,6 @@
 import { ErrorHandler, ErrorType } from '@/utils/errorHandler';
 import { getApiUrl } from '@/config';
+import { createIdempotencyKey } from '@/services/apiClient';
 
 /**
  * SSE 事件类型
@@ -21,12 +22,15 @@ export interface SSEClientOptions {
 
 /**
  * SSE 客户端类 - 修复版本
- * 直接处理POST请求的流式响应
+ * 直接处理POST请求的流式响应；连接中断时带 Last-Event-ID 恢复，不重新发送消息
  */
 export class SSEClient {
   private abortController: AbortController | null = null;
   private options: Required<SSEClientOptions>;
   private retryCount = 0;
+  private resumeSessionId: string | null = null; // 服务端已接收消息的会话，断线后从该会话恢复
+  private lastEventId: string | null = null; // 最后处理的事件ID
+  private idempotencyKey: string | null = null; // 本条消息的幂等键，自动重试时沿用，服务端不会重复生成回复
 
   constructor(options: SSEClientOptions = {}) {
     this.options = {
@@ -53,10 +57,46 @@ export class SSEClient {
   ): void {
     this.cleanup();
     this.abortController = new AbortController();
+    this.retryCount = 0;
+    this.resumeSessionId = null;
+    this.lastEventId = null;
+    this.idempotencyKey = createIdempotencyKey();
 
     this.processStreamingResponse(sessionId, message, onData, onComplete, onError);
   }
 
+  /**
+   * 发起请求：首次发送消息，之后从服务端重放缓冲恢复
+   * @param sessionId 会话ID
+   * @param message 消息内容
+   */
+  private openStream(sessionId: string, message: string): Promise<Response> {
+    if (this.resumeSessionId) {
+      const headers: Record<string, string> = {};
+      if (this.lastEventId) {
+        headers['Last-Event-ID'] = this.lastEventId;
+      }
+      return fetch(getApiUrl(`/api/v1/sessions/${this.resumeSessionId}/stream`), {
+        method: 'GET',
+        headers,
+        signal: this.abortController?.signal,
+      });
+    }
+
+    return fetch(getApiUrl('/api/v1/chat/stream'), {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Idempotency-Key': this.idempotencyKey ?? createIdempotencyKey(),
+      },
+      body: JSON.stringify({
+        session_id: sessionId,
+        message: message,
+      }),
+      signal: this.abortController?.signal,
+    });
+  }
+
   /**
    * 处理流式响应
    * @param sessionId 会话ID
@@ -73,23 +113,16 @@ export class SSEClient {
     onError: (error: Error) => void
   ): Promise<void> {
     try {
-      const response = await fetch(getApiUrl('/api/v1/chat/stream'), {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          session_id: sessionId,
-          message: message,
-        }),
-        signal: this.abortController?.signal,
-      });
+      const endpoint = this.resumeSessionId
+        ? `/api/v1/sessions/${this.resumeSessionId}/stream`
+        : '/api/v1/chat/stream';
+      const response = await this.openStream(sessionId, message);
 
       if (!response.ok) {
         const error = await ErrorHandler.fromHttpResponse(
           response,
-          '/api/v1/chat/stream',
-          'POST'
+          endpoint,
+          this.resumeSessionId ? 'GET' : 'POST'
         );
         onError(error);
         return;
@@ -104,6 +137,7 @@ export class SSEClient {
       const reader = response.body.getReader();
       const decoder = new TextDecoder();
       let buffer = '';
+      let pendingEventId: string | null = null;
 
       try {
         while (true) {
@@ -117,13 +151,17 @@ export class SSEClient {
           const chunk = decoder.decode(value, { stream: true });
           buffer += chunk;
 
-          // 处理完整的SSE消息
+          // 处理完整的SSE消息（以 : 开头的心跳注释直接忽略）
           const lines = buffer.split('\n');
           buffer = lines.pop() || ''; // 保留不完整的行
 
           for (const line of lines) {
-            if (line.startsWith('data: ')) {
+            if (line.startsWith('id: ')) {
+              pendingEventId = line.slice(4).trim();
+            } else if (line.startsWith('data: ')) {
               const data = line.slice(6); // 移除 'data: ' 前缀
+              const eventId = pendingEventId;
+              pendingEventId = null;
               
               if (data.trim() === '') {
                 continue; // 跳过空数据行
@@ -133,7 +171,8 @@ export class SSEClient {
                 const parsed = JSON.parse(data);
                 
                 if (parsed.type === 'session') {
-                  // 会话信息，可以忽略或记录
+                  // 服务端已接收消息，之后断线从该会话恢复
+                  this.resumeSessionId = parsed.session_id || sessionId;
                   continue;
                 } else if (parsed.type === 'chunk') {
                   // 数据块 - 确保正确提取消息内容
@@ -154,19 +193,24 @@ export class SSEClient {
                 // 如果不是JSON，直接作为文本处理
                 onData(data);
               }
+
+              // 事件处理完成后才记录ID，恢复时从下一个事件继续
+              if (eventId !== null) {
+                this.lastEventId = eventId;
+                this.retryCount = 0;
+              }
             }
           }
         }
 
+        if (this.resumeSessionId) {
+          // 没有收到完成事件就断开，交给下面的重试逻辑恢复
+          throw new Error('流式连接意外中断');
+        }
+
         // 如果循环正常结束，表示流完成
         onComplete();
 
-      } catch (readError) {
-        if (readError.name === 'AbortError') {
-          // 用户取消，不报错
-          return;
-        }
-        onError(readError as Error);
       } finally {
         reader.releaseLock();
       }
@@ -177,7 +221,7 @@ export class SSEClient {
         return;
       }
       
-      // 重试逻辑
+      // 重试逻辑：消息已被服务端接收时从重放缓冲恢复，不会重新生成回复
       if (this.retryCount < this.options.maxRetries) {
         this.retryCount++;
         setTimeout(() => {
@@ -10,7 +10,7 @@ import logging
 import sys
 import os
 from qcli_api_service.config import config
-from qcli_api_service.app import create_app
+from qcli_api_service.app import create_app, install_shutdown_handlers
 
 # 设置环境编码
 os.environ['PYTHONIOENCODING'] = 'utf-8'
@@ -35,6 +35,9 @@ def main():
         # 创建Flask应用
         app = create_app()
         
+        # 收到SIGTERM/SIGINT或进程退出时并行关闭所有Q Chat进程
+        install_shutdown_handlers()
+        
         # 启动服务
         app.run(
             host=config.HOST,
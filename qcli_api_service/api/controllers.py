@@ -8,106 +8,97 @@ import logging
 import time
 import json
 import os
+import threading
 from flask import request, jsonify, Response, stream_with_context, current_app
+from qcli_api_service.config import config
 from qcli_api_service.models.core import ChatRequest, ChatResponse, Message
 from qcli_api_service.services.session_manager import session_manager
 from qcli_api_service.services.session_process_manager import session_process_manager
+from qcli_api_service.services.async_session_process import async_process_manager
+from qcli_api_service.services.process_pool import process_pool
+from qcli_api_service.services.completion_detector import turn_latency_stats, turn_cancellation_stats
+from qcli_api_service.services.chunk_coalescer import ChunkCoalescer
+from qcli_api_service.services.stream_replay import stream_replay
+from qcli_api_service.services.job_manager import job_manager, JobQueueFullError
+from qcli_api_service.services.response_cache import response_cache
+from qcli_api_service.services.rate_limiter import rate_limiter
+from qcli_api_service.services.idempotency import (
+    idempotency_store, IdempotencyStore, IdempotencyKeyMismatchError,
+    IDEMPOTENCY_KEY_HEADER, IDEMPOTENT_REPLAYED_HEADER, MAX_KEY_LENGTH, IN_PROGRESS_RETRY_AFTER
+)
+from qcli_api_service.services.admission_control import (
+    admission_controller, AdmissionRejectedError, DEFAULT_PRIORITY
+)
+from qcli_api_service.services.maintenance import maintenance_scheduler
+from qcli_api_service.services.turn_scheduler import (
+    turn_scheduler, TurnQueueFullError, TurnQueueTimeoutError
+)
 from qcli_api_service.utils.validators import input_validator
+from qcli_api_service.utils.client_identity import client_identity, API_KEY_HEADER
 from qcli_api_service.utils.errors import (
-    APIError, ValidationError, SessionError, ServiceError, InternalError,
+    APIError, ValidationError, SessionError, JobError, IdempotencyError, ServiceError, InternalError, RateLimitError,
+    OverloadedError, IdempotencyInProgressError,
     handle_qcli_error, log_error, ERRORS
 )
 
 
 logger = logging.getLogger(__name__)
 
+# 后台读取流式回复时检查客户端是否已断开的间隔，单位：秒
+_STREAM_PUMP_TICK = 1.0
+
+# 流式响应头和心跳注释
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type, Last-Event-ID'
+}
+SSE_HEARTBEAT = ": heartbeat\n\n"
+
+# 客户端断开且未在等待时间内重新连接时，本轮的最后一个事件
+_CANCELLED_EVENT = {
+    'error': "客户端已断开，本轮回复已取消",
+    'code': "TURN_CANCELLED",
+    'suggestions': ["请重新发送消息"],
+    'type': 'error'
+}
+
+
+class _UncachedReply(Exception):
+    """一次性问题没有得到可缓存的回复，携带错误响应交给等待同一问题的请求"""
+    
+    def __init__(self, status: int, body: dict):
+        super().__init__(status)
+        self.status = status
+        self.body = body
+
 
 def chat():
     """标准聊天接口"""
     try:
-        # 解析请求
-        data = request.get_json(force=True, silent=True)
-        if data is None:
-            error = ERRORS["EMPTY_REQUEST"]
-            log_error(error, {"endpoint": "/api/v1/chat", "method": "POST"})
+        # 解析并验证请求
+        chat_request, error = _parse_chat_request(
+            request.get_json(force=True, silent=True), "/api/v1/chat", client_id=_client_id()
+        )
+        if error:
             return error.to_response()
         
-        # 验证请求数据
-        is_valid, error_msg = input_validator.validate_request_data(data)
-        if not is_valid:
-            error = ValidationError(error_msg)
-            log_error(error, {"endpoint": "/api/v1/chat", "method": "POST", "data": data})
+        # 带Idempotency-Key的重复请求等待或直接返回第一次请求的结果
+        entry, owner, error = _begin_idempotent(request.headers.get(IDEMPOTENCY_KEY_HEADER), chat_request, "/api/v1/chat")
+        if error:
             return error.to_response()
+        if not owner:
+            if not idempotency_store.wait(entry):
+                return _idempotent_in_progress("/api/v1/chat").to_response()
+            return _idempotent_replay(entry)
         
-        # 创建请求对象
-        chat_request = ChatRequest(
-            session_id=data.get('session_id'),
-            message=input_validator.clean_message(data.get('message', '')),
-            stream=data.get('stream', False)
-        )
-        
-        # 获取或创建会话
-        session = None
-        if chat_request.session_id:
-            session = session_manager.get_session(chat_request.session_id)
-            if not session:
-                error = SessionError("指定的会话不存在", session_id=chat_request.session_id)
-                log_error(error, {"endpoint": "/api/v1/chat", "session_id": chat_request.session_id})
-                return error.to_response()
-        else:
-            session = session_manager.create_session()
-            chat_request.session_id = session.session_id
-        
-        # 添加用户消息到会话
-        user_message = Message.create_user_message(chat_request.message)
-        session_manager.add_message(session.session_id, user_message)
-        
-        # 使用SessionProcessManager获取或创建长期进程
+        response = None
         try:
-            process = session_process_manager.get_or_create_process(
-                session.session_id,
-                work_directory=session.work_directory
-            )
-            
-            # 发送消息到长期进程
-            if not process.send_message(chat_request.message):
-                raise RuntimeError("发送消息到Q CLI进程失败")
-            
-            # 收集完整响应
-            response_parts = []
-            for chunk in process.read_response():
-                response_parts.append(chunk)
-            
-            response_text = "\n".join(response_parts)
-            
-            if not response_text:
-                raise RuntimeError("Q CLI没有返回有效响应")
-                
-        except Exception as e:
-            error = handle_qcli_error(e)
-            log_error(error, {
-                "endpoint": "/api/v1/chat", 
-                "session_id": session.session_id,
-                "message_length": len(chat_request.message)
-            })
-            return error.to_response()
-        
-        # 添加助手回复到会话
-        assistant_message = Message.create_assistant_message(response_text)
-        session_manager.add_message(session.session_id, assistant_message)
-        
-        # 返回响应
-        response = ChatResponse.create(session.session_id, response_text)
-        
-        # 创建响应，确保中文正确显示
-        response_data = {
-            "session_id": response.session_id,
-            "response": response.message,  # 使用response字段名，与前端保持一致
-            "timestamp": response.timestamp
-        }
-        
-        # 使用自定义JSON响应函数
-        return current_app.custom_jsonify(response_data)
+            response = _chat(chat_request)
+            return response
+        finally:
+            _finish_idempotent_response(entry, response)
         
     except APIError as e:
         # API错误已经处理过了，直接返回
@@ -118,116 +109,427 @@ def chat():
         return error.to_response()
 
 
-def stream_chat():
-    """流式聊天接口"""
+def _chat(chat_request: ChatRequest):
+    """执行一轮标准聊天，不带会话ID的一次性问题先查回复缓存"""
+    if chat_request.session_id or not response_cache.enabled:
+        return _session_chat(chat_request)
+    
+    result = {}
+    
+    def compute():
+        response = _session_chat(chat_request)
+        result["response"] = response
+        body = response.get_json(silent=True)
+        if response.status_code != 200 or not body:
+            raise _UncachedReply(response.status_code, body)
+        return body["response"]
+    
     try:
-        # 解析请求
-        data = request.get_json(force=True, silent=True)
-        if data is None:
-            error = ERRORS["EMPTY_REQUEST"]
-            log_error(error, {"endpoint": "/api/v1/chat/stream", "method": "POST"})
-            return error.to_response()
+        response_text, cached = response_cache.get_or_compute(chat_request.message, compute)
+    except _UncachedReply as e:
+        # 同一问题正在执行的一轮失败：等待它的请求得到同样的错误
+        response = result.get("response") or current_app.custom_jsonify(e.body)
+        response.status_code = e.status
+        return response
+    if not cached:
+        return result["response"]
+    return current_app.custom_jsonify(_cached_chat_reply(chat_request, response_text))
+
+
+def _cached_chat_reply(chat_request: ChatRequest, response_text: str, process_manager=None) -> dict:
+    """
+    回复来自缓存：创建新会话保存这一问一答，不启动Q CLI进程
+    
+    客户端继续在该会话中对话时，按保存的消息为新进程恢复历史。
+    """
+    session = session_manager.create_session()
+    session_manager.add_message(session.session_id, Message.create_user_message(chat_request.message))
+    session_manager.add_message(session.session_id, Message.create_assistant_message(response_text))
+    (process_manager or session_process_manager).restore_from_history(session.session_id)
+    
+    response = ChatResponse.create(session.session_id, response_text)
+    return {
+        "session_id": response.session_id,
+        "response": response.message,
+        "timestamp": response.timestamp,
+        "cached": True
+    }
+
+
+def _session_chat(chat_request: ChatRequest):
+    """获取或创建会话，排队后执行一轮标准聊天"""
+    session, error = _resolve_session(chat_request, "/api/v1/chat")
+    if error:
+        return error.to_response()
+    
+    # 同一会话的请求按顺序排队，本轮独占会话进程直到回复结束
+    ticket, error = _acquire_turn(chat_request, "/api/v1/chat")
+    if error:
+        return error.to_response()
+    try:
+        return _run_chat_turn(session, chat_request, ticket)
+    finally:
+        _release_turn(ticket)
+
+
+def _client_id() -> str:
+    """当前请求的客户端标识"""
+    return client_identity(
+        request.headers.get(API_KEY_HEADER), request.headers.get('X-Forwarded-For'), request.remote_addr
+    )
+
+
+def _parse_chat_request(data, endpoint: str, stream: bool = False, client_id: str = ""):
+    """解析并验证聊天请求体，返回 (请求对象, 错误)"""
+    if data is None:
+        error = ERRORS["EMPTY_REQUEST"]
+        log_error(error, {"endpoint": endpoint, "method": "POST"})
+        return None, error
+    
+    # 验证请求数据
+    is_valid, error_msg = input_validator.validate_request_data(data)
+    if not is_valid:
+        error = ValidationError(error_msg)
+        log_error(error, {"endpoint": endpoint, "method": "POST", "data": data})
+        return None, error
+    
+    # 创建请求对象
+    chat_request = ChatRequest(
+        session_id=data.get('session_id'),
+        message=input_validator.clean_message(data.get('message', '')),
+        stream=stream or data.get('stream', False),
+        coalesce_ms=data.get('coalesce_ms'),
+        coalesce_bytes=data.get('coalesce_bytes'),
+        priority=data.get('priority'),
+        client_id=client_id
+    )
+    return chat_request, None
+
+
+def _begin_idempotent(raw_key: str, chat_request: ChatRequest, endpoint: str):
+    """
+    按Idempotency-Key登记请求
+    
+    返回:
+        (请求, 是否由本请求执行, 错误)；没有幂等键时请求为None
+    """
+    if raw_key is None:
+        return None, True, None
+    key = raw_key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH or not (key.isascii() and key.isprintable()):
+        error = ValidationError(
+            f"Idempotency-Key必须是1-{MAX_KEY_LENGTH}个可见ASCII字符", field=IDEMPOTENCY_KEY_HEADER, value=raw_key[:64]
+        )
+        log_error(error, {"endpoint": endpoint, "method": "POST"})
+        return None, True, error
+    try:
+        entry, owner = idempotency_store.begin(
+            IdempotencyStore.make_key(chat_request.client_id, endpoint, key),
+            IdempotencyStore.fingerprint(chat_request.session_id, chat_request.message)
+        )
+    except IdempotencyKeyMismatchError:
+        error = IdempotencyError(idempotency_key=key)
+        log_error(error, {"endpoint": endpoint, "session_id": chat_request.session_id})
+        return None, True, error
+    return entry, owner, None
+
+
+def _finish_idempotent(entry, status: int = 500, body: dict = None, stream=None) -> None:
+    """登记带幂等键请求的结果（没有幂等键或已登记时忽略），未得到结果时按内部错误登记"""
+    if entry is None or entry.done.is_set():
+        return
+    if body is None and stream is None:
+        status, body = 500, InternalError("聊天服务内部错误").to_dict()
+    idempotency_store.finish(entry, status, body, stream)
+
+
+def _finish_idempotent_response(entry, response) -> None:
+    """按Flask响应登记带幂等键请求的结果"""
+    if response is None:
+        _finish_idempotent(entry)
+    else:
+        _finish_idempotent(entry, response.status_code, response.get_json(silent=True))
+
+
+def _idempotent_in_progress(endpoint: str) -> APIError:
+    """重复请求等待第一次请求的结果超时（第一次请求可能卡住），返回409让客户端稍后重试"""
+    error = IdempotencyInProgressError(retry_after=IN_PROGRESS_RETRY_AFTER)
+    log_error(error, {"endpoint": endpoint, "method": "POST"})
+    return error
+
+
+def _idempotent_replay(entry) -> Response:
+    """重复请求的响应：返回第一次请求的结果，流式接口从头重放同一轮回复"""
+    if entry.stream is not None:
+        stream = entry.stream
+        response = _sse_response(stream, _stream_events(stream, stream.start_id - 1, stream.session_id))
+    else:
+        response = current_app.custom_jsonify(entry.body)
+        response.status_code = entry.status
+    response.headers[IDEMPOTENT_REPLAYED_HEADER] = "true"
+    return response
+
+
+def _resolve_session(chat_request: ChatRequest, endpoint: str):
+    """获取请求指定的会话，未指定时创建新会话，返回 (会话, 错误)"""
+    if chat_request.session_id:
+        session = session_manager.get_session(chat_request.session_id)
+        if not session:
+            error = SessionError("指定的会话不存在", session_id=chat_request.session_id)
+            log_error(error, {"endpoint": endpoint, "session_id": chat_request.session_id})
+            return None, error
+        return session, None
+    
+    session = session_manager.create_session()
+    chat_request.session_id = session.session_id
+    return session, None
+
+
+def _acquire_turn(chat_request: ChatRequest, endpoint: str, default_priority: str = DEFAULT_PRIORITY):
+    """为会话排队获取一轮对话的执行权，再等待全局准入，返回 (凭证, 错误)"""
+    session_id = chat_request.session_id
+    try:
+        ticket = turn_scheduler.acquire(session_id)
+    except TurnQueueFullError as e:
+        error = RateLimitError("该会话排队的请求过多，请等待当前回复完成", retry_after=e.retry_after)
+    except TurnQueueTimeoutError as e:
+        error = handle_qcli_error(e)
+    else:
+        try:
+            _admit_turn(ticket, admission_controller.acquire(
+                chat_request.client_id, chat_request.priority or default_priority
+            ))
+            return ticket, None
+        except AdmissionRejectedError as e:
+            turn_scheduler.release(ticket)
+            error = _admission_error(e)
+    log_error(error, {"endpoint": endpoint, "session_id": session_id})
+    return None, error
+
+
+def _admit_turn(ticket, slot) -> None:
+    """记录准入名额，排队时间包含等待准入的时间"""
+    ticket.admission = slot
+    ticket.started_at = slot.granted_at
+
+
+def _admission_error(e: AdmissionRejectedError) -> APIError:
+    """准入被拒绝时的错误：单个客户端排队过多为429，全局繁忙为503"""
+    if e.http_status == 429:
+        return RateLimitError("您排队的请求过多，请等待之前的请求完成", retry_after=e.retry_after)
+    return OverloadedError("服务繁忙，等待处理的对话过多，请稍后重试", retry_after=e.retry_after)
+
+
+def _release_turn(ticket) -> None:
+    """结束一轮对话：归还准入名额，把会话执行权交给下一个请求"""
+    if ticket.admission is not None:
+        admission_controller.release(ticket.admission)
+    turn_scheduler.release(ticket)
+
+
+def _run_chat_turn(session, chat_request: ChatRequest, ticket):
+    """执行一轮标准聊天（调用方需持有该会话的执行权）"""
+    # 添加用户消息到会话
+    user_message = Message.create_user_message(chat_request.message)
+    session_manager.add_message(session.session_id, user_message)
+    
+    # 使用SessionProcessManager获取或创建长期进程（本轮结束前占用，不会被驱逐）
+    process = None
+    try:
+        process = session_process_manager.get_or_create_process(
+            session.session_id,
+            work_directory=session.work_directory,
+            lease=True
+        )
         
-        # 验证请求数据
-        is_valid, error_msg = input_validator.validate_request_data(data)
-        if not is_valid:
-            error = ValidationError(error_msg)
-            log_error(error, {"endpoint": "/api/v1/chat/stream", "method": "POST", "data": data})
-            return error.to_response()
+        # 发送消息到长期进程
+        if not process.send_message(chat_request.message):
+            raise RuntimeError("发送消息到Q CLI进程失败")
         
-        # 创建请求对象
-        chat_request = ChatRequest(
-            session_id=data.get('session_id'),
-            message=input_validator.clean_message(data.get('message', '')),
-            stream=True
+        # 收集完整响应
+        response_parts = []
+        for chunk in process.read_response():
+            response_parts.append(chunk)
+        
+        # 各响应片段自带换行，按顺序拼接即为完整回复
+        response_text = "".join(response_parts).strip()
+        
+        if not response_text:
+            raise RuntimeError("Q CLI没有返回有效响应")
+    
+    except Exception as e:
+        error = handle_qcli_error(e)
+        log_error(error, {
+            "endpoint": "/api/v1/chat", 
+            "session_id": session.session_id,
+            "message_length": len(chat_request.message)
+        })
+        return error.to_response()
+    finally:
+        if process is not None:
+            session_process_manager.release_process(process)
+    
+    # 使用自定义JSON响应函数，确保中文正确显示
+    return current_app.custom_jsonify(_complete_chat_turn(session.session_id, response_text, ticket))
+
+
+def _complete_chat_turn(session_id: str, response_text: str, ticket) -> dict:
+    """保存助手回复并生成标准聊天接口的响应数据"""
+    # 添加助手回复到会话
+    assistant_message = Message.create_assistant_message(response_text)
+    session_manager.add_message(session_id, assistant_message)
+    
+    # 返回响应
+    response = ChatResponse.create(session_id, response_text)
+    return {
+        "session_id": response.session_id,
+        "response": response.message,  # 使用response字段名，与前端保持一致
+        "timestamp": response.timestamp,
+        "timing": ticket.get_timing()
+    }
+
+
+def _pump_stream_turn(session, chat_request: ChatRequest, ticket, stream, coalescer: ChunkCoalescer):
+    """在后台读取一轮流式回复并写入重放缓冲（持有该会话的执行权直到本轮结束）"""
+    process = None
+    try:
+        # 获取或创建会话进程（本轮结束前占用，不会被驱逐）
+        process = session_process_manager.get_or_create_process(
+            session.session_id,
+            work_directory=session.work_directory,
+            lease=True
         )
         
-        # 获取或创建会话
-        session = None
-        if chat_request.session_id:
-            session = session_manager.get_session(chat_request.session_id)
-            if not session:
-                error = SessionError("指定的会话不存在", session_id=chat_request.session_id)
-                log_error(error, {"endpoint": "/api/v1/chat/stream", "session_id": chat_request.session_id})
-                return error.to_response()
-        else:
-            session = session_manager.create_session()
-            chat_request.session_id = session.session_id
+        # 发送消息到长期进程
+        if not process.send_message(chat_request.message):
+            raise RuntimeError("发送消息到Q CLI进程失败")
         
-        # 添加用户消息到会话
-        user_message = Message.create_user_message(chat_request.message)
-        session_manager.add_message(session.session_id, user_message)
+        # 收集完整回复用于保存到会话
+        full_response = []
         
-        # 创建流式响应
-        def generate():
-            try:
-                # 发送会话ID
-                session_data = {
-                    'session_id': session.session_id,
-                    'type': 'session'
-                }
-                yield f"data: {json.dumps(session_data, ensure_ascii=False)}\n\n"
-                
-                # 获取或创建会话进程
-                process = session_process_manager.get_or_create_process(
-                    session.session_id,
-                    work_directory=session.work_directory
-                )
-                
-                # 发送消息到长期进程
-                if not process.send_message(chat_request.message):
-                    raise RuntimeError("发送消息到Q CLI进程失败")
-                
-                # 收集完整回复用于保存到会话
-                full_response = []
-                
-                # 流式读取响应
-                for chunk in process.read_response():
-                    full_response.append(chunk)
-                    # 发送数据块
-                    chunk_data = {
-                        'message': chunk,
-                        'type': 'chunk'
-                    }
-                    yield f"data: {json.dumps(chunk_data, ensure_ascii=False)}\n\n"
-                
-                # 发送完成信号
-                done_data = {'type': 'done'}
-                yield f"data: {json.dumps(done_data, ensure_ascii=False)}\n\n"
-                
-                # 保存完整回复到会话
-                if full_response:
-                    complete_response = "\n".join(full_response)
-                    assistant_message = Message.create_assistant_message(complete_response)
-                    session_manager.add_message(session.session_id, assistant_message)
-                
-            except Exception as e:
-                # 处理所有错误
-                error = handle_qcli_error(e) if isinstance(e, RuntimeError) else InternalError("流式聊天内部错误", original_error=e)
-                log_error(error, {
-                    "endpoint": "/api/v1/chat/stream", 
-                    "session_id": session.session_id,
-                    "message_length": len(chat_request.message)
-                })
-                # 发送详细错误信息
-                error_data = {
-                    'error': error.message,
-                    'code': error.code,
-                    'suggestions': error.suggestions,
-                    'type': 'error'
-                }
-                yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
-        
-        return Response(
-            stream_with_context(generate()),
-            mimetype='text/event-stream',
-            headers={
-                'Cache-Control': 'no-cache',
-                'Connection': 'keep-alive',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type'
-            }
+        # 流式读取响应，小片段按时间和字节预算合并为一个事件；定时检查是否还有客户端在接收
+        for chunk in process.read_response(coalescer, heartbeat=_STREAM_PUMP_TICK):
+            if stream.abandoned(config.STREAM_RESUME_GRACE):
+                # 客户端断开且没有在等待时间内重新连接，中断Q Chat本轮生成，进程可直接处理下一条消息
+                process.cancel_turn()
+                stream.append(_CANCELLED_EVENT)
+                return
+            if not chunk:
+                continue
+            full_response.append(chunk)
+            stream.append({'message': chunk, 'type': 'chunk'})
+        
+        # 保存完整回复到会话并发送完成信号
+        stream.append(_complete_stream_turn(session.session_id, full_response, ticket))
+        
+    except Exception as e:
+        # 发送详细错误信息
+        stream.append(_stream_error_event(e, session.session_id, chat_request))
+    finally:
+        if process is not None:
+            session_process_manager.release_process(process)
+        stream.finish()
+        _release_turn(ticket)
+
+
+def _complete_stream_turn(session_id: str, full_response, ticket) -> dict:
+    """保存流式回复到会话，返回完成事件"""
+    if full_response:
+        complete_response = "".join(full_response).strip()
+        assistant_message = Message.create_assistant_message(complete_response)
+        session_manager.add_message(session_id, assistant_message)
+    return {'type': 'done', 'timing': ticket.get_timing()}
+
+
+def _stream_error_event(e: Exception, session_id: str, chat_request: ChatRequest) -> dict:
+    """记录流式对话中的错误，返回错误事件"""
+    error = handle_qcli_error(e) if isinstance(e, RuntimeError) else InternalError("流式聊天内部错误", original_error=e)
+    log_error(error, {
+        "endpoint": "/api/v1/chat/stream", 
+        "session_id": session_id,
+        "message_length": len(chat_request.message)
+    })
+    return {
+        'error': error.message,
+        'code': error.code,
+        'suggestions': error.suggestions,
+        'type': 'error'
+    }
+
+
+def _session_event(session_id: str) -> str:
+    """编码新流开头的会话ID事件（不带ID，不进入重放缓冲）"""
+    session_data = {
+        'session_id': session_id,
+        'type': 'session'
+    }
+    return f"data: {json.dumps(session_data, ensure_ascii=False)}\n\n"
+
+
+def _sse_event(event_id: int, event: dict) -> str:
+    """编码一个带ID的SSE事件"""
+    return f"id: {event_id}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def _stream_events(stream, after_id: int, session_id: str = None):
+    """把重放缓冲中指定ID之后的事件编码为SSE（新的流先发送会话ID）"""
+    if session_id:
+        yield _session_event(session_id)
+    
+    heartbeat = config.SSE_HEARTBEAT_INTERVAL or None
+    while True:
+        events, finished = stream.read(after_id, timeout=heartbeat)
+        if finished:
+            return
+        if not events:
+            # 心跳注释：防止代理断开空闲连接，写入失败时即可发现客户端已断开
+            yield SSE_HEARTBEAT
+            continue
+        for event_id, event in events:
+            after_id = event_id
+            yield _sse_event(event_id, event)
+
+
+def _sse_response(stream, events) -> Response:
+    """创建订阅重放缓冲的SSE响应，响应关闭时登记客户端断开"""
+    stream.attach()
+    response = Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS
+    )
+    # 客户端在流开始前断开时生成器不会执行，关闭回调仍会执行
+    response.call_on_close(stream.detach)
+    return response
+
+
+def stream_chat():
+    """流式聊天接口"""
+    try:
+        # 解析并验证请求
+        chat_request, error = _parse_chat_request(
+            request.get_json(force=True, silent=True), "/api/v1/chat/stream", stream=True, client_id=_client_id()
         )
+        if error:
+            return error.to_response()
+        
+        # 带Idempotency-Key的重复请求订阅第一次请求的那一轮回复
+        entry, owner, error = _begin_idempotent(
+            request.headers.get(IDEMPOTENCY_KEY_HEADER), chat_request, "/api/v1/chat/stream"
+        )
+        if error:
+            return error.to_response()
+        if not owner:
+            if not idempotency_store.wait(entry):
+                return _idempotent_in_progress("/api/v1/chat/stream").to_response()
+            return _idempotent_replay(entry)
+        
+        response = None
+        try:
+            response = _stream_chat(chat_request, entry)
+            return response
+        finally:
+            _finish_idempotent_response(entry, response)
         
     except APIError as e:
         # API错误已经处理过了，直接返回
@@ -238,6 +540,35 @@ def stream_chat():
         return error.to_response()
 
 
+def _stream_chat(chat_request: ChatRequest, entry=None):
+    """获取或创建会话，排队后在后台线程中开始一轮流式回复"""
+    session, error = _resolve_session(chat_request, "/api/v1/chat/stream")
+    if error:
+        return error.to_response()
+    
+    # 同一会话的请求按顺序排队，本轮独占会话进程直到流结束
+    ticket, error = _acquire_turn(chat_request, "/api/v1/chat/stream")
+    if error:
+        return error.to_response()
+    
+    # 添加用户消息到会话
+    user_message = Message.create_user_message(chat_request.message)
+    session_manager.add_message(session.session_id, user_message)
+    
+    # 回复由后台线程读取并写入重放缓冲，SSE连接只是订阅者：断线后可带Last-Event-ID恢复
+    stream = stream_replay.start_turn(session.session_id)
+    response = _sse_response(stream, _stream_events(stream, stream.start_id - 1, session.session_id))
+    _finish_idempotent(entry, 200, stream=stream)
+    coalescer = ChunkCoalescer(chat_request.coalesce_ms, chat_request.coalesce_bytes)
+    threading.Thread(
+        target=_pump_stream_turn,
+        args=(session, chat_request, ticket, stream, coalescer),
+        name=f"stream-{session.session_id[:8]}",
+        daemon=True
+    ).start()
+    return response
+
+
 def health():
     """健康检查接口"""
     try:
@@ -257,6 +588,19 @@ def health():
             "qcli_available": qcli_available,
             "active_sessions": active_sessions,
             "active_processes": active_processes,
+            "process_manager": session_process_manager.get_stats(),
+            "async_process_manager": async_process_manager.get_stats(),
+            "process_pool": process_pool.get_stats(),
+            "turn_latency": turn_latency_stats.get_stats(),
+            "turn_cancellation": turn_cancellation_stats.get_stats(),
+            "turn_scheduler": turn_scheduler.get_stats(),
+            "admission": admission_controller.get_stats(),
+            "rate_limit": rate_limiter.get_stats(),
+            "idempotency": idempotency_store.get_stats(),
+            "stream_replay": stream_replay.get_stats(),
+            "jobs": job_manager.get_stats(),
+            "response_cache": response_cache.get_stats(),
+            "maintenance": maintenance_scheduler.get_stats(),
             "version": "1.0.0"
         })
         
@@ -372,6 +716,190 @@ def get_session_files(session_id: str):
         return error.to_response()
 
 
+def get_session_stderr(session_id: str):
+    """获取会话Q Chat进程最近的stderr输出接口（用于排查问题）"""
+    try:
+        session = session_manager.get_session(session_id)
+        if not session:
+            error = SessionError("指定的会话不存在", session_id=session_id)
+            log_error(error, {"endpoint": f"/api/v1/sessions/{session_id}/stderr", "method": "GET"})
+            return error.to_response()
+        
+        limit = request.args.get('limit', 100, type=int)
+        process = session_process_manager.get_process(session_id)
+        if process:
+            snapshot = process.stderr.snapshot(limit)
+        else:
+            snapshot = {"lines": [], "events": [], "total_lines": 0}
+        
+        return current_app.custom_jsonify({
+            "session_id": session_id,
+            "process_running": bool(process and process.is_alive()),
+            **snapshot
+        })
+        
+    except Exception as e:
+        error = InternalError("获取会话stderr失败", original_error=e)
+        log_error(error, {"endpoint": f"/api/v1/sessions/{session_id}/stderr", "method": "GET"})
+        return error.to_response()
+
+
+def resume_stream(session_id: str):
+    """恢复流式回复接口：按Last-Event-ID继续发送断线后的事件，不重新生成"""
+    try:
+        # EventSource重连时自动带Last-Event-ID请求头，也可以用查询参数指定
+        raw_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        found, error = _find_resumable_stream(session_id, raw_id)
+        if error:
+            return error.to_response()
+        
+        stream, after_id = found
+        return _sse_response(stream, _stream_events(stream, after_id))
+        
+    except Exception as e:
+        error = InternalError("恢复流式回复失败", original_error=e)
+        log_error(error, {"endpoint": f"/api/v1/sessions/{session_id}/stream", "method": "GET"})
+        return error.to_response()
+
+
+def _find_resumable_stream(session_id: str, raw_id: str = None):
+    """按会话和最后收到的事件ID查找可恢复的一轮，返回 ((事件序列, 起始ID), 错误)"""
+    endpoint = f"/api/v1/sessions/{session_id}/stream"
+    session = session_manager.get_session(session_id)
+    if not session:
+        error = SessionError("指定的会话不存在", session_id=session_id)
+        log_error(error, {"endpoint": endpoint, "method": "GET"})
+        return None, error
+    
+    last_event_id, error = _parse_last_event_id(raw_id, endpoint)
+    if error:
+        return None, error
+    
+    found = stream_replay.find(session_id, last_event_id)
+    if found is None:
+        error = SessionError("没有可恢复的流式回复", session_id=session_id, error_type="STREAM_EXPIRED")
+        log_error(error, {"endpoint": endpoint, "last_event_id": raw_id})
+        return None, error
+    return found, None
+
+
+def _parse_last_event_id(raw_id: str, endpoint: str):
+    """解析Last-Event-ID，返回 (事件ID或None, 错误)"""
+    if not raw_id:
+        return None, None
+    try:
+        return int(raw_id), None
+    except ValueError:
+        error = ValidationError("Last-Event-ID必须是整数", field="Last-Event-ID", value=raw_id)
+        log_error(error, {"endpoint": endpoint, "method": "GET"})
+        return None, error
+
+
+def submit_job():
+    """提交异步任务接口：立即返回任务ID，回复在后台线程池中生成"""
+    try:
+        chat_request, error = _parse_chat_request(
+            request.get_json(force=True, silent=True), "/api/v1/jobs", stream=True, client_id=_client_id()
+        )
+        if error:
+            return error.to_response()
+        session, error = _resolve_session(chat_request, "/api/v1/jobs")
+        if error:
+            return error.to_response()
+        
+        try:
+            job = job_manager.submit(session.session_id, lambda job: _run_job(job, session, chat_request))
+        except JobQueueFullError as e:
+            error = RateLimitError("等待执行的任务过多，请稍后重试", retry_after=e.retry_after)
+            log_error(error, {"endpoint": "/api/v1/jobs", "session_id": session.session_id})
+            return error.to_response()
+        
+        response = current_app.custom_jsonify(job.to_dict())
+        response.status_code = 202
+        response.headers['Location'] = f"/api/v1/jobs/{job.job_id}"
+        return response
+        
+    except Exception as e:
+        error = InternalError("提交任务失败", original_error=e)
+        log_error(error, {"endpoint": "/api/v1/jobs", "method": "POST"})
+        return error.to_response()
+
+
+def _run_job(job, session, chat_request: ChatRequest):
+    """在任务线程中执行一轮对话，回复事件写入任务"""
+    # 与流式聊天相同：同一会话的任务和请求按顺序排队；未指定优先级时任务以low优先级等待准入
+    ticket, error = _acquire_turn(chat_request, "/api/v1/jobs", default_priority="low")
+    if error:
+        job.append({
+            'error': error.message,
+            'code': error.code,
+            'suggestions': error.suggestions,
+            'type': 'error'
+        })
+        return
+    
+    user_message = Message.create_user_message(chat_request.message)
+    session_manager.add_message(session.session_id, user_message)
+    coalescer = ChunkCoalescer(chat_request.coalesce_ms, chat_request.coalesce_bytes)
+    _pump_stream_turn(session, chat_request, ticket, job, coalescer)
+
+
+def get_job(job_id: str):
+    """查询任务接口，?wait=秒 时长轮询直到任务结束或超时"""
+    try:
+        job, error = _find_job(job_id, f"/api/v1/jobs/{job_id}")
+        if error:
+            return error.to_response()
+        
+        raw_wait = request.args.get('wait')
+        if raw_wait:
+            try:
+                wait = min(max(float(raw_wait), 0.0), config.JOB_MAX_WAIT)
+            except ValueError:
+                error = ValidationError("wait必须是数字（秒）", field="wait", value=raw_wait)
+                log_error(error, {"endpoint": f"/api/v1/jobs/{job_id}", "method": "GET"})
+                return error.to_response()
+            job.wait(wait)
+        
+        return current_app.custom_jsonify(job.to_dict())
+        
+    except Exception as e:
+        error = InternalError("查询任务失败", original_error=e)
+        log_error(error, {"endpoint": f"/api/v1/jobs/{job_id}", "method": "GET"})
+        return error.to_response()
+
+
+def stream_job(job_id: str):
+    """订阅任务回复接口：SSE格式与流式聊天相同，支持Last-Event-ID"""
+    try:
+        endpoint = f"/api/v1/jobs/{job_id}/stream"
+        job, error = _find_job(job_id, endpoint)
+        if error:
+            return error.to_response()
+        after_id, error = _parse_last_event_id(
+            request.headers.get('Last-Event-ID') or request.args.get('last_event_id'), endpoint
+        )
+        if error:
+            return error.to_response()
+        
+        return _sse_response(job, _stream_events(job, after_id or 0))
+        
+    except Exception as e:
+        error = InternalError("订阅任务失败", original_error=e)
+        log_error(error, {"endpoint": f"/api/v1/jobs/{job_id}/stream", "method": "GET"})
+        return error.to_response()
+
+
+def _find_job(job_id: str, endpoint: str):
+    """查找任务，返回 (任务, 错误)"""
+    job = job_manager.get(job_id)
+    if not job:
+        error = JobError("指定的任务不存在或已过期", job_id=job_id)
+        log_error(error, {"endpoint": endpoint, "method": "GET"})
+        return None, error
+    return job, None
+
+
 # 旧的_error_response函数已被新的错误处理系统替代
 
 
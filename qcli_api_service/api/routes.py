@@ -21,6 +21,13 @@ api_bp.add_url_rule('/sessions', 'create_session', controllers.create_session, m
 api_bp.add_url_rule('/sessions/<session_id>', 'get_session', controllers.get_session, methods=['GET'])
 api_bp.add_url_rule('/sessions/<session_id>', 'delete_session', controllers.delete_session, methods=['DELETE'])
 api_bp.add_url_rule('/sessions/<session_id>/files', 'get_session_files', controllers.get_session_files, methods=['GET'])
+api_bp.add_url_rule('/sessions/<session_id>/stderr', 'get_session_stderr', controllers.get_session_stderr, methods=['GET'])
+api_bp.add_url_rule('/sessions/<session_id>/stream', 'resume_stream', controllers.resume_stream, methods=['GET'])
+
+# 异步任务路由
+api_bp.add_url_rule('/jobs', 'submit_job', controllers.submit_job, methods=['POST'])
+api_bp.add_url_rule('/jobs/<job_id>', 'get_job', controllers.get_job, methods=['GET'])
+api_bp.add_url_rule('/jobs/<job_id>/stream', 'stream_job', controllers.stream_job, methods=['GET'])
 
 
 # 创建健康检查蓝图
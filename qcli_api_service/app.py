@@ -4,13 +4,37 @@ Flask应用工厂 - 核心版本
 创建和配置Flask应用实例。
 """
 
+import atexit
 import logging
 import json
-from flask import Flask, jsonify, Response
+import signal
+import sys
+import threading
+from flask import Flask, jsonify, Response, g, request
 from flask_cors import CORS
 from werkzeug.exceptions import BadRequest
 from qcli_api_service.config import config
 from qcli_api_service.api.routes import register_routes
+from qcli_api_service.services.process_pool import process_pool
+from qcli_api_service.services.maintenance import maintenance_scheduler
+from qcli_api_service.services.job_manager import job_manager
+from qcli_api_service.services.session_process_manager import session_process_manager
+from qcli_api_service.services.rate_limiter import rate_limiter
+from qcli_api_service.utils.client_identity import API_KEY_HEADER
+from qcli_api_service.utils.errors import RateLimitError
+
+logger = logging.getLogger(__name__)
+
+# 允许跨域访问的前端地址
+CORS_ORIGINS = [
+    'http://localhost:3000',  # 开发环境前端
+    'http://127.0.0.1:3000',  # 本地前端
+    'http://localhost:5173',  # Vite默认端口
+    'http://127.0.0.1:5173'   # Vite本地
+]
+
+_shutdown_lock = threading.Lock()
+_shutdown_done = False
 
 
 def create_app() -> Flask:
@@ -18,12 +42,7 @@ def create_app() -> Flask:
     app = Flask(__name__)
     
     # 配置CORS - 允许前端访问
-    CORS(app, origins=[
-        'http://localhost:3000',  # 开发环境前端
-        'http://127.0.0.1:3000',  # 本地前端
-        'http://localhost:5173',  # Vite默认端口
-        'http://127.0.0.1:5173'   # Vite本地
-    ], supports_credentials=True)
+    CORS(app, origins=CORS_ORIGINS, supports_credentials=True)
     
     # 配置Flask
     app.config['DEBUG'] = config.DEBUG
@@ -48,12 +67,21 @@ def create_app() -> Flask:
     if not app.debug:
         app.logger.setLevel(logging.INFO)
     
+    # 注册限流中间件（RATE_LIMIT_ENABLED为false时不限制）
+    register_rate_limiter(app)
+    
     # 注册路由
     register_routes(app)
     
     # 注册错误处理器
     register_error_handlers(app)
     
+    # 启动预热进程池（PROCESS_POOL_SIZE为0时不启动）
+    process_pool.start()
+    
+    # 启动后台维护调度器，定期清理过期会话（MAINTENANCE_INTERVAL为0时不启动）
+    maintenance_scheduler.start()
+    
     # 添加基本路由
     @app.route('/')
     def index():
@@ -73,6 +101,28 @@ def create_app() -> Flask:
     return app
 
 
+def register_rate_limiter(app: Flask) -> None:
+    """注册限流中间件：超出限额的请求直接返回429，受限接口的响应附带RateLimit-*头"""
+    
+    @app.before_request
+    def check_rate_limit():
+        decision = rate_limiter.check(
+            request.method, request.path, request.headers.get(API_KEY_HEADER),
+            request.headers.get('X-Forwarded-For'), request.remote_addr
+        )
+        g.rate_limit = decision
+        if decision is not None and not decision.allowed:
+            return RateLimitError("请求过于频繁，请稍后重试", retry_after=decision.retry_after).to_response()
+        return None
+    
+    @app.after_request
+    def add_rate_limit_headers(response):
+        decision = g.get('rate_limit')
+        if decision is not None:
+            response.headers.update(decision.headers())
+        return response
+
+
 def register_error_handlers(app: Flask) -> None:
     """注册错误处理器"""
     
@@ -162,4 +212,41 @@ def register_error_handlers(app: Flask) -> None:
             ]
         })
         response.status_code = 500
-        return response
\ No newline at end of file
+        return response
+
+
+def shutdown_services() -> None:
+    """
+    关闭后台服务并在SHUTDOWN_TIMEOUT内终止所有Q Chat进程
+    
+    会话进程与预热进程共用同一个时间预算，重复调用只执行一次。
+    """
+    global _shutdown_done
+    with _shutdown_lock:
+        if _shutdown_done:
+            return
+        _shutdown_done = True
+    
+    logger.info("正在关闭服务...")
+    maintenance_scheduler.stop()
+    
+    job_manager.shutdown()
+    
+    pool_shutdown = threading.Thread(target=process_pool.shutdown, name="qcli-pool-shutdown", daemon=True)
+    pool_shutdown.start()
+    stats = session_process_manager.shutdown_all(config.SHUTDOWN_TIMEOUT)
+    pool_shutdown.join(timeout=config.SHUTDOWN_TIMEOUT)
+    logger.info(f"服务已关闭，耗时 {stats['duration']} 秒")
+
+
+def install_shutdown_handlers() -> None:
+    """注册SIGTERM/SIGINT信号处理和atexit钩子（需在主线程调用）"""
+    
+    def handle_signal(signum, frame):
+        logger.info(f"收到信号 {signal.Signals(signum).name}，开始关闭")
+        shutdown_services()
+        sys.exit(0)
+    
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    atexit.register(shutdown_services)
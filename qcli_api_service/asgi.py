@@ -0,0 +1,648 @@
+"""
+ASGI应用 - asyncio服务模式
+
+聊天相关接口（/api/v1/chat、/api/v1/chat/stream、/api/v1/sessions/{id}/stream、
+POST /api/v1/jobs、/api/v1/jobs/{id}/stream）直接在事件循环中处理：Q Chat进程由 asyncio.create_subprocess_exec 驱动，
+等待回复和保持SSE连接都不占用线程，单个worker可以同时保持数千个流。
+请求解析、会话、排队、重放缓冲和事件格式与Flask控制器共用同一套实现。
+
+其余接口（会话管理、健康检查等）交给Flask应用处理，在有界线程池中执行。
+
+运行方式（需要安装uvicorn）：
+    python -m qcli_api_service.asgi
+    uvicorn --factory qcli_api_service.asgi:create_asgi_app --port 8080
+"""
+
+import asyncio
+import functools
+import io
+import json
+import logging
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from qcli_api_service.config import config
+from qcli_api_service.api import controllers
+from qcli_api_service.app import create_app, shutdown_services, CORS_ORIGINS
+from qcli_api_service.models.core import Message
+from qcli_api_service.services.admission_control import (
+    admission_controller, AdmissionRejectedError, DEFAULT_PRIORITY
+)
+from qcli_api_service.services.async_session_process import async_process_manager
+from qcli_api_service.services.chunk_coalescer import ChunkCoalescer
+from qcli_api_service.services.job_manager import job_manager, JobQueueFullError
+from qcli_api_service.services.rate_limiter import rate_limiter
+from qcli_api_service.services.response_cache import response_cache
+from qcli_api_service.services.idempotency import (
+    idempotency_store, IDEMPOTENCY_KEY_HEADER, IDEMPOTENT_REPLAYED_HEADER
+)
+from qcli_api_service.services.session_manager import session_manager
+from qcli_api_service.services.stream_replay import stream_replay
+from qcli_api_service.services.turn_scheduler import (
+    turn_scheduler, TurnQueueFullError, TurnQueueTimeoutError, _AsyncGrant
+)
+from qcli_api_service.utils.client_identity import client_identity, API_KEY_HEADER
+from qcli_api_service.utils.errors import (
+    APIError, RateLimitError, InternalError, handle_qcli_error, log_error
+)
+
+logger = logging.getLogger(__name__)
+
+_RESUME_PATH = re.compile(r'^/api/v1/sessions/([^/]+)/stream$')
+_JOB_STREAM_PATH = re.compile(r'^/api/v1/jobs/([^/]+)/stream$')
+_REPLAYED_HEADER = (IDEMPOTENT_REPLAYED_HEADER.lower().encode("latin-1"), b"true")
+
+
+class ASGIApp:
+    """ASGI入口：聊天接口走asyncio，其余接口交给Flask"""
+
+    def __init__(self, flask_app=None, wsgi_threads: int = None):
+        self.flask_app = flask_app or create_app()
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.ASGI_WSGI_THREADS if wsgi_threads is None else wsgi_threads,
+            thread_name_prefix="asgi-wsgi"
+        )
+        self._tasks = set()  # 后台读取回复的任务，保持引用直到结束
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        method, path = scope["method"], scope["path"]
+        handler = self._route(method, path)
+        try:
+            if handler is None:
+                await self._call_flask(scope, receive, send)
+            else:
+                send, error = _check_rate_limit(scope, send)
+                if error:
+                    raise error
+                await handler(scope, receive, send)
+        except APIError as e:
+            await self._send_error(scope, send, e)
+        except Exception as e:
+            error = InternalError("ASGI服务内部错误", original_error=e)
+            log_error(error, {"endpoint": path, "method": method})
+            await self._send_error(scope, send, error)
+
+    def _route(self, method: str, path: str):
+        """由事件循环直接处理的接口，其余接口返回None（交给Flask，限流由Flask中间件处理）"""
+        if method == "POST" and path == "/api/v1/chat/stream":
+            return self._stream_chat
+        if method == "POST" and path == "/api/v1/chat":
+            return self._chat
+        if method == "POST" and path == "/api/v1/jobs":
+            return self._submit_job
+        match = _RESUME_PATH.match(path)
+        if method == "GET" and match:
+            return functools.partial(self._resume_stream, session_id=match.group(1))
+        match = _JOB_STREAM_PATH.match(path)
+        if method == "GET" and match:
+            return functools.partial(self._stream_job, job_id=match.group(1))
+        return None
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                async_process_manager.bind_loop()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                # asyncio进程由事件循环终止；维护调度器、任务管理器、预热池和线程版进程（Flask处理的接口）
+                # 与Flask模式相同，由shutdown_services在线程中关闭，两者共用SHUTDOWN_TIMEOUT
+                await asyncio.gather(
+                    async_process_manager.shutdown_all_async(),
+                    asyncio.to_thread(shutdown_services)
+                )
+                self._executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # ---------- 聊天接口 ----------
+
+    async def _chat(self, scope, receive, send):
+        """标准聊天接口"""
+        data = _parse_json(await _read_body(receive))
+        chat_request, error = controllers._parse_chat_request(data, "/api/v1/chat", client_id=_client_id(scope))
+        if error:
+            raise error
+
+        # 带Idempotency-Key的重复请求等待或直接返回第一次请求的结果
+        entry, owner, error = controllers._begin_idempotent(
+            _headers(scope).get(IDEMPOTENCY_KEY_HEADER.lower()), chat_request, "/api/v1/chat"
+        )
+        if error:
+            raise error
+        if not owner:
+            await _wait_idempotent(entry, "/api/v1/chat")
+            await self._send_json(scope, send, entry.status, entry.body, [_REPLAYED_HEADER])
+            return
+
+        try:
+            data = await self._chat_turn(chat_request)
+        except APIError as e:
+            controllers._finish_idempotent(entry, e.http_status, e.to_dict())
+            raise
+        except BaseException:
+            controllers._finish_idempotent(entry)
+            raise
+        controllers._finish_idempotent(entry, 200, data)
+        await self._send_json(scope, send, 200, data)
+
+    async def _chat_turn(self, chat_request) -> dict:
+        """执行一轮标准聊天，返回响应数据；不带会话ID的一次性问题先查回复缓存"""
+        if chat_request.session_id or not response_cache.enabled:
+            return await self._session_chat_turn(chat_request)
+
+        result = {}
+
+        async def compute():
+            result["data"] = await self._session_chat_turn(chat_request)
+            return result["data"]["response"]
+
+        response_text, cached = await response_cache.get_or_compute_async(chat_request.message, compute)
+        if not cached:
+            return result["data"]
+        return controllers._cached_chat_reply(chat_request, response_text, async_process_manager)
+
+    async def _session_chat_turn(self, chat_request) -> dict:
+        """获取或创建会话，排队后执行一轮标准聊天，返回响应数据"""
+        session, error = controllers._resolve_session(chat_request, "/api/v1/chat")
+        if error:
+            raise error
+
+        ticket = await _acquire_turn(chat_request, "/api/v1/chat")
+        try:
+            session_manager.add_message(session.session_id, Message.create_user_message(chat_request.message))
+            process = None
+            try:
+                process = await async_process_manager.get_or_create_process_async(
+                    session.session_id, work_directory=session.work_directory, lease=True
+                )
+                if not await process.send_message_async(chat_request.message):
+                    raise RuntimeError("发送消息到Q CLI进程失败")
+
+                # 各响应片段自带换行，按顺序拼接即为完整回复
+                response_text = "".join([chunk async for chunk in process.read_response_async()]).strip()
+                if not response_text:
+                    raise RuntimeError("Q CLI没有返回有效响应")
+            except Exception as e:
+                error = handle_qcli_error(e)
+                log_error(error, {
+                    "endpoint": "/api/v1/chat",
+                    "session_id": session.session_id,
+                    "message_length": len(chat_request.message)
+                })
+                raise error
+            finally:
+                if process is not None:
+                    async_process_manager.release_process(process)
+
+            return controllers._complete_chat_turn(session.session_id, response_text, ticket)
+        finally:
+            controllers._release_turn(ticket)
+
+    async def _stream_chat(self, scope, receive, send):
+        """流式聊天接口"""
+        data = _parse_json(await _read_body(receive))
+        chat_request, error = controllers._parse_chat_request(
+            data, "/api/v1/chat/stream", stream=True, client_id=_client_id(scope)
+        )
+        if error:
+            raise error
+
+        # 带Idempotency-Key的重复请求订阅第一次请求的那一轮回复
+        entry, owner, error = controllers._begin_idempotent(
+            _headers(scope).get(IDEMPOTENCY_KEY_HEADER.lower()), chat_request, "/api/v1/chat/stream"
+        )
+        if error:
+            raise error
+        if not owner:
+            await _wait_idempotent(entry, "/api/v1/chat/stream")
+            if entry.stream is None:
+                await self._send_json(scope, send, entry.status, entry.body, [_REPLAYED_HEADER])
+                return
+            stream = entry.stream
+            stream.attach()
+            await _send_sse(send, receive, stream, _stream_events(stream, stream.start_id - 1, stream.session_id),
+                            [_REPLAYED_HEADER])
+            return
+
+        try:
+            stream = await self._start_stream_turn(chat_request)
+        except APIError as e:
+            controllers._finish_idempotent(entry, e.http_status, e.to_dict())
+            raise
+        except BaseException:
+            controllers._finish_idempotent(entry)
+            raise
+        controllers._finish_idempotent(entry, 200, stream=stream)
+        await _send_sse(send, receive, stream, _stream_events(stream, stream.start_id - 1, stream.session_id))
+
+    async def _start_stream_turn(self, chat_request):
+        """获取或创建会话，排队后在后台任务中开始一轮流式回复，返回已订阅的重放缓冲"""
+        session, error = controllers._resolve_session(chat_request, "/api/v1/chat/stream")
+        if error:
+            raise error
+
+        ticket = await _acquire_turn(chat_request, "/api/v1/chat/stream")
+        session_manager.add_message(session.session_id, Message.create_user_message(chat_request.message))
+
+        # 与Flask相同：后台任务读取回复写入重放缓冲，本连接只是订阅者
+        stream = stream_replay.start_turn(session.session_id)
+        stream.attach()
+        coalescer = ChunkCoalescer(chat_request.coalesce_ms, chat_request.coalesce_bytes)
+        task = asyncio.ensure_future(_pump_stream_turn(session, chat_request, ticket, stream, coalescer))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return stream
+
+    async def _resume_stream(self, scope, receive, send, session_id: str):
+        """恢复流式回复接口"""
+        headers = _headers(scope)
+        raw_id = headers.get("last-event-id") or _query(scope).get("last_event_id")
+        found, error = controllers._find_resumable_stream(session_id, raw_id)
+        if error:
+            raise error
+
+        stream, after_id = found
+        stream.attach()
+        await _send_sse(send, receive, stream, _stream_events(stream, after_id))
+
+    async def _submit_job(self, scope, receive, send):
+        """提交异步任务接口：任务线程只等待事件循环中的这一轮结束，Q Chat进程仍由asyncio驱动"""
+        data = _parse_json(await _read_body(receive))
+        chat_request, error = controllers._parse_chat_request(
+            data, "/api/v1/jobs", stream=True, client_id=_client_id(scope)
+        )
+        if error:
+            raise error
+        session, error = controllers._resolve_session(chat_request, "/api/v1/jobs")
+        if error:
+            raise error
+
+        def runner(job):
+            future = async_process_manager.run_in_loop(_run_job(job, session, chat_request))
+            if future is not None:
+                future.result()
+
+        try:
+            job = job_manager.submit(session.session_id, runner)
+        except JobQueueFullError as e:
+            error = RateLimitError("等待执行的任务过多，请稍后重试", retry_after=e.retry_after)
+            log_error(error, {"endpoint": "/api/v1/jobs", "session_id": session.session_id})
+            raise error
+        await self._send_json(scope, send, 202, job.to_dict(),
+                              [(b"location", f"/api/v1/jobs/{job.job_id}".encode("latin-1"))])
+
+    async def _stream_job(self, scope, receive, send, job_id: str):
+        """订阅任务回复接口"""
+        endpoint = f"/api/v1/jobs/{job_id}/stream"
+        job, error = controllers._find_job(job_id, endpoint)
+        if error:
+            raise error
+        raw_id = _headers(scope).get("last-event-id") or _query(scope).get("last_event_id")
+        after_id, error = controllers._parse_last_event_id(raw_id, endpoint)
+        if error:
+            raise error
+
+        job.attach()
+        await _send_sse(send, receive, job, _stream_events(job, after_id or 0))
+
+    # ---------- 响应 ----------
+
+    async def _send_json(self, scope, send, status: int, data: dict, extra_headers=None):
+        body = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        headers = [(b"content-type", b"application/json; charset=utf-8"),
+                   (b"content-length", str(len(body)).encode())]
+        headers += _cors_headers(scope)
+        headers += extra_headers or []
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _send_error(self, scope, send, error: APIError):
+        extra = []
+        if isinstance(error, RateLimitError):
+            extra.append((b"retry-after", str(error.retry_after).encode()))
+        await self._send_json(scope, send, error.http_status, error.to_dict(), extra)
+
+    # ---------- 其他接口交给Flask ----------
+
+    async def _call_flask(self, scope, receive, send):
+        """在线程池中调用Flask应用（只用于非流式接口）"""
+        environ = _wsgi_environ(scope, await _read_body(receive))
+        loop = asyncio.get_running_loop()
+        status, headers, body = await loop.run_in_executor(self._executor, _run_wsgi, self.flask_app, environ)
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+async def _acquire_turn(chat_request, endpoint: str, default_priority: str = DEFAULT_PRIORITY):
+    """为会话排队获取一轮对话的执行权，再等待全局准入，排队期间不占用线程"""
+    session_id = chat_request.session_id
+    try:
+        ticket = await turn_scheduler.acquire_async(session_id)
+    except TurnQueueFullError as e:
+        error = RateLimitError("该会话排队的请求过多，请等待当前回复完成", retry_after=e.retry_after)
+    except TurnQueueTimeoutError as e:
+        error = handle_qcli_error(e)
+    else:
+        try:
+            controllers._admit_turn(ticket, await admission_controller.acquire_async(
+                chat_request.client_id, chat_request.priority or default_priority
+            ))
+            return ticket
+        except AdmissionRejectedError as e:
+            turn_scheduler.release(ticket)
+            error = controllers._admission_error(e)
+        except asyncio.CancelledError:
+            turn_scheduler.release(ticket)
+            raise
+    log_error(error, {"endpoint": endpoint, "session_id": session_id})
+    raise error
+
+
+async def _pump_stream_turn(session, chat_request, ticket, stream, coalescer: ChunkCoalescer):
+    """在后台读取一轮流式回复并写入重放缓冲（持有该会话的执行权直到本轮结束）"""
+    process = None
+    try:
+        process = await async_process_manager.get_or_create_process_async(
+            session.session_id, work_directory=session.work_directory, lease=True
+        )
+        if not await process.send_message_async(chat_request.message):
+            raise RuntimeError("发送消息到Q CLI进程失败")
+
+        full_response = []
+        async for chunk in process.read_response_async(coalescer, heartbeat=controllers._STREAM_PUMP_TICK):
+            if stream.abandoned(config.STREAM_RESUME_GRACE):
+                # 客户端断开且没有在等待时间内重新连接，中断Q Chat本轮生成
+                await process.cancel_turn_async()
+                stream.append(controllers._CANCELLED_EVENT)
+                return
+            if not chunk:
+                continue
+            full_response.append(chunk)
+            stream.append({'message': chunk, 'type': 'chunk'})
+
+        stream.append(controllers._complete_stream_turn(session.session_id, full_response, ticket))
+
+    except Exception as e:
+        stream.append(controllers._stream_error_event(e, session.session_id, chat_request))
+    finally:
+        if process is not None:
+            async_process_manager.release_process(process)
+        stream.finish()
+        controllers._release_turn(ticket)
+
+
+async def _run_job(job, session, chat_request):
+    """在事件循环中执行异步任务的一轮对话"""
+    try:
+        ticket = await _acquire_turn(chat_request, "/api/v1/jobs", default_priority="low")
+    except APIError as error:
+        job.append({'error': error.message, 'code': error.code, 'suggestions': error.suggestions, 'type': 'error'})
+        return
+    session_manager.add_message(session.session_id, Message.create_user_message(chat_request.message))
+    coalescer = ChunkCoalescer(chat_request.coalesce_ms, chat_request.coalesce_bytes)
+    await _pump_stream_turn(session, chat_request, ticket, job, coalescer)
+
+
+async def _stream_events(stream, after_id: int, session_id: str = None):
+    """controllers._stream_events的asyncio版本：等待新事件时不占用线程"""
+    loop = asyncio.get_running_loop()
+    ready = asyncio.Event()
+
+    def notify():
+        loop.call_soon_threadsafe(ready.set)
+
+    stream.add_listener(notify)
+    try:
+        if session_id:
+            yield controllers._session_event(session_id)
+
+        heartbeat = config.SSE_HEARTBEAT_INTERVAL or None
+        while True:
+            ready.clear()
+            events, finished = stream.read(after_id, timeout=0)
+            if finished:
+                return
+            if not events:
+                try:
+                    await asyncio.wait_for(ready.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield controllers.SSE_HEARTBEAT
+                continue
+            for event_id, event in events:
+                after_id = event_id
+                yield controllers._sse_event(event_id, event)
+    finally:
+        stream.remove_listener(notify)
+
+
+async def _send_sse(send, receive, stream, events, extra_headers=None):
+    """发送SSE响应，同时监听客户端断开；结束时登记订阅者离开"""
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    iterator = events.__aiter__()
+    next_event = None
+    try:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/event-stream; charset=utf-8")] + [
+                (name.lower().encode(), value.encode()) for name, value in controllers.SSE_HEADERS.items()
+            ] + (extra_headers or [])
+        })
+        while True:
+            next_event = asyncio.ensure_future(iterator.__anext__())
+            await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not next_event.done():
+                break  # 客户端已断开
+            try:
+                chunk = next_event.result()
+            except StopAsyncIteration:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                break
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+    finally:
+        disconnected.cancel()
+        if next_event is not None and not next_event.done():
+            # 生成器正在等待新事件，取消后才能关闭
+            next_event.cancel()
+            await asyncio.wait({next_event})
+        await iterator.aclose()
+        stream.detach()
+
+
+async def _wait_idempotent(entry, endpoint: str) -> None:
+    """等待相同幂等键的第一次请求得到结果，等待期间不占用线程；超时抛出409错误"""
+    grant = _AsyncGrant()
+    entry.add_listener(grant.set)
+    if not await grant.wait(idempotency_store.wait_timeout):
+        entry.remove_listener(grant.set)
+        idempotency_store.record_wait_timeout()
+        raise controllers._idempotent_in_progress(endpoint)
+
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _read_body(receive) -> bytes:
+    """读取完整请求体"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+def _parse_json(body: bytes):
+    """与 request.get_json(force=True, silent=True) 一致：解析失败返回None"""
+    try:
+        return json.loads(body.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _headers(scope) -> dict:
+    return {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+
+
+def _client_id(scope) -> str:
+    """与 controllers._client_id 相同的客户端标识"""
+    headers = _headers(scope)
+    client = scope.get("client") or ("", 0)
+    return client_identity(headers.get(API_KEY_HEADER.lower()), headers.get("x-forwarded-for"), client[0])
+
+
+def _check_rate_limit(scope, send):
+    """
+    与Flask限流中间件相同的检查
+
+    返回:
+        (在响应头中附带RateLimit-*头的send, 超出限额时的RateLimitError)
+    """
+    headers = _headers(scope)
+    client = scope.get("client") or ("", 0)
+    decision = rate_limiter.check(scope["method"], scope["path"], headers.get(API_KEY_HEADER.lower()),
+                                  headers.get("x-forwarded-for"), client[0])
+    if decision is None:
+        return send, None
+    extra = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in decision.headers().items()]
+
+    async def send_with_headers(message):
+        if message["type"] == "http.response.start":
+            present = {name for name, _ in message.get("headers", [])}
+            message = dict(message, headers=list(message.get("headers", [])) +
+                           [(name, value) for name, value in extra if name not in present])
+        await send(message)
+
+    if not decision.allowed:
+        return send_with_headers, RateLimitError("请求过于频繁，请稍后重试", retry_after=decision.retry_after)
+    return send_with_headers, None
+
+
+def _query(scope) -> dict:
+    return {key: values[-1] for key, values in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+
+
+def _cors_headers(scope) -> list:
+    """与Flask应用的CORS配置一致"""
+    origin = _headers(scope).get("origin")
+    if origin not in CORS_ORIGINS:
+        return []
+    return [(b"access-control-allow-origin", origin.encode("latin-1")),
+            (b"access-control-allow-credentials", b"true"),
+            (b"vary", b"Origin")]
+
+
+def _wsgi_environ(scope, body: bytes) -> dict:
+    """把ASGI请求转换为WSGI environ"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "CONTENT_LENGTH": str(len(body)),
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _run_wsgi(app, environ: dict):
+    """调用WSGI应用并收集完整响应（在线程池中执行）"""
+    response = {}
+    chunks = []
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = headers
+        return chunks.append
+
+    result = app(environ, start_response)
+    try:
+        for chunk in result:
+            chunks.append(chunk)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], b"".join(chunks)
+
+
+def create_asgi_app(flask_app=None) -> ASGIApp:
+    """创建ASGI应用实例"""
+    return ASGIApp(flask_app)
+
+
+def main():
+    """使用uvicorn运行ASGI服务"""
+    try:
+        import uvicorn
+    except ImportError:
+        print("ASGI模式需要安装uvicorn: pip install uvicorn")
+        sys.exit(1)
+
+    config.validate()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    logger.info(f"启动Amazon Q CLI API服务 (ASGI)... HOST={config.HOST}, PORT={config.PORT}")
+    uvicorn.run(create_asgi_app(), host=config.HOST, port=config.PORT, log_level="info")
+
+
+if __name__ == "__main__":
+    main()
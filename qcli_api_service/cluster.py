@@ -0,0 +1,336 @@
+"""
+多worker启动器
+
+会话、对话历史和Q Chat进程都保存在worker进程内存中，不能让多个worker随意分担请求。
+启动器运行N个worker（各自监听 127.0.0.1:WORKER_BASE_PORT+编号），前端的路由进程监听
+HOST:PORT，按会话ID把请求转发到拥有该会话的worker：
+- 路径中带会话ID或任务ID（/api/v1/sessions/{session_id}/...、/api/v1/jobs/{job_id}/...）
+  或请求体中带 session_id 的请求，按 worker_for_session(ID) 转发
+- 其余请求（创建会话、不带会话ID的首次对话、健康检查等）轮流转发；worker创建的会话ID
+  总是哈希到自己，之后的请求自然回到同一个worker
+- 不带会话ID但带 Idempotency-Key 的请求按幂等键哈希转发，重试的请求回到保存结果的worker
+
+worker异常退出时由启动器重新拉起（该worker上的会话失效）。
+
+运行方式：
+    WORKERS=4 python -m qcli_api_service.cluster
+    WORKERS=4 python -m qcli_api_service.cluster --asgi   # worker使用ASGI模式（需要安装uvicorn）
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import re
+import signal
+import subprocess
+import sys
+import time
+from http import HTTPStatus
+from typing import Dict, List, Optional
+from qcli_api_service.config import config
+from qcli_api_service.utils.errors import APIError, ServiceError
+from qcli_api_service.utils.session_routing import worker_for_session
+
+logger = logging.getLogger(__name__)
+
+# 会话ID和任务ID都哈希到所属worker
+_SESSION_PATH = re.compile(r'^/api/v1/(?:sessions|jobs)/([^/]+)')
+
+# 请求头和请求体的大小上限
+_MAX_HEADER_BYTES = 64 * 1024
+_MAX_BODY_BYTES = 8 * 1024 * 1024
+
+# 转发时去掉的逐跳请求头，统一改为 Connection: close（每个连接只转发一个请求）
+_HOP_HEADERS = {"connection", "keep-alive", "proxy-connection", "te", "upgrade"}
+
+_COPY_SIZE = 65536
+
+
+def worker_port(index: int) -> int:
+    """worker监听的端口"""
+    return (config.WORKER_BASE_PORT or config.PORT + 1) + index
+
+
+def route_key(path: str, body: bytes) -> Optional[str]:
+    """请求所属的会话ID，没有会话ID时返回None"""
+    match = _SESSION_PATH.match(path)
+    if match:
+        return match.group(1)
+    if not body:
+        return None
+    try:
+        data = json.loads(body.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    session_id = data.get("session_id") if isinstance(data, dict) else None
+    return session_id if isinstance(session_id, str) and session_id else None
+
+
+class SessionRouter:
+    """按会话ID把HTTP请求转发到固定worker的路由"""
+
+    def __init__(self, ports: List[int], host: str = "127.0.0.1"):
+        self.ports = ports
+        self.host = host
+        self._round_robin = itertools.count()
+
+        # 统计信息
+        self.requests = [0] * len(ports)
+        self.routed_by_session = 0
+        self.upstream_errors = 0
+
+    def select_worker(self, path: str, body: bytes, idempotency_key: str = None) -> int:
+        """选择处理请求的worker"""
+        session_id = route_key(path, body)
+        if session_id is None:
+            if idempotency_key:
+                return worker_for_session(idempotency_key, len(self.ports))
+            return next(self._round_robin) % len(self.ports)
+        self.routed_by_session += 1
+        return worker_for_session(session_id, len(self.ports))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个客户端连接（只转发一个请求）"""
+        upstream_writer = None
+        try:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.LimitOverrunError:
+                raise APIError("请求头过大", "REQUEST_HEADER_TOO_LARGE", http_status=431)
+            except asyncio.IncompleteReadError:
+                return
+
+            request_line, headers = _parse_head(head)
+            names = {name.lower(): value for name, value in headers}
+            if "chunked" in names.get("transfer-encoding", "").lower():
+                raise APIError("不支持分块传输的请求体，请提供Content-Length", "LENGTH_REQUIRED", http_status=411)
+            try:
+                length = int(names.get("content-length", "0"))
+            except ValueError:
+                raise APIError("无效的Content-Length", "INVALID_REQUEST", http_status=400)
+            if length > _MAX_BODY_BYTES:
+                raise APIError("请求体过大", "REQUEST_TOO_LARGE", http_status=413)
+            body = await reader.readexactly(length) if length else b""
+
+            parts = request_line.split(" ")
+            if len(parts) != 3:
+                raise APIError("无效的HTTP请求", "INVALID_REQUEST", http_status=400)
+            index = self.select_worker(parts[1].split("?", 1)[0], body, names.get("idempotency-key"))
+            self.requests[index] += 1
+
+            try:
+                upstream_reader, upstream_writer = await asyncio.open_connection(self.host, self.ports[index])
+            except OSError as e:
+                self.upstream_errors += 1
+                logger.warning(f"无法连接worker {index} (端口 {self.ports[index]}): {e}")
+                raise ServiceError(f"会话所在的worker {index} 暂时不可用", service="WORKER")
+
+            upstream_writer.write(_build_head(request_line, headers, writer.get_extra_info("peername")) + body)
+            await upstream_writer.drain()
+            await _relay(reader, writer, upstream_reader, upstream_writer)
+
+        except APIError as e:
+            await _send_error(writer, e)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # 客户端断开，或路由进程关闭时仍有连接未结束
+            pass
+        finally:
+            for stream in (upstream_writer, writer):
+                if stream is not None:
+                    stream.close()
+
+    def get_stats(self) -> dict:
+        """获取路由统计信息"""
+        return {
+            "workers": len(self.ports),
+            "requests": list(self.requests),
+            "routed_by_session": self.routed_by_session,
+            "upstream_errors": self.upstream_errors
+        }
+
+
+def _parse_head(head: bytes):
+    """解析请求行和请求头"""
+    lines = head.decode("latin-1").split("\r\n")
+    headers = []
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, _, value = line.partition(":")
+        headers.append((name.strip(), value.strip()))
+    return lines[0], headers
+
+
+def _build_head(request_line: str, headers, peer) -> bytes:
+    """生成转发给worker的请求头"""
+    lines = [request_line]
+    forwarded_for = peer[0] if peer else ""
+    for name, value in headers:
+        lowered = name.lower()
+        if lowered in _HOP_HEADERS:
+            continue
+        if lowered == "x-forwarded-for":
+            forwarded_for = f"{value}, {forwarded_for}"
+            continue
+        lines.append(f"{name}: {value}")
+    lines.append(f"X-Forwarded-For: {forwarded_for}")
+    lines.append("Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _relay(reader, writer, upstream_reader, upstream_writer):
+    """双向转发，任意一方关闭即结束（客户端断开时worker随之检测到断开）"""
+    async def copy(source, target):
+        while True:
+            data = await source.read(_COPY_SIZE)
+            if not data:
+                return
+            target.write(data)
+            await target.drain()
+
+    tasks = [asyncio.ensure_future(copy(upstream_reader, writer)),
+             asyncio.ensure_future(copy(reader, upstream_writer))]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _send_error(writer, error: APIError):
+    """直接在路由返回错误（与Flask应用相同的错误格式）"""
+    body = json.dumps(error.to_dict(), ensure_ascii=False, indent=2).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {error.http_status} {HTTPStatus(error.http_status).phrase}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n"
+    )
+    try:
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+
+
+class WorkerSupervisor:
+    """启动worker进程并在异常退出时重新拉起"""
+
+    def __init__(self, workers: int, asgi: bool = False):
+        self.workers = workers
+        self.asgi = asgi
+        self.processes: Dict[int, subprocess.Popen] = {}
+        self.restarts = 0
+        self._stopping = False
+
+    def start_worker(self, index: int) -> None:
+        env = dict(os.environ)
+        env.update({
+            "HOST": "127.0.0.1",
+            "PORT": str(worker_port(index)),
+            "WORKERS": str(self.workers),
+            "WORKER_INDEX": str(index),
+            "DEBUG": "false",
+        })
+        command = [sys.executable, "-m", "qcli_api_service.cluster", "--worker"]
+        if self.asgi:
+            command.append("--asgi")
+        self.processes[index] = subprocess.Popen(command, env=env)
+        logger.info(f"启动worker {index} PID: {self.processes[index].pid}, 端口: {worker_port(index)}")
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            self.start_worker(index)
+
+    def check(self) -> None:
+        """重新拉起已退出的worker"""
+        if self._stopping:
+            return
+        for index, process in list(self.processes.items()):
+            if process.poll() is not None:
+                logger.error(f"worker {index} 已退出 (返回码 {process.returncode})，重新启动")
+                self.restarts += 1
+                self.start_worker(index)
+
+    def stop(self, timeout: float = None) -> None:
+        """通知所有worker关闭，超时后强制结束"""
+        self._stopping = True
+        timeout = config.SHUTDOWN_TIMEOUT + 2 if timeout is None else timeout
+        for process in self.processes.values():
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        deadline = time.time() + timeout
+        for process in self.processes.values():
+            try:
+                process.wait(timeout=max(deadline - time.time(), 0.1))
+            except subprocess.TimeoutExpired:
+                process.kill()
+        logger.info("所有worker已关闭")
+
+
+async def _serve(supervisor: WorkerSupervisor) -> None:
+    router = SessionRouter([worker_port(index) for index in range(supervisor.workers)])
+    server = await asyncio.start_server(
+        router.handle, config.HOST, config.PORT, limit=_MAX_HEADER_BYTES, backlog=4096
+    )
+    logger.info(f"路由进程监听 {config.HOST}:{config.PORT}，{supervisor.workers} 个worker")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+
+    async with server:
+        while not stop.is_set():
+            supervisor.check()
+            try:
+                await asyncio.wait_for(stop.wait(), 1.0)
+            except asyncio.TimeoutError:
+                pass
+    logger.info(f"路由进程关闭: {router.get_stats()}")
+
+
+def _run_worker(asgi: bool) -> None:
+    """worker进程入口：与单进程服务相同，只是监听启动器分配的端口"""
+    if asgi:
+        from qcli_api_service.asgi import main as asgi_main
+        asgi_main()
+        return
+
+    from qcli_api_service.app import create_app, install_shutdown_handlers
+    logger.info(f"启动worker {config.WORKER_INDEX}/{config.WORKERS}，端口 {config.PORT}")
+    app = create_app()
+    install_shutdown_handlers()
+    app.run(host=config.HOST, port=config.PORT, debug=False, threaded=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Amazon Q CLI API服务多worker启动器")
+    parser.add_argument("--asgi", action="store_true", help="worker使用ASGI模式（需要安装uvicorn）")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    config.validate()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    if args.worker:
+        _run_worker(args.asgi)
+        return
+
+    supervisor = WorkerSupervisor(config.WORKERS, asgi=args.asgi)
+    supervisor.start()
+    try:
+        asyncio.run(_serve(supervisor))
+    finally:
+        supervisor.stop()
+
+
+if __name__ == "__main__":
+    main()
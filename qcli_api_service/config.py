@@ -4,7 +4,9 @@
 管理应用的核心配置项，支持环境变量配置。
 """
 
+import ipaddress
 import os
+import re
 from dataclasses import dataclass
 
 
@@ -35,6 +37,8 @@ class Config:
     # Q CLI配置
     QCLI_TIMEOUT: int = 45  # Q CLI调用超时时间，单位：秒（根据实际测试调整）
     FORCE_CHINESE: bool = True  # 强制使用中文回复
+    QCLI_PROMPT_PATTERN: str = r"^(\[[^\]]*\]\s*)?!?>\s*$"  # Q Chat输入提示符，出现即表示回复结束
+    QCLI_COMPLETION_SENTINEL: str = ""  # 可选的回复结束标记，为空时只依赖提示符检测
     
     # AWS配置
     AWS_DEFAULT_REGION: str = "us-east-1"  # 默认AWS区域，减少网络延迟
@@ -43,6 +47,87 @@ class Config:
     SESSIONS_BASE_DIR: str = "sessions"  # 会话基础目录
     AUTO_CLEANUP_SESSIONS: bool = True  # 自动清理过期会话目录
     
+    # 后台维护配置
+    MAINTENANCE_INTERVAL: int = 60  # 过期会话清理间隔，单位：秒，0表示禁用
+    MAINTENANCE_JITTER: float = 0.1  # 清理间隔的随机抖动比例
+    
+    # 进程容量配置
+    MAX_PROCESSES: int = 100  # 同时存活的Q Chat进程上限，0表示不限制
+    PROCESS_RESUME: bool = True  # 被驱逐的会话重建进程时使用 q chat --resume 恢复对话
+    
+    # 预热进程池配置
+    PROCESS_POOL_SIZE: int = 0  # 预热的空闲Q Chat进程数，0表示禁用
+    PROCESS_POOL_LOW_WATER: int = 1  # 空闲进程低于该值时触发补充
+    PROCESS_POOL_REFILL_CONCURRENCY: int = 2  # 同时启动的预热进程数
+    
+    # 进程连接方式
+    QCLI_TRANSPORT: str = "pipe"  # pipe：管道；pty：伪终端（逐行输出并显示交互提示符）
+    QCLI_PTY_COLUMNS: int = 200  # 伪终端列数，较宽以减少自动换行
+    QCLI_PTY_ROWS: int = 50  # 伪终端行数
+    
+    # 诊断配置
+    STDERR_BUFFER_LINES: int = 200  # 每个会话保留的最近stderr行数
+    
+    # 流式输出配置
+    STREAM_LATENCY_BUDGET_MS: int = 50  # 未换行的部分输出最多等待多久即发给客户端，单位：毫秒
+    STREAM_COALESCE_MS: int = 50  # SSE事件合并的时间预算，小片段最多等待多久合并发出，0表示不合并，单位：毫秒
+    STREAM_COALESCE_BYTES: int = 4096  # SSE事件合并的字节预算，累积到该大小立即发出，0表示不限
+    SSE_HEARTBEAT_INTERVAL: int = 15  # 流式响应没有内容时发送心跳注释的间隔，0表示不发送，单位：秒
+    TURN_CANCEL_TIMEOUT: int = 5  # 客户端断开后中断本轮生成并等待Q Chat回到提示符的最长时间，单位：秒
+    STREAM_REPLAY_TURNS: int = 2  # 每个会话保留最近几轮流式回复的事件，用于断线后按Last-Event-ID恢复
+    STREAM_REPLAY_EVENTS: int = 4096  # 每轮最多保留的事件数
+    STREAM_RESUME_GRACE: int = 30  # 客户端断开后等待重新连接的时间，超时仍无连接则中断本轮生成，0表示立即中断，单位：秒
+    DEDUP_WINDOW_LINES: int = 3  # 连续多少行与之前的输出相同即判定为重复块并跳过，0表示禁用去重
+    
+    # 会话请求排队配置
+    SESSION_QUEUE_DEPTH: int = 4  # 每个会话在进行中的一轮之外最多排队的请求数
+    SESSION_QUEUE_TIMEOUT: int = 600  # 排队等待的最长时间，单位：秒
+    
+    # 全局准入控制（所有会话和无状态调用同时生成回复的轮次）
+    MAX_CONCURRENT_TURNS: int = 0  # 同时生成回复的轮次上限，0表示按CPU和内存自动计算
+    ADMISSION_TURNS_PER_CPU: int = 4  # 自动计算时每个CPU允许的轮次数
+    QCLI_PROCESS_MEMORY_MB: int = 150  # 自动计算时每个生成中的Q Chat进程预留的内存，单位：MB，0表示不按内存限制
+    ADMISSION_QUEUE_DEPTH: int = 100  # 全局排队上限，超过时返回503
+    ADMISSION_CLIENT_QUEUE_DEPTH: int = 10  # 单个客户端排队上限，超过时返回429
+    ADMISSION_QUEUE_TIMEOUT: int = 60  # 等待准入的最长时间，超时返回503，单位：秒
+    
+    # 客户端标识（准入控制、限流、幂等键按客户端区分）
+    TRUSTED_PROXIES: str = ""  # 可信反向代理的IP或CIDR（逗号分隔），只有对端是可信代理时才采用X-Forwarded-For
+    
+    # 请求频率限制（按API密钥和客户端IP的令牌桶）
+    RATE_LIMIT_ENABLED: bool = False  # 是否开启限流，默认关闭
+    RATE_LIMIT_RULES: str = "POST /api/v1/chat/stream=10/60,POST /api/v1/chat=30/60,POST /api/v1/jobs=30/60"  # 逗号分隔的 [方法 ]路径=次数/秒数，路径以*结尾时按前缀匹配
+    RATE_LIMIT_BACKEND: str = "memory"  # 计数后端：memory（每个进程各自计数）或 redis（多worker共享）
+    RATE_LIMIT_REDIS_URL: str = "redis://localhost:6379/0"  # RATE_LIMIT_BACKEND=redis 时使用的Redis地址
+    
+    # 聊天请求幂等键（Idempotency-Key请求头）
+    IDEMPOTENCY_TTL: int = 3600  # 带幂等键的请求结果保留的时间，单位：秒
+    IDEMPOTENCY_MAX_KEYS: int = 10000  # 保留的幂等键数上限，超出时淘汰最久未使用的已完成请求，0表示不限
+    
+    # 异步任务配置（POST /api/v1/jobs）
+    JOB_WORKERS: int = 4  # 同时执行的任务数（线程池大小）
+    JOB_QUEUE_DEPTH: int = 100  # 等待执行的任务数上限，超过时返回429
+    JOB_RESULT_TTL: int = 3600  # 任务结束后结果保留的时间，单位：秒
+    JOB_MAX_WAIT: int = 30  # 长轮询（?wait=秒）的最长等待时间，单位：秒
+    
+    # 无状态对话回复缓存（QCLIService.chat）
+    RESPONSE_CACHE_ENABLED: bool = False  # 缓存相同问题的回复，默认关闭
+    RESPONSE_CACHE_TTL: int = 600  # 缓存条目的有效期，单位：秒
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1000  # 缓存条目数上限，超出时淘汰最久未使用的条目，0表示不限
+    RESPONSE_CACHE_MAX_BYTES: int = 16 * 1024 * 1024  # 缓存回复的总字节数上限，0表示不限
+    RESPONSE_CACHE_SIMILARITY: float = 0.0  # 近似重复问题命中缓存的最低相似度（0-1，字符3-gram的Jaccard相似度），0表示只精确匹配
+    
+    # ASGI服务配置（python -m qcli_api_service.asgi）
+    ASGI_WSGI_THREADS: int = 16  # 交给Flask处理的非聊天接口使用的线程数
+    
+    # 多worker配置（python -m qcli_api_service.cluster）
+    WORKERS: int = 1  # worker进程数，会话按ID哈希固定到其中一个worker
+    WORKER_INDEX: int = 0  # 当前worker的编号，由启动器为每个worker设置
+    WORKER_BASE_PORT: int = 0  # worker监听 127.0.0.1:WORKER_BASE_PORT+编号，0表示从PORT+1开始
+    
+    # 关闭配置
+    SHUTDOWN_TIMEOUT: int = 10  # 服务关闭时终止所有Q Chat进程的总时限，单位：秒
+    
     @classmethod
     def from_env(cls) -> 'Config':
         """从环境变量创建配置实例"""
@@ -54,9 +139,60 @@ class Config:
             MAX_HISTORY_LENGTH=int(os.getenv("MAX_HISTORY_LENGTH", str(cls.MAX_HISTORY_LENGTH))),
             QCLI_TIMEOUT=int(os.getenv("QCLI_TIMEOUT", str(cls.QCLI_TIMEOUT))),
             FORCE_CHINESE=os.getenv("FORCE_CHINESE", "true").lower() == "true",
+            QCLI_PROMPT_PATTERN=os.getenv("QCLI_PROMPT_PATTERN", cls.QCLI_PROMPT_PATTERN),
+            QCLI_COMPLETION_SENTINEL=os.getenv("QCLI_COMPLETION_SENTINEL", cls.QCLI_COMPLETION_SENTINEL),
             AWS_DEFAULT_REGION=os.getenv("AWS_DEFAULT_REGION", cls.AWS_DEFAULT_REGION),
             SESSIONS_BASE_DIR=os.getenv("SESSIONS_BASE_DIR", cls.SESSIONS_BASE_DIR),
             AUTO_CLEANUP_SESSIONS=os.getenv("AUTO_CLEANUP_SESSIONS", "true").lower() == "true",
+            MAINTENANCE_INTERVAL=int(os.getenv("MAINTENANCE_INTERVAL", str(cls.MAINTENANCE_INTERVAL))),
+            MAINTENANCE_JITTER=float(os.getenv("MAINTENANCE_JITTER", str(cls.MAINTENANCE_JITTER))),
+            MAX_PROCESSES=int(os.getenv("MAX_PROCESSES", str(cls.MAX_PROCESSES))),
+            PROCESS_RESUME=os.getenv("PROCESS_RESUME", "true").lower() == "true",
+            PROCESS_POOL_SIZE=int(os.getenv("PROCESS_POOL_SIZE", str(cls.PROCESS_POOL_SIZE))),
+            PROCESS_POOL_LOW_WATER=int(os.getenv("PROCESS_POOL_LOW_WATER", str(cls.PROCESS_POOL_LOW_WATER))),
+            PROCESS_POOL_REFILL_CONCURRENCY=int(os.getenv("PROCESS_POOL_REFILL_CONCURRENCY", str(cls.PROCESS_POOL_REFILL_CONCURRENCY))),
+            QCLI_TRANSPORT=os.getenv("QCLI_TRANSPORT", cls.QCLI_TRANSPORT).lower(),
+            QCLI_PTY_COLUMNS=int(os.getenv("QCLI_PTY_COLUMNS", str(cls.QCLI_PTY_COLUMNS))),
+            QCLI_PTY_ROWS=int(os.getenv("QCLI_PTY_ROWS", str(cls.QCLI_PTY_ROWS))),
+            STDERR_BUFFER_LINES=int(os.getenv("STDERR_BUFFER_LINES", str(cls.STDERR_BUFFER_LINES))),
+            STREAM_LATENCY_BUDGET_MS=int(os.getenv("STREAM_LATENCY_BUDGET_MS", str(cls.STREAM_LATENCY_BUDGET_MS))),
+            STREAM_COALESCE_MS=int(os.getenv("STREAM_COALESCE_MS", str(cls.STREAM_COALESCE_MS))),
+            STREAM_COALESCE_BYTES=int(os.getenv("STREAM_COALESCE_BYTES", str(cls.STREAM_COALESCE_BYTES))),
+            SSE_HEARTBEAT_INTERVAL=int(os.getenv("SSE_HEARTBEAT_INTERVAL", str(cls.SSE_HEARTBEAT_INTERVAL))),
+            TURN_CANCEL_TIMEOUT=int(os.getenv("TURN_CANCEL_TIMEOUT", str(cls.TURN_CANCEL_TIMEOUT))),
+            STREAM_REPLAY_TURNS=int(os.getenv("STREAM_REPLAY_TURNS", str(cls.STREAM_REPLAY_TURNS))),
+            STREAM_REPLAY_EVENTS=int(os.getenv("STREAM_REPLAY_EVENTS", str(cls.STREAM_REPLAY_EVENTS))),
+            STREAM_RESUME_GRACE=int(os.getenv("STREAM_RESUME_GRACE", str(cls.STREAM_RESUME_GRACE))),
+            DEDUP_WINDOW_LINES=int(os.getenv("DEDUP_WINDOW_LINES", str(cls.DEDUP_WINDOW_LINES))),
+            SESSION_QUEUE_DEPTH=int(os.getenv("SESSION_QUEUE_DEPTH", str(cls.SESSION_QUEUE_DEPTH))),
+            SESSION_QUEUE_TIMEOUT=int(os.getenv("SESSION_QUEUE_TIMEOUT", str(cls.SESSION_QUEUE_TIMEOUT))),
+            MAX_CONCURRENT_TURNS=int(os.getenv("MAX_CONCURRENT_TURNS", str(cls.MAX_CONCURRENT_TURNS))),
+            ADMISSION_TURNS_PER_CPU=int(os.getenv("ADMISSION_TURNS_PER_CPU", str(cls.ADMISSION_TURNS_PER_CPU))),
+            QCLI_PROCESS_MEMORY_MB=int(os.getenv("QCLI_PROCESS_MEMORY_MB", str(cls.QCLI_PROCESS_MEMORY_MB))),
+            ADMISSION_QUEUE_DEPTH=int(os.getenv("ADMISSION_QUEUE_DEPTH", str(cls.ADMISSION_QUEUE_DEPTH))),
+            ADMISSION_CLIENT_QUEUE_DEPTH=int(os.getenv("ADMISSION_CLIENT_QUEUE_DEPTH", str(cls.ADMISSION_CLIENT_QUEUE_DEPTH))),
+            ADMISSION_QUEUE_TIMEOUT=int(os.getenv("ADMISSION_QUEUE_TIMEOUT", str(cls.ADMISSION_QUEUE_TIMEOUT))),
+            TRUSTED_PROXIES=os.getenv("TRUSTED_PROXIES", cls.TRUSTED_PROXIES),
+            RATE_LIMIT_ENABLED=os.getenv("RATE_LIMIT_ENABLED", "false").lower() == "true",
+            RATE_LIMIT_RULES=os.getenv("RATE_LIMIT_RULES", cls.RATE_LIMIT_RULES),
+            RATE_LIMIT_BACKEND=os.getenv("RATE_LIMIT_BACKEND", cls.RATE_LIMIT_BACKEND).lower(),
+            RATE_LIMIT_REDIS_URL=os.getenv("RATE_LIMIT_REDIS_URL", cls.RATE_LIMIT_REDIS_URL),
+            IDEMPOTENCY_TTL=int(os.getenv("IDEMPOTENCY_TTL", str(cls.IDEMPOTENCY_TTL))),
+            IDEMPOTENCY_MAX_KEYS=int(os.getenv("IDEMPOTENCY_MAX_KEYS", str(cls.IDEMPOTENCY_MAX_KEYS))),
+            JOB_WORKERS=int(os.getenv("JOB_WORKERS", str(cls.JOB_WORKERS))),
+            JOB_QUEUE_DEPTH=int(os.getenv("JOB_QUEUE_DEPTH", str(cls.JOB_QUEUE_DEPTH))),
+            JOB_RESULT_TTL=int(os.getenv("JOB_RESULT_TTL", str(cls.JOB_RESULT_TTL))),
+            JOB_MAX_WAIT=int(os.getenv("JOB_MAX_WAIT", str(cls.JOB_MAX_WAIT))),
+            RESPONSE_CACHE_ENABLED=os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true",
+            RESPONSE_CACHE_TTL=int(os.getenv("RESPONSE_CACHE_TTL", str(cls.RESPONSE_CACHE_TTL))),
+            RESPONSE_CACHE_MAX_ENTRIES=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", str(cls.RESPONSE_CACHE_MAX_ENTRIES))),
+            RESPONSE_CACHE_MAX_BYTES=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(cls.RESPONSE_CACHE_MAX_BYTES))),
+            RESPONSE_CACHE_SIMILARITY=float(os.getenv("RESPONSE_CACHE_SIMILARITY", str(cls.RESPONSE_CACHE_SIMILARITY))),
+            ASGI_WSGI_THREADS=int(os.getenv("ASGI_WSGI_THREADS", str(cls.ASGI_WSGI_THREADS))),
+            WORKERS=int(os.getenv("WORKERS", str(cls.WORKERS))),
+            WORKER_INDEX=int(os.getenv("WORKER_INDEX", str(cls.WORKER_INDEX))),
+            WORKER_BASE_PORT=int(os.getenv("WORKER_BASE_PORT", str(cls.WORKER_BASE_PORT))),
+            SHUTDOWN_TIMEOUT=int(os.getenv("SHUTDOWN_TIMEOUT", str(cls.SHUTDOWN_TIMEOUT))),
         )
     
     def validate(self) -> None:
@@ -72,6 +208,144 @@ class Config:
         
         if self.QCLI_TIMEOUT < 5:
             raise ValueError(f"Q CLI超时时间不能少于5秒，当前值: {self.QCLI_TIMEOUT}")
+        
+        try:
+            re.compile(self.QCLI_PROMPT_PATTERN)
+        except re.error as e:
+            raise ValueError(f"Q Chat提示符正则表达式无效: {e}")
+        
+        if self.MAINTENANCE_INTERVAL < 0:
+            raise ValueError(f"维护间隔不能为负数，当前值: {self.MAINTENANCE_INTERVAL}")
+        
+        if not 0 <= self.MAINTENANCE_JITTER < 1:
+            raise ValueError(f"维护间隔抖动比例必须在0到1之间，当前值: {self.MAINTENANCE_JITTER}")
+        
+        if self.MAX_PROCESSES < 0:
+            raise ValueError(f"进程数量上限不能为负数，当前值: {self.MAX_PROCESSES}")
+        
+        if self.PROCESS_POOL_SIZE < 0:
+            raise ValueError(f"预热进程池大小不能为负数，当前值: {self.PROCESS_POOL_SIZE}")
+        
+        if self.PROCESS_POOL_LOW_WATER < 0 or self.PROCESS_POOL_LOW_WATER > self.PROCESS_POOL_SIZE > 0:
+            raise ValueError(f"预热进程池低水位必须在0到池大小之间，当前值: {self.PROCESS_POOL_LOW_WATER}")
+        
+        if self.PROCESS_POOL_REFILL_CONCURRENCY < 1:
+            raise ValueError(f"预热进程补充并发数必须大于0，当前值: {self.PROCESS_POOL_REFILL_CONCURRENCY}")
+        
+        if self.QCLI_TRANSPORT not in ("pipe", "pty"):
+            raise ValueError(f"进程连接方式必须是pipe或pty，当前值: {self.QCLI_TRANSPORT}")
+        
+        if self.QCLI_PTY_COLUMNS < 20 or self.QCLI_PTY_ROWS < 5:
+            raise ValueError(f"伪终端大小过小，当前值: {self.QCLI_PTY_COLUMNS}x{self.QCLI_PTY_ROWS}")
+        
+        if self.STDERR_BUFFER_LINES < 0:
+            raise ValueError(f"stderr缓冲行数不能为负数，当前值: {self.STDERR_BUFFER_LINES}")
+        
+        if self.STREAM_LATENCY_BUDGET_MS < 0:
+            raise ValueError(f"流式输出延迟预算不能为负数，当前值: {self.STREAM_LATENCY_BUDGET_MS}")
+        
+        if not 0 <= self.STREAM_COALESCE_MS <= 1000:
+            raise ValueError(f"SSE合并时间预算必须在0到1000毫秒之间，当前值: {self.STREAM_COALESCE_MS}")
+        
+        if self.STREAM_COALESCE_BYTES < 0:
+            raise ValueError(f"SSE合并字节预算不能为负数，当前值: {self.STREAM_COALESCE_BYTES}")
+        
+        if self.SSE_HEARTBEAT_INTERVAL < 0:
+            raise ValueError(f"SSE心跳间隔不能为负数，当前值: {self.SSE_HEARTBEAT_INTERVAL}")
+        
+        if self.TURN_CANCEL_TIMEOUT < 1:
+            raise ValueError(f"取消对话的等待时间必须大于0，当前值: {self.TURN_CANCEL_TIMEOUT}")
+        
+        if self.STREAM_REPLAY_TURNS < 1:
+            raise ValueError(f"流式回复重放轮数必须大于0，当前值: {self.STREAM_REPLAY_TURNS}")
+        
+        if self.STREAM_REPLAY_EVENTS < 1:
+            raise ValueError(f"流式回复重放事件数必须大于0，当前值: {self.STREAM_REPLAY_EVENTS}")
+        
+        if self.STREAM_RESUME_GRACE < 0:
+            raise ValueError(f"流式回复恢复等待时间不能为负数，当前值: {self.STREAM_RESUME_GRACE}")
+        
+        if self.DEDUP_WINDOW_LINES < 0:
+            raise ValueError(f"去重窗口行数不能为负数，当前值: {self.DEDUP_WINDOW_LINES}")
+        
+        if self.SESSION_QUEUE_DEPTH < 0:
+            raise ValueError(f"会话排队深度不能为负数，当前值: {self.SESSION_QUEUE_DEPTH}")
+        
+        if self.SESSION_QUEUE_TIMEOUT < 1:
+            raise ValueError(f"排队等待时间必须大于0，当前值: {self.SESSION_QUEUE_TIMEOUT}")
+        
+        if self.MAX_CONCURRENT_TURNS < 0:
+            raise ValueError(f"并发轮次上限不能为负数，当前值: {self.MAX_CONCURRENT_TURNS}")
+        
+        if self.ADMISSION_TURNS_PER_CPU < 1:
+            raise ValueError(f"每个CPU的轮次数必须大于0，当前值: {self.ADMISSION_TURNS_PER_CPU}")
+        
+        if self.QCLI_PROCESS_MEMORY_MB < 0:
+            raise ValueError(f"Q Chat进程预留内存不能为负数，当前值: {self.QCLI_PROCESS_MEMORY_MB}")
+        
+        if self.ADMISSION_QUEUE_DEPTH < 0:
+            raise ValueError(f"全局排队上限不能为负数，当前值: {self.ADMISSION_QUEUE_DEPTH}")
+        
+        if self.ADMISSION_CLIENT_QUEUE_DEPTH < 0:
+            raise ValueError(f"客户端排队上限不能为负数，当前值: {self.ADMISSION_CLIENT_QUEUE_DEPTH}")
+        
+        if self.ADMISSION_QUEUE_TIMEOUT < 1:
+            raise ValueError(f"准入等待时间必须大于0，当前值: {self.ADMISSION_QUEUE_TIMEOUT}")
+        
+        for proxy in self.TRUSTED_PROXIES.split(","):
+            try:
+                if proxy.strip():
+                    ipaddress.ip_network(proxy.strip(), strict=False)
+            except ValueError:
+                raise ValueError(f"可信代理地址格式错误（应为IP或CIDR），当前值: {proxy.strip()}")
+        
+        if self.RATE_LIMIT_BACKEND not in ("memory", "redis"):
+            raise ValueError(f"限流后端必须是memory或redis，当前值: {self.RATE_LIMIT_BACKEND}")
+        
+        if self.IDEMPOTENCY_TTL < 1:
+            raise ValueError(f"幂等键保留时间必须大于0，当前值: {self.IDEMPOTENCY_TTL}")
+        
+        if self.IDEMPOTENCY_MAX_KEYS < 0:
+            raise ValueError(f"幂等键数上限不能为负数，当前值: {self.IDEMPOTENCY_MAX_KEYS}")
+        
+        if self.JOB_WORKERS < 1:
+            raise ValueError(f"任务线程数必须大于0，当前值: {self.JOB_WORKERS}")
+        
+        if self.JOB_QUEUE_DEPTH < 0:
+            raise ValueError(f"任务排队深度不能为负数，当前值: {self.JOB_QUEUE_DEPTH}")
+        
+        if self.JOB_RESULT_TTL < 1:
+            raise ValueError(f"任务结果保留时间必须大于0，当前值: {self.JOB_RESULT_TTL}")
+        
+        if self.JOB_MAX_WAIT < 0:
+            raise ValueError(f"长轮询等待时间不能为负数，当前值: {self.JOB_MAX_WAIT}")
+        
+        if self.RESPONSE_CACHE_TTL < 1:
+            raise ValueError(f"回复缓存有效期必须大于0，当前值: {self.RESPONSE_CACHE_TTL}")
+        
+        if self.RESPONSE_CACHE_MAX_ENTRIES < 0:
+            raise ValueError(f"回复缓存条目数上限不能为负数，当前值: {self.RESPONSE_CACHE_MAX_ENTRIES}")
+        
+        if self.RESPONSE_CACHE_MAX_BYTES < 0:
+            raise ValueError(f"回复缓存字节数上限不能为负数，当前值: {self.RESPONSE_CACHE_MAX_BYTES}")
+        
+        if not 0 <= self.RESPONSE_CACHE_SIMILARITY <= 1:
+            raise ValueError(f"近似重复相似度阈值必须在0-1范围内，当前值: {self.RESPONSE_CACHE_SIMILARITY}")
+        
+        if self.ASGI_WSGI_THREADS < 1:
+            raise ValueError(f"ASGI模式的WSGI线程数必须大于0，当前值: {self.ASGI_WSGI_THREADS}")
+        
+        if self.WORKERS < 1:
+            raise ValueError(f"worker数量必须大于0，当前值: {self.WORKERS}")
+        
+        if not 0 <= self.WORKER_INDEX < self.WORKERS:
+            raise ValueError(f"worker编号必须在0-{self.WORKERS - 1}范围内，当前值: {self.WORKER_INDEX}")
+        
+        if self.WORKER_BASE_PORT and not 1 <= self.WORKER_BASE_PORT <= 65535 - self.WORKERS:
+            raise ValueError(f"worker起始端口超出范围，当前值: {self.WORKER_BASE_PORT}")
+        
+        if self.SHUTDOWN_TIMEOUT < 1:
+            raise ValueError(f"关闭超时时间必须大于0，当前值: {self.SHUTDOWN_TIMEOUT}")
 
 
 # 全局配置实例
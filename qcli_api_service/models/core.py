@@ -46,11 +46,19 @@ class Session:
     work_directory: str  # 会话专用工作目录
     messages: List[Message] = field(default_factory=list)
     
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        # 活跃时间变化时通知会话管理器更新过期索引
+        if name == "last_activity":
+            listener = self.__dict__.get("_activity_listener")
+            if listener:
+                listener(self)
+    
     @classmethod
-    def create_new(cls, base_dir: str = "sessions") -> 'Session':
-        """创建新会话"""
+    def create_new(cls, base_dir: str = "sessions", session_id: Optional[str] = None) -> 'Session':
+        """创建新会话（session_id为空时随机生成）"""
         current_time = time.time()
-        session_id = str(uuid.uuid4())
+        session_id = session_id or str(uuid.uuid4())
         
         # 创建会话专用工作目录
         work_directory = os.path.join(base_dir, session_id)
@@ -104,6 +112,10 @@ class ChatRequest:
     session_id: Optional[str]
     message: str
     stream: bool = False
+    coalesce_ms: Optional[int] = None  # SSE事件合并时间预算（毫秒），未指定时使用配置
+    coalesce_bytes: Optional[int] = None  # SSE事件合并字节预算，未指定时使用配置
+    priority: Optional[str] = None  # 准入优先级（high/normal/low），未指定时按接口默认
+    client_id: str = ""  # 客户端标识，准入控制按客户端公平排队
     
     def validate(self) -> None:
         """验证请求数据"""
@@ -0,0 +1,326 @@
+"""
+全局准入控制
+
+轮次调度器只保证同一会话的请求依次执行，不限制不同会话同时生成回复的数量：突发请求会同时驱动
+大量Q Chat进程，拖垮整台机器，一个客户端的突发也会挤占其他客户端。准入控制器位于会话进程和
+无状态调用（QCLIService.chat）之前：
+- 同时生成回复的轮次数不超过全局上限（MAX_CONCURRENT_TURNS，0表示按CPU和内存自动计算）
+- 等待的请求按优先级（high/normal/low）严格分级，同一优先级内按客户端轮流放行，
+  一个客户端排队再多也只能轮到自己的那一份
+- 单个客户端排队过多时返回429，全局排队已满或等待超过 ADMISSION_QUEUE_TIMEOUT 时返回503，
+  都附带按平均每轮耗时估算的 retry_after
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, List, Optional
+from qcli_api_service.config import config
+from qcli_api_service.services.turn_scheduler import _AsyncGrant
+
+logger = logging.getLogger(__name__)
+
+# 优先级，数值越小越先放行
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+DEFAULT_PRIORITY = "normal"
+
+# 拒绝原因
+REJECT_CLIENT_QUEUE_FULL = "client_queue_full"
+REJECT_QUEUE_FULL = "queue_full"
+REJECT_DEADLINE = "deadline"
+
+# 等待时间直方图的桶上限（毫秒）和排队深度直方图的桶上限
+WAIT_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class AdmissionRejectedError(RuntimeError):
+    """请求未被准入：单个客户端排队过多（429），或全局排队已满、等待超时（503）"""
+
+    def __init__(self, reason: str, retry_after: int, message: str):
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(message)
+
+    @property
+    def http_status(self) -> int:
+        return 429 if self.reason == REJECT_CLIENT_QUEUE_FULL else 503
+
+
+class AdmissionSlot:
+    """一个生成回复的名额"""
+
+    def __init__(self, client_id: str, priority: str, granted=None):
+        self.client_id = client_id
+        self.priority = priority
+        self.enqueued_at = time.time()
+        self.granted_at = 0.0
+        self.released = False
+        self.granted = threading.Event() if granted is None else granted
+
+    @property
+    def queue_wait(self) -> float:
+        """等待准入的时间（秒）"""
+        return max((self.granted_at or time.time()) - self.enqueued_at, 0.0)
+
+
+def _read_cgroup(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def available_cpus() -> float:
+    """可用CPU数：CPU亲和性和cgroup配额中较小的一个"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    quota = _read_cgroup("/sys/fs/cgroup/cpu.max")
+    if quota and not quota.startswith("max"):
+        limit, period = quota.split()[:2]
+        cpus = min(cpus, int(limit) / int(period))
+    return max(cpus, 1)
+
+
+def available_memory_mb() -> Optional[int]:
+    """可用内存（MB）：物理内存和cgroup内存上限中较小的一个，无法获取时返回None"""
+    memory = None
+    try:
+        memory = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        pass
+    limit = _read_cgroup("/sys/fs/cgroup/memory.max")
+    if limit and limit.isdigit():
+        memory = min(memory, int(limit)) if memory else int(limit)
+    return memory // (1024 * 1024) if memory else None
+
+
+def derive_concurrency_limit() -> int:
+    """按CPU和内存计算同时生成回复的轮次上限"""
+    limit = int(available_cpus() * config.ADMISSION_TURNS_PER_CPU)
+    memory_mb = available_memory_mb()
+    if memory_mb and config.QCLI_PROCESS_MEMORY_MB:
+        limit = min(limit, memory_mb // config.QCLI_PROCESS_MEMORY_MB)
+    return max(limit, 1)
+
+
+class _Histogram:
+    """固定桶的计数直方图"""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+
+    def to_dict(self) -> Dict[str, int]:
+        labels = [str(bound) for bound in self.bounds] + ["+Inf"]
+        return dict(zip(labels, self.counts))
+
+
+class AdmissionController:
+    """全局并发上限 + 按优先级和客户端公平排队"""
+
+    def __init__(self, max_concurrent: int = None, max_queue: int = None,
+                 max_per_client: int = None, queue_timeout: float = None):
+        max_concurrent = config.MAX_CONCURRENT_TURNS if max_concurrent is None else max_concurrent
+        self.limit = max_concurrent or derive_concurrency_limit()
+        self.max_queue = config.ADMISSION_QUEUE_DEPTH if max_queue is None else max_queue
+        self.max_per_client = config.ADMISSION_CLIENT_QUEUE_DEPTH if max_per_client is None else max_per_client
+        self.queue_timeout = config.ADMISSION_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        # 每个优先级：客户端 -> 该客户端等待的请求，客户端按轮流顺序排列
+        self._waiting: List["OrderedDict[str, Deque[AdmissionSlot]]"] = [OrderedDict() for _ in PRIORITIES]
+        self._waiting_count = 0
+        self._client_waiting: Dict[str, int] = {}
+        self._active = 0
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {REJECT_CLIENT_QUEUE_FULL: 0, REJECT_QUEUE_FULL: 0, REJECT_DEADLINE: 0}
+        self.total_hold_time = 0.0
+        self.completed = 0
+        self.wait_histogram = _Histogram(WAIT_BUCKETS_MS)
+        self.depth_histogram = _Histogram(DEPTH_BUCKETS)
+
+    def acquire(self, client_id: str, priority: str = DEFAULT_PRIORITY,
+                timeout: float = None) -> AdmissionSlot:
+        """
+        等待生成回复的名额
+
+        参数:
+            client_id: 客户端标识（同一优先级内按客户端轮流放行）
+            priority: high、normal或low
+            timeout: 最长等待时间（秒），默认ADMISSION_QUEUE_TIMEOUT
+
+        返回:
+            已获得名额的凭证，使用完毕后必须调用release
+
+        异常:
+            AdmissionRejectedError: 排队已满或等待超时
+        """
+        slot = AdmissionSlot(client_id, priority)
+        if self._enqueue(slot) and not slot.granted.wait(self.queue_timeout if timeout is None else timeout):
+            self._abandon(slot)
+        return slot
+
+    async def acquire_async(self, client_id: str, priority: str = DEFAULT_PRIORITY,
+                            timeout: float = None) -> AdmissionSlot:
+        """acquire的asyncio版本，等待时不占用线程（ASGI模式）"""
+        slot = AdmissionSlot(client_id, priority, granted=_AsyncGrant())
+        if not self._enqueue(slot):
+            return slot
+        try:
+            granted = await slot.granted.wait(self.queue_timeout if timeout is None else timeout)
+        except asyncio.CancelledError:
+            # 客户端在等待期间断开：退出排队，已获得的名额直接交给下一个请求
+            if not self._remove_waiting(slot):
+                self.release(slot)
+            raise
+        if not granted:
+            self._abandon(slot)
+        return slot
+
+    def _enqueue(self, slot: AdmissionSlot) -> bool:
+        """直接获得名额时返回False，否则加入排队并返回True"""
+        with self._lock:
+            self.depth_histogram.observe(self._waiting_count)
+            if self._active < self.limit and not self._waiting_count:
+                self._grant(slot)
+                return False
+
+            client_waiting = self._client_waiting.get(slot.client_id, 0)
+            if client_waiting >= self.max_per_client:
+                self.rejected[REJECT_CLIENT_QUEUE_FULL] += 1
+                raise AdmissionRejectedError(
+                    REJECT_CLIENT_QUEUE_FULL, self._estimate_retry_after(client_waiting),
+                    f"客户端 {slot.client_id} 排队的请求已达上限 ({self.max_per_client})"
+                )
+            if self._waiting_count >= self.max_queue:
+                self.rejected[REJECT_QUEUE_FULL] += 1
+                raise AdmissionRejectedError(
+                    REJECT_QUEUE_FULL, self._estimate_retry_after(self._waiting_count),
+                    f"等待生成回复的请求已达上限 ({self.max_queue})"
+                )
+
+            level = self._waiting[PRIORITIES.get(slot.priority, PRIORITIES[DEFAULT_PRIORITY])]
+            level.setdefault(slot.client_id, deque()).append(slot)
+            self._client_waiting[slot.client_id] = client_waiting + 1
+            self._waiting_count += 1
+            self.queued += 1
+        logger.info(f"已有 {self.limit} 轮对话在生成回复，客户端 {slot.client_id} 的请求排队等待 "
+                    f"(优先级 {slot.priority}，排队 {self._waiting_count})")
+        return True
+
+    def _grant(self, slot: AdmissionSlot) -> None:
+        """放行（调用方需持有_lock）"""
+        slot.granted_at = time.time()
+        self._active += 1
+        self.admitted += 1
+        self.wait_histogram.observe(slot.queue_wait * 1000)
+        slot.granted.set()
+
+    def _remove_waiting(self, slot: AdmissionSlot) -> bool:
+        """从排队中移除，返回是否仍在排队"""
+        with self._lock:
+            level = self._waiting[PRIORITIES.get(slot.priority, PRIORITIES[DEFAULT_PRIORITY])]
+            waiters = level.get(slot.client_id)
+            if not waiters or slot not in waiters:
+                return False
+            waiters.remove(slot)
+            if not waiters:
+                del level[slot.client_id]
+            self._waiting_count -= 1
+            self._client_waiting[slot.client_id] -= 1
+            if not self._client_waiting[slot.client_id]:
+                del self._client_waiting[slot.client_id]
+            return True
+
+    def _abandon(self, slot: AdmissionSlot) -> None:
+        """等待超时（与放行同时发生时以排队中的状态为准）"""
+        if self._remove_waiting(slot):
+            with self._lock:
+                self.rejected[REJECT_DEADLINE] += 1
+                retry_after = self._estimate_retry_after(self._waiting_count)
+            raise AdmissionRejectedError(
+                REJECT_DEADLINE, retry_after, f"等待生成回复超时 ({slot.queue_wait:.0f}秒)"
+            )
+
+    def release(self, slot: AdmissionSlot) -> None:
+        """归还名额并放行下一个请求"""
+        with self._lock:
+            if slot.released or not slot.granted_at:
+                return
+            slot.released = True
+            self._active -= 1
+            self.completed += 1
+            self.total_hold_time += time.time() - slot.granted_at
+
+            while self._active < self.limit:
+                next_slot = self._next_waiter()
+                if next_slot is None:
+                    break
+                self._grant(next_slot)
+
+    def _next_waiter(self) -> Optional[AdmissionSlot]:
+        """最高优先级中轮到的客户端的下一个请求（调用方需持有_lock）"""
+        for level in self._waiting:
+            if not level:
+                continue
+            client_id, waiters = next(iter(level.items()))
+            slot = waiters.popleft()
+            if waiters:
+                level.move_to_end(client_id)
+            else:
+                del level[client_id]
+            self._waiting_count -= 1
+            self._client_waiting[client_id] -= 1
+            if not self._client_waiting[client_id]:
+                del self._client_waiting[client_id]
+            return slot
+        return None
+
+    @contextmanager
+    def slot(self, client_id: str, priority: str = DEFAULT_PRIORITY) -> Iterator[AdmissionSlot]:
+        """以上下文管理器方式占用一个名额"""
+        slot = self.acquire(client_id, priority)
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def _estimate_retry_after(self, waiting: int) -> int:
+        """按平均每轮耗时估算重试等待秒数（调用方需持有_lock）"""
+        average = self.total_hold_time / self.completed if self.completed else config.QCLI_TIMEOUT
+        return max(int(average * (waiting / self.limit + 1)), 1)
+
+    def get_stats(self) -> dict:
+        """获取准入控制统计信息"""
+        with self._lock:
+            return {
+                "limit": self.limit,
+                "active": self._active,
+                "waiting": self._waiting_count,
+                "waiting_by_priority": {
+                    name: sum(len(waiters) for waiters in self._waiting[level].values())
+                    for name, level in PRIORITIES.items()
+                },
+                "waiting_clients": len(self._client_waiting),
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": dict(self.rejected),
+                "avg_hold_ms": round(self.total_hold_time / self.completed * 1000, 1) if self.completed else 0.0,
+                "wait_histogram_ms": self.wait_histogram.to_dict(),
+                "queue_depth_histogram": self.depth_histogram.to_dict()
+            }
+
+
+# 全局准入控制器实例
+admission_controller = AdmissionController()
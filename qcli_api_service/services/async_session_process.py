@@ -0,0 +1,380 @@
+"""
+asyncio会话进程（ASGI模式）
+
+通过 asyncio.create_subprocess_exec 启动Q Chat进程，stdout/stderr由事件循环中的
+读取任务消费。输出解码、过滤、去重、结束检测与线程版 SessionProcess 完全相同（继承），
+只替换进程I/O和等待方式：等待响应时不占用线程，一个worker可以同时保持大量流式连接。
+
+只支持管道传输（QCLI_TRANSPORT=pty 在此模式下按 pipe 处理），不使用预热进程池。
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import Future
+from typing import AsyncIterator, List, Optional
+from qcli_api_service.config import config
+from qcli_api_service.services.chunk_coalescer import ChunkCoalescer
+from qcli_api_service.services.stream_decoder import StreamDecoder
+from qcli_api_service.services.stderr_monitor import QCLIProcessError
+from qcli_api_service.services.session_process_manager import (
+    SessionProcess, SessionProcessManager, _ReadState
+)
+
+logger = logging.getLogger(__name__)
+
+# 每次从管道读取的最大字节数
+_READ_SIZE = 65536
+
+
+def _install_child_watcher(loop: asyncio.AbstractEventLoop) -> None:
+    """Python 3.12之前默认为每个子进程启动一个等待线程，改用pidfd在事件循环中等待子进程退出"""
+    if sys.version_info >= (3, 12) or not hasattr(os, "pidfd_open"):
+        return
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        watcher = asyncio.get_child_watcher()
+        if not isinstance(watcher, asyncio.PidfdChildWatcher):
+            watcher = asyncio.PidfdChildWatcher()
+            asyncio.set_child_watcher(watcher)
+        if watcher._loop is not loop:
+            watcher.attach_loop(loop)
+
+
+class AsyncSessionProcess(SessionProcess):
+    """由asyncio驱动的单个会话Q Chat进程"""
+
+    def __init__(self, session_id: str, work_directory: str = None, resume: bool = False):
+        super().__init__(session_id, work_directory, resume)
+        self.transport = "pipe"
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._wakeup = asyncio.Event()
+        self._input_lock = asyncio.Lock()
+        self._readers: List[asyncio.Task] = []
+
+    def is_alive(self) -> bool:
+        """检查进程是否还活着"""
+        return self.process is not None and self.process.returncode is None
+
+    def _notify_readers(self):
+        super()._notify_readers()
+        self._wakeup.set()
+
+    def _write_input(self, data: bytes, timeout: float = 10.0):
+        """写入一行输入（写入缓冲，需要时由调用方await drain）"""
+        self.process.stdin.write(data + b"\n")
+
+    async def start_async(self) -> bool:
+        """启动Q Chat进程并创建输出读取任务"""
+        if self.is_alive():
+            return True
+        self._cancel_readers()
+
+        try:
+            command, env = self._build_command()
+            _install_child_watcher(asyncio.get_running_loop())
+            self.process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=self.work_directory,
+                env=env
+            )
+        except Exception as e:
+            logger.error(f"启动Q Chat进程失败 (会话 {self.session_id}): {e}")
+            self.process = None
+            return False
+
+        with self.response_lock:
+            self._stream = StreamDecoder()
+            self._partial_since = 0.0
+        self._readers = [
+            asyncio.ensure_future(self._read_stdout(self.process.stdout)),
+            asyncio.ensure_future(self._read_stderr(self.process.stderr)),
+        ]
+        logger.info(f"为会话 {self.session_id} 启动Q Chat进程 PID: {self.process.pid} (asyncio)")
+        return True
+
+    async def _read_stdout(self, stdout: asyncio.StreamReader):
+        while True:
+            data = await stdout.read(_READ_SIZE)
+            if not data:
+                break
+            self._on_stdout_data(data)
+        self._on_stdout_closed()
+
+    async def _read_stderr(self, stderr: asyncio.StreamReader):
+        while True:
+            data = await stderr.read(_READ_SIZE)
+            if not data:
+                break
+            self._on_stderr_data(data)
+
+    def _cancel_readers(self):
+        for task in self._readers:
+            task.cancel()
+        self._readers = []
+
+    async def send_message_async(self, message: str) -> bool:
+        """发送消息到Q Chat进程"""
+        async with self._input_lock:
+            if not self.is_alive():
+                logger.warning(f"进程已死亡，尝试重启 (会话 {self.session_id})")
+                self.resume = config.PROCESS_RESUME
+                if not await self.start_async():
+                    return False
+
+            try:
+                formatted_message = self._prepare_message(message)
+                self._begin_turn(formatted_message)
+                # 写入前标记本轮开始：进程可能在写入返回之前就在stderr报告错误
+                self.in_turn = True
+
+                self._write_input(formatted_message.encode("utf-8"))
+                await self.process.stdin.drain()
+                self.last_activity = time.time()
+
+                logger.debug(f"向会话 {self.session_id} 发送消息: {message[:50]}...")
+                return True
+
+            except Exception as e:
+                self.in_turn = False
+                logger.error(f"发送消息失败 (会话 {self.session_id}): {e}")
+                return False
+
+    async def read_response_async(self, coalescer: Optional[ChunkCoalescer] = None,
+                                  heartbeat: float = None) -> AsyncIterator[str]:
+        """read_response的asyncio版本，参数和返回内容相同"""
+        if not self.is_alive():
+            logger.error(f"进程未运行 (会话 {self.session_id})")
+            return
+
+        state = _ReadState()
+        try:
+            while True:
+                # 读取任务与本协程在同一个事件循环中，先清除再检查不会丢失唤醒
+                self._wakeup.clear()
+                with self.response_lock:
+                    response, finished, wait = self._poll_response(state, coalescer, heartbeat)
+                if finished:
+                    break
+                if response is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                state.note_yield(response)
+                yield response
+
+            for response in self._drain_response(state, coalescer):
+                yield response
+            self._finish_read(state)
+
+        except QCLIProcessError:
+            raise
+        except Exception as e:
+            logger.error(f"读取响应失败 (会话 {self.session_id}): {e}")
+        finally:
+            self.in_turn = False
+            self.last_activity = time.time()
+
+    async def warm_up_async(self, timeout: float = 30.0, quiet_period: float = 1.0) -> bool:
+        """warm_up的asyncio版本：等待输入提示符或输出静默，丢弃已有输出"""
+        deadline = time.time() + timeout
+        while time.time() < deadline and self.is_alive():
+            if self.prompt_seen.is_set():
+                break
+            if self.last_output_at and time.time() - self.last_output_at >= quiet_period:
+                break
+            await asyncio.sleep(min(0.05, quiet_period))
+
+        with self.response_lock:
+            self.response_queue.clear()
+        return self.is_alive()
+
+    async def cancel_turn_async(self, timeout: float = None) -> bool:
+        """cancel_turn的asyncio版本"""
+        timeout = config.TURN_CANCEL_TIMEOUT if timeout is None else timeout
+        cancelled = self._interrupt_turn()
+        if cancelled is None:
+            return False
+
+        await self.warm_up_async(timeout=timeout, quiet_period=min(1.0, timeout))
+        self._finish_cancel(*cancelled)
+        return True
+
+    async def terminate_async(self, timeout: float = 5.0):
+        """终止Q Chat进程：先发送 /quit，超时后依次terminate、kill"""
+        process = self.process
+        if process is None:
+            return
+        try:
+            if self.is_alive():
+                self.request_quit()
+                try:
+                    await asyncio.wait_for(process.wait(), timeout)
+                except asyncio.TimeoutError:
+                    process.terminate()
+                    try:
+                        await asyncio.wait_for(process.wait(), 2)
+                    except asyncio.TimeoutError:
+                        process.kill()
+                        await process.wait()
+            logger.info(f"会话 {self.session_id} 的Q Chat进程已终止")
+        except Exception as e:
+            logger.error(f"终止进程失败 (会话 {self.session_id}): {e}")
+        finally:
+            self._cancel_readers()
+            self.process = None
+
+    def terminate(self):
+        """同步终止（例如其他线程清理会话时），交给进程所在的事件循环执行"""
+        async_process_manager.run_in_loop(self.terminate_async())
+
+
+class AsyncSessionProcessManager(SessionProcessManager):
+    """asyncio会话进程管理器
+
+    字典、驱逐和统计沿用线程版；进程的创建和终止在事件循环中进行，
+    其他线程（维护调度器、删除会话）发起的终止通过 run_in_loop 交给事件循环。
+    """
+
+    def __init__(self, max_processes: int = None):
+        super().__init__(max_processes=max_processes, reaper_workers=1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop = None) -> None:
+        """记录进程所在的事件循环（应用启动时调用，之后可以再创建进程）"""
+        self._loop = loop or asyncio.get_running_loop()
+        with self.lock:
+            self._closed = False
+
+    def run_in_loop(self, coroutine) -> Optional[Future]:
+        """在进程所在的事件循环中执行协程（可在任意线程调用）"""
+        if self._loop is None or self._loop.is_closed():
+            coroutine.close()
+            return None
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+
+    async def get_or_create_process_async(self, session_id: str, work_directory: str = None,
+                                          lease: bool = False) -> AsyncSessionProcess:
+        """获取或创建会话进程（lease 与 get_or_create_process 相同）"""
+        if self._loop is None:
+            self.bind_loop()
+
+        with self.lock:
+            if self._closed:
+                raise RuntimeError("服务正在关闭，不再创建Q CLI进程")
+            if session_id in self.processes:
+                self.processes.move_to_end(session_id)
+                process = self.processes[session_id]
+                if lease:
+                    process.leases += 1
+                return process
+
+            future = self._pending.get(session_id)
+            if future is None:
+                victims = self._ensure_capacity()
+                future = self._loop.create_future()
+                self._pending[session_id] = future
+                respawn = session_id in self.evicted_sessions or session_id in self.restore_sessions
+                owner = True
+            else:
+                owner = False
+
+        # 其他请求正在创建该会话的进程，等待同一个结果
+        if not owner:
+            process = await asyncio.shield(future)
+            if process is None:
+                raise RuntimeError(f"无法为会话 {session_id} 启动Q Chat进程")
+            if lease:
+                return await self.get_or_create_process_async(session_id, work_directory, lease)
+            return process
+
+        for victim in victims:
+            self._reap(victim)
+
+        process = None
+        try:
+            resume = respawn and self._can_resume(session_id)
+            process = AsyncSessionProcess(session_id, work_directory, resume=resume)
+            if respawn and not resume:
+                process.restore_context = self._build_restore_context(session_id)
+            # 没有预热进程池，冷启动后先等待启动横幅输出完毕，避免横幅中的提示符提前结束第一轮
+            if not await process.start_async() or not await process.warm_up_async():
+                process = None
+                raise RuntimeError(f"无法为会话 {session_id} 启动Q Chat进程")
+            logger.info(f"为会话 {session_id} 创建新的Q Chat进程 (asyncio)")
+        finally:
+            with self.lock:
+                self._pending.pop(session_id, None)
+                closed = self._closed
+                if process is not None and not closed:
+                    self.processes[session_id] = process
+                    if lease:
+                        process.leases += 1
+                    if respawn:
+                        self._mark_respawned(session_id)
+            if process is None or not closed:
+                future.set_result(process)
+
+        # 创建期间开始关闭：shutdown_all_async会等待该Future，终止刚启动的进程后再结束
+        if closed:
+            try:
+                await process.terminate_async()
+            finally:
+                future.set_result(None)
+            raise RuntimeError("服务正在关闭，不再创建Q CLI进程")
+        return process
+
+    def _reap(self, process: AsyncSessionProcess) -> Optional[Future]:
+        """在事件循环中终止进程"""
+        future = self.run_in_loop(process.terminate_async())
+        if future is None:
+            return None
+
+        with self.lock:
+            self._reaping[process] = future
+
+        def done(_):
+            with self.lock:
+                self._reaping.pop(process, None)
+
+        future.add_done_callback(done)
+        return future
+
+    async def shutdown_all_async(self, timeout: float = None) -> dict:
+        """在限定时间内并行关闭所有进程（与shutdown_all相同，包括回收中和正在创建的进程）"""
+        timeout = config.SHUTDOWN_TIMEOUT if timeout is None else timeout
+        with self.lock:
+            self._closed = True
+            processes = list(self.processes.values()) + list(self._reaping)
+            self.processes.clear()
+            pending = list(self._pending.values())
+
+        start_time = time.time()
+        if processes:
+            await asyncio.wait(
+                [asyncio.ensure_future(p.terminate_async(timeout=max(timeout - 2, 0.5))) for p in processes],
+                timeout=timeout
+            )
+        stats = {
+            "total": len(processes),
+            "remaining": sum(1 for p in processes if p.is_alive()),
+            "duration": round(time.time() - start_time, 2)
+        }
+        if pending:
+            _, not_done = await asyncio.wait(pending, timeout=max(0.0, timeout - (time.time() - start_time)))
+            stats["pending"] = len(pending)
+            stats["pending_remaining"] = len(not_done)
+        logger.info(f"所有asyncio会话进程已关闭: {stats}")
+        return stats
+
+
+# 全局asyncio会话进程管理器实例（仅ASGI模式使用）
+async_process_manager = AsyncSessionProcessManager()
@@ -0,0 +1,81 @@
+"""
+流式响应块合并
+
+位于read_response与SSE生成器之间：把连续到达的小片段合并为一个事件，
+累积字节数达到字节预算或最早一段等待超过时间预算时发出，
+避免逐个部分行发送大量很小的事件，同时保证延迟有上限。
+每轮的第一块立即发出，不增加首字延迟。
+"""
+
+import time
+from typing import List, Optional
+from qcli_api_service.config import config
+
+
+class ChunkCoalescer:
+    """按时间和字节预算合并响应块"""
+
+    def __init__(self, max_delay_ms: int = None, max_bytes: int = None):
+        max_delay_ms = config.STREAM_COALESCE_MS if max_delay_ms is None else max_delay_ms
+        self.max_delay = max_delay_ms / 1000.0
+        self.max_bytes = config.STREAM_COALESCE_BYTES if max_bytes is None else max_bytes
+
+        self._parts: List[str] = []
+        self._bytes = 0
+        self._since = 0.0  # 缓冲中最早一段的到达时间
+        self._first_sent = False
+
+        # 统计信息
+        self.chunks_in = 0
+        self.events_out = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_delay > 0
+
+    @property
+    def buffered(self) -> bool:
+        return bool(self._parts)
+
+    @property
+    def deadline(self) -> float:
+        """缓冲内容最迟发出的时刻，无缓冲时为0"""
+        return self._since + self.max_delay if self._parts else 0.0
+
+    def add(self, chunk: str, now: float = None) -> None:
+        """加入一个响应块"""
+        if not chunk:
+            return
+        if not self._parts:
+            self._since = time.time() if now is None else now
+        self._parts.append(chunk)
+        self._bytes += len(chunk.encode("utf-8"))
+        self.chunks_in += 1
+
+    def ready(self, now: float = None) -> bool:
+        """缓冲内容是否应立即发出"""
+        if not self._parts:
+            return False
+        if not self.enabled or not self._first_sent:
+            return True
+        if self.max_bytes and self._bytes >= self.max_bytes:
+            return True
+        return (time.time() if now is None else now) >= self.deadline
+
+    def take(self) -> str:
+        """取出全部缓冲内容作为一个事件"""
+        chunk = "".join(self._parts)
+        self._parts = []
+        self._bytes = 0
+        self._since = 0.0
+        if chunk:
+            self._first_sent = True
+            self.events_out += 1
+        return chunk
+
+    def get_stats(self) -> dict:
+        """获取合并统计信息"""
+        return {
+            "chunks_in": self.chunks_in,
+            "events_out": self.events_out
+        }
@@ -0,0 +1,218 @@
+"""
+回复结束检测
+
+识别Q Chat重新出现的输入提示符或服务注入的结束标记，
+在模型回复结束时立即判定本轮对话完成，空闲超时仅作为兜底。
+同时统计每轮"模型完成"与"服务返回"之间的延迟。
+"""
+
+import re
+import threading
+import logging
+from typing import Optional
+from qcli_api_service.config import config
+
+logger = logging.getLogger(__name__)
+
+# 尚未输出完整的Q Chat提示符，例如 "[default] !"、"!"
+_PROMPT_PREFIX = re.compile(r'^(\[[^\]]*(\]\s*!?>?)?|!?>?)$')
+# 终端重绘的输入行：提示符后跟用户输入，例如 "[default] !> 你好"
+_ECHO = re.compile(r'^(\[[^\]]*\]\s*)?!?>\s')
+
+
+# 结束原因
+REASON_PROMPT = "prompt"
+REASON_SENTINEL = "sentinel"
+REASON_IDLE_TIMEOUT = "idle_timeout"
+REASON_MAX_WAIT = "max_wait"
+REASON_PROCESS_EXIT = "process_exit"
+REASON_CANCELLED = "cancelled"
+
+
+class CompletionDetector:
+    """单轮对话的结束检测器"""
+
+    def __init__(self, prompt_pattern: str = None, sentinel: str = None):
+        self.prompt_regex = re.compile(prompt_pattern or config.QCLI_PROMPT_PATTERN)
+        self.sentinel = config.QCLI_COMPLETION_SENTINEL if sentinel is None else sentinel
+        self.content_seen = False
+        self.sent_message = ""
+
+    def reset(self, sent_message: str = "") -> None:
+        """开始新一轮对话（sent_message 为本轮写入的消息，用于识别回显）"""
+        self.content_seen = False
+        self.sent_message = sent_message.strip()
+
+    def note_content(self) -> None:
+        """记录本轮已收到有效回复内容"""
+        self.content_seen = True
+
+    def is_prompt(self, text: str) -> bool:
+        """判断文本是否为Q Chat的输入提示符"""
+        return bool(self.prompt_regex.match(text))
+
+    def match_line(self, line: str) -> Optional[str]:
+        """
+        检查一行完整输出是否标志着回复结束
+
+        参数:
+            line: 清理后的输出行
+
+        返回:
+            结束原因，未结束时返回None
+        """
+        if self.sentinel and line == self.sentinel:
+            return REASON_SENTINEL
+        if self.content_seen and self.is_prompt(line):
+            return REASON_PROMPT
+        return None
+
+    def match_pending(self, text: str) -> Optional[str]:
+        """
+        检查尚未换行的尾部输出（提示符不带换行符）
+
+        参数:
+            text: 清理后的尾部输出
+
+        返回:
+            结束原因，未结束时返回None
+        """
+        if self.content_seen and self.is_prompt(text):
+            return REASON_PROMPT
+        return None
+
+    def is_echo(self, text: str) -> bool:
+        """判断文本是否以提示符开头（可能是提示符加用户输入的回显行）"""
+        return bool(_ECHO.match(text))
+
+    def strip_echo(self, text: str) -> Optional[str]:
+        """
+        去掉行首的提示符
+
+        冷启动时横幅末尾未换行的提示符会和回复的第一行连在一起，只去掉提示符，保留其后的回复。
+
+        返回:
+            去掉提示符后的内容；剩余内容正是本轮发送的消息（输入回显）时返回None
+        """
+        match = _ECHO.match(text)
+        if not match:
+            return text
+        rest = text[match.end():].strip()
+        if rest == self.sent_message:
+            return None
+        return rest
+
+    def may_complete(self, text: str) -> bool:
+        """
+        判断尚未换行的尾部输出是否可能继续变成提示符或结束标记
+
+        这类尾部不能作为部分回复提前发出，需要等到整行或后续输出再判断。
+        """
+        text = text.strip()
+        if self.sentinel and self.sentinel.startswith(text):
+            return True
+        return self.is_prompt(text) or bool(_PROMPT_PREFIX.match(text))
+
+    def format_message(self, message: str) -> str:
+        """配置了结束标记时，要求模型在回答末尾输出该标记"""
+        if not self.sentinel:
+            return message
+        return f"{message}（回答结束后请单独输出一行 {self.sentinel}）"
+
+
+class TurnLatencyStats:
+    """每轮对话的完成延迟统计"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.by_reason = {}
+        self.total_return_delay = 0.0
+        self.max_return_delay = 0.0
+
+    def record(self, session_id: str, reason: str, model_finished_at: float, returned_at: float) -> None:
+        """
+        记录一轮对话
+
+        参数:
+            session_id: 会话ID
+            reason: 结束原因
+            model_finished_at: 模型输出完成的时间
+            returned_at: 服务返回响应的时间
+        """
+        delay = max(returned_at - model_finished_at, 0.0) if model_finished_at else 0.0
+        with self._lock:
+            self.turns += 1
+            self.by_reason[reason] = self.by_reason.get(reason, 0) + 1
+            self.total_return_delay += delay
+            self.max_return_delay = max(self.max_return_delay, delay)
+        logger.info(f"会话 {session_id} 本轮结束: 原因={reason}, 模型完成到服务返回耗时 {delay * 1000:.0f}ms")
+
+    def get_stats(self) -> dict:
+        """获取统计信息"""
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "by_reason": dict(self.by_reason),
+                "avg_return_delay_ms": round(self.total_return_delay / self.turns * 1000, 1) if self.turns else 0.0,
+                "max_return_delay_ms": round(self.max_return_delay * 1000, 1)
+            }
+
+
+class TurnCancellationStats:
+    """客户端断开后取消的对话轮次统计
+    
+    节省的CPU时间按已完成轮次的平均CPU消耗减去被取消轮次已消耗的CPU估算。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.completed_turns = 0
+        self.completed_cpu_seconds = 0.0
+        self.cancelled_turns = 0
+        self.cancelled_cpu_seconds = 0.0
+        self.cpu_seconds_saved = 0.0
+
+    def record_completed(self, cpu_seconds: Optional[float]) -> None:
+        """记录一轮正常结束的对话消耗的CPU时间"""
+        if cpu_seconds is None:
+            return
+        with self._lock:
+            self.completed_turns += 1
+            self.completed_cpu_seconds += cpu_seconds
+
+    def record_cancelled(self, session_id: str, elapsed: float, cpu_seconds: Optional[float]) -> float:
+        """
+        记录一轮被取消的对话
+
+        返回:
+            估算节省的CPU秒数
+        """
+        with self._lock:
+            self.cancelled_turns += 1
+            saved = 0.0
+            if cpu_seconds is not None:
+                self.cancelled_cpu_seconds += cpu_seconds
+                if self.completed_turns:
+                    average = self.completed_cpu_seconds / self.completed_turns
+                    saved = max(average - cpu_seconds, 0.0)
+                    self.cpu_seconds_saved += saved
+        logger.info(f"会话 {session_id} 客户端已断开，取消本轮对话: 已进行 {elapsed:.1f}秒，估算节省CPU {saved:.2f}秒")
+        return saved
+
+    def get_stats(self) -> dict:
+        """获取统计信息"""
+        with self._lock:
+            return {
+                "cancelled_turns": self.cancelled_turns,
+                "cpu_seconds_before_cancel": round(self.cancelled_cpu_seconds, 2),
+                "cpu_seconds_saved": round(self.cpu_seconds_saved, 2),
+                "avg_completed_turn_cpu_seconds": round(
+                    self.completed_cpu_seconds / self.completed_turns, 3
+                ) if self.completed_turns else 0.0
+            }
+
+
+# 全局延迟统计实例
+turn_latency_stats = TurnLatencyStats()
+turn_cancellation_stats = TurnCancellationStats()
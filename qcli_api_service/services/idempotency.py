@@ -0,0 +1,245 @@
+"""
+聊天请求的幂等键
+
+前端请求失败时会自动重试，代理超时也会重发请求，同一条用户消息可能到达两次，
+会话因此多出一轮、模型运行两次。请求带 Idempotency-Key 头时：
+- 第一次到达的请求正常执行，结果按 (客户端, 接口, 幂等键) 保存 IDEMPOTENCY_TTL 秒
+- 执行中收到相同键的请求等待同一个结果；流式接口在回复开始后直接订阅同一轮的重放缓冲。
+  等待不超过一轮对话可能用的时间（排队、等待准入和生成回复的时限之和），超时返回409和Retry-After
+- 结束后收到相同键的请求直接返回保存的结果（流式接口从头重放本轮事件），不再调用Q CLI
+- 同一个键配不同的请求内容（消息或会话ID不同）返回422
+
+只保存成功的结果：失败的请求（包括流式回复出错或客户端断开后被取消的一轮）不保留，
+客户端用同一个键重试会重新执行。
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+from qcli_api_service.config import config
+from qcli_api_service.services.session_process_manager import TURN_MAX_WAIT
+from qcli_api_service.services.stream_replay import TurnStream
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+
+# 重放的响应带有该响应头
+IDEMPOTENT_REPLAYED_HEADER = "Idempotent-Replayed"
+
+# 幂等键的最大长度
+MAX_KEY_LENGTH = 255
+
+# 等待第一次请求超时后，建议客户端重试的间隔（秒）
+IN_PROGRESS_RETRY_AFTER = 30
+
+
+class IdempotencyKeyMismatchError(ValueError):
+    """同一个幂等键用于不同的请求内容"""
+
+
+class IdempotentRequest:
+    """一个幂等键对应的请求：执行中或已经得到结果"""
+
+    def __init__(self, key: str, fingerprint: str):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.status = 0
+        self.body: Optional[dict] = None
+        self.stream: Optional[TurnStream] = None  # 流式接口的一轮回复
+        self.expires_at = 0.0
+        self._listeners: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def succeeded(self) -> bool:
+        return 200 <= self.status < 300
+
+    @property
+    def reusable(self) -> bool:
+        """结果是否可以返回给重复的请求（流式回复以错误或取消结束时不可以）"""
+        if not self.done.is_set():
+            return True
+        if not self.succeeded:
+            return False
+        return self.stream is None or not self.stream.failed
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """登记得到结果时的回调（已有结果时立即调用）"""
+        with self._lock:
+            if not self.done.is_set():
+                self._listeners.append(callback)
+                return
+        callback()
+
+    def remove_listener(self, callback: Callable[[], None]) -> None:
+        """取消登记的回调（等待方超时放弃时）"""
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _resolve(self, status: int, body: Optional[dict], stream: Optional[TurnStream]) -> None:
+        with self._lock:
+            self.status = status
+            self.body = body
+            self.stream = stream
+            self.done.set()
+            listeners, self._listeners = self._listeners, []
+        for callback in listeners:
+            callback()
+
+
+class IdempotencyStore:
+    """按幂等键保存执行中和已完成的请求，过期或超出条目数时淘汰已完成的条目"""
+
+    def __init__(self, ttl: int = None, max_entries: int = None, wait_timeout: float = None):
+        self.ttl = config.IDEMPOTENCY_TTL if ttl is None else ttl
+        self.max_entries = config.IDEMPOTENCY_MAX_KEYS if max_entries is None else max_entries
+        # 重复请求等待第一次请求结果的最长时间
+        self.wait_timeout = (
+            config.SESSION_QUEUE_TIMEOUT + config.ADMISSION_QUEUE_TIMEOUT + TURN_MAX_WAIT
+            if wait_timeout is None else wait_timeout
+        )
+        # 键 -> 请求，按最近使用排序
+        self._entries: "OrderedDict[str, IdempotentRequest]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.started = 0
+        self.attached = 0
+        self.replayed = 0
+        self.mismatched = 0
+        self.evictions = 0
+        self.expired = 0
+        self.wait_timeouts = 0
+
+    @staticmethod
+    def make_key(client_id: str, endpoint: str, idempotency_key: str) -> str:
+        """幂等键按客户端和接口区分，不同客户端碰巧使用相同的键互不影响"""
+        return f"{client_id}|{endpoint}|{idempotency_key}"
+
+    @staticmethod
+    def fingerprint(session_id: Optional[str], message: str) -> str:
+        return hashlib.sha256(f"{session_id or ''}\n{message}".encode("utf-8")).hexdigest()
+
+    def begin(self, key: str, fingerprint: str) -> Tuple[IdempotentRequest, bool]:
+        """
+        登记一个带幂等键的请求
+
+        参数:
+            key: make_key 生成的键
+            fingerprint: 请求内容的指纹
+
+        返回:
+            (请求, 是否由调用方执行)；不由调用方执行时等待或直接使用该请求的结果
+
+        异常:
+            IdempotencyKeyMismatchError: 相同的键已用于不同的请求内容
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.done.is_set() and (entry.expires_at <= now or not entry.reusable):
+                del self._entries[key]
+                if entry.expires_at <= now:
+                    self.expired += 1
+                entry = None
+
+            if entry is not None:
+                if entry.fingerprint != fingerprint:
+                    self.mismatched += 1
+                    raise IdempotencyKeyMismatchError("幂等键已用于其他请求")
+                self._entries.move_to_end(key)
+                if entry.done.is_set():
+                    self.replayed += 1
+                else:
+                    self.attached += 1
+                return entry, False
+
+            entry = IdempotentRequest(key, fingerprint)
+            self._entries[key] = entry
+            self.started += 1
+            self._evict()
+            return entry, True
+
+    def finish(self, entry: IdempotentRequest, status: int, body: Optional[dict] = None,
+               stream: Optional[TurnStream] = None) -> None:
+        """
+        登记请求的结果并唤醒等待的重复请求
+
+        参数:
+            entry: begin 返回的请求
+            status: HTTP状态码，非2xx的结果不保留
+            body: 响应数据
+            stream: 流式接口的一轮回复（开始生成时即登记）
+        """
+        with self._lock:
+            entry.expires_at = time.time() + self.ttl
+            if not 200 <= status < 300 and self._entries.get(entry.key) is entry:
+                del self._entries[entry.key]
+        entry._resolve(status, body, stream)
+
+    def wait(self, entry: IdempotentRequest) -> bool:
+        """等待执行中的请求得到结果，超过 wait_timeout 返回False"""
+        if entry.done.wait(self.wait_timeout):
+            return True
+        self.record_wait_timeout()
+        return False
+
+    def record_wait_timeout(self) -> None:
+        with self._lock:
+            self.wait_timeouts += 1
+
+    def cleanup_expired(self) -> int:
+        """删除过期的条目，返回删除的数量"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items()
+                       if entry.done.is_set() and entry.expires_at <= now]
+            for key in expired:
+                del self._entries[key]
+            self.expired += len(expired)
+        return len(expired)
+
+    def _evict(self) -> None:
+        """超出条目数上限时淘汰最久未使用的已完成条目（调用方需持有_lock）"""
+        excess = len(self._entries) - self.max_entries
+        if not self.max_entries or excess <= 0:
+            return
+        # 执行中的条目不淘汰
+        victims = []
+        for key, entry in self._entries.items():
+            if len(victims) >= excess:
+                break
+            if entry.done.is_set():
+                victims.append(key)
+        for key in victims:
+            del self._entries[key]
+        self.evictions += len(victims)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            in_flight = sum(1 for entry in self._entries.values() if not entry.done.is_set())
+            return {
+                "entries": len(self._entries),
+                "in_flight": in_flight,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+                "started": self.started,
+                "suppressed": self.attached + self.replayed,
+                "attached": self.attached,
+                "replayed": self.replayed,
+                "mismatched": self.mismatched,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "wait_timeouts": self.wait_timeouts
+            }
+
+
+# 全局幂等键存储实例
+idempotency_store = IdempotencyStore()
@@ -0,0 +1,228 @@
+"""
+异步任务管理器
+
+POST /api/v1/jobs 提交一轮对话后立即返回任务ID，回复在有界线程池中生成，
+与HTTP连接数解耦。任务本身就是一轮流式回复的事件序列（TurnStream），
+客户端可以轮询、长轮询或订阅SSE（支持Last-Event-ID），结束后的结果保留一段时间。
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+from qcli_api_service.config import config
+from qcli_api_service.services.stream_replay import TurnStream
+from qcli_api_service.utils.session_routing import generate_session_id
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+class JobQueueFullError(RuntimeError):
+    """等待执行的任务数已达上限"""
+
+    def __init__(self, pending: int, retry_after: int):
+        self.pending = pending
+        self.retry_after = retry_after
+        super().__init__(f"等待执行的任务已达上限 ({pending})")
+
+
+class Job(TurnStream):
+    """一个异步对话任务：事件序列加上状态和最终结果"""
+
+    def __init__(self, job_id: str, session_id: str, max_events: int = None):
+        super().__init__(session_id, 1, config.STREAM_REPLAY_EVENTS if max_events is None else max_events)
+        self.job_id = job_id
+        self.status = JOB_QUEUED
+        self.started_at = 0.0
+        self.finished_at = 0.0
+        self._response_parts = []
+        self._result: Optional[dict] = None  # 最后的done或error事件
+
+        # 任务自身持有一个订阅：SSE客户端全部断开也不会中断生成
+        self.attach()
+
+    def append(self, event: dict) -> int:
+        with self._cond:
+            if event.get('type') == 'chunk':
+                self._response_parts.append(event['message'])
+            elif event.get('type') in ('done', 'error'):
+                self._result = event
+            return super().append(event)
+
+    def start(self) -> None:
+        with self._cond:
+            self.status = JOB_RUNNING
+            self.started_at = time.time()
+
+    def finish(self) -> None:
+        with self._cond:
+            if self.finished:
+                return
+            self.finished_at = time.time()
+            succeeded = self._result is not None and self._result.get('type') == 'done'
+            self.status = JOB_COMPLETED if succeeded else JOB_FAILED
+            super().finish()
+
+    def wait(self, timeout: float) -> bool:
+        """等待任务结束（长轮询），返回是否已结束"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.finished, timeout)
+
+    def to_dict(self) -> dict:
+        """任务状态和结果"""
+        with self._cond:
+            data = {
+                "job_id": self.job_id,
+                "session_id": self.session_id,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at or None,
+                "finished_at": self.finished_at or None
+            }
+            if self.status == JOB_COMPLETED:
+                data["response"] = "".join(self._response_parts).strip()
+                data["timing"] = self._result.get('timing')
+            elif self.status == JOB_FAILED:
+                result = self._result or {}
+                data["error"] = {
+                    "error": result.get('error', "任务执行失败"),
+                    "code": result.get('code', "JOB_FAILED"),
+                    "suggestions": result.get('suggestions', [])
+                }
+            return data
+
+
+class JobManager:
+    """任务提交、执行和结果保留"""
+
+    def __init__(self, workers: int = None, max_pending: int = None, result_ttl: int = None):
+        self.workers = config.JOB_WORKERS if workers is None else workers
+        self.max_pending = config.JOB_QUEUE_DEPTH if max_pending is None else max_pending
+        self.result_ttl = config.JOB_RESULT_TTL if result_ttl is None else result_ttl
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = 0
+        self._running = 0
+
+        # 统计信息
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.total_run_time = 0.0
+
+    def submit(self, session_id: str, runner: Callable[[Job], None]) -> Job:
+        """
+        提交任务
+
+        参数:
+            session_id: 任务所属会话
+            runner: 在线程池中执行的函数，向任务写入事件（调用结束后任务自动结束）
+
+        异常:
+            JobQueueFullError: 等待执行的任务数已达上限
+        """
+        # 任务ID与会话ID一样哈希到当前worker，多worker部署时查询请求可以直接路由
+        job = Job(generate_session_id(config.WORKER_INDEX, config.WORKERS), session_id)
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise JobQueueFullError(self._pending, self._estimate_retry_after())
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="qcli-job")
+            self._jobs[job.job_id] = job
+            self._pending += 1
+            self.submitted += 1
+            self._executor.submit(self._execute, job, runner)
+
+        logger.info(f"提交任务 {job.job_id} (会话 {session_id})")
+        return job
+
+    def _execute(self, job: Job, runner: Callable[[Job], None]) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+        job.start()
+        try:
+            runner(job)
+        except Exception as e:
+            logger.error(f"任务 {job.job_id} 执行失败: {e}")
+            job.append({'error': "任务执行失败", 'code': "JOB_FAILED", 'suggestions': [], 'type': 'error'})
+        finally:
+            job.finish()
+            with self._lock:
+                self._running -= 1
+                self.total_run_time += job.finished_at - job.started_at
+                if job.status == JOB_COMPLETED:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """获取任务，不存在或已过期时返回None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def remove_session(self, session_id: str) -> None:
+        """删除会话时丢弃该会话已结束的任务"""
+        with self._lock:
+            for job_id in [job_id for job_id, job in self._jobs.items()
+                           if job.session_id == session_id and job.finished]:
+                del self._jobs[job_id]
+
+    def cleanup_expired(self) -> int:
+        """清理结束时间超过保留时间的任务，返回清理数量"""
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+            self.expired += len(expired)
+        if expired:
+            logger.info(f"清理过期任务 {len(expired)} 个")
+        return len(expired)
+
+    def shutdown(self) -> None:
+        """停止执行新任务，尚未开始的任务被取消"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _estimate_retry_after(self) -> int:
+        """按平均任务耗时估算重试等待秒数（调用方需持有_lock）"""
+        finished = self.completed + self.failed
+        average = self.total_run_time / finished if finished else config.QCLI_TIMEOUT
+        return max(int(average * (self._pending / max(self.workers, 1) + 1)), 1)
+
+    def get_stats(self) -> dict:
+        """获取任务统计信息"""
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "running": self._running,
+                "stored": len(self._jobs),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "expired": self.expired,
+                "avg_run_ms": round(self.total_run_time / finished * 1000, 1) if finished else 0.0
+            }
+
+
+# 全局任务管理器实例
+job_manager = JobManager()
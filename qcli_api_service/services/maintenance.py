@@ -0,0 +1,115 @@
+"""
+后台维护调度器
+
+定期清理过期会话及其Q Chat进程和工作目录。每次间隔加入随机抖动，
+避免多个实例同时执行清理。
+"""
+
+import random
+import threading
+import time
+import logging
+from typing import Optional
+from qcli_api_service.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceScheduler:
+    """维护任务调度器"""
+
+    def __init__(self, interval: float = None, jitter: float = None):
+        self.interval = config.MAINTENANCE_INTERVAL if interval is None else interval
+        self.jitter = config.MAINTENANCE_JITTER if jitter is None else jitter
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.runs = 0
+        self.sessions_cleaned = 0
+        self.processes_cleaned = 0
+        self.jobs_cleaned = 0
+        self.last_run_at = 0.0
+        self.last_duration = 0.0
+
+    def start(self) -> None:
+        """启动后台调度线程（重复调用无副作用）"""
+        if self.interval <= 0:
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="qcli-maintenance", daemon=True)
+            self._thread.start()
+        logger.info(f"维护调度器已启动，间隔 {self.interval} 秒，抖动 ±{self.jitter * 100:.0f}%")
+
+    def stop(self) -> None:
+        """停止后台调度线程"""
+        self._stop_event.set()
+        thread = self._thread
+        if thread and thread.is_alive():
+            thread.join(timeout=5)
+
+    def next_delay(self) -> float:
+        """计算下一次执行前的等待时间"""
+        return max(self.interval * (1 + random.uniform(-self.jitter, self.jitter)), 1.0)
+
+    def run_once(self) -> dict:
+        """执行一次维护任务"""
+        from qcli_api_service.services.session_manager import session_manager
+        from qcli_api_service.services.session_process_manager import session_process_manager
+        from qcli_api_service.services.async_session_process import async_process_manager
+        from qcli_api_service.services.job_manager import job_manager
+        from qcli_api_service.services.response_cache import response_cache
+        from qcli_api_service.services.rate_limiter import rate_limiter
+        from qcli_api_service.services.idempotency import idempotency_store
+
+        start_time = time.time()
+        sessions = session_manager.cleanup_expired_sessions()
+        # 会话已删除但进程仍空闲超时的情况（例如会话被驱逐后未再访问）
+        processes = session_process_manager.cleanup_expired_processes(config.SESSION_EXPIRY)
+        processes += async_process_manager.cleanup_expired_processes(config.SESSION_EXPIRY)
+        jobs = job_manager.cleanup_expired()
+        response_cache.cleanup_expired()
+        rate_limiter.cleanup()
+        idempotency_store.cleanup_expired()
+        duration = time.time() - start_time
+
+        with self._lock:
+            self.runs += 1
+            self.sessions_cleaned += sessions
+            self.processes_cleaned += processes
+            self.jobs_cleaned += jobs
+            self.last_run_at = start_time
+            self.last_duration = duration
+
+        if sessions or processes:
+            logger.info(f"维护任务完成: 清理会话 {sessions} 个, 进程 {processes} 个, 耗时 {duration:.2f} 秒")
+        return {"sessions": sessions, "processes": processes, "jobs": jobs, "duration": duration}
+
+    def get_stats(self) -> dict:
+        """获取调度器统计信息"""
+        with self._lock:
+            return {
+                "running": bool(self._thread and self._thread.is_alive()),
+                "interval": self.interval,
+                "runs": self.runs,
+                "sessions_cleaned": self.sessions_cleaned,
+                "processes_cleaned": self.processes_cleaned,
+                "jobs_cleaned": self.jobs_cleaned,
+                "last_run_at": self.last_run_at,
+                "last_duration_ms": round(self.last_duration * 1000, 1)
+            }
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.next_delay()):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"维护任务执行失败: {e}")
+
+
+# 全局维护调度器实例
+maintenance_scheduler = MaintenanceScheduler()
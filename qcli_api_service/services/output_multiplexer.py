@@ -0,0 +1,162 @@
+"""
+进程输出多路复用器
+
+用一个后台线程通过selectors（Linux下为epoll）监听所有Q Chat进程的stdout/stderr，
+以非阻塞方式读取并分发给各会话的回调，线程数不随会话数量增长。
+"""
+
+import os
+import selectors
+import threading
+import logging
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+DataCallback = Callable[[bytes], None]
+CloseCallback = Callable[[], None]
+
+
+class OutputMultiplexer:
+    """共享的进程输出读取循环"""
+
+    def __init__(self, read_size: int = 65536):
+        self.read_size = read_size
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._handlers: Dict[int, Tuple[DataCallback, Optional[CloseCallback]]] = {}
+        self._pending_ops: Deque[tuple] = deque()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._wake_r: Optional[int] = None
+        self._wake_w: Optional[int] = None
+
+    def register(self, fd: int, on_data: DataCallback, on_close: CloseCallback = None) -> None:
+        """
+        注册需要读取的文件描述符
+
+        参数:
+            fd: 文件描述符，会被设置为非阻塞
+            on_data: 读到数据时的回调（在读取线程中执行，不应阻塞）
+            on_close: 读到EOF时的回调
+        """
+        os.set_blocking(fd, False)
+        self._submit(("register", fd, on_data, on_close))
+
+    def unregister(self, fd: int) -> None:
+        """注销文件描述符，返回后不会再有该描述符的回调"""
+        if threading.current_thread() is self._thread:
+            self._remove(fd)
+            return
+        done = threading.Event()
+        self._submit(("unregister", fd, done))
+        done.wait(timeout=5)
+
+    def get_stats(self) -> dict:
+        """获取多路复用器状态"""
+        with self._lock:
+            return {
+                "running": bool(self._thread and self._thread.is_alive()),
+                "registered_fds": len(self._handlers)
+            }
+
+    def _submit(self, op: tuple) -> None:
+        with self._lock:
+            self._ensure_started()
+            self._pending_ops.append(op)
+        try:
+            os.write(self._wake_w, b"\0")
+        except BlockingIOError:
+            pass  # 唤醒管道已满，读取线程必定会被唤醒
+
+    def _ensure_started(self) -> None:
+        """首次使用时启动读取线程（调用方需持有_lock）"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ)
+        self._thread = threading.Thread(target=self._run, name="qcli-output-mux", daemon=True)
+        self._thread.start()
+        logger.info(f"进程输出多路复用线程已启动 ({type(self._selector).__name__})")
+
+    def _apply_pending_ops(self) -> None:
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        while True:
+            with self._lock:
+                if not self._pending_ops:
+                    return
+                op = self._pending_ops.popleft()
+
+            if op[0] == "register":
+                _, fd, on_data, on_close = op
+                try:
+                    self._selector.register(fd, selectors.EVENT_READ)
+                    with self._lock:
+                        self._handlers[fd] = (on_data, on_close)
+                except (ValueError, KeyError, OSError) as e:
+                    logger.warning(f"注册文件描述符 {fd} 失败: {e}")
+            else:
+                _, fd, done = op
+                self._remove(fd)
+                done.set()
+
+    def _remove(self, fd: int) -> Optional[Tuple[DataCallback, Optional[CloseCallback]]]:
+        with self._lock:
+            handler = self._handlers.pop(fd, None)
+        if handler:
+            try:
+                self._selector.unregister(fd)
+            except (KeyError, ValueError, OSError):
+                pass
+        return handler
+
+    def _run(self) -> None:
+        while True:
+            try:
+                events = self._selector.select()
+            except OSError as e:
+                logger.error(f"多路复用select失败: {e}")
+                continue
+
+            for key, _ in events:
+                fd = key.fd
+                if fd == self._wake_r:
+                    self._apply_pending_ops()
+                    continue
+
+                with self._lock:
+                    handler = self._handlers.get(fd)
+                if handler is None:
+                    continue
+                on_data, on_close = handler
+
+                try:
+                    data = os.read(fd, self.read_size)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b""
+
+                try:
+                    if data:
+                        on_data(data)
+                    else:
+                        # EOF：进程已关闭输出
+                        self._remove(fd)
+                        if on_close:
+                            on_close()
+                except Exception as e:
+                    logger.error(f"处理文件描述符 {fd} 的输出时出错: {e}")
+
+
+# 全局输出多路复用器实例
+output_multiplexer = OutputMultiplexer()
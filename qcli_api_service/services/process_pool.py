@@ -0,0 +1,182 @@
+"""
+Q Chat进程预热池
+
+预先启动并初始化一批空闲的Q Chat进程（启动横幅已消费），
+新会话首次对话时直接绑定，避免冷启动延迟。池中进程被取走后在后台补充。
+"""
+
+import os
+import shutil
+import threading
+import uuid
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Deque
+from qcli_api_service.config import config
+from qcli_api_service.services.session_process_manager import SessionProcess, terminate_processes
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessPool:
+    """预热进程池"""
+
+    def __init__(self, size: int = None, low_water: int = None, refill_concurrency: int = None,
+                 base_dir: str = None):
+        self.size = config.PROCESS_POOL_SIZE if size is None else size
+        self.low_water = config.PROCESS_POOL_LOW_WATER if low_water is None else low_water
+        self.refill_concurrency = (config.PROCESS_POOL_REFILL_CONCURRENCY
+                                   if refill_concurrency is None else refill_concurrency)
+        self.pool_dir = os.path.join(base_dir or config.SESSIONS_BASE_DIR, ".pool")
+
+        self._idle: Deque[SessionProcess] = deque()
+        self._spawning = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._closed = False
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.spawned = 0
+        self.spawn_failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def start(self) -> None:
+        """启动预热池并填充到目标大小"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._closed = False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(1, self.refill_concurrency),
+                    thread_name_prefix="qcli-pool"
+                )
+        self._refill()
+
+    def acquire(self, session_id: str, work_directory: str = None) -> Optional[SessionProcess]:
+        """取出一个预热进程并绑定到会话，未命中时返回None"""
+        if not self.enabled:
+            return None
+
+        process = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.popleft()
+                if candidate.is_alive():
+                    process = candidate
+                    break
+                self._discard(candidate)
+
+        if process and work_directory and not process.bind(session_id, work_directory):
+            # 会话目录不可用（例如已有文件），放回池中留给其他会话
+            with self._lock:
+                self._idle.appendleft(process)
+            process = None
+        elif process and not work_directory:
+            process.session_id = session_id
+
+        with self._lock:
+            if process:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        self._refill()
+        return process
+
+    def _refill(self) -> None:
+        """空闲进程低于低水位时在后台补充"""
+        with self._lock:
+            if self._closed or self._executor is None:
+                return
+            available = len(self._idle) + self._spawning
+            if available > self.low_water and available > 0:
+                return
+            needed = self.size - available
+            self._spawning += max(needed, 0)
+
+        for _ in range(max(needed, 0)):
+            self._executor.submit(self._spawn_one)
+
+    def _spawn_one(self) -> None:
+        """启动并预热一个进程"""
+        process = None
+        try:
+            pool_id = uuid.uuid4().hex
+            staging_dir = os.path.join(self.pool_dir, pool_id)
+            os.makedirs(staging_dir, exist_ok=True)
+
+            process = SessionProcess(f"pool-{pool_id}", staging_dir)
+            if not process.start() or not process.warm_up():
+                raise RuntimeError("预热进程启动失败")
+
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("预热池已关闭")
+                self._idle.append(process)
+                self.spawned += 1
+            logger.info(f"预热进程就绪 PID: {process.process.pid}")
+
+        except Exception as e:
+            logger.warning(f"补充预热进程失败: {e}")
+            with self._lock:
+                self.spawn_failures += 1
+            if process:
+                self._discard(process)
+        finally:
+            with self._lock:
+                self._spawning -= 1
+
+    def _discard(self, process: SessionProcess) -> None:
+        """终止进程并清理其预热目录"""
+        try:
+            process.terminate()
+        except Exception as e:
+            logger.debug(f"终止预热进程失败: {e}")
+        if process.work_directory and process.work_directory.startswith(self.pool_dir):
+            shutil.rmtree(process.work_directory, ignore_errors=True)
+
+    def get_stats(self) -> dict:
+        """获取预热池统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "size": self.size,
+                "low_water": self.low_water,
+                "idle": len(self._idle),
+                "spawning": self._spawning,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+                "spawned": self.spawned,
+                "spawn_failures": self.spawn_failures
+            }
+
+    def shutdown(self, timeout: float = None) -> None:
+        """关闭预热池并在限定时间内并行终止所有空闲进程"""
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            executor = self._executor
+            self._executor = None
+
+        if executor:
+            executor.shutdown(wait=False)
+        directories = [process.work_directory for process in idle]
+        terminate_processes(idle, config.SHUTDOWN_TIMEOUT if timeout is None else timeout)
+        for directory in directories:
+            if directory and directory.startswith(self.pool_dir):
+                shutil.rmtree(directory, ignore_errors=True)
+        logger.info("预热进程池已关闭")
+
+
+# 全局预热进程池实例
+process_pool = ProcessPool()
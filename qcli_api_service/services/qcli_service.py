@@ -5,12 +5,17 @@ Amazon Q CLI服务 - 核心版本
 """
 
 import os
-import re
 import subprocess
 import tempfile
 import logging
-from typing import Iterator, Optional, List
+from typing import Iterator, Optional, List, Tuple
 from qcli_api_service.config import config, get_timeout_for_request
+from qcli_api_service.services.admission_control import admission_controller, DEFAULT_PRIORITY
+from qcli_api_service.services.response_cache import response_cache
+from qcli_api_service.utils.deduplicator import StreamDeduplicator, deduplicate_text
+from qcli_api_service.utils.output_filter import (
+    ANSI_ESCAPE, clean_line, filter_line, filter_lines, is_prompt_echo, should_skip_line
+)
 
 
 logger = logging.getLogger(__name__)
@@ -20,7 +25,7 @@ class QCLIService:
     """Amazon Q CLI服务类"""
     
     def __init__(self):
-        self.ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+        self.ansi_escape = ANSI_ESCAPE
     
     def is_available(self) -> bool:
         """检查Q CLI是否可用"""
@@ -36,7 +41,8 @@ class QCLIService:
             logger.warning(f"Q CLI不可用: {e}")
             return False
     
-    def chat(self, message: str, context: str = "", work_directory: str = None) -> str:
+    def chat(self, message: str, context: str = "", work_directory: str = None,
+             client_id: str = "", priority: str = DEFAULT_PRIORITY) -> str:
         """
         调用Q CLI进行对话（非流式）
         
@@ -44,10 +50,38 @@ class QCLIService:
             message: 用户消息
             context: 对话上下文（可选）
             work_directory: 工作目录（可选）
+            client_id: 客户端标识，准入控制按客户端公平排队（可选）
+            priority: 准入优先级，high、normal或low（可选）
             
         返回:
             Q CLI的回复
+            
+        异常:
+            AdmissionRejectedError: 排队已满或等待准入超时
+        """
+        return self.chat_with_cache_status(message, context, work_directory, client_id, priority)[0]
+    
+    def chat_with_cache_status(self, message: str, context: str = "", work_directory: str = None,
+                               client_id: str = "", priority: str = DEFAULT_PRIORITY) -> Tuple[str, bool]:
+        """
+        调用Q CLI进行对话（非流式），无状态调用使用回复缓存
+        
+        不带上下文和工作目录的调用与会话无关，开启 RESPONSE_CACHE_ENABLED 时相同的问题直接返回缓存，
+        相同的并发请求只运行一个q进程。启动q进程前先等待全局准入，命中缓存时不占用名额。
+        
+        返回:
+            (Q CLI的回复, 是否来自缓存)
         """
+        def run():
+            with admission_controller.slot(client_id, priority):
+                return self._run_chat(message, context, work_directory)
+        
+        if context or work_directory:
+            return run(), False
+        return response_cache.get_or_compute(message, run)
+    
+    def _run_chat(self, message: str, context: str = "", work_directory: str = None) -> str:
+        """启动一个q进程完成一次对话"""
         try:
             # 准备完整消息
             full_message = self._prepare_message(message, context)
@@ -164,15 +198,15 @@ class QCLIService:
                 
                 # 流式读取输出
                 buffer = []
+                deduplicator = StreamDeduplicator()
                 for line in iter(process.stdout.readline, ''):
-                    # 清理行
-                    cleaned_line = self._clean_line(line)
-                    
-                    # 跳过无效行
-                    if not cleaned_line or self._should_skip_line(cleaned_line):
+                    # 清理行并跳过无效行
+                    cleaned_line = filter_line(line)
+                    if cleaned_line is None:
                         continue
                     
-                    buffer.append(cleaned_line)
+                    # 跳过与之前输出重复的内容
+                    buffer.extend(deduplicator.feed(cleaned_line))
                     
                     # 当缓冲区有内容时，返回
                     if len(buffer) >= 3:  # 每3行返回一次
@@ -180,6 +214,7 @@ class QCLIService:
                         buffer = []
                 
                 # 返回剩余内容
+                buffer.extend(deduplicator.flush())
                 if buffer:
                     yield "\n".join(buffer)
                 
@@ -238,19 +273,16 @@ class QCLIService:
         返回:
             清理后的输出
         """
-        lines = output.split('\n')
         cleaned_lines = []
         
-        for line in lines:
-            cleaned_line = self._clean_line(line)
-            if cleaned_line and not self._should_skip_line(cleaned_line):
-                # 如果行以">"开头且包含实际内容，移除">"符号
-                if cleaned_line.startswith("> "):
-                    cleaned_line = cleaned_line[2:]  # 移除"> "
-                elif cleaned_line.startswith(">"):
-                    cleaned_line = cleaned_line[1:]  # 移除">"
-                
-                cleaned_lines.append(cleaned_line)
+        for cleaned_line in filter_lines(output.split('\n')):
+            # 如果行以">"开头且包含实际内容，移除">"符号
+            if cleaned_line.startswith("> "):
+                cleaned_line = cleaned_line[2:]  # 移除"> "
+            elif cleaned_line.startswith(">"):
+                cleaned_line = cleaned_line[1:]  # 移除">"
+            
+            cleaned_lines.append(cleaned_line)
         
         result = '\n'.join(cleaned_lines)
         
@@ -261,7 +293,9 @@ class QCLIService:
     
     def _remove_duplicate_content(self, text: str) -> str:
         """
-        移除文本中的重复内容（优化版本）
+        移除文本中的重复内容
+        
+        与流式输出使用相同的增量去重规则，保证两种方式得到的回复一致
         
         参数:
             text: 原始文本
@@ -269,178 +303,10 @@ class QCLIService:
         返回:
             去重后的文本
         """
-        if not text or len(text) < 50:  # 短文本直接返回
-            return text
-        
-        # 使用更高效的算法
-        # 首先尝试检测和移除完全重复的段落
-        text = self._remove_exact_duplicates_optimized(text)
-        
-        # 然后使用优化的模式匹配移除常见的重复内容
-        text = self._remove_pattern_duplicates_optimized(text)
-        
-        return text
-    
-    def _remove_exact_duplicates(self, text: str) -> str:
-        """移除完全重复的段落"""
-        # 按段落分割（双换行符）
-        paragraphs = text.split('\n\n')
-        
-        # 如果只有一个段落，按单换行符分割检查
-        if len(paragraphs) == 1:
-            lines = text.split('\n')
-            return self._remove_duplicate_blocks(lines)
-        
-        # 检查段落级别的重复
-        unique_paragraphs = []
-        seen_paragraphs = set()
-        
-        for paragraph in paragraphs:
-            paragraph = paragraph.strip()
-            if paragraph and paragraph not in seen_paragraphs:
-                unique_paragraphs.append(paragraph)
-                seen_paragraphs.add(paragraph)
-        
-        return '\n\n'.join(unique_paragraphs)
-    
-    def _remove_pattern_duplicates(self, text: str) -> str:
-        """使用模式匹配移除常见的重复内容"""
-        lines = text.split('\n')
-        if len(lines) <= 1:
+        if not text:
             return text
         
-        # 定义常见的重复模式
-        help_patterns = [
-            "我可以帮助您",
-            "我可以帮助你",
-            "有什么我可以帮助",
-            "请问有什么我可以帮助",
-            "什么我可以帮助您的吗",
-            "什么我可以帮助你的吗"
-        ]
-        
-        service_patterns = [
-            "管理和查询 AWS 资源",
-            "AWS 服务管理和配置",
-            "代码编写和调试",
-            "编写和调试代码",
-            "文件系统操作",
-            "读写本地文件系统",
-            "执行命令行操作",
-            "命令行操作"
-        ]
-        
-        # 移除重复的帮助提示行和服务列表项
-        unique_lines = []
-        seen_help_line = False
-        seen_service_lists = set()
-        seen_exact_lines = set()
-        
-        for line in lines:
-            line_stripped = line.strip()
-            
-            # 跳过空行
-            if not line_stripped:
-                unique_lines.append(line)
-                continue
-            
-            # 检查完全重复的行
-            if line_stripped in seen_exact_lines:
-                continue
-            
-            # 检查是否是帮助提示行
-            is_help_line = any(pattern in line_stripped for pattern in help_patterns)
-            if is_help_line:
-                if not seen_help_line:
-                    unique_lines.append(line)
-                    seen_help_line = True
-                    seen_exact_lines.add(line_stripped)
-                # 跳过重复的帮助提示行
-                continue
-            
-            # 检查是否是服务列表项（以•开头或包含服务关键词）
-            is_service_line = (line_stripped.startswith('•') or 
-                             any(pattern in line_stripped for pattern in service_patterns))
-            
-            if is_service_line:
-                # 标准化服务描述
-                normalized = self._normalize_service_description(line_stripped)
-                if normalized not in seen_service_lists:
-                    unique_lines.append(line)
-                    seen_service_lists.add(normalized)
-                    seen_exact_lines.add(line_stripped)
-                # 跳过重复的服务列表项
-                continue
-            
-            # 其他行直接添加
-            unique_lines.append(line)
-            seen_exact_lines.add(line_stripped)
-        
-        return '\n'.join(unique_lines)
-    
-    def _normalize_service_description(self, text: str) -> str:
-        """标准化服务描述，用于重复检测"""
-        # 移除项目符号和多余空格
-        normalized = text.replace('•', '').strip()
-        
-        # 标准化常见的服务描述
-        mappings = {
-            "管理和查询 AWS 资源": "aws_management",
-            "AWS 服务管理和配置": "aws_management", 
-            "代码编写和调试": "code_development",
-            "编写和调试代码": "code_development",
-            "文件系统操作": "file_operations",
-            "读写本地文件系统": "file_operations",
-            "读写文件和目录": "file_operations",
-            "执行命令行操作": "command_operations",
-            "命令行操作": "command_operations",
-            "基础设施配置": "infrastructure",
-            "基础设施优化": "infrastructure",
-            "提供 AWS 最佳实践建议": "aws_best_practices",
-            "AWS 最佳实践建议": "aws_best_practices",
-            "解决技术问题": "technical_support",
-            "技术问题": "technical_support"
-        }
-        
-        for pattern, standard in mappings.items():
-            if pattern in normalized:
-                return standard
-        
-        return normalized.lower()
-    
-    def _remove_duplicate_blocks(self, lines: List[str]) -> str:
-        """
-        移除重复的行块
-        
-        参数:
-            lines: 文本行列表
-            
-        返回:
-            去重后的文本
-        """
-        if len(lines) <= 1:
-            return '\n'.join(lines)
-        
-        # 简化算法：检查文本是否在中间位置有完全重复的部分
-        text = '\n'.join(lines)
-        
-        # 尝试找到文本的中点，看是否前半部分和后半部分相同
-        text_length = len(text)
-        mid_point = text_length // 2
-        
-        # 在中点附近寻找可能的分割点（换行符）
-        for offset in range(-50, 51):  # 在中点前后50个字符内寻找
-            split_point = mid_point + offset
-            if 0 < split_point < text_length and text[split_point] == '\n':
-                first_half = text[:split_point].strip()
-                second_half = text[split_point + 1:].strip()
-                
-                # 如果两半完全相同，返回其中一半
-                if first_half == second_half and first_half:
-                    return first_half
-        
-        # 如果没有找到完全重复，返回原文本
-        return text
+        return deduplicate_text(text)
     
     def _clean_line(self, line: str) -> str:
         """
@@ -452,10 +318,7 @@ class QCLIService:
         返回:
             清理后的行
         """
-        # 移除ANSI颜色代码
-        cleaned = self.ansi_escape.sub('', line)
-        # 去除首尾空白
-        return cleaned.strip()
+        return clean_line(line)
     
     def _should_skip_line(self, line: str) -> bool:
         """
@@ -467,123 +330,11 @@ class QCLIService:
         返回:
             是否应该跳过
         """
-        # 跳过命令提示符和退出命令，但保留包含实际回复内容的行
-        
-        # 如果行以">"开头，需要进一步判断
+        # 以">"开头的行只跳过空提示符和用户输入的回显，保留包含AI回复内容的行
         if line.startswith(">"):
-            # 如果">"后面只有空格或者是用户输入的回显，则跳过
-            content_after_prompt = line[1:].strip()
-            
-            # 跳过用户输入的回显（通常是我们发送的问题）
-            if (content_after_prompt.startswith("请用中文回答") or 
-                content_after_prompt.startswith("以下是我们之前的对话历史") or
-                not content_after_prompt):
-                return True
-            
-            # 保留包含AI回复内容的行
-            return False
-        
-        # 其他跳过模式
-        skip_patterns = [
-            lambda l: "/quit" in l,
-            lambda l: l.startswith("q chat"),
-            lambda l: "Welcome to" in l,
-            lambda l: "Type /quit" in l,
-            lambda l: "Did you know?" in l,
-            lambda l: "Get notified whenever" in l,
-            lambda l: "chat.enableNotifications" in l,
-            lambda l: "/help all commands" in l,
-            lambda l: "ctrl + j new lines" in l,
-            lambda l: "You are chatting with" in l,
-            lambda l: "Thinking..." in l,
-            lambda l: l.startswith("━"),
-            lambda l: l.startswith("╭"),
-            lambda l: l.startswith("│"),
-            lambda l: l.startswith("╰"),
-        ]
-        
-        return any(pattern(line) for pattern in skip_patterns)
-    
-    def _remove_exact_duplicates_optimized(self, text: str) -> str:
-        """优化版本的完全重复检测"""
-        # 快速检查：如果文本长度小于100，跳过复杂检测
-        if len(text) < 100:
-            return text
-        
-        # 使用更高效的算法检测重复
-        lines = text.split('\n')
-        if len(lines) < 4:  # 少于4行，不太可能有重复
-            return text
-        
-        # 检查是否有连续的重复行块
-        seen_blocks = set()
-        unique_lines = []
-        i = 0
-        
-        while i < len(lines):
-            line = lines[i].strip()
-            
-            # 检查接下来的3行是否形成重复块
-            if i + 2 < len(lines):
-                block = '\n'.join([lines[i].strip(), lines[i+1].strip(), lines[i+2].strip()])
-                if block in seen_blocks and block.strip():
-                    # 跳过重复块
-                    i += 3
-                    continue
-                elif block.strip():
-                    seen_blocks.add(block)
-            
-            unique_lines.append(lines[i])
-            i += 1
-        
-        return '\n'.join(unique_lines)
-    
-    def _remove_pattern_duplicates_optimized(self, text: str) -> str:
-        """优化版本的模式重复检测"""
-        lines = text.split('\n')
-        if len(lines) <= 2:
-            return text
-        
-        # 使用更高效的重复检测
-        unique_lines = []
-        seen_patterns = set()
-        
-        # 预编译常用模式（避免重复编译）
-        help_keywords = {"帮助", "help", "可以帮助"}
-        service_keywords = {"AWS", "资源", "代码", "文件", "命令"}
-        
-        for line in lines:
-            line_stripped = line.strip()
-            
-            # 跳过空行
-            if not line_stripped:
-                unique_lines.append(line)
-                continue
-            
-            # 快速检查是否是重复的帮助或服务行
-            line_lower = line_stripped.lower()
-            
-            # 生成行的特征（用于重复检测）
-            is_help_line = any(keyword in line_stripped for keyword in help_keywords)
-            is_service_line = (line_stripped.startswith('•') or 
-                             any(keyword in line_stripped for keyword in service_keywords))
-            
-            # 创建行的特征标识
-            if is_help_line:
-                pattern_key = "help_line"
-            elif is_service_line:
-                # 标准化服务行
-                normalized = line_stripped.replace('•', '').strip()
-                pattern_key = f"service_{hash(normalized) % 1000}"
-            else:
-                pattern_key = line_stripped
-            
-            # 检查是否已见过此模式
-            if pattern_key not in seen_patterns:
-                unique_lines.append(line)
-                seen_patterns.add(pattern_key)
+            return is_prompt_echo(line)
         
-        return '\n'.join(unique_lines)
+        return should_skip_line(line)
 
 
 # 全局Q CLI服务实例
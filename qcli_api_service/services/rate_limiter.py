@@ -0,0 +1,341 @@
+"""
+按API密钥和客户端IP的请求频率限制（令牌桶）
+
+每条规则对应一个令牌桶：容量为窗口内允许的请求数，按 次数/窗口秒数 的速率补充令牌，
+空闲的客户端可以一次用满容量，持续请求时平均速率不超过规则。
+- 每个请求按客户端IP计数；带 X-API-Key 时同时按API密钥计数，两个桶都有令牌才放行
+  （更换密钥不能绕过IP限制，同一个密钥从多个地址请求也不能超过密钥的限额）。
+  多个桶原子地检查和扣除：被其中一个桶拒绝的请求不消耗其他桶的令牌
+- 规则按路由配置（RATE_LIMIT_RULES），未匹配任何规则的接口不限制
+- 内存后端按键的哈希分成多个分片，每个分片一把锁，并发请求很少争用同一把锁；
+  多worker部署时每个worker各自计数，可以设置 RATE_LIMIT_BACKEND=redis 共享计数
+  （需要安装redis客户端，令牌桶用Lua脚本在Redis中原子更新）
+
+被限制的请求返回429和Retry-After头，所有受限接口的响应都带 RateLimit-Limit、
+RateLimit-Remaining、RateLimit-Reset 和 RateLimit-Policy 头（IETF RateLimit头字段草案）。
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+from qcli_api_service.config import config
+from qcli_api_service.utils.client_identity import client_address, client_identity
+
+logger = logging.getLogger(__name__)
+
+# 规则格式：[方法 ]路径=次数/秒数，路径以*结尾时按前缀匹配，例如 "POST /api/v1/chat=30/60"
+_RULE_PATTERN = re.compile(r'^(?:([A-Z]+)\s+)?(/\S*)\s*=\s*(\d+)\s*/\s*(\d+)$')
+
+# 内存后端的分片数
+DEFAULT_SHARDS = 16
+
+# Redis中令牌桶键的前缀
+REDIS_KEY_PREFIX = "qcli:ratelimit:"
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """一条路由的限额：window 秒内最多 limit 个请求"""
+    method: Optional[str]
+    path: str
+    limit: int
+    window: int
+
+    @property
+    def name(self) -> str:
+        return f"{self.method} {self.path}" if self.method else self.path
+
+    @property
+    def rate(self) -> float:
+        """每秒补充的令牌数"""
+        return self.limit / self.window
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.method and self.method != method:
+            return False
+        if self.path.endswith("*"):
+            return path.startswith(self.path[:-1])
+        return path == self.path
+
+
+def parse_rules(text: str) -> List[RateLimitRule]:
+    """
+    解析 RATE_LIMIT_RULES
+
+    参数:
+        text: 逗号分隔的规则，例如 "POST /api/v1/chat/stream=10/60, /api/v1/sessions*=120/60"
+
+    返回:
+        规则列表，精确路径优先，其次按前缀从长到短
+    """
+    rules = []
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        match = _RULE_PATTERN.match(item)
+        if not match:
+            raise ValueError(f"限流规则格式错误（应为 [方法 ]路径=次数/秒数）: {item}")
+        method, path, limit, window = match.group(1), match.group(2), int(match.group(3)), int(match.group(4))
+        if limit < 1 or window < 1:
+            raise ValueError(f"限流规则的次数和秒数必须大于0: {item}")
+        rules.append(RateLimitRule(method, path, limit, window))
+    # 精确路径先于前缀，较长的前缀先于较短的前缀，指定方法的规则先于不限方法的规则
+    return sorted(rules, key=lambda r: (r.path.endswith("*"), -len(r.path), r.method is None))
+
+
+@dataclass
+class RateLimitDecision:
+    """一次限流检查的结果（多个桶时取剩余最少的桶）"""
+    rule: RateLimitRule
+    allowed: bool
+    remaining: int
+    reset: int
+    retry_after: int
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            "RateLimit-Limit": str(self.rule.limit),
+            "RateLimit-Remaining": str(self.remaining),
+            "RateLimit-Reset": str(self.reset),
+            "RateLimit-Policy": f"{self.rule.limit};w={self.rule.window}",
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+class MemoryBackend:
+    """进程内令牌桶，按键的哈希分片加锁"""
+
+    name = "memory"
+
+    def __init__(self, shards: int = DEFAULT_SHARDS):
+        # 每个分片：(锁, 键 -> (令牌数, 更新时间, 容量, 速率))
+        self._shards: List[Tuple[threading.Lock, Dict[str, Tuple[float, float, int, float]]]] = [
+            (threading.Lock(), {}) for _ in range(max(1, shards))
+        ]
+
+    def consume(self, key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+        """
+        从桶中取一个令牌
+
+        返回:
+            (是否取到, 取之后剩余的令牌数)
+        """
+        return self.consume_all([key], capacity, rate)
+
+    def consume_all(self, keys: Sequence[str], capacity: int, rate: float) -> Tuple[bool, float]:
+        """
+        所有桶都有令牌时各取一个，否则都不取
+
+        返回:
+            (是否取到, 各桶中最少的剩余令牌数)
+        """
+        indexes = [zlib.crc32(key.encode("utf-8")) % len(self._shards) for key in keys]
+        # 按分片顺序加锁，避免并发请求互相等待
+        locks = [self._shards[index][0] for index in sorted(set(indexes))]
+        now = time.monotonic()
+        for lock in locks:
+            lock.acquire()
+        try:
+            levels = []
+            for key, index in zip(keys, indexes):
+                bucket = self._shards[index][1].get(key)
+                levels.append(capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate))
+            allowed = all(tokens >= 1 for tokens in levels)
+            if allowed:
+                levels = [tokens - 1 for tokens in levels]
+            for key, index, tokens in zip(keys, indexes, levels):
+                self._shards[index][1][key] = (tokens, now, capacity, rate)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        return allowed, min(levels)
+
+    def cleanup(self) -> int:
+        """删除已经补满的桶（与从未请求过的客户端等价），返回删除的数量"""
+        now = time.monotonic()
+        removed = 0
+        for lock, buckets in self._shards:
+            with lock:
+                full = [key for key, (tokens, updated, capacity, rate) in buckets.items()
+                        if tokens + (now - updated) * rate >= capacity]
+                for key in full:
+                    del buckets[key]
+            removed += len(full)
+        return removed
+
+    def size(self) -> int:
+        return sum(len(buckets) for _, buckets in self._shards)
+
+
+# KEYS=桶键；ARGV=容量, 每秒速率, 当前时间(秒)。所有桶都有令牌时各取一个，否则都不取
+_REDIS_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local levels = {}
+local allowed = 1
+for i, key in ipairs(KEYS) do
+  local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+  local tokens = tonumber(bucket[1])
+  if tokens == nil then
+    tokens = capacity
+  else
+    tokens = math.min(capacity, tokens + math.max(0, now - tonumber(bucket[2])) * rate)
+  end
+  if tokens < 1 then
+    allowed = 0
+  end
+  levels[i] = tokens
+end
+local remaining = capacity
+for i, key in ipairs(KEYS) do
+  local tokens = levels[i] - allowed
+  remaining = math.min(remaining, tokens)
+  redis.call('HSET', key, 'tokens', tostring(tokens), 'updated', tostring(now))
+  redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return {allowed, tostring(remaining)}
+"""
+
+
+class RedisBackend:
+    """多个worker共享的令牌桶（Redis + Lua脚本）"""
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        import redis  # 可选依赖，只有 RATE_LIMIT_BACKEND=redis 时需要
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._script = self._client.register_script(_REDIS_SCRIPT)
+        self.errors = 0
+
+    def consume(self, key: str, capacity: int, rate: float) -> Tuple[bool, float]:
+        return self.consume_all([key], capacity, rate)
+
+    def consume_all(self, keys: Sequence[str], capacity: int, rate: float) -> Tuple[bool, float]:
+        try:
+            allowed, tokens = self._script(
+                keys=[REDIS_KEY_PREFIX + key for key in keys], args=[capacity, rate, time.time()]
+            )
+        except Exception as e:
+            # Redis不可用时放行，限流失效好过整个服务不可用
+            self.errors += 1
+            logger.warning(f"限流后端Redis不可用，本次请求不限流: {e}")
+            return True, capacity - 1
+        return bool(allowed), float(tokens)
+
+    def cleanup(self) -> int:
+        return 0  # 键带过期时间，由Redis清理
+
+
+def create_backend(name: str, redis_url: str):
+    """按配置创建限流后端，Redis客户端未安装时退回内存后端"""
+    if name == "redis":
+        try:
+            return RedisBackend(redis_url)
+        except ImportError:
+            logger.warning("RATE_LIMIT_BACKEND=redis 需要安装redis客户端（pip install redis），改用进程内限流")
+    return MemoryBackend()
+
+
+class RateLimiter:
+    """按路由规则检查请求频率"""
+
+    def __init__(self, enabled: bool = None, rules: List[RateLimitRule] = None, backend=None):
+        self.enabled = config.RATE_LIMIT_ENABLED if enabled is None else enabled
+        self.rules = parse_rules(config.RATE_LIMIT_RULES) if rules is None else rules
+        self._backend = backend
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def backend(self):
+        # 延迟创建，未开启限流时不连接Redis
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = create_backend(config.RATE_LIMIT_BACKEND, config.RATE_LIMIT_REDIS_URL)
+        return self._backend
+
+    def match(self, method: str, path: str) -> Optional[RateLimitRule]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    def check(self, method: str, path: str, api_key: Optional[str],
+              forwarded_for: Optional[str], remote_addr: Optional[str]) -> Optional[RateLimitDecision]:
+        """
+        检查一个请求并扣除令牌
+
+        参数:
+            method, path: 请求方法和路径
+            api_key, forwarded_for, remote_addr: 用于识别客户端（与准入控制的客户端标识一致）
+
+        返回:
+            检查结果；未开启限流或接口不受限时返回None
+        """
+        if not self.enabled or method == "OPTIONS":
+            return None
+        rule = self.match(method, path)
+        if rule is None:
+            return None
+
+        identities = ["ip:" + client_address(forwarded_for, remote_addr)]
+        if api_key:
+            identities.append(client_identity(api_key, None, None))
+
+        # 所有桶一起检查和扣除，被一个桶拒绝时不消耗其他桶的令牌
+        allowed, tokens = self.backend.consume_all(
+            [f"{rule.name}|{identity}" for identity in identities], rule.limit, rule.rate
+        )
+
+        with self._lock:
+            if allowed:
+                self.allowed += 1
+            else:
+                self.limited += 1
+
+        return RateLimitDecision(
+            rule=rule,
+            allowed=allowed,
+            remaining=max(0, int(tokens)),
+            reset=math.ceil((rule.limit - tokens) / rule.rate),
+            retry_after=0 if allowed else max(1, math.ceil((1 - tokens) / rule.rate)),
+        )
+
+    def cleanup(self) -> int:
+        if not self.enabled:
+            return 0
+        return self.backend.cleanup()
+
+    def get_stats(self) -> dict:
+        stats = {
+            "enabled": self.enabled,
+            "rules": [f"{rule.name}={rule.limit}/{rule.window}" for rule in self.rules],
+        }
+        if not self.enabled:
+            return stats
+        backend = self.backend
+        with self._lock:
+            stats.update({"backend": backend.name, "allowed": self.allowed, "limited": self.limited})
+        if isinstance(backend, MemoryBackend):
+            stats["buckets"] = backend.size()
+        else:
+            stats["backend_errors"] = backend.errors
+        return stats
+
+
+# 全局限流器实例
+rate_limiter = RateLimiter()
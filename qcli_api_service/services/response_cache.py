@@ -0,0 +1,270 @@
+"""
+无状态对话的回复缓存
+
+不带会话ID的一次性问题每次都要新建会话、运行一轮q，同样的常见问题（例如飞书机器人整天收到的AWS问题）
+会被反复计算。开启 RESPONSE_CACHE_ENABLED 后，按规范化的消息加 FORCE_CHINESE 缓存回复：
+- 条目在 RESPONSE_CACHE_TTL 秒后过期，超出条目数或字节上限时淘汰最久未使用的条目
+- 相同的请求同时到达时只运行一个q进程，其余请求等待同一个结果（singleflight）
+- 设置 RESPONSE_CACHE_SIMILARITY 后，精确匹配未命中时在近似重复索引中查找相似度达到阈值的
+  已缓存问题（只差空白、标点或开头说法不同），直接返回它的回复
+
+只缓存成功的回复；指定会话的对话（回复取决于会话历史）不经过缓存。
+Flask控制器使用 get_or_compute，ASGI应用使用 get_or_compute_async（等待其他请求的结果时不占用线程）。
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from qcli_api_service.config import config
+from qcli_api_service.services.turn_scheduler import _AsyncGrant
+from qcli_api_service.utils.prompt_similarity import PromptSimilarityIndex
+from qcli_api_service.utils.validators import InputValidator
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """一次进行中的计算，相同键的请求等待它的结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self._listeners: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """登记得到结果时的回调（已有结果时立即调用）"""
+        with self._lock:
+            if not self.done.is_set():
+                self._listeners.append(callback)
+                return
+        callback()
+
+    def resolve(self, value: Optional[str], error: Optional[BaseException]) -> None:
+        with self._lock:
+            self.value = value
+            self.error = error
+            self.done.set()
+            listeners, self._listeners = self._listeners, []
+        for callback in listeners:
+            callback()
+
+    def result(self) -> Tuple[str, bool]:
+        """等待其他请求计算的结果：异常原样抛出，回复视为命中"""
+        if self.error is not None:
+            raise self.error
+        return self.value, True
+
+
+class ResponseCache:
+    """带TTL、LRU淘汰和字节上限的回复缓存"""
+
+    def __init__(self, enabled: bool = None, ttl: int = None,
+                 max_entries: int = None, max_bytes: int = None, similarity: float = None):
+        self.enabled = config.RESPONSE_CACHE_ENABLED if enabled is None else enabled
+        self.ttl = config.RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.max_entries = config.RESPONSE_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = config.RESPONSE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.similarity = config.RESPONSE_CACHE_SIMILARITY if similarity is None else similarity
+        # 键 -> (回复, 字节数, 过期时间)，按最近使用排序
+        self._entries: "OrderedDict[str, Tuple[str, int, float]]" = OrderedDict()
+        self._flights: Dict[str, _Flight] = {}
+        self._index = PromptSimilarityIndex()
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        # 统计信息
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expired = 0
+
+    @staticmethod
+    def make_key(message: str) -> str:
+        """缓存键：规范化的消息（去除首尾空白、合并空白、忽略大小写）加是否强制中文"""
+        normalized = InputValidator.clean_message(message).casefold()
+        return hashlib.sha256(f"{int(config.FORCE_CHINESE)}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def get_or_compute(self, message: str, compute: Callable[[], str]) -> Tuple[str, bool]:
+        """
+        获取缓存的回复，未命中时计算并缓存
+
+        参数:
+            message: 用户消息
+            compute: 未命中时调用，返回回复（异常原样抛给所有等待的请求，不缓存）
+
+        返回:
+            (回复, 是否来自缓存)；等待其他请求计算结果的也视为命中
+        """
+        if not self.enabled:
+            return compute(), False
+
+        key = self.make_key(message)
+        cached, flight, owner = self._begin(key, message)
+        if cached is not None:
+            return cached, True
+        if not owner:
+            flight.done.wait()
+            return flight.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            self._end(key, flight, message, None, e)
+            raise
+        self._end(key, flight, message, value, None)
+        return value, False
+
+    async def get_or_compute_async(self, message: str, compute: Callable[[], Awaitable[str]]) -> Tuple[str, bool]:
+        """get_or_compute 的asyncio版本，compute 为返回回复的协程函数"""
+        if not self.enabled:
+            return await compute(), False
+
+        key = self.make_key(message)
+        cached, flight, owner = self._begin(key, message)
+        if cached is not None:
+            return cached, True
+        if not owner:
+            grant = _AsyncGrant()
+            flight.add_listener(grant.set)
+            await grant.wait(None)
+            return flight.result()
+
+        try:
+            value = await compute()
+        except BaseException as e:
+            self._end(key, flight, message, None, e)
+            raise
+        self._end(key, flight, message, value, None)
+        return value, False
+
+    def _begin(self, key: str, message: str) -> Tuple[Optional[str], Optional[_Flight], bool]:
+        """
+        查找缓存，未命中时登记或加入进行中的计算
+
+        返回:
+            (缓存的回复, 计算, 是否由调用方计算)；命中时计算为None
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits += 1
+                return entry, None, False
+
+            entry = self._lookup_similar(message)
+            if entry is not None:
+                self.near_hits += 1
+                return entry, None, False
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return None, flight, False
+
+            flight = _Flight()
+            self._flights[key] = flight
+            self.misses += 1
+            return None, flight, True
+
+    def _end(self, key: str, flight: _Flight, message: str,
+             value: Optional[str], error: Optional[BaseException]) -> None:
+        """缓存成功的回复，结束计算并唤醒等待的请求"""
+        if error is None:
+            self._store(key, value, message)
+        with self._lock:
+            self._flights.pop(key, None)
+        flight.resolve(value, error)
+
+    def _lookup(self, key: str) -> Optional[str]:
+        """查找未过期的条目并标记为最近使用（调用方需持有_lock）"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] <= time.time():
+            self._remove(key)
+            self.expired += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _lookup_similar(self, message: str) -> Optional[str]:
+        """查找相似度达到阈值的已缓存问题的回复（调用方需持有_lock）"""
+        if self.similarity <= 0:
+            return None
+        match = self._index.query(message, self.similarity)
+        if match is None:
+            return None
+        logger.debug(f"近似重复问题命中缓存，相似度 {match[1]:.2f}")
+        return self._lookup(match[0])
+
+    def _store(self, key: str, value: str, message: str) -> None:
+        size = len(value.encode("utf-8"))
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.time() + self.ttl)
+            self._bytes += size
+            if self.similarity > 0:
+                self._index.add(key, message)
+            while self._entries and (
+                (self.max_entries and len(self._entries) > self.max_entries)
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        """删除条目（调用方需持有_lock）"""
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        self._index.remove(key)
+
+    def cleanup_expired(self) -> int:
+        """清理过期条目，返回清理数量"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (_, _, expires_at) in self._entries.items() if expires_at <= now]
+            for key in expired:
+                self._remove(key)
+            self.expired += len(expired)
+        return len(expired)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._index.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> dict:
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses + self.coalesced
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "similarity_threshold": self.similarity,
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_ratio": round((self.hits + self.near_hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired
+            }
+
+
+# 全局回复缓存实例
+response_cache = ResponseCache()
@@ -5,14 +5,16 @@
 支持为每个会话创建独立的工作目录。
 """
 
+import heapq
 import threading
 import time
 import os
 import shutil
 import logging
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 from qcli_api_service.models.core import Session, Message
 from qcli_api_service.config import config
+from qcli_api_service.utils.session_routing import generate_session_id
 
 logger = logging.getLogger(__name__)
 
@@ -23,14 +25,21 @@ class SessionManager:
     def __init__(self):
         self._sessions: Dict[str, Session] = {}
         self._lock = threading.RLock()
+        # 过期索引：(过期时间, 会话ID) 小顶堆，活跃时间更新时追加新条目，旧条目在弹出时校验丢弃
+        self._expiry_heap: List[Tuple[float, str]] = []
         # 确保会话基础目录存在
         os.makedirs(config.SESSIONS_BASE_DIR, exist_ok=True)
     
     def create_session(self) -> Session:
         """创建新会话"""
         with self._lock:
-            session = Session.create_new(config.SESSIONS_BASE_DIR)
+            session = Session.create_new(
+                config.SESSIONS_BASE_DIR,
+                generate_session_id(config.WORKER_INDEX, config.WORKERS)
+            )
             self._sessions[session.session_id] = session
+            session._activity_listener = self._on_session_activity
+            self._on_session_activity(session)
             logger.info(f"创建新会话: {session.session_id}, 工作目录: {session.work_directory}")
             return session
     
@@ -42,23 +51,14 @@ class SessionManager:
     def delete_session(self, session_id: str) -> bool:
         """删除会话"""
         with self._lock:
-            if session_id in self._sessions:
-                session = self._sessions[session_id]
-                
-                # 清理对应的Q CLI进程
-                try:
-                    from qcli_api_service.services.session_process_manager import session_process_manager
-                    session_process_manager.remove_process(session_id)
-                    logger.info(f"已清理会话 {session_id} 的Q CLI进程")
-                except Exception as e:
-                    logger.warning(f"清理会话 {session_id} 的Q CLI进程时出错: {e}")
-                
-                # 删除会话工作目录
-                self._cleanup_session_directory(session.work_directory)
-                del self._sessions[session_id]
-                logger.info(f"删除会话: {session_id}, 工作目录: {session.work_directory}")
-                return True
+            session = self._sessions.pop(session_id, None)
+        if not session:
             return False
+        
+        # 进程和目录的清理较慢，在锁外进行，避免阻塞其他请求
+        self._release_session_resources(session_id, session.work_directory, remove_directory=True)
+        logger.info(f"删除会话: {session_id}, 工作目录: {session.work_directory}")
+        return True
     
     def add_message(self, session_id: str, message: Message) -> bool:
         """向会话添加消息"""
@@ -90,28 +90,84 @@ class SessionManager:
     
     def cleanup_expired_sessions(self) -> int:
         """清理过期会话"""
+        expired_sessions = []
+        current_time = time.time()
+        
+        # 只从过期索引中弹出已到期的条目，不扫描全部会话
         with self._lock:
-            expired_sessions = []
-            for session_id, session in self._sessions.items():
+            while self._expiry_heap and self._expiry_heap[0][0] < current_time:
+                _, session_id = heapq.heappop(self._expiry_heap)
+                session = self._sessions.get(session_id)
+                if session is None:
+                    continue
                 if session.is_expired(config.SESSION_EXPIRY):
+                    del self._sessions[session_id]
                     expired_sessions.append((session_id, session.work_directory))
-            
-            for session_id, work_dir in expired_sessions:
-                # 清理对应的Q CLI进程
-                try:
-                    from qcli_api_service.services.session_process_manager import session_process_manager
-                    session_process_manager.remove_process(session_id)
-                    logger.info(f"已清理过期会话 {session_id} 的Q CLI进程")
-                except Exception as e:
-                    logger.warning(f"清理过期会话 {session_id} 的Q CLI进程时出错: {e}")
-                
-                # 清理会话工作目录
-                if config.AUTO_CLEANUP_SESSIONS:
-                    self._cleanup_session_directory(work_dir)
-                del self._sessions[session_id]
-                logger.info(f"清理过期会话: {session_id}, 工作目录: {work_dir}")
-            
-            return len(expired_sessions)
+                else:
+                    # 过期时间已推迟，重新放入索引
+                    heapq.heappush(self._expiry_heap, (session.last_activity + config.SESSION_EXPIRY, session_id))
+        
+        for session_id, work_dir in expired_sessions:
+            self._release_session_resources(session_id, work_dir, remove_directory=config.AUTO_CLEANUP_SESSIONS)
+            logger.info(f"清理过期会话: {session_id}, 工作目录: {work_dir}")
+        
+        return len(expired_sessions)
+    
+    def _on_session_activity(self, session: Session) -> None:
+        """会话活跃时间更新时追加过期索引条目"""
+        with self._lock:
+            heapq.heappush(self._expiry_heap, (session.last_activity + config.SESSION_EXPIRY, session.session_id))
+            # 过期条目过多时重建索引
+            if len(self._expiry_heap) > 2 * len(self._sessions) + 64:
+                self._expiry_heap = [
+                    (s.last_activity + config.SESSION_EXPIRY, sid) for sid, s in self._sessions.items()
+                ]
+                heapq.heapify(self._expiry_heap)
+    
+    def _release_session_resources(self, session_id: str, work_directory: str, remove_directory: bool) -> None:
+        """清理会话对应的Q CLI进程和工作目录（在锁外调用）"""
+        terminations = []
+        try:
+            from qcli_api_service.services.session_process_manager import session_process_manager
+            from qcli_api_service.services.async_session_process import async_process_manager
+            terminations.append(session_process_manager.remove_process(session_id))
+            terminations.append(async_process_manager.remove_process(session_id))
+            logger.info(f"已清理会话 {session_id} 的Q CLI进程")
+        except Exception as e:
+            logger.warning(f"清理会话 {session_id} 的Q CLI进程时出错: {e}")
+        
+        from qcli_api_service.services.stream_replay import stream_replay
+        from qcli_api_service.services.job_manager import job_manager
+        stream_replay.remove_session(session_id)
+        job_manager.remove_session(session_id)
+        
+        if remove_directory:
+            self._cleanup_directory_after(terminations, work_directory)
+    
+    def _cleanup_directory_after(self, terminations: List, work_directory: str) -> None:
+        """
+        等进程终止后再删除工作目录
+        
+        进程在后台回收线程中终止，q 的当前目录就是会话目录，处理 /quit 时仍可能写入，
+        因此目录在所有终止操作结束后由最后一个完成回调删除，不阻塞调用方。
+        """
+        pending = [future for future in terminations if future is not None and not future.done()]
+        if not pending:
+            self._cleanup_session_directory(work_directory)
+            return
+        
+        remaining = [len(pending)]
+        lock = threading.Lock()
+        
+        def on_terminated(_):
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                self._cleanup_session_directory(work_directory)
+        
+        for future in pending:
+            future.add_done_callback(on_terminated)
     
     def get_active_session_count(self) -> int:
         """获取活跃会话数量"""
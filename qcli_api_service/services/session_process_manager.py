@@ -5,14 +5,29 @@
 """
 
 import os
+import fcntl
+import select
+import signal
+import struct
 import subprocess
+import termios
 import threading
 import time
 import logging
-import select
-import sys
-from typing import Dict, Optional, Iterator
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Dict, Optional, Iterator, Deque, List
 from qcli_api_service.config import config
+from qcli_api_service.services.output_multiplexer import output_multiplexer
+from qcli_api_service.services.stream_decoder import StreamDecoder
+from qcli_api_service.services.chunk_coalescer import ChunkCoalescer
+from qcli_api_service.services.stderr_monitor import StderrMonitor, QCLIProcessError
+from qcli_api_service.services.completion_detector import (
+    CompletionDetector, turn_latency_stats, turn_cancellation_stats,
+    REASON_IDLE_TIMEOUT, REASON_MAX_WAIT, REASON_PROCESS_EXIT, REASON_CANCELLED
+)
+from qcli_api_service.utils.deduplicator import StreamDeduplicator
+from qcli_api_service.utils.output_filter import should_skip_line
 
 logger = logging.getLogger(__name__)
 
@@ -20,20 +35,50 @@ logger = logging.getLogger(__name__)
 class SessionProcess:
     """单个会话的Q Chat进程封装"""
     
-    def __init__(self, session_id: str, work_directory: str = None):
+    def __init__(self, session_id: str, work_directory: str = None, resume: bool = False):
         self.session_id = session_id
         self.work_directory = work_directory
+        self.resume = resume  # 使用 q chat --resume 恢复该目录下的上一次对话
+        self.restore_context: Optional[str] = None  # 随下一条消息发送的历史上下文
+        self.in_turn = False
+        self.leases = 0  # 已交给请求、尚未结束的轮次数（由进程管理器的锁保护），占用中的进程不会被驱逐
+        self.transport = config.QCLI_TRANSPORT  # pipe 或 pty
         self.process: Optional[subprocess.Popen] = None
+        self._pty_master: Optional[int] = None
         self.lock = threading.Lock()
         self.created_at = time.time()
         self.last_activity = time.time()
+        self.last_output_at = 0.0
+        
+        # 响应处理相关：读取线程生产，read_response消费，有新内容时通过条件变量唤醒
+        # 队列中的每一块都是原样的文本片段（自带换行），按顺序拼接即为完整回复
+        self.response_queue: Deque[str] = deque()
+        self.response_lock = threading.RLock()
+        self.response_ready = threading.Condition(self.response_lock)
+        
+        # 输出由共享的多路复用线程读取，这里保存增量解码状态
+        self._stream = StreamDecoder()
+        self._registered_fds = []
+        
+        # 未换行的部分输出超过延迟预算后即发出，不等待整行
+        self.stream_latency_budget = config.STREAM_LATENCY_BUDGET_MS / 1000.0
+        self._partial_since = 0.0
+        
+        # 每轮回复逐行去重，与非流式的清理规则一致
+        self._deduplicator = StreamDeduplicator()
+        
+        # 回复结束检测相关
+        self.detector = CompletionDetector()
+        self.turn_complete = threading.Event()
+        self.turn_completed_at = 0.0
+        self.turn_completion_reason: Optional[str] = None
+        self.turn_started_at = 0.0
+        self._turn_cpu_start: Optional[float] = None
+        self.prompt_seen = threading.Event()
         
-        # 响应处理相关
-        self.response_queue = []
-        self.response_lock = threading.Lock()
-        self.output_thread = None
-        self.reading = False
-        self.current_response = []
+        # stderr环形缓冲，对话中出现认证过期、限流等错误时立即结束本轮
+        self.stderr = StderrMonitor()
+        self.turn_error: Optional[QCLIProcessError] = None
         
     def start(self) -> bool:
         """启动Q Chat进程"""
@@ -41,121 +86,297 @@ class SessionProcess:
             if self.process and self.is_alive():
                 return True
                 
+            # 旧进程已退出时先注销其输出
+            self._unregister_output()
+            
             try:
-                # 准备环境变量
-                env = os.environ.copy()
-                if not env.get("AWS_DEFAULT_REGION"):
-                    env["AWS_DEFAULT_REGION"] = config.AWS_DEFAULT_REGION
+                command, env = self._build_command()
                 
-                # 启动Q Chat进程，使用--trust-all-tools参数
-                self.process = subprocess.Popen(
-                    ["q", "chat", "--trust-all-tools"],
-                    stdin=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    bufsize=1,  # 行缓冲
-                    universal_newlines=True,
-                    cwd=self.work_directory,
-                    env=env
-                )
+                if self.transport == "pty":
+                    # 连接到伪终端：CLI按终端方式逐行输出并显示交互提示符
+                    self._pty_master, slave_fd = _open_pty(config.QCLI_PTY_ROWS, config.QCLI_PTY_COLUMNS)
+                    env.setdefault("TERM", "xterm-256color")
+                    env["COLUMNS"] = str(config.QCLI_PTY_COLUMNS)
+                    env["LINES"] = str(config.QCLI_PTY_ROWS)
+                    try:
+                        self.process = subprocess.Popen(
+                            command,
+                            stdin=slave_fd,
+                            stdout=slave_fd,
+                            stderr=subprocess.PIPE,
+                            cwd=self.work_directory,
+                            env=env,
+                            start_new_session=True
+                        )
+                    finally:
+                        os.close(slave_fd)
+                else:
+                    self.process = subprocess.Popen(
+                        command,
+                        stdin=subprocess.PIPE,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.PIPE,
+                        bufsize=0,  # 输出按字节读取，便于识别不带换行的提示符
+                        cwd=self.work_directory,
+                        env=env
+                    )
                 
-                logger.info(f"为会话 {self.session_id} 启动Q Chat进程 PID: {self.process.pid}")
+                logger.info(f"为会话 {self.session_id} 启动Q Chat进程 PID: {self.process.pid} ({self.transport})")
                 
-                # 启动后台线程持续读取输出
-                self._start_output_reader()
+                # 交给共享的多路复用线程读取输出
+                self._register_output()
                 return True
                 
             except Exception as e:
                 logger.error(f"启动Q Chat进程失败 (会话 {self.session_id}): {e}")
                 self.process = None
+                self._close_pty()
                 return False
     
-    def _start_output_reader(self):
-        """启动后台线程持续读取输出"""
-        if self.output_thread and self.output_thread.is_alive():
+    def _build_command(self):
+        """Q Chat启动命令和环境变量"""
+        env = os.environ.copy()
+        if not env.get("AWS_DEFAULT_REGION"):
+            env["AWS_DEFAULT_REGION"] = config.AWS_DEFAULT_REGION
+        
+        # 启动Q Chat进程，使用--trust-all-tools参数
+        command = ["q", "chat", "--trust-all-tools"]
+        if self.resume:
+            command.append("--resume")
+        return command, env
+    
+    def _register_output(self):
+        """将stdout和stderr注册到共享的输出多路复用器"""
+        with self.response_lock:
+            self._stream = StreamDecoder(terminal=self._pty_master is not None)
+            self._partial_since = 0.0
+        
+        stdout_fd = self._pty_master if self._pty_master is not None else self.process.stdout.fileno()
+        stderr_fd = self.process.stderr.fileno()
+        output_multiplexer.register(stdout_fd, self._on_stdout_data, self._on_stdout_closed)
+        output_multiplexer.register(stderr_fd, self._on_stderr_data)
+        self._registered_fds = [stdout_fd, stderr_fd]
+        logger.debug(f"会话 {self.session_id} 的输出已注册到多路复用器")
+    
+    def _unregister_output(self):
+        """从输出多路复用器注销"""
+        for fd in self._registered_fds:
+            output_multiplexer.unregister(fd)
+        self._registered_fds = []
+        self._close_pty()
+    
+    def _close_pty(self):
+        """关闭伪终端主端"""
+        if self._pty_master is not None:
+            try:
+                os.close(self._pty_master)
+            except OSError:
+                pass
+            self._pty_master = None
+    
+    def _write_input(self, data: bytes, timeout: float = 10.0):
+        """向进程写入一行输入（PTY模式下以回车结束）"""
+        if self._pty_master is None:
+            self.process.stdin.write(data + b"\n")
+            self.process.stdin.flush()
             return
         
-        self.reading = True
-        self.output_thread = threading.Thread(target=self._read_output_continuously, daemon=True)
-        self.output_thread.start()
-        logger.debug(f"为会话 {self.session_id} 启动输出读取线程")
+        # 主端为非阻塞，终端缓冲区写满时等待可写
+        view = memoryview(data + b"\r")
+        deadline = time.time() + timeout
+        while view:
+            try:
+                view = view[os.write(self._pty_master, view):]
+            except BlockingIOError:
+                if time.time() >= deadline:
+                    raise TimeoutError("写入伪终端超时")
+                select.select([], [self._pty_master], [], 0.1)
     
-    def _read_output_continuously(self):
-        """持续读取Q Chat输出的后台线程"""
-        last_output_time = time.time()
+    def _on_stdout_data(self, data: bytes):
+        """处理stdout数据（在多路复用线程中调用）"""
+        self.last_output_at = time.time()
         
-        try:
-            while self.reading and self.is_alive():
-                try:
-                    line = self.process.stdout.readline()
-                    if not line:
-                        # 检查是否长时间没有输出，如果有当前响应则保存
-                        current_time = time.time()
-                        if current_time - last_output_time > 2.0:  # 2秒没有新输出就保存
-                            with self.response_lock:
-                                if self.current_response:
-                                    response_text = "\n".join(self.current_response)
-                                    self.response_queue.append(response_text)
-                                    logger.debug(f"自动保存响应到队列 (会话 {self.session_id}): {len(response_text)} 字符")
-                                    self.current_response = []
-                                    last_output_time = current_time  # 重置时间
-                        
-                        time.sleep(0.1)
-                        continue
-                    
-                    last_output_time = time.time()
-                    
-                    # 清理ANSI颜色代码
-                    cleaned_line = self._clean_line(line)
-                    
-                    # 处理输出行
-                    self._process_output_line(cleaned_line)
-                    
-                except Exception as e:
-                    logger.debug(f"读取输出行时出错 (会话 {self.session_id}): {e}")
-                    time.sleep(0.1)
-                    
-        except Exception as e:
-            logger.error(f"输出读取线程异常 (会话 {self.session_id}): {e}")
-        finally:
-            # 线程结束时保存剩余响应
-            with self.response_lock:
-                if self.current_response:
-                    response_text = "\n".join(self.current_response)
-                    self.response_queue.append(response_text)
-                    logger.debug(f"线程结束时保存响应 (会话 {self.session_id}): {len(response_text)} 字符")
-                    self.current_response = []
+        with self.response_lock:
+            # 按换行拆分出完整行，不完整的尾部留在解码器中
+            for line, emitted in self._stream.feed(data):
+                self._process_output_line(line, emitted)
             
-            logger.debug(f"会话 {self.session_id} 输出读取线程结束")
+            # 提示符不带换行符，需要检查尾部
+            self._check_pending_output()
+    
+    def _on_stdout_closed(self):
+        """stdout关闭（进程退出）时保存剩余响应"""
+        with self.response_lock:
+            for line, emitted in self._stream.feed(b"", final=True):
+                self._process_output_line(line, emitted)
+            self._partial_since = 0.0
+        self._mark_turn_complete(REASON_PROCESS_EXIT)
+        logger.debug(f"会话 {self.session_id} 的输出已关闭")
+    
+    def _on_stderr_data(self, data: bytes):
+        """持续读取stderr，避免管道写满阻塞进程"""
+        for event in self.stderr.feed(data):
+            logger.warning(f"会话 {self.session_id} 的Q Chat进程报告错误 ({event['type']}): {event['line']}")
+            if self.in_turn:
+                with self.response_lock:
+                    if self.turn_error is None:
+                        self.turn_error = QCLIProcessError(event["type"], event["line"])
+                self._mark_turn_complete(event["type"])
+    
+    def _check_pending_output(self):
+        """检查尚未换行的输出：识别输入提示符，或在延迟预算到期后作为部分行发出（调用方需持有response_lock）"""
+        text = self._stream.visible_pending().strip()
+        if self.detector.is_prompt(text):
+            self.prompt_seen.set()
+        reason = self.detector.match_pending(text)
+        if reason:
+            self._partial_since = 0.0
+            self._mark_turn_complete(reason)
+            return
+        
+        if not self._has_partial_output():
+            self._partial_since = 0.0
+            return
+        if not self._partial_since:
+            # 通知读取方按延迟预算安排发出时间
+            self._partial_since = time.time()
+            self._notify_readers()
+        if time.time() - self._partial_since >= self.stream_latency_budget:
+            self._flush_partial_output()
+    
+    def _has_partial_output(self) -> bool:
+        """尾部是否有可以提前发出的内容（调用方需持有response_lock）"""
+        if not self._stream.partial_available():
+            return False
+        # 之前的行仍在等待去重判断时，后续内容不能先发出
+        if self._deduplicator.holding:
+            return False
+        text = self._stream.pending.strip()
+        if not text or text.startswith(">") or self.detector.is_echo(text):
+            return False
+        # 可能是尚未输出完整的提示符或结束标记，需等待整行
+        if self.detector.may_complete(text):
+            return False
+        return not self._should_skip_line(text)
+    
+    def _flush_partial_output(self):
+        """发出尾部尚未发出的部分（调用方需持有response_lock）"""
+        self._partial_since = 0.0
+        partial = self._stream.take_partial()
+        if partial:
+            self.detector.note_content()
+            self._enqueue_response(partial)
     
-    def _process_output_line(self, line: str):
-        """处理单行输出"""
+    def _enqueue_response(self, response_text: str):
+        """将响应片段放入队列并唤醒等待的读取方（调用方需持有response_lock）"""
+        if self.response_queue:
+            # 读取方尚未取走上一块时直接合并，减少小块数量
+            self.response_queue[-1] += response_text
+        else:
+            self.response_queue.append(response_text)
+        self._notify_readers()
+    
+    def _notify_readers(self):
+        """唤醒等待响应的读取方（调用方需持有response_lock）"""
+        self.response_ready.notify_all()
+    
+    def _mark_turn_complete(self, reason: str):
+        """标记本轮回复已结束"""
         with self.response_lock:
-            # 检查是否是用户输入回显（以 > 开头）
-            if line.startswith("> "):
-                # 如果有当前响应，保存它
-                if self.current_response:
-                    response_text = "\n".join(self.current_response)
-                    self.response_queue.append(response_text)
-                    logger.debug(f"保存响应到队列 (会话 {self.session_id}): {len(response_text)} 字符")
-                    self.current_response = []
+            if self.turn_complete.is_set():
                 return
+            for held in self._deduplicator.flush():
+                self._enqueue_line(held)
+            self.turn_completed_at = time.time()
+            self.turn_completion_reason = reason
+            self.turn_complete.set()
+            self._notify_readers()
+        logger.debug(f"检测到回复结束 (会话 {self.session_id}): {reason}")
+    
+    def _process_output_line(self, line: str, emitted: int = 0):
+        """处理单行输出（调用方需持有response_lock）
+        
+        参数:
+            line: 去除ANSI后的完整行
+            emitted: 该行已作为部分行发出的字符数
+        """
+        text = line.strip()
+        
+        # 检查是否为结束标记或重新出现的提示符
+        if self.detector.is_prompt(text):
+            self.prompt_seen.set()
+        reason = self.detector.match_line(text)
+        if reason:
+            self._mark_turn_complete(reason)
+            return
+        
+        # 已部分发出的行只补上剩余部分，不再参与去重
+        if emitted:
+            *held, _ = self._deduplicator.commit(text)
+            for held_line in held:
+                self._enqueue_line(held_line)
+            self._enqueue_response(line[emitted:].rstrip() + "\n")
+            return
+        
+        # 跳过用户输入回显和无效行；行首的提示符之后若不是本轮发送的消息，则是接在提示符后的回复
+        if text.startswith("> "):
+            return
+        text = self.detector.strip_echo(text)
+        if text is None or self._should_skip_line(text):
+            return
+        
+        # 保留回复中的段落空行
+        if text or self.detector.content_seen:
+            for released in self._deduplicator.feed(text):
+                self._enqueue_line(released)
+    
+    def _enqueue_line(self, text: str):
+        """放入一整行回复（调用方需持有response_lock）"""
+        if text:
+            self.detector.note_content()
+        self._enqueue_response(text + "\n")
+    
+    def warm_up(self, timeout: float = 30.0, quiet_period: float = 1.0) -> bool:
+        """等待启动横幅输出完毕并丢弃，使进程可以直接处理第一条消息"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if not self.is_alive():
+                return False
+            # 出现输入提示符说明启动完成，否则以输出静默作为兜底
+            if self.prompt_seen.wait(timeout=min(quiet_period, max(deadline - time.time(), 0))):
+                break
+            if self.last_output_at and time.time() - self.last_output_at >= quiet_period:
+                break
+        
+        with self.response_lock:
+            self.response_queue.clear()
+        return self.is_alive()
+    
+    def bind(self, session_id: str, work_directory: str) -> bool:
+        """将预热进程绑定到会话及其工作目录
+        
+        进程的当前目录跟随目录inode，因此把预热目录重命名为会话目录后，
+        进程即在会话目录中运行。会话目录已有文件时无法绑定。
+        """
+        with self.lock:
+            if not self.is_alive():
+                return False
             
-            # 跳过无效行
-            if self._should_skip_line(line):
-                return
+            try:
+                if os.path.isdir(work_directory):
+                    if os.listdir(work_directory):
+                        return False
+                    os.rmdir(work_directory)
+                os.rename(self.work_directory, work_directory)
+            except OSError as e:
+                logger.warning(f"绑定预热进程到目录 {work_directory} 失败: {e}")
+                return False
             
-            # 收集响应内容
-            if line.strip():  # 只收集非空行
-                self.current_response.append(line)
-                
-                # 对于长响应，定期保存部分内容到队列（流式输出）
-                if len(self.current_response) >= 20:  # 每20行保存一次，减少频繁保存
-                    response_text = "\n".join(self.current_response)
-                    self.response_queue.append(response_text)
-                    logger.debug(f"保存部分响应到队列 (会话 {self.session_id}): {len(response_text)} 字符")
-                    self.current_response = []
+            logger.info(f"预热进程 PID {self.process.pid} 绑定到会话 {session_id}")
+            self.session_id = session_id
+            self.work_directory = work_directory
+            self.last_activity = time.time()
+            return True
     
     def is_alive(self) -> bool:
         """检查进程是否还活着"""
@@ -166,112 +387,268 @@ class SessionProcess:
         with self.lock:
             if not self.is_alive():
                 logger.warning(f"进程已死亡，尝试重启 (会话 {self.session_id})")
+                self.resume = config.PROCESS_RESUME
                 if not self.start():
                     return False
             
             try:
-                # 直接发送用户消息，不添加额外的上下文
-                if config.FORCE_CHINESE:
-                    formatted_message = f"请用中文回答：{message}\n"
-                else:
-                    formatted_message = f"{message}\n"
+                formatted_message = self._prepare_message(message)
+                self._begin_turn(formatted_message)
+                # 写入前标记本轮开始：进程可能在写入返回之前就在stderr报告错误
+                self.in_turn = True
                 
-                self.process.stdin.write(formatted_message)
-                self.process.stdin.flush()
+                self._write_input(formatted_message.encode("utf-8"))
                 self.last_activity = time.time()
                 
                 logger.debug(f"向会话 {self.session_id} 发送消息: {message[:50]}...")
                 return True
                 
             except Exception as e:
+                self.in_turn = False
                 logger.error(f"发送消息失败 (会话 {self.session_id}): {e}")
                 return False
     
-    def read_response(self) -> Iterator[str]:
-        """从队列读取Q Chat的响应（支持流式输出）"""
+    def _prepare_message(self, message: str) -> str:
+        """生成实际写入Q Chat的消息（单行）"""
+        # 直接发送用户消息，不添加额外的上下文
+        if config.FORCE_CHINESE:
+            formatted_message = f"请用中文回答：{message}"
+        else:
+            formatted_message = message
+        
+        # 被驱逐后重建的进程需要先恢复历史上下文
+        if self.restore_context:
+            formatted_message = f"{self.restore_context} {formatted_message}"
+            self.restore_context = None
+        return self.detector.format_message(formatted_message)
+    
+    def _begin_turn(self, message: str = ""):
+        """开始新一轮对话的结束检测，丢弃上一轮末尾的提示符"""
+        with self.response_lock:
+            self.detector.reset(message)
+            self._stream.discard_pending()
+            self._partial_since = 0.0
+            self._deduplicator = StreamDeduplicator()
+            self.turn_complete.clear()
+            self.turn_completed_at = 0.0
+            self.turn_completion_reason = None
+            self.turn_error = None
+            self.turn_started_at = time.time()
+            self._turn_cpu_start = _process_cpu_seconds(self.process.pid)
+    
+    def read_response(self, coalescer: Optional[ChunkCoalescer] = None,
+                      heartbeat: float = None) -> Iterator[str]:
+        """从队列读取Q Chat的响应（支持流式输出）
+        
+        参数:
+            coalescer: 响应块合并器（可选），按其时间和字节预算合并后再返回
+            heartbeat: 心跳间隔（秒，可选），超过该时间没有返回内容时返回空字符串，
+                       调用方据此发送心跳并及时发现客户端断开
+        """
         if not self.is_alive():
             logger.error(f"进程未运行 (会话 {self.session_id})")
             return
         
-        max_wait_time = 600  # 最大等待时间（秒）- 增加到120-》600秒以支持复杂任务
-        start_time = time.time()
-        last_response_time = start_time
-        response_count = 0
-        
+        state = _ReadState()
         try:
-            while time.time() - start_time < max_wait_time:
-                current_time = time.time()
-                
-                # 检查队列中是否有新响应
+            while True:
                 with self.response_lock:
-                    if self.response_queue:
-                        # 获取队列中的响应
-                        response = self.response_queue.pop(0)
-                        response_count += 1
-                        last_response_time = current_time
-                        logger.info(f"从队列获取响应 #{response_count} (会话 {self.session_id}): {len(response)} 字符")
-                        yield response
-                        continue  # 继续检查是否有更多响应
-                
-                # 如果没有队列响应，检查是否有部分内容
-                if current_time - last_response_time > 3.0:  # 3秒没有新响应
-                    with self.response_lock:
-                        if self.current_response:
-                            response = "\n".join(self.current_response)
-                            self.current_response = []
-                            response_count += 1
-                            last_response_time = current_time
-                            logger.debug(f"获取部分响应 #{response_count} (会话 {self.session_id}): {len(response)} 字符")
-                            yield response
-                            continue
+                    while True:
+                        response, finished, wait = self._poll_response(state, coalescer, heartbeat)
+                        if finished or response is not None:
+                            break
+                        # 等待新响应、结束信号或最近的超时时刻
+                        self.response_ready.wait(timeout=wait)
                 
-                # 如果已经有响应且长时间没有新内容，可能响应结束了
-                # 对于复杂任务，给更多时间，特别是涉及多个文件创建的任务
-                if response_count == 0:
-                    idle_timeout = 35.0  # 第一个响应等待25秒
-                elif response_count < 5:
-                    idle_timeout = 35.0  # 前几个响应等待35秒（复杂任务需要更多思考时间）
-                elif response_count < 15:
-                    idle_timeout = 65.0  # 中等响应等待30秒
-                else:
-                    idle_timeout = 100.0  # 后续响应等待25秒
-                
-                if response_count > 0 and current_time - last_response_time > idle_timeout:
-                    logger.info(f"响应可能结束 (会话 {self.session_id})，共 {response_count} 个响应块，空闲时间: {current_time - last_response_time:.1f}秒，使用的超时时间: {idle_timeout}秒")
+                if finished:
                     break
-                
-                # 短暂等待
-                time.sleep(0.1)
+                state.note_yield(response)
+                yield response
             
             # 最后检查是否还有剩余内容
-            with self.response_lock:
-                if self.current_response:
-                    response = "\n".join(self.current_response)
-                    self.current_response = []
-                    response_count += 1
-                    logger.debug(f"获取最终响应 #{response_count} (会话 {self.session_id}): {len(response)} 字符")
-                    yield response
+            for response in self._drain_response(state, coalescer):
+                yield response
+            self._finish_read(state)
+                
+        except QCLIProcessError:
+            raise
+        except Exception as e:
+            logger.error(f"读取响应失败 (会话 {self.session_id}): {e}")
+        finally:
+            self.in_turn = False
+            self.last_activity = time.time()
+    
+    def _poll_response(self, state: "_ReadState", coalescer: Optional[ChunkCoalescer],
+                       heartbeat: Optional[float]):
+        """检查当前是否有可返回的响应（调用方需持有response_lock）
+        
+        返回:
+            (响应片段或None, 本轮是否已结束, 没有响应时最多等待的秒数)
+        """
+        while True:
+            current_time = time.time()
+            
+            # 检查队列中是否有新响应
+            if self.response_queue:
+                response = self.response_queue.popleft()
+                logger.debug(f"从队列获取响应 #{state.response_count + 1} (会话 {self.session_id}): {len(response)} 字符")
+                if coalescer is None:
+                    return response, False, 0.0
+                coalescer.add(response, current_time)
+            
+            # 合并的内容达到字节预算或等待超过时间预算后发出
+            if coalescer is not None and coalescer.ready(current_time):
+                return coalescer.take(), False, 0.0
+            
+            # 检测到提示符或结束标记，队列已取空即可立即返回
+            if self.turn_complete.is_set():
+                state.reason = self.turn_completion_reason
+                return None, True, 0.0
+            
+            if current_time - state.start_time >= state.max_wait_time:
+                return None, True, 0.0
+            
+            # 未换行的部分输出超过延迟预算后发出
+            partial_deadline = self._partial_since + self.stream_latency_budget
+            if self._partial_since and current_time >= partial_deadline:
+                self._flush_partial_output()
+                continue
+            
+            # 长时间没有返回内容（例如模型思考中）时返回心跳
+            if heartbeat and current_time - state.last_yield_time >= heartbeat:
+                return "", False, 0.0
             
+            # 如果已经有响应且长时间没有新内容，可能响应结束了
+            # 对于复杂任务，给更多时间，特别是涉及多个文件创建的任务
+            response_count = state.response_count
             if response_count == 0:
-                logger.warning(f"读取响应超时，未获取到任何响应 (会话 {self.session_id})")
+                idle_timeout = 35.0  # 第一个响应等待25秒
+            elif response_count < 5:
+                idle_timeout = 35.0  # 前几个响应等待35秒（复杂任务需要更多思考时间）
+            elif response_count < 15:
+                idle_timeout = 65.0  # 中等响应等待30秒
             else:
-                logger.info(f"响应读取完成 (会话 {self.session_id})，共 {response_count} 个响应块")
-                
+                idle_timeout = 100.0  # 后续响应等待25秒
+            
+            # 空闲超时仅作为未识别到结束标志时的兜底
+            if response_count > 0 and current_time - state.last_response_time > idle_timeout:
+                logger.info(f"响应可能结束 (会话 {self.session_id})，共 {response_count} 个响应块，空闲时间: {current_time - state.last_response_time:.1f}秒，使用的超时时间: {idle_timeout}秒")
+                state.reason = REASON_IDLE_TIMEOUT
+                return None, True, 0.0
+            
+            deadlines = [state.start_time + state.max_wait_time]
+            if self._partial_since:
+                deadlines.append(partial_deadline)
+            if response_count > 0:
+                deadlines.append(state.last_response_time + idle_timeout)
+            if coalescer is not None and coalescer.buffered:
+                deadlines.append(coalescer.deadline)
+            if heartbeat:
+                deadlines.append(state.last_yield_time + heartbeat)
+            return None, False, max(min(deadlines) - current_time, 0.001)
+    
+    def _drain_response(self, state: "_ReadState", coalescer: Optional[ChunkCoalescer]) -> List[str]:
+        """本轮结束后取出剩余的响应"""
+        with self.response_lock:
+            if self._has_partial_output():
+                self._flush_partial_output()
+            remaining = list(self.response_queue)
+            self.response_queue.clear()
+        if coalescer is not None:
+            for response in remaining:
+                coalescer.add(response)
+            remaining = [coalescer.take()] if coalescer.buffered else []
+        for response in remaining:
+            state.response_count += 1
+            logger.debug(f"获取最终响应 #{state.response_count} (会话 {self.session_id}): {len(response)} 字符")
+        return remaining
+    
+    def _finish_read(self, state: "_ReadState"):
+        """记录本轮统计；stderr报告了错误时抛出"""
+        if state.response_count == 0:
+            logger.warning(f"读取响应超时，未获取到任何响应 (会话 {self.session_id})")
+        else:
+            logger.info(f"响应读取完成 (会话 {self.session_id})，共 {state.response_count} 个响应块")
+        
+        # 记录模型完成与服务返回之间的延迟
+        model_finished_at = self.turn_completed_at or self.last_output_at
+        turn_latency_stats.record(self.session_id, state.reason, model_finished_at, time.time())
+        if state.reason != REASON_CANCELLED:
+            turn_cancellation_stats.record_completed(self._turn_cpu_used())
+        
+        # stderr报告了错误，返回明确的错误而不是不完整的回复
+        if self.turn_error:
+            raise self.turn_error
+    
+    def cancel_turn(self, timeout: float = None) -> bool:
+        """
+        取消进行中的一轮对话（客户端已断开）
+        
+        向Q Chat发送中断信号停止生成，等待其回到输入提示符并丢弃被中断一轮的剩余输出，
+        使进程可以直接处理下一条消息。
+        
+        返回:
+            是否取消了进行中的一轮（本轮已结束时返回False）
+        """
+        timeout = config.TURN_CANCEL_TIMEOUT if timeout is None else timeout
+        cancelled = self._interrupt_turn()
+        if cancelled is None:
+            return False
+        
+        # 等待中断后的提示符（或输出静默），丢弃剩余输出
+        self.warm_up(timeout=timeout, quiet_period=min(1.0, timeout))
+        self._finish_cancel(*cancelled)
+        return True
+    
+    def _interrupt_turn(self):
+        """中断进行中的一轮并标记结束，返回 (已进行秒数, 已消耗CPU秒数)，本轮已结束时返回None"""
+        with self.response_lock:
+            if self.turn_complete.is_set() or not self.turn_started_at:
+                return None
+            self.prompt_seen.clear()
+        
+        elapsed = time.time() - self.turn_started_at
+        cpu_used = self._turn_cpu_used()
+        self.interrupt()
+        self._mark_turn_complete(REASON_CANCELLED)
+        return elapsed, cpu_used
+    
+    def _finish_cancel(self, elapsed: float, cpu_used: Optional[float]):
+        """丢弃被中断一轮的剩余输出并记录取消统计"""
+        with self.response_lock:
+            self._stream.discard_pending()
+            self._partial_since = 0.0
+            self._deduplicator = StreamDeduplicator()
+        turn_cancellation_stats.record_cancelled(self.session_id, elapsed, cpu_used)
+    
+    def interrupt(self):
+        """中断Q Chat当前的生成（相当于在终端中按Ctrl-C）"""
+        try:
+            if self._pty_master is not None:
+                # 伪终端模式下进程是独立的进程组，中断整组（包括正在执行的工具命令）
+                os.killpg(self.process.pid, signal.SIGINT)
+            else:
+                self.process.send_signal(signal.SIGINT)
         except Exception as e:
-            logger.error(f"读取响应失败 (会话 {self.session_id}): {e}")
+            logger.debug(f"发送中断信号失败 (会话 {self.session_id}): {e}")
+    
+    def _turn_cpu_used(self) -> Optional[float]:
+        """本轮对话开始以来进程消耗的CPU秒数，无法获取时返回None"""
+        if self._turn_cpu_start is None or not self.process:
+            return None
+        current = _process_cpu_seconds(self.process.pid)
+        if current is None:
+            return None
+        return max(current - self._turn_cpu_start, 0.0)
     
     def terminate(self):
         """终止Q Chat进程"""
         with self.lock:
-            # 停止后台读取线程
-            self.reading = False
-            
             if self.process:
                 try:
                     # 发送退出命令
                     if self.is_alive():
-                        self.process.stdin.write("/quit\n")
-                        self.process.stdin.flush()
+                        self.request_quit()
                         
                         # 等待进程正常退出
                         try:
@@ -289,99 +666,415 @@ class SessionProcess:
                 except Exception as e:
                     logger.error(f"终止进程失败 (会话 {self.session_id}): {e}")
                 finally:
-                    self.process = None
-                    
-            # 等待输出线程结束
-            if self.output_thread and self.output_thread.is_alive():
-                self.output_thread.join(timeout=2)
-    
-    def _clean_line(self, line: str) -> str:
-        """清理单行输出"""
-        # 移除ANSI颜色代码
-        import re
-        ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-        cleaned = ansi_escape.sub('', line)
-        return cleaned.strip()
+                    self.release()
+    
+    def request_quit(self):
+        """发送 /quit 命令，不等待进程退出"""
+        try:
+            self._write_input(b"/quit", timeout=1.0)
+        except Exception as e:
+            logger.debug(f"发送退出命令失败 (会话 {self.session_id}): {e}")
+    
+    def send_signal(self, sig: int):
+        """向进程发送信号"""
+        try:
+            self.process.send_signal(sig)
+        except Exception as e:
+            logger.debug(f"发送信号 {sig} 失败 (会话 {self.session_id}): {e}")
+    
+    def release(self):
+        """停止读取输出并释放进程对象"""
+        self._unregister_output()
+        self.process = None
     
     def _should_skip_line(self, line: str) -> bool:
         """判断是否应该跳过某行"""
-        skip_patterns = [
-            lambda l: "/quit" in l,
-            lambda l: l.startswith("q chat"),
-            lambda l: "Welcome to" in l,
-            lambda l: "Type /quit" in l,
-            lambda l: "Did you know?" in l,
-            lambda l: "Get notified whenever" in l,
-            lambda l: "chat.enableNotifications" in l,
-            lambda l: "/help all commands" in l,
-            lambda l: "ctrl + j new lines" in l,
-            lambda l: "You are chatting with" in l,
-            lambda l: "Thinking..." in l,
-            lambda l: l.startswith("━"),
-            lambda l: l.startswith("╭"),
-            lambda l: l.startswith("│"),
-            lambda l: l.startswith("╰"),
-        ]
-        
-        return any(pattern(line) for pattern in skip_patterns)
+        return should_skip_line(line)
 
 
-class SessionProcessManager:
-    """会话进程管理器"""
+# 一轮回复的最大等待时间（秒）- 增加到120-》600秒以支持复杂任务
+TURN_MAX_WAIT = 600
+
+
+class _ReadState:
+    """一次read_response的读取进度"""
+    
+    __slots__ = ("start_time", "last_response_time", "last_yield_time", "response_count", "reason", "max_wait_time")
     
     def __init__(self):
-        self.processes: Dict[str, SessionProcess] = {}
+        self.start_time = time.time()
+        self.last_response_time = self.start_time
+        self.last_yield_time = self.start_time
+        self.response_count = 0
+        self.reason = REASON_MAX_WAIT
+        self.max_wait_time = TURN_MAX_WAIT
+    
+    def note_yield(self, response: str):
+        """记录一次返回（空字符串为心跳，不计入响应块）"""
+        self.last_yield_time = time.time()
+        if response:
+            self.response_count += 1
+            self.last_response_time = self.last_yield_time
+
+
+def _process_cpu_seconds(pid: int) -> Optional[float]:
+    """读取进程的用户态和内核态CPU时间（秒），不支持/proc的平台返回None"""
+    try:
+        with open(f"/proc/{pid}/stat") as stat_file:
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _open_pty(rows: int, columns: int):
+    """创建固定窗口大小、关闭回显的伪终端，返回 (主端, 从端)"""
+    master_fd, slave_fd = os.openpty()
+    fcntl.ioctl(slave_fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, columns, 0, 0))
+    # 关闭行规程回显，避免发送的消息出现在输出中
+    attrs = termios.tcgetattr(slave_fd)
+    attrs[3] &= ~termios.ECHO
+    termios.tcsetattr(slave_fd, termios.TCSANOW, attrs)
+    return master_fd, slave_fd
+
+
+def _wait_for_exit(processes: List[SessionProcess], deadline: float) -> List[SessionProcess]:
+    """等待一组进程退出直到截止时间，返回仍未退出的进程"""
+    alive = [p for p in processes if p.process and p.process.poll() is None]
+    while alive and time.time() < deadline:
+        time.sleep(0.05)
+        # 回收线程可能同时在终止并释放进程对象
+        alive = [p for p in alive if p.process and p.process.poll() is None]
+    return alive
+
+
+def terminate_processes(processes: List[SessionProcess], timeout: float) -> dict:
+    """
+    在给定时间内并行终止一组进程
+    
+    先同时向所有进程发送 /quit，用掉一半时间后对未退出的进程统一发送SIGTERM，
+    用掉80%时间后对仍未退出的进程发送SIGKILL。
+    
+    参数:
+        processes: 待终止的会话进程
+        timeout: 总时间预算（秒）
+        
+    返回:
+        各阶段退出的进程数量
+    """
+    start_time = time.time()
+    deadline = start_time + timeout
+    alive = [p for p in processes if p.is_alive()]
+    stats = {"total": len(alive), "quit": 0, "sigterm": 0, "sigkill": 0, "remaining": 0}
+    
+    for process in alive:
+        process.request_quit()
+    remaining = _wait_for_exit(alive, start_time + timeout * 0.5)
+    stats["quit"] = len(alive) - len(remaining)
+    
+    for process in remaining:
+        process.send_signal(signal.SIGTERM)
+    alive, remaining = remaining, _wait_for_exit(remaining, start_time + timeout * 0.8)
+    stats["sigterm"] = len(alive) - len(remaining)
+    
+    for process in remaining:
+        process.send_signal(signal.SIGKILL)
+    alive, remaining = remaining, _wait_for_exit(remaining, deadline)
+    stats["sigkill"] = len(alive) - len(remaining)
+    stats["remaining"] = len(remaining)
+    
+    for process in processes:
+        if process.process:
+            process.release()
+    
+    stats["duration"] = round(time.time() - start_time, 2)
+    return stats
+
+
+class SessionProcessManager:
+    """会话进程管理器
+    
+    全局锁只保护字典操作。进程的启动在锁外进行，同一会话的并发请求
+    等待同一个创建Future；进程的终止交给后台回收线程执行。
+    """
+    
+    def __init__(self, max_processes: int = None, reaper_workers: int = 4):
+        # 按最近活跃顺序排列，最久未活跃的在最前面
+        self.processes: "OrderedDict[str, SessionProcess]" = OrderedDict()
         self.lock = threading.RLock()
+        self.max_processes = config.MAX_PROCESSES if max_processes is None else max_processes
+        
+        # 正在创建中的会话进程
+        self._pending: Dict[str, Future] = {}
+        
+        # 后台回收线程，负责终止进程；正在回收的进程 -> 终止操作的Future
+        self._reaper = ThreadPoolExecutor(max_workers=reaper_workers, thread_name_prefix="qcli-reaper")
+        self._reaping: Dict[SessionProcess, Future] = {}
+        
+        # shutdown_all之后不再创建进程
+        self._closed = False
+        
+        # 被驱逐的会话，再次访问时重建进程
+        self.evicted_sessions = set()
+        # 对话只保存在会话管理器中的会话（回复来自缓存），创建进程时按保存的消息恢复历史
+        self.restore_sessions = set()
+        self.evictions = 0
+        self.respawns = 0
     
-    def get_or_create_process(self, session_id: str, work_directory: str = None) -> SessionProcess:
-        """获取或创建会话进程"""
+    def get_or_create_process(self, session_id: str, work_directory: str = None,
+                              timeout: float = 120, lease: bool = False) -> SessionProcess:
+        """
+        获取或创建会话进程
+        
+        lease=True 时在交出进程的同时（持有锁）登记占用：从交出进程到本轮开始之间进程也不会被驱逐，
+        本轮结束后调用 release_process。
+        """
         with self.lock:
-            if session_id not in self.processes:
-                process = SessionProcess(session_id, work_directory)
-                if process.start():
-                    self.processes[session_id] = process
-                    logger.info(f"为会话 {session_id} 创建新的Q Chat进程")
-                else:
-                    raise RuntimeError(f"无法为会话 {session_id} 启动Q Chat进程")
+            if self._closed:
+                raise RuntimeError("服务正在关闭，不再创建Q CLI进程")
+            if session_id in self.processes:
+                self.processes.move_to_end(session_id)
+                process = self.processes[session_id]
+                if lease:
+                    process.leases += 1
+                return process
             
-            return self.processes[session_id]
+            future = self._pending.get(session_id)
+            if future is None:
+                victims = self._ensure_capacity()
+                future = Future()
+                self._pending[session_id] = future
+                respawn = session_id in self.evicted_sessions or session_id in self.restore_sessions
+                owner = True
+            else:
+                owner = False
+        
+        # 其他请求正在创建该会话的进程，等待同一个结果
+        if not owner:
+            process = future.result(timeout=timeout)
+            # 需要占用时重新从字典获取并登记（刚创建的进程可能已被驱逐）
+            return self.get_or_create_process(session_id, work_directory, timeout, lease) if lease else process
+        
+        for victim in victims:
+            self._reap(victim)
+        
+        try:
+            process = self._create_process(session_id, work_directory, respawn)
+        except Exception as e:
+            with self.lock:
+                self._pending.pop(session_id, None)
+            future.set_exception(e)
+            raise
+        
+        with self.lock:
+            self._pending.pop(session_id, None)
+            closed = self._closed
+            if not closed:
+                self.processes[session_id] = process
+                if lease:
+                    process.leases += 1
+                if respawn:
+                    self._mark_respawned(session_id)
+        
+        # 创建期间开始关闭：shutdown_all会等待该Future，在其期限内终止刚启动的进程
+        if closed:
+            process.terminate()
+            error = RuntimeError("服务正在关闭，不再创建Q CLI进程")
+            future.set_exception(error)
+            raise error
+        
+        future.set_result(process)
+        return process
+    
+    def _create_process(self, session_id: str, work_directory: str, respawn: bool) -> SessionProcess:
+        """启动会话进程（在锁外调用）"""
+        from qcli_api_service.services.process_pool import process_pool
+        
+        # 被驱逐的会话需要恢复历史，不能使用预热进程
+        if respawn:
+            return self._respawn_process(session_id, work_directory)
+        
+        # 优先从预热池中获取进程，未命中时冷启动
+        process = process_pool.acquire(session_id, work_directory)
+        if process:
+            logger.info(f"为会话 {session_id} 分配预热的Q Chat进程")
+            return process
+        
+        # 冷启动后先等待启动横幅输出完毕，避免横幅中的行被当作回复、横幅中的提示符提前结束第一轮
+        process = SessionProcess(session_id, work_directory)
+        if not process.start() or not process.warm_up():
+            raise RuntimeError(f"无法为会话 {session_id} 启动Q Chat进程")
+        logger.info(f"为会话 {session_id} 创建新的Q Chat进程")
+        return process
+    
+    def _ensure_capacity(self) -> List[SessionProcess]:
+        """达到进程上限时取出最久未活跃的空闲进程（调用方需持有锁），返回待回收的进程"""
+        victims = []
+        if self.max_processes <= 0:
+            return victims
+        
+        while len(self.processes) + len(self._pending) >= self.max_processes:
+            victim_id = next(
+                (sid for sid, process in self.processes.items() if not process.in_turn and not process.leases),
+                None
+            )
+            if victim_id is None:
+                raise RuntimeError(f"Q CLI进程数量已达上限（{self.max_processes}），服务暂时不可用")
+            
+            victims.append(self.processes.pop(victim_id))
+            self.evicted_sessions.add(victim_id)
+            self.evictions += 1
+            logger.info(f"进程数量达到上限，驱逐最久未活跃的会话进程: {victim_id}")
+        return victims
+    
+    def _respawn_process(self, session_id: str, work_directory: str = None) -> SessionProcess:
+        """为被驱逐的会话重建进程并恢复对话"""
+        resume = self._can_resume(session_id)
+        process = SessionProcess(session_id, work_directory, resume=resume)
+        if not resume:
+            process.restore_context = self._build_restore_context(session_id)
+        
+        # q chat --resume 启动时先输出恢复对话的提示和横幅，等待输出完毕再交给请求，
+        # 否则第一轮只读到横幅并在其中的提示符处结束，真正的回复被推迟到下一轮
+        if not process.start() or not process.warm_up():
+            raise RuntimeError(f"无法为会话 {session_id} 重建Q Chat进程")
+        
+        logger.info(f"为会话 {session_id} 重建Q Chat进程 (resume={resume})")
+        return process
     
-    def remove_process(self, session_id: str):
-        """移除并清理会话进程"""
+    def _can_resume(self, session_id: str) -> bool:
+        """重建进程时能否用 q chat --resume 恢复（对话从未在Q CLI进程中进行过时不能）"""
+        return config.PROCESS_RESUME and session_id not in self.restore_sessions
+    
+    def _mark_respawned(self, session_id: str) -> None:
+        """会话的进程已重建（调用方需持有锁）"""
+        if session_id in self.evicted_sessions:
+            self.evicted_sessions.discard(session_id)
+            self.respawns += 1
+        self.restore_sessions.discard(session_id)
+    
+    def restore_from_history(self, session_id: str) -> None:
+        """会话的对话不在任何Q CLI进程中（回复来自缓存），下次创建进程时按会话保存的消息恢复历史"""
         with self.lock:
-            if session_id in self.processes:
-                process = self.processes[session_id]
+            self.restore_sessions.add(session_id)
+    
+    def _build_restore_context(self, session_id: str) -> Optional[str]:
+        """根据会话保存的消息生成历史上下文（单行，避免被拆成多条输入）"""
+        from qcli_api_service.services.session_manager import session_manager
+        
+        messages = session_manager.get_conversation_history(session_id)
+        # 最后一条用户消息即本次要发送的消息，不计入历史
+        if messages and messages[-1].role == "user":
+            messages = messages[:-1]
+        if not messages:
+            return None
+        
+        parts = []
+        for msg in messages:
+            prefix = "用户: " if msg.role == "user" else "助手: "
+            parts.append(prefix + " ".join(msg.content.split()))
+        history = " ".join(parts)[-8000:]
+        return f"以下是我们之前的对话历史：{history} 请基于以上历史继续对话。"
+    
+    def _reap(self, process: SessionProcess) -> Future:
+        """把进程交给后台回收线程终止"""
+        def terminate():
+            try:
                 process.terminate()
-                del self.processes[session_id]
-                logger.info(f"会话 {session_id} 的进程已清理")
+            finally:
+                with self.lock:
+                    self._reaping.pop(process, None)
+        
+        # 持有锁提交，回收线程在登记之后才能移除该进程
+        with self.lock:
+            future = self._reaper.submit(terminate)
+            self._reaping[process] = future
+        return future
+    
+    def release_process(self, process: SessionProcess) -> None:
+        """结束 get_or_create_process(lease=True) 登记的占用（进程已被移除时无需处理）"""
+        with self.lock:
+            if self.processes.get(process.session_id) is process and process.leases > 0:
+                process.leases -= 1
+    
+    def get_process(self, session_id: str) -> Optional[SessionProcess]:
+        """获取会话当前的进程（不创建进程，也不更新活跃顺序）"""
+        with self.lock:
+            return self.processes.get(session_id)
+    
+    def remove_process(self, session_id: str) -> Optional[Future]:
+        """移除会话进程，终止操作在后台进行"""
+        with self.lock:
+            self.evicted_sessions.discard(session_id)
+            self.restore_sessions.discard(session_id)
+            process = self.processes.pop(session_id, None)
+        if process is None:
+            return None
+        
+        logger.info(f"会话 {session_id} 的进程已移交后台清理")
+        return self._reap(process)
     
     def cleanup_expired_processes(self, expiry_seconds: int = 3600):
         """清理过期的进程"""
+        current_time = time.time()
         with self.lock:
-            current_time = time.time()
-            expired_sessions = []
-            
-            for session_id, process in self.processes.items():
-                if current_time - process.last_activity > expiry_seconds:
-                    expired_sessions.append(session_id)
-            
-            for session_id in expired_sessions:
-                self.remove_process(session_id)
-                logger.info(f"清理过期会话进程: {session_id}")
-            
-            return len(expired_sessions)
+            expired = [
+                (session_id, process) for session_id, process in self.processes.items()
+                if not process.in_turn and not process.leases and current_time - process.last_activity > expiry_seconds
+            ]
+            for session_id, _ in expired:
+                del self.processes[session_id]
+        
+        for session_id, process in expired:
+            self._reap(process)
+            logger.info(f"清理过期会话进程: {session_id}")
+        
+        return len(expired)
     
     def get_active_process_count(self) -> int:
         """获取活跃进程数量"""
         with self.lock:
             return len(self.processes)
     
-    def shutdown_all(self):
-        """关闭所有进程"""
+    def get_stats(self) -> dict:
+        """获取进程管理统计信息"""
         with self.lock:
-            for session_id in list(self.processes.keys()):
-                self.remove_process(session_id)
-            logger.info("所有会话进程已关闭")
+            return {
+                "active": len(self.processes),
+                "pending": len(self._pending),
+                "reaping": len(self._reaping),
+                "max_processes": self.max_processes,
+                "evicted_sessions": len(self.evicted_sessions),
+                "evictions": self.evictions,
+                "respawns": self.respawns
+            }
+    
+    def shutdown_all(self, timeout: float = None):
+        """
+        在限定时间内并行关闭所有进程
+        
+        除了当前的进程，还包括已移交回收线程、尚未退出的进程（删除、过期或被驱逐的会话），
+        以及正在创建的进程：创建完成后由创建线程终止，这里在期限内等待。
+        """
+        timeout = config.SHUTDOWN_TIMEOUT if timeout is None else timeout
+        deadline = time.time() + timeout
+        with self.lock:
+            self._closed = True
+            processes = list(self.processes.values()) + list(self._reaping)
+            self.processes.clear()
+            pending = list(self._pending.values())
+        
+        stats = terminate_processes(processes, timeout)
+        
+        if pending:
+            _, not_done = wait(pending, timeout=max(0.0, deadline - time.time()))
+            stats["pending"] = len(pending)
+            stats["pending_remaining"] = len(not_done)
+        
+        # 终止操作已由上面统一完成，排队中的回收任务不再执行
+        self._reaper.shutdown(wait=False, cancel_futures=True)
+        logger.info(f"所有会话进程已关闭: {stats}")
+        return stats
 
 
 # 全局会话进程管理器实例
@@ -0,0 +1,111 @@
+"""
+Q Chat进程stderr监控
+
+持续读取每个会话进程的stderr，最近的输出保存在有界的环形缓冲中供调试查看。
+识别已知的失败信息（认证过期、请求被限流），对话进行中出现时立即结束本轮并返回明确的错误，
+而不是等到最大等待时间。
+"""
+
+import codecs
+import re
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+from qcli_api_service.config import config
+from qcli_api_service.services.stream_decoder import ANSI_ESCAPE
+
+
+# 错误事件类型
+EVENT_AUTH_EXPIRED = "auth_expired"
+EVENT_THROTTLED = "throttled"
+
+_EVENT_PATTERNS = [
+    (EVENT_AUTH_EXPIRED, re.compile(
+        r"token (has )?expired|expired ?token|session (has )?expired|not logged in|q login"
+        r"|unauthori[sz]ed|invalid_grant|access ?denied",
+        re.IGNORECASE
+    )),
+    (EVENT_THROTTLED, re.compile(
+        r"throttl|too many requests|rate exceeded|rate limit|\b429\b",
+        re.IGNORECASE
+    )),
+]
+
+_EVENT_MESSAGES = {
+    EVENT_AUTH_EXPIRED: "Q CLI认证已过期或无效 (auth)",
+    EVENT_THROTTLED: "Amazon Q请求被限流 (throttled)",
+}
+
+_MAX_LINE_LENGTH = 2000
+
+
+class QCLIProcessError(RuntimeError):
+    """Q Chat进程通过stderr报告的错误"""
+
+    def __init__(self, event: str, line: str):
+        self.event = event
+        self.line = line
+        super().__init__(f"{_EVENT_MESSAGES[event]}: {line}")
+
+
+def classify_stderr_line(line: str) -> Optional[str]:
+    """识别stderr行对应的错误事件类型，未识别时返回None"""
+    for event, pattern in _EVENT_PATTERNS:
+        if pattern.search(line):
+            return event
+    return None
+
+
+class StderrMonitor:
+    """单个进程的stderr环形缓冲"""
+
+    def __init__(self, max_lines: int = None):
+        max_lines = config.STDERR_BUFFER_LINES if max_lines is None else max_lines
+        self.lines: Deque[Tuple[float, str]] = deque(maxlen=max_lines)
+        self.events: Deque[dict] = deque(maxlen=20)
+        self.total_lines = 0
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending = ""
+        self._lock = threading.Lock()
+
+    def feed(self, data: bytes) -> List[dict]:
+        """
+        输入一段stderr字节
+
+        返回:
+            本次识别出的错误事件列表
+        """
+        events = []
+        with self._lock:
+            self._pending += self._decoder.decode(data)
+            *lines, self._pending = self._pending.split("\n")
+            if len(self._pending) > _MAX_LINE_LENGTH:
+                # 没有换行的超长输出按一行处理，避免缓冲无限增长
+                lines.append(self._pending)
+                self._pending = ""
+
+            now = time.time()
+            for line in lines:
+                line = ANSI_ESCAPE.sub("", line).strip()[:_MAX_LINE_LENGTH]
+                if not line:
+                    continue
+                self.lines.append((now, line))
+                self.total_lines += 1
+
+                event = classify_stderr_line(line)
+                if event:
+                    record = {"type": event, "line": line, "timestamp": now}
+                    self.events.append(record)
+                    events.append(record)
+        return events
+
+    def snapshot(self, limit: int = 100) -> dict:
+        """获取最近的stderr输出和错误事件"""
+        with self._lock:
+            lines = list(self.lines)[-limit:] if limit > 0 else []
+            return {
+                "lines": [{"timestamp": timestamp, "line": line} for timestamp, line in lines],
+                "events": list(self.events),
+                "total_lines": self.total_lines
+            }
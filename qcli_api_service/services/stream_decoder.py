@@ -0,0 +1,103 @@
+"""
+进程输出流解码
+
+把Q Chat进程stdout的原始字节增量解码为文本：多字节UTF-8字符（中文）跨读取边界时
+不会被拆开，跨边界的ANSI转义序列也能被完整去除。按换行拆分出完整行，
+未换行的尾部保留下来，并记录已经作为部分行发出的长度。
+
+终端模式（PTY传输）下还会处理终端控制：CRLF换行、OSC标题序列、
+字符集切换，以及用回车重绘同一行（只保留最后一次绘制的内容）。
+"""
+
+import codecs
+import re
+from typing import List, Tuple
+from qcli_api_service.utils.output_filter import ANSI_ESCAPE
+
+# 终端控制序列：OSC（窗口标题等）、字符集切换、CSI/单字符转义，以及响铃、退格等控制字符
+TERMINAL_CONTROL = re.compile(
+    r'\x1B(?:\][^\x07\x1B]*(?:\x07|\x1B\\)|[()][0-9A-Za-z]|[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])'
+    r'|[\x00-\x08\x0B\x0C\x0E-\x1A\x7F]'
+)
+# 读取边界处尚未结束的转义序列
+_INCOMPLETE_ESCAPE = re.compile(r'\x1B(?:\[[0-?]*[ -/]*)?\Z')
+_INCOMPLETE_TERMINAL = re.compile(r'\x1B(?:\[[0-?]*[ -/]*|\][^\x07\x1B]{0,4096}|[()])?\Z|\r\Z')
+
+
+class StreamDecoder:
+    """stdout字节流的增量解码器"""
+
+    def __init__(self, terminal: bool = False):
+        self.terminal = terminal
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._control = TERMINAL_CONTROL if terminal else ANSI_ESCAPE
+        self._incomplete = _INCOMPLETE_TERMINAL if terminal else _INCOMPLETE_ESCAPE
+        self._escape = ""  # 上次读取末尾未结束的转义序列
+        self.pending = ""  # 当前未换行的文本（已去除ANSI）
+        self.emitted = 0  # pending中已作为部分行发出的字符数
+
+    def feed(self, data: bytes, final: bool = False) -> List[Tuple[str, int]]:
+        """
+        输入一段原始字节
+
+        参数:
+            data: 从stdout读到的字节
+            final: 是否为流的末尾（进程退出），此时尾部作为最后一行返回
+
+        返回:
+            本次拼出的完整行列表，每项为 (行文本, 该行已作为部分行发出的字符数)
+        """
+        text = self._escape + self._decoder.decode(data, final)
+        self._escape = ""
+        if not final:
+            incomplete = self._incomplete.search(text)
+            if incomplete:
+                self._escape = text[incomplete.start():]
+                text = text[:incomplete.start()]
+
+        text = self._control.sub("", text)
+        if self.terminal:
+            text = text.replace("\r\n", "\n")
+
+        *lines, tail = (self.pending + text).split("\n")
+        if final and tail:
+            lines.append(tail)
+            tail = ""
+
+        result = []
+        for line in lines:
+            emitted = self.emitted
+            if self.terminal and "\r" in line:
+                # 回车后重绘的内容覆盖之前的内容
+                redraw = line.rfind("\r") + 1
+                line, emitted = line[redraw:], max(emitted - redraw, 0)
+            result.append((line, emitted))
+            self.emitted = 0
+        self.pending = tail
+        return result
+
+    def visible_pending(self) -> str:
+        """未换行尾部当前在终端上可见的内容"""
+        if self.terminal:
+            return self.pending[self.pending.rfind("\r") + 1:]
+        return self.pending
+
+    def partial_available(self) -> bool:
+        """尾部是否有尚未发出的内容（正在用回车重绘的行需等到整行）"""
+        if self.terminal and "\r" in self.pending:
+            return False
+        return len(self.pending) > self.emitted
+
+    def take_partial(self) -> str:
+        """取出尾部尚未发出的部分并标记为已发出"""
+        if self.emitted == 0:
+            # 行首空白与完整行的处理保持一致
+            self.emitted = len(self.pending) - len(self.pending.lstrip())
+        partial = self.pending[self.emitted:]
+        self.emitted = len(self.pending)
+        return partial
+
+    def discard_pending(self) -> None:
+        """丢弃未换行的尾部（例如上一轮末尾的提示符）"""
+        self.pending = ""
+        self.emitted = 0
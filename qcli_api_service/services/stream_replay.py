@@ -0,0 +1,188 @@
+"""
+流式回复重放缓冲
+
+流式对话的每个事件带有会话内单调递增的ID，事件同时写入该会话的重放缓冲
+（保留当前一轮和最近几轮，每轮事件数有上限）。SSE连接断开后Q Chat继续生成，
+客户端带 Last-Event-ID 重新连接即可从下一个事件继续接收，无需重新发送问题。
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from qcli_api_service.config import config
+
+
+class TurnStream:
+    """一轮流式回复的事件序列"""
+
+    def __init__(self, session_id: str, start_id: int, max_events: int):
+        self.session_id = session_id
+        self.start_id = start_id  # 本轮第一个事件的ID
+        self.next_id = start_id
+        self.events: Deque[Tuple[int, dict]] = deque(maxlen=max_events)
+        self.finished = False
+        self.created_at = time.time()
+        self.subscribers = 0
+        self.detached_at = time.time()  # 最近一次没有订阅者的时间
+        self._cond = threading.Condition()
+        self._listeners: List[Callable[[], None]] = []  # asyncio订阅者的唤醒回调
+
+    @property
+    def first_available_id(self) -> int:
+        """缓冲中最早的事件ID（更早的事件已被丢弃）"""
+        with self._cond:
+            return self.events[0][0] if self.events else self.next_id
+
+    @property
+    def failed(self) -> bool:
+        """本轮是否以错误事件结束（包括客户端断开后取消）"""
+        with self._cond:
+            return self.finished and bool(self.events) and self.events[-1][1].get('type') == 'error'
+
+    def append(self, event: dict) -> int:
+        """追加事件并唤醒等待的订阅者，返回事件ID"""
+        with self._cond:
+            event_id = self.next_id
+            self.next_id += 1
+            self.events.append((event_id, event))
+            self._notify()
+            return event_id
+
+    def finish(self) -> None:
+        """本轮结束，不再追加事件"""
+        with self._cond:
+            self.finished = True
+            self._notify()
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """登记有新事件时的回调（在追加事件的线程中调用，不能阻塞）"""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[], None]) -> None:
+        with self._cond:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def _notify(self) -> None:
+        """唤醒等待的订阅者（调用方需持有_cond）"""
+        self._cond.notify_all()
+        for callback in self._listeners:
+            callback()
+
+    def read(self, after_id: int, timeout: float = None) -> Tuple[List[Tuple[int, dict]], bool]:
+        """
+        读取指定ID之后的事件，没有新事件时等待
+
+        参数:
+            after_id: 已收到的最后一个事件ID
+            timeout: 最长等待时间（秒），None表示一直等待
+
+        返回:
+            (事件列表, 本轮是否已结束且事件已全部读取)
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.next_id - 1 > after_id or self.finished, timeout)
+            events = [item for item in self.events if item[0] > after_id]
+            return events, self.finished and not events
+
+    def attach(self) -> None:
+        """订阅者连接"""
+        with self._cond:
+            self.subscribers += 1
+
+    def detach(self) -> None:
+        """订阅者断开"""
+        with self._cond:
+            self.subscribers -= 1
+            if self.subscribers == 0:
+                self.detached_at = time.time()
+
+    def abandoned(self, grace: float) -> bool:
+        """是否已经没有订阅者超过指定时间（秒）"""
+        with self._cond:
+            return self.subscribers == 0 and time.time() - self.detached_at >= grace
+
+
+class StreamReplayBuffer:
+    """按会话保存最近几轮流式回复的事件"""
+
+    def __init__(self, max_turns: int = None, max_events: int = None):
+        self.max_turns = config.STREAM_REPLAY_TURNS if max_turns is None else max_turns
+        self.max_events = config.STREAM_REPLAY_EVENTS if max_events is None else max_events
+        self._sessions: Dict[str, Deque[TurnStream]] = {}
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.resumes = 0
+        self.expired = 0
+
+    def start_turn(self, session_id: str) -> TurnStream:
+        """开始新一轮，事件ID接着该会话上一轮继续递增"""
+        with self._lock:
+            turns = self._sessions.get(session_id)
+            if turns is None:
+                turns = self._sessions[session_id] = deque(maxlen=max(self.max_turns, 1))
+            start_id = turns[-1].next_id if turns else 1
+            stream = TurnStream(session_id, start_id, self.max_events)
+            turns.append(stream)
+            return stream
+
+    def find(self, session_id: str, last_event_id: Optional[int] = None) -> Optional[Tuple[TurnStream, int]]:
+        """
+        查找可以恢复的一轮
+
+        参数:
+            session_id: 会话ID
+            last_event_id: 客户端收到的最后一个事件ID，None表示从最近一轮的开头重放
+
+        返回:
+            (事件序列, 从该ID之后继续发送)，事件已不在缓冲中时返回None
+        """
+        with self._lock:
+            turns = list(self._sessions.get(session_id, ()))
+
+        stream = None
+        if last_event_id is None:
+            stream = turns[-1] if turns else None
+            after_id = stream.start_id - 1 if stream else 0
+        else:
+            after_id = last_event_id
+            for candidate in reversed(turns):
+                if candidate.start_id - 1 <= last_event_id < candidate.next_id:
+                    stream = candidate
+                    break
+
+        # 中间有事件已被丢弃时无法完整恢复
+        if stream is not None and stream.first_available_id > after_id + 1:
+            stream = None
+
+        with self._lock:
+            if stream is None:
+                self.expired += 1
+                return None
+            self.resumes += 1
+        return stream, after_id
+
+    def remove_session(self, session_id: str) -> None:
+        """删除会话的重放缓冲"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def get_stats(self) -> dict:
+        """获取重放缓冲统计信息"""
+        with self._lock:
+            turns = [stream for streams in self._sessions.values() for stream in streams]
+            return {
+                "sessions": len(self._sessions),
+                "turns": len(turns),
+                "active_turns": sum(1 for stream in turns if not stream.finished),
+                "buffered_events": sum(len(stream.events) for stream in turns),
+                "resumes": self.resumes,
+                "expired": self.expired
+            }
+
+
+# 全局重放缓冲实例
+stream_replay = StreamReplayBuffer()
@@ -0,0 +1,252 @@
+"""
+会话轮次调度器
+
+同一会话的多个请求按FIFO顺序排队，每一轮独占会话进程的输入输出直到回复结束，
+避免并发请求的回复互相交错。每个会话的排队深度有上限，超出时立即拒绝。
+"""
+
+import asyncio
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional
+from qcli_api_service.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class TurnQueueFullError(RuntimeError):
+    """会话排队请求数已达上限"""
+
+    def __init__(self, session_id: str, depth: int, retry_after: int):
+        self.session_id = session_id
+        self.depth = depth
+        self.retry_after = retry_after
+        super().__init__(f"会话 {session_id} 的排队请求已达上限 ({depth})")
+
+
+class TurnQueueTimeoutError(RuntimeError):
+    """排队等待超时"""
+
+    def __init__(self, session_id: str, waited: float):
+        self.session_id = session_id
+        self.waited = waited
+        super().__init__(f"会话 {session_id} 排队等待超时 ({waited:.0f}秒)")
+
+
+class TurnTicket:
+    """一轮对话的排队凭证"""
+
+    def __init__(self, session_id: str, granted=None):
+        self.session_id = session_id
+        self.enqueued_at = time.time()
+        self.started_at = 0.0
+        self.finished_at = 0.0
+        self.granted = threading.Event() if granted is None else granted
+        self.admission = None  # 全局准入名额，由调用方在获得执行权后设置
+
+    @property
+    def queue_wait(self) -> float:
+        """排队等待时间（秒）"""
+        return max((self.started_at or time.time()) - self.enqueued_at, 0.0)
+
+    @property
+    def generation_time(self) -> float:
+        """获得执行权到结束的时间（秒）"""
+        if not self.started_at:
+            return 0.0
+        return max((self.finished_at or time.time()) - self.started_at, 0.0)
+
+    def get_timing(self) -> dict:
+        """获取耗时信息，用于响应"""
+        return {
+            "queue_wait_ms": round(self.queue_wait * 1000, 1),
+            "generation_ms": round(self.generation_time * 1000, 1)
+        }
+
+
+class _AsyncGrant:
+    """asyncio等待方的执行权通知，set可在任意线程调用"""
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.create_future()
+
+    def set(self) -> None:
+        self._loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self._future.done():
+            self._future.set_result(True)
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class _SessionQueue:
+    """单个会话的执行中轮次和排队轮次"""
+
+    __slots__ = ("active", "waiting")
+
+    def __init__(self):
+        self.active: Optional[TurnTicket] = None
+        self.waiting: Deque[TurnTicket] = deque()
+
+
+class TurnScheduler:
+    """按会话FIFO调度对话轮次"""
+
+    def __init__(self, max_depth: int = None, queue_timeout: float = None):
+        self.max_depth = config.SESSION_QUEUE_DEPTH if max_depth is None else max_depth
+        self.queue_timeout = config.SESSION_QUEUE_TIMEOUT if queue_timeout is None else queue_timeout
+        self._queues: Dict[str, _SessionQueue] = {}
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.turns = 0
+        self.queued_turns = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.total_generation_time = 0.0
+
+    def acquire(self, session_id: str) -> TurnTicket:
+        """
+        为会话排队并等待执行权
+
+        参数:
+            session_id: 会话ID
+
+        返回:
+            已获得执行权的凭证，使用完毕后必须调用release
+
+        异常:
+            TurnQueueFullError: 排队请求数已达上限
+            TurnQueueTimeoutError: 排队等待超过SESSION_QUEUE_TIMEOUT
+        """
+        ticket = TurnTicket(session_id)
+        queue = self._enqueue(ticket)
+        if queue is not None and not ticket.granted.wait(self.queue_timeout):
+            self._abandon(queue, ticket)
+        return ticket
+
+    async def acquire_async(self, session_id: str) -> TurnTicket:
+        """acquire的asyncio版本，排队时不占用线程（ASGI模式）"""
+        ticket = TurnTicket(session_id, granted=_AsyncGrant())
+        queue = self._enqueue(ticket)
+        if queue is None:
+            return ticket
+        try:
+            granted = await ticket.granted.wait(self.queue_timeout)
+        except asyncio.CancelledError:
+            # 客户端在排队期间断开：退出队列，已获得的执行权直接交给下一个请求
+            with self._lock:
+                waiting = ticket in queue.waiting
+                if waiting:
+                    queue.waiting.remove(ticket)
+            if not waiting:
+                self.release(ticket)
+            raise
+        if not granted:
+            self._abandon(queue, ticket)
+        return ticket
+
+    def _enqueue(self, ticket: TurnTicket) -> Optional[_SessionQueue]:
+        """直接获得执行权时返回None，否则加入排队并返回所在队列"""
+        session_id = ticket.session_id
+        with self._lock:
+            queue = self._queues.get(session_id)
+            if queue is None:
+                queue = self._queues[session_id] = _SessionQueue()
+
+            if queue.active is None:
+                ticket.started_at = ticket.enqueued_at
+                queue.active = ticket
+                return None
+
+            if len(queue.waiting) >= self.max_depth:
+                self.rejected += 1
+                raise TurnQueueFullError(session_id, self.max_depth, self._estimate_retry_after(len(queue.waiting)))
+
+            queue.waiting.append(ticket)
+            self.queued_turns += 1
+
+        logger.info(f"会话 {session_id} 有进行中的对话，排队等待 (队列长度 {len(queue.waiting)})")
+        return queue
+
+    def _abandon(self, queue: _SessionQueue, ticket: TurnTicket) -> None:
+        """排队等待超时"""
+        with self._lock:
+            # 等待超时与获得执行权可能同时发生，以队列中的状态为准
+            if ticket in queue.waiting:
+                queue.waiting.remove(ticket)
+                self.timeouts += 1
+                raise TurnQueueTimeoutError(ticket.session_id, ticket.queue_wait)
+
+    def release(self, ticket: TurnTicket) -> None:
+        """结束一轮对话并把执行权交给下一个排队的请求"""
+        with self._lock:
+            queue = self._queues.get(ticket.session_id)
+            if queue is None or queue.active is not ticket:
+                return
+
+            ticket.finished_at = time.time()
+            self.turns += 1
+            self.total_queue_wait += ticket.queue_wait
+            self.max_queue_wait = max(self.max_queue_wait, ticket.queue_wait)
+            self.total_generation_time += ticket.generation_time
+
+            if queue.waiting:
+                next_ticket = queue.waiting.popleft()
+                next_ticket.started_at = ticket.finished_at
+                queue.active = next_ticket
+                next_ticket.granted.set()
+            else:
+                del self._queues[ticket.session_id]
+
+    @contextmanager
+    def turn(self, session_id: str) -> Iterator[TurnTicket]:
+        """以上下文管理器方式占用会话的一轮对话"""
+        ticket = self.acquire(session_id)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def get_queue_length(self, session_id: str) -> int:
+        """获取会话当前排队的请求数（不含执行中的一轮）"""
+        with self._lock:
+            queue = self._queues.get(session_id)
+            return len(queue.waiting) if queue else 0
+
+    def get_stats(self) -> dict:
+        """获取调度统计信息"""
+        with self._lock:
+            return {
+                "max_depth": self.max_depth,
+                "active_sessions": len(self._queues),
+                "waiting": sum(len(queue.waiting) for queue in self._queues.values()),
+                "turns": self.turns,
+                "queued_turns": self.queued_turns,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "avg_queue_wait_ms": round(self.total_queue_wait / self.turns * 1000, 1) if self.turns else 0.0,
+                "max_queue_wait_ms": round(self.max_queue_wait * 1000, 1),
+                "avg_generation_ms": round(self.total_generation_time / self.turns * 1000, 1) if self.turns else 0.0
+            }
+
+    def _estimate_retry_after(self, waiting: int) -> int:
+        """按平均每轮耗时估算重试等待秒数（调用方需持有_lock）"""
+        average = self.total_generation_time / self.turns if self.turns else config.QCLI_TIMEOUT
+        return max(int(average * (waiting + 1)), 1)
+
+
+# 全局轮次调度器实例
+turn_scheduler = TurnScheduler()
@@ -0,0 +1,79 @@
+"""
+客户端标识
+
+准入控制按客户端公平排队、限流按客户端计数、幂等键按客户端区分，需要一个稳定的客户端标识：
+- 请求带 X-API-Key 时按API密钥区分（只保存哈希，统计和日志中不出现密钥原文）
+- 否则按客户端IP区分。默认使用连接的对端地址；只有对端是可信代理（TRUSTED_PROXIES，
+  多worker部署时还包括本机的路由进程）时才采用 X-Forwarded-For：从右向左跳过可信代理，
+  取第一个不可信的地址。直接连接服务的客户端伪造的 X-Forwarded-For 不会被采用
+"""
+
+import functools
+import hashlib
+import ipaddress
+from typing import Optional, Tuple
+from qcli_api_service.config import config
+
+API_KEY_HEADER = "X-API-Key"
+
+
+def client_identity(api_key: Optional[str], forwarded_for: Optional[str], remote_addr: Optional[str]) -> str:
+    """
+    计算客户端标识
+
+    参数:
+        api_key: X-API-Key请求头
+        forwarded_for: X-Forwarded-For请求头
+        remote_addr: 连接的对端地址
+
+    返回:
+        "key:<密钥哈希前缀>" 或 "ip:<地址>"
+    """
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+    return "ip:" + client_address(forwarded_for, remote_addr)
+
+
+def client_address(forwarded_for: Optional[str], remote_addr: Optional[str]) -> str:
+    """客户端IP：对端是可信代理时取X-Forwarded-For中最右边的不可信地址，否则为对端地址"""
+    address = remote_addr or "unknown"
+    if not forwarded_for or not is_trusted_proxy(address):
+        return address
+    for hop in reversed([hop.strip() for hop in forwarded_for.split(",")]):
+        if not hop:
+            continue
+        address = hop
+        if not is_trusted_proxy(hop):
+            break
+    return address
+
+
+def is_trusted_proxy(address: str) -> bool:
+    """地址是否为可信代理"""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    # 多worker部署时worker只监听127.0.0.1，请求都由本机的路由进程转发
+    if config.WORKERS > 1 and ip.is_loopback:
+        return True
+    return any(ip in network for network in _trusted_networks(config.TRUSTED_PROXIES))
+
+
+@functools.lru_cache(maxsize=4)
+def _trusted_networks(text: str) -> Tuple[ipaddress._BaseNetwork, ...]:
+    return parse_trusted_proxies(text)
+
+
+def parse_trusted_proxies(text: str) -> Tuple[ipaddress._BaseNetwork, ...]:
+    """解析 TRUSTED_PROXIES（逗号分隔的IP或CIDR）"""
+    networks = []
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            raise ValueError(f"可信代理地址格式错误（应为IP或CIDR）: {item}")
+    return tuple(networks)
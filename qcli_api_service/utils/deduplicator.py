@@ -0,0 +1,227 @@
+"""
+Q CLI输出增量去重
+
+逐行输入、逐行放行，流式和非流式回复使用同一套规则，整体为线性时间：
+- 连续 window 行与之前已输出的内容完全相同时，判定为重复块并跳过，直到内容不再重复。
+  用行窗口的滚动哈希查找候选位置，命中后逐行比较确认，哈希冲突不会误删内容。
+- 反复出现的帮助提示和能力列表项（同义描述视为相同）只保留第一次。
+
+只有与之前某行相同、可能是重复块开头的行才会暂缓放行（最多 window-1 行），
+新内容立即放行，不影响流式输出的延迟。
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+from qcli_api_service.config import config
+
+# 滚动哈希参数（模 2^61-1 的多项式哈希）
+_MOD = (1 << 61) - 1
+_BASE = 1_000_003
+
+# 重复块至少包含的非空白字符数，避免 ``` 、空行等短行组合被误判
+MIN_BLOCK_CHARS = 16
+
+# 帮助提示：同一回复中只保留第一行
+HELP_PATTERNS = (
+    "我可以帮助您",
+    "我可以帮助你",
+    "有什么我可以帮助",
+    "请问有什么我可以帮助",
+    "什么我可以帮助您的吗",
+    "什么我可以帮助你的吗",
+)
+
+# 能力列表项的同义描述
+SERVICE_DESCRIPTIONS = {
+    "管理和查询 AWS 资源": "aws_management",
+    "AWS 服务管理和配置": "aws_management",
+    "代码编写和调试": "code_development",
+    "编写和调试代码": "code_development",
+    "文件系统操作": "file_operations",
+    "读写本地文件系统": "file_operations",
+    "读写文件和目录": "file_operations",
+    "执行命令行操作": "command_operations",
+    "命令行操作": "command_operations",
+    "基础设施配置": "infrastructure",
+    "基础设施优化": "infrastructure",
+    "提供 AWS 最佳实践建议": "aws_best_practices",
+    "AWS 最佳实践建议": "aws_best_practices",
+    "解决技术问题": "technical_support",
+    "技术问题": "technical_support",
+}
+
+
+def boilerplate_key(line: str) -> Optional[str]:
+    """帮助提示或能力列表项的归一化标识，其他行返回None"""
+    if any(pattern in line for pattern in HELP_PATTERNS):
+        return "help"
+    if line.startswith("•"):
+        for description, key in SERVICE_DESCRIPTIONS.items():
+            if description in line:
+                return key
+    return None
+
+
+class StreamDeduplicator:
+    """逐行增量去重"""
+
+    def __init__(self, window: int = None):
+        self.window = config.DEDUP_WINDOW_LINES if window is None else window
+        self._powers = [pow(_BASE, exponent, _MOD) for exponent in range(max(self.window, 0) + 1)]
+
+        # 已放行的行（去除首尾空白后用于比较）及其前缀哈希：_prefix[i] 为前i行的哈希
+        self._lines: List[str] = []
+        self._prefix: List[int] = [0]
+        # 完整窗口：(哈希) -> 已放行内容中的起点列表；不足窗口长度的片段只记录是否出现过
+        self._windows: Dict[int, List[int]] = {}
+        self._segments: Set[Tuple[int, int]] = set()
+
+        self._pending: List[Tuple[str, str, int]] = []  # 暂缓放行的 (原始行, 比较用文本, 行哈希)
+        self._pending_hash = 0
+        self._run = -1  # 重复块进行中时，下一行应等于的已放行位置
+        self._boilerplate = set()
+
+        # 统计信息
+        self.lines_in = 0
+        self.lines_out = 0
+        self.suppressed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0
+
+    @property
+    def holding(self) -> bool:
+        """是否有暂缓放行的行或正在跳过重复块（此时不应提前发出下一行的部分内容）"""
+        return bool(self._pending) or self._run >= 0
+
+    def feed(self, line: str) -> List[str]:
+        """
+        输入一行（不含换行符）
+
+        返回:
+            可以放行的行列表
+        """
+        self.lines_in += 1
+        if not self.enabled:
+            self.lines_out += 1
+            return [line]
+
+        text = line.strip()
+
+        # 重复块延续：与已放行内容逐行比较
+        if self._run >= 0:
+            if self._run < len(self._lines) and self._lines[self._run] == text:
+                self._run += 1
+                self.suppressed += 1
+                return []
+            self._run = -1
+
+        if text:
+            key = boilerplate_key(text)
+            if key is not None:
+                if key in self._boilerplate:
+                    self.suppressed += 1
+                    return []
+                self._boilerplate.add(key)
+
+        line_hash = self._hash_line(text)
+        self._pending.append((line, text, line_hash))
+        self._pending_hash = (self._pending_hash * _BASE + line_hash) % _MOD
+        return self._resolve()
+
+    def commit(self, line: str) -> List[str]:
+        """
+        放行一行且不参与重复判断（例如已作为部分行发给客户端的行）
+
+        返回:
+            连同此前暂缓的行一起放行的行列表
+        """
+        self.lines_in += 1
+        released = self.flush()
+        self._run = -1
+        text = line.strip()
+        self._emit(text, self._hash_line(text))
+        released.append(line)
+        return released
+
+    def flush(self) -> List[str]:
+        """输出结束时放行所有暂缓的行"""
+        released = []
+        while self._pending:
+            released.append(self._shift())
+        return released
+
+    def _resolve(self) -> List[str]:
+        """放行不可能构成重复块开头的暂缓行"""
+        released = []
+        while self._pending:
+            length = len(self._pending)
+            if length == self.window:
+                positions = self._windows.get(self._pending_hash)
+                start = self._verify(positions) if positions else -1
+                if start >= 0:
+                    # 确认是重复块，跳过并继续比较后续行
+                    self.suppressed += length
+                    self._pending.clear()
+                    self._pending_hash = 0
+                    self._run = start + length
+                    return released
+            elif (length, self._pending_hash) in self._segments:
+                # 可能是重复块的开头，等待更多行
+                return released
+            released.append(self._shift())
+        return released
+
+    def _verify(self, positions: List[int]) -> int:
+        """逐行比较确认候选位置，返回重复块在已放行内容中的起点，未确认返回-1"""
+        texts = [text for _, text, _ in self._pending]
+        if sum(len(text) for text in texts) < MIN_BLOCK_CHARS:
+            return -1
+        for start in positions:
+            if self._lines[start:start + len(texts)] == texts:
+                return start
+        return -1
+
+    def _shift(self) -> str:
+        """放行暂缓的第一行，并从暂缓窗口的滚动哈希中移除它"""
+        line, text, line_hash = self._pending.pop(0)
+        self._pending_hash = (self._pending_hash - line_hash * self._powers[len(self._pending)]) % _MOD
+        self._emit(text, line_hash)
+        return line
+
+    def _emit(self, text: str, line_hash: int) -> None:
+        """记录已放行的行，并登记以其结尾的各长度片段"""
+        lines, prefix, powers = self._lines, self._prefix, self._powers
+        lines.append(text)
+        prefix.append((prefix[-1] * _BASE + line_hash) % _MOD)
+        self.lines_out += 1
+
+        end = len(lines)
+        for length in range(1, min(self.window - 1, end) + 1):
+            self._segments.add((length, (prefix[end] - prefix[end - length] * powers[length]) % _MOD))
+        if end >= self.window:
+            start = end - self.window
+            window_hash = (prefix[end] - prefix[start] * powers[self.window]) % _MOD
+            self._windows.setdefault(window_hash, []).append(start)
+
+    @staticmethod
+    def _hash_line(text: str) -> int:
+        return hash(text) % _MOD
+
+    def get_stats(self) -> dict:
+        """获取去重统计信息"""
+        return {
+            "lines_in": self.lines_in,
+            "lines_out": self.lines_out,
+            "suppressed": self.suppressed
+        }
+
+
+def deduplicate_text(text: str, window: int = None) -> str:
+    """对完整文本逐行去重（与流式输出使用相同规则）"""
+    deduplicator = StreamDeduplicator(window)
+    lines = []
+    for line in text.split('\n'):
+        lines.extend(deduplicator.feed(line))
+    lines.extend(deduplicator.flush())
+    return '\n'.join(lines)
@@ -99,6 +99,11 @@ class SessionError(APIError):
                 "会话已过期，请创建新会话",
                 "可以通过配置延长会话有效期"
             ]
+        elif error_type == "STREAM_EXPIRED":
+            suggestions = [
+                "该轮回复已不在重放缓冲中，请重新发送消息",
+                "可以通过 GET /api/v1/sessions/{session_id} 查看已保存的对话历史"
+            ]
         
         super().__init__(
             message=message,
@@ -109,6 +114,41 @@ class SessionError(APIError):
         )
 
 
+class JobError(APIError):
+    """异步任务相关错误"""
+    
+    def __init__(self, message: str, job_id: str = None):
+        details = {"job_id": job_id} if job_id else {}
+        super().__init__(
+            message=message,
+            code="JOB_NOT_FOUND",
+            http_status=404,
+            details=details,
+            suggestions=[
+                "请检查任务ID是否正确",
+                "任务结果只保留一段时间，过期后请重新提交",
+                "使用 POST /api/v1/jobs 提交新任务"
+            ]
+        )
+
+
+class IdempotencyError(APIError):
+    """幂等键冲突：同一个幂等键用于不同的请求内容"""
+    
+    def __init__(self, message: str = "幂等键已用于内容不同的请求", idempotency_key: str = None):
+        details = {"idempotency_key": idempotency_key} if idempotency_key else {}
+        super().__init__(
+            message=message,
+            code="IDEMPOTENCY_KEY_REUSED",
+            http_status=422,
+            details=details,
+            suggestions=[
+                "重试同一条消息时使用相同的Idempotency-Key",
+                "发送新消息时请生成新的Idempotency-Key"
+            ]
+        )
+
+
 class ServiceError(APIError):
     """服务相关错误"""
     
@@ -138,6 +178,11 @@ class ServiceError(APIError):
                     "尝试重新配置AWS CLI凭证",
                     "联系AWS管理员检查权限设置"
                 ]
+        elif service == "WORKER":
+            suggestions = [
+                "会话所在的worker进程正在重启，请稍后重试",
+                "worker重启后原有会话已失效，请创建新会话"
+            ]
         
         super().__init__(
             message=message,
@@ -177,6 +222,7 @@ class RateLimitError(APIError):
     """请求频率限制错误"""
     
     def __init__(self, message: str = "请求过于频繁", retry_after: int = 60):
+        self.retry_after = retry_after
         details = {"retry_after": retry_after}
         
         suggestions = [
@@ -192,6 +238,39 @@ class RateLimitError(APIError):
             details=details,
             suggestions=suggestions
         )
+    
+    def to_response(self):
+        """转换为Flask响应，附带Retry-After头"""
+        response = super().to_response()
+        response.headers["Retry-After"] = str(self.retry_after)
+        return response
+
+
+class OverloadedError(RateLimitError):
+    """服务繁忙：等待生成回复的请求已满或等待超时"""
+    
+    def __init__(self, message: str = "服务繁忙，请稍后重试", retry_after: int = 30):
+        super().__init__(message, retry_after=retry_after)
+        self.code = "SERVICE_OVERLOADED"
+        self.http_status = 503
+        self.suggestions = [
+            f"请等待 {retry_after} 秒后重试",
+            "当前同时处理的对话较多，稍后重试通常即可成功",
+            "非实时需求可以通过 /api/v1/jobs 提交异步任务"
+        ]
+
+
+class IdempotencyInProgressError(RateLimitError):
+    """相同幂等键的第一次请求仍未完成，重复请求等待超时"""
+    
+    def __init__(self, message: str = "相同幂等键的请求仍在处理中", retry_after: int = 30):
+        super().__init__(message, retry_after=retry_after)
+        self.code = "IDEMPOTENCY_KEY_IN_PROGRESS"
+        self.http_status = 409
+        self.suggestions = [
+            f"请等待 {retry_after} 秒后使用相同的Idempotency-Key重试",
+            "第一次请求完成后，重试会直接返回它的结果"
+        ]
 
 
 # 错误处理工具函数
@@ -199,7 +278,12 @@ def handle_qcli_error(error: Exception) -> APIError:
     """处理Q CLI相关错误"""
     error_msg = str(error)
     
-    if "超时" in error_msg or "timeout" in error_msg.lower():
+    if "限流" in error_msg or "throttl" in error_msg.lower():
+        return RateLimitError(
+            message="Amazon Q服务请求被限流，请稍后重试",
+            retry_after=30
+        )
+    elif "超时" in error_msg or "timeout" in error_msg.lower():
         return ServiceError(
             message="AI处理超时，请稍后重试",
             service="QCLI",
@@ -0,0 +1,93 @@
+"""
+Q CLI输出行过滤
+
+Q CLI、会话进程和飞书机器人共用的输出清理规则：去除ANSI颜色代码、首尾空白，
+并跳过启动横幅、提示信息、边框和退出命令等非回复内容。
+跳过规则在导入时编译一次：全部子串规则合并为一个正则，前缀规则合并为一次前缀比较。
+"""
+
+import re
+from typing import Iterable, Iterator, Optional
+
+# ANSI颜色代码
+ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+
+# 行中任意位置出现即跳过
+SKIP_SUBSTRINGS = (
+    "/quit",
+    "Welcome to",
+    "Type /quit",
+    "Did you know?",
+    "Get notified whenever",
+    "chat.enableNotifications",
+    "/help all commands",
+    "ctrl + j new lines",
+    "You are chatting with",
+    "Thinking...",
+)
+
+# 以此开头即跳过（命令行回显和横幅边框）
+SKIP_PREFIXES = (
+    "q chat",
+    "━",
+    "╭",
+    "│",
+    "╰",
+)
+
+# 提示符后的用户输入回显（我们发送的问题）
+ECHO_PREFIXES = (
+    "请用中文回答",
+    "以下是我们之前的对话历史",
+)
+
+# 前缀规则用str.startswith一次比较全部前缀；行首锚定的分支放进合并正则会在每个位置重试，反而更慢
+SKIP_PATTERN = re.compile("|".join(re.escape(substring) for substring in SKIP_SUBSTRINGS))
+
+
+def clean_line(line: str) -> str:
+    """去除ANSI颜色代码和首尾空白"""
+    if "\x1b" in line:
+        line = ANSI_ESCAPE.sub('', line)
+    return line.strip()
+
+
+def should_skip_line(line: str) -> bool:
+    """判断清理后的行是否为横幅、提示信息等非回复内容"""
+    return line.startswith(SKIP_PREFIXES) or SKIP_PATTERN.search(line) is not None
+
+
+def is_prompt_echo(line: str) -> bool:
+    """判断以">"开头的行是否为空提示符或用户输入的回显"""
+    content = line[1:].strip()
+    return not content or content.startswith(ECHO_PREFIXES)
+
+
+def filter_line(line: str) -> Optional[str]:
+    """
+    清理并过滤单行输出
+
+    以">"开头的行只在为空提示符或用户输入回显时跳过，保留其中的回复内容。
+
+    参数:
+        line: 原始行
+
+    返回:
+        清理后的行，应跳过时返回None
+    """
+    line = clean_line(line)
+    if not line:
+        return None
+    if line.startswith(">"):
+        return None if is_prompt_echo(line) else line
+    if line.startswith(SKIP_PREFIXES) or SKIP_PATTERN.search(line):
+        return None
+    return line
+
+
+def filter_lines(lines: Iterable[str]) -> Iterator[str]:
+    """逐行清理并过滤，只产出保留的行"""
+    for line in lines:
+        line = filter_line(line)
+        if line is not None:
+            yield line
@@ -0,0 +1,156 @@
+"""
+问题近似重复检测
+
+只差空白、标点或开头换了个说法的问题，精确匹配的缓存键无法命中。这里用MinHash局部敏感哈希
+为缓存的问题建立相似度索引：
+- 问题先经过 InputValidator.clean_message 规范化，忽略大小写，去掉空白和标点，
+  切成字符3-gram（中文没有分词，按字符切分同时适用于中英文）
+- 签名使用单次哈希MinHash（每个3-gram只计算一次哈希，按哈希值分到各个桶取最小值，
+  空桶向右借值），按行分段（banding）建立倒排表，只有至少一段完全相同的问题才成为候选
+- 候选再用3-gram集合的Jaccard相似度精确比较，签名碰撞不会返回不相似的问题
+
+索引查找只计算一次签名和候选的集合交并，1000个问题时单次查找约0.15毫秒
+（scripts/benchmark_prompt_similarity.py）。字符相似度不理解语义，只差一个关键词的问题
+（例如“创建”和“删除”）也可能超过较低的阈值，阈值越高越保守。
+"""
+
+import re
+import zlib
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+from qcli_api_service.utils.validators import InputValidator
+
+# 字符n-gram长度
+SHINGLE_SIZE = 3
+
+# MinHash桶数 = 段数 × 每段行数；相似度为s的两个问题成为候选的概率为 1-(1-s^ROWS)^BANDS
+# （s=0.8时约96%，s=0.5时约22%）
+BANDS = 8
+ROWS = 5
+_BINS = BANDS * ROWS
+
+_HASH_SPACE = 1 << 32
+
+# 空白、标点和符号
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def normalize_prompt(message: str) -> str:
+    """规范化问题：清理空白和控制字符，忽略大小写，去掉空白和标点"""
+    return _NON_WORD.sub('', InputValidator.clean_message(message).casefold())
+
+
+def shingles(message: str) -> FrozenSet[int]:
+    """问题的字符3-gram哈希集合"""
+    text = normalize_prompt(message)
+    if len(text) <= SHINGLE_SIZE:
+        return frozenset([zlib.crc32(text.encode('utf-8'))]) if text else frozenset()
+    return frozenset(
+        zlib.crc32(text[i:i + SHINGLE_SIZE].encode('utf-8'))
+        for i in range(len(text) - SHINGLE_SIZE + 1)
+    )
+
+
+def minhash(shingle_set: FrozenSet[int]) -> Tuple[int, ...]:
+    """单次哈希MinHash签名（空桶向右借用最近非空桶的值）"""
+    bins = [_HASH_SPACE] * _BINS
+    for value in shingle_set:
+        index = value % _BINS
+        if value < bins[index]:
+            bins[index] = value
+    if not shingle_set:
+        return tuple(bins)
+
+    signature = list(bins)
+    for index in range(_BINS):
+        if bins[index] == _HASH_SPACE:
+            distance = 1
+            while bins[(index + distance) % _BINS] == _HASH_SPACE:
+                distance += 1
+            # 借来的值加上距离，避免不同位置借到同一个值后所有空桶都相同
+            signature[index] = bins[(index + distance) % _BINS] + distance * _HASH_SPACE
+    return tuple(signature)
+
+
+def jaccard(first: FrozenSet[int], second: FrozenSet[int]) -> float:
+    """两个集合的Jaccard相似度"""
+    if not first or not second:
+        return 0.0
+    intersection = len(first & second)
+    return intersection / (len(first) + len(second) - intersection)
+
+
+class PromptSimilarityIndex:
+    """问题相似度索引：按键添加、删除问题，查找最相似的已有问题"""
+
+    def __init__(self):
+        self._shingles: Dict[str, FrozenSet[int]] = {}
+        self._bands: Dict[str, Tuple[Tuple[int, ...], ...]] = {}
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._shingles)
+
+    def add(self, key: str, message: str) -> None:
+        """添加问题（键已存在时替换）"""
+        self.remove(key)
+        shingle_set = shingles(message)
+        if not shingle_set:
+            return
+        bands = _split_bands(minhash(shingle_set))
+        self._shingles[key] = shingle_set
+        self._bands[key] = bands
+        for index, band in enumerate(bands):
+            self._buckets.setdefault((index, band), set()).add(key)
+
+    def remove(self, key: str) -> None:
+        """删除问题"""
+        bands = self._bands.pop(key, None)
+        if bands is None:
+            return
+        del self._shingles[key]
+        for index, band in enumerate(bands):
+            bucket = self._buckets.get((index, band))
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[(index, band)]
+
+    def query(self, message: str, threshold: float) -> Optional[Tuple[str, float]]:
+        """
+        查找与问题最相似的已有问题
+
+        参数:
+            message: 问题
+            threshold: 最低Jaccard相似度（0-1）
+
+        返回:
+            (键, 相似度)，没有达到阈值的问题时返回None
+        """
+        shingle_set = shingles(message)
+        if not shingle_set:
+            return None
+
+        candidates = set()
+        for index, band in enumerate(_split_bands(minhash(shingle_set))):
+            candidates.update(self._buckets.get((index, band), ()))
+
+        best = None
+        size = len(shingle_set)
+        for key in candidates:
+            other = self._shingles[key]
+            # 集合大小相差过多时Jaccard相似度不可能达到阈值
+            if min(size, len(other)) < threshold * max(size, len(other)):
+                continue
+            similarity = jaccard(shingle_set, other)
+            if similarity >= threshold and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+    def clear(self) -> None:
+        self._shingles.clear()
+        self._bands.clear()
+        self._buckets.clear()
+
+
+def _split_bands(signature: Tuple[int, ...]) -> Tuple[Tuple[int, ...], ...]:
+    return tuple(signature[i * ROWS:(i + 1) * ROWS] for i in range(BANDS))
@@ -0,0 +1,25 @@
+"""
+会话路由工具
+
+多worker部署时会话及其Q Chat进程只存在于一个worker中。会话ID按CRC32哈希映射到worker，
+前端路由和各worker使用同一个函数：worker创建会话时重新生成UUID，直到哈希落在自己身上，
+因此路由无需共享状态即可把后续请求转发到拥有该会话的worker。
+"""
+
+import uuid
+import zlib
+
+
+def worker_for_session(session_id: str, workers: int) -> int:
+    """会话所属的worker编号"""
+    if workers <= 1:
+        return 0
+    return zlib.crc32(session_id.encode("utf-8")) % workers
+
+
+def generate_session_id(worker_index: int = 0, workers: int = 1) -> str:
+    """生成属于指定worker的会话ID（UUID4，平均尝试workers次）"""
+    while True:
+        session_id = str(uuid.uuid4())
+        if worker_for_session(session_id, workers) == worker_index:
+            return session_id
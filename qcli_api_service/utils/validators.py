@@ -95,6 +95,17 @@ class InputValidator:
             if not isinstance(data['stream'], bool):
                 return False, "stream字段必须为布尔值"
         
+        # 验证SSE事件合并预算（仅流式接口使用）
+        for field, maximum in (('coalesce_ms', 1000), ('coalesce_bytes', 1024 * 1024)):
+            if field in data and data[field] is not None:
+                value = data[field]
+                if isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= maximum:
+                    return False, f"{field}必须为0到{maximum}之间的整数"
+        
+        # 验证准入优先级
+        if data.get('priority') is not None and data['priority'] not in ('high', 'normal', 'low'):
+            return False, "priority必须为high、normal或low"
+        
         return True, None
     
     @staticmethod
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+并发流式连接容量基准测试（Flask线程模式 vs ASGI asyncio模式）
+
+在子进程中启动服务，N个客户端同时调用 /api/v1/chat/stream 并保持连接直到回复结束，
+比较两种服务模式：
+- 完成/失败的流数量（所有流同时保持打开）
+- 服务进程的峰值线程数
+- 服务进程的峰值RSS，以及相对空闲时每个流增加的内存
+
+使用模拟的q命令（shell脚本，每个片段间隔固定时间输出），不依赖真实的Amazon Q CLI。
+Flask模式使用werkzeug多线程服务器（与 app.run 相同）；ASGI模式优先使用uvicorn，
+未安装时使用本脚本内置的最小HTTP/1.1服务器。
+"""
+
+import sys
+import os
+import argparse
+import asyncio
+import json
+import shutil
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+
+FAKE_Q = '''#!/bin/sh
+printf '!> '
+while IFS= read -r line; do
+    [ "$line" = "/quit" ] && exit 0
+    i=0
+    while [ $i -lt {tokens} ]; do
+        printf '回复片段%d\\n' $i
+        sleep {interval}
+        i=$((i + 1))
+    done
+    printf '\\n!> '
+done
+'''
+
+
+# ---------- 服务端（子进程） ----------
+
+def serve(mode: str, port: int):
+    if mode == "flask":
+        from werkzeug.serving import make_server
+        from qcli_api_service.app import create_app
+        make_server("127.0.0.1", port, create_app(), threaded=True).serve_forever()
+        return
+
+    from qcli_api_service.asgi import create_asgi_app
+    app = create_asgi_app()
+    try:
+        import uvicorn
+    except ImportError:
+        asyncio.run(_serve_asgi(app, port))
+        return
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+async def _serve_asgi(app, port: int):
+    """最小ASGI HTTP/1.1服务器：每个连接一个请求，响应结束后关闭连接"""
+    from qcli_api_service.services.async_session_process import async_process_manager
+    async_process_manager.bind_loop()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = []
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers.append((name.strip().lower().encode("latin-1"), value.strip().encode("latin-1")))
+            length = int(dict(headers).get(b"content-length", b"0"))
+            body = await reader.readexactly(length) if length else b""
+        except (ValueError, IndexError, asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+
+        path, _, query = request_line[1].partition("?")
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": request_line[0], "scheme": "http", "path": path, "root_path": "",
+            "query_string": query.encode("latin-1"), "headers": headers,
+            "server": ("127.0.0.1", port), "client": writer.get_extra_info("peername"),
+        }
+        pending = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            if pending:
+                return pending.pop()
+            # 客户端关闭连接时读到EOF
+            await reader.read()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                lines = [f"HTTP/1.1 {message['status']} OK"] + [
+                    f"{name.decode('latin-1')}: {value.decode('latin-1')}" for name, value in message["headers"]
+                ] + ["Connection: close", "", ""]
+                writer.write("\r\n".join(lines).encode("latin-1"))
+            else:
+                writer.write(message.get("body", b""))
+                await writer.drain()
+
+        try:
+            await app(scope, receive, send)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", port, backlog=4096)
+    async with server:
+        await server.serve_forever()
+
+
+# ---------- 客户端（父进程） ----------
+
+def _proc_status(pid: int) -> dict:
+    """读取进程的RSS（KB）和线程数"""
+    status = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "Threads"):
+                status[key] = int(value.split()[0])
+    return status
+
+
+async def _stream_client(port: int, index: int, results: list):
+    start = time.perf_counter()
+    body = json.dumps({"message": f"问题{index}"}).encode("utf-8")
+    done = False
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(
+            b"POST /api/v1/chat/stream HTTP/1.0\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+            + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+        buffer = b""
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            buffer += data
+            if b'"type": "done"' in buffer:
+                done = True
+                break
+            buffer = buffer[-64:]
+        writer.close()
+    except (OSError, asyncio.IncompleteReadError):
+        pass
+    results.append((done, time.perf_counter() - start))
+
+
+async def _run_clients(port: int, streams: int, ramp: float, pid: int) -> dict:
+    results = []
+    peak = {"VmRSS": 0, "Threads": 0}
+    clients = []
+    for index in range(streams):
+        clients.append(asyncio.ensure_future(_stream_client(port, index, results)))
+        await asyncio.sleep(ramp / streams)
+
+    while not all(client.done() for client in clients):
+        status = _proc_status(pid)
+        for key in peak:
+            peak[key] = max(peak[key], status[key])
+        await asyncio.sleep(0.2)
+    return {"results": results, "peak": peak}
+
+
+def _wait_ready(port: int, timeout: float = 30) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+
+def run(mode: str, streams: int, tokens: int, interval: float, ramp: float, port: int) -> dict:
+    work_dir = tempfile.mkdtemp(prefix="qcli-bench-")
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(bin_dir)
+    fake_q = os.path.join(bin_dir, "q")
+    with open(fake_q, "w") as f:
+        f.write(FAKE_Q.format(tokens=tokens, interval=interval))
+    os.chmod(fake_q, 0o755)
+
+    env = dict(os.environ)
+    env.update({
+        "PATH": f"{bin_dir}{os.pathsep}{env.get('PATH', '')}",
+        "SESSIONS_BASE_DIR": os.path.join(work_dir, "sessions"),
+        "MAX_PROCESSES": "0",
+        "PROCESS_POOL_SIZE": "0",
+        "MAINTENANCE_INTERVAL": "0",
+        "FORCE_CHINESE": "false",
+    })
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", mode, "--port", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if not _wait_ready(port):
+            raise RuntimeError(f"{mode} 服务启动失败")
+        idle = _proc_status(server.pid)
+        start = time.perf_counter()
+        outcome = asyncio.run(_run_clients(port, streams, ramp, server.pid))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        subprocess.run(["pkill", "-f", fake_q], check=False)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    completed = [duration for done, duration in outcome["results"] if done]
+    peak = outcome["peak"]
+    return {
+        "mode": mode,
+        "streams": streams,
+        "completed": len(completed),
+        "failed": streams - len(completed),
+        "stream_p50_s": round(statistics.median(completed), 2) if completed else None,
+        "stream_max_s": round(max(completed), 2) if completed else None,
+        "peak_threads": peak["Threads"],
+        "idle_rss_mb": round(idle["VmRSS"] / 1024, 1),
+        "peak_rss_mb": round(peak["VmRSS"] / 1024, 1),
+        "rss_per_stream_kb": round((peak["VmRSS"] - idle["VmRSS"]) / streams, 1),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发流式连接容量基准测试")
+    parser.add_argument("--mode", default="flask,asgi", help="服务模式列表（flask、asgi，逗号分隔）")
+    parser.add_argument("--streams", type=int, default=300, help="并发流数量")
+    parser.add_argument("--tokens", type=int, default=20, help="每个回复的片段数")
+    parser.add_argument("--interval", type=float, default=1.0, help="片段输出间隔（秒）")
+    parser.add_argument("--ramp", type=float, default=5.0, help="在多少秒内建立全部连接")
+    parser.add_argument("--port", type=int, default=18080, help="服务端口")
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    for mode in args.mode.split(","):
+        result = run(mode, args.streams, args.tokens, args.interval, args.ramp, args.port)
+        print(" ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
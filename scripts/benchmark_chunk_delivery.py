@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+响应块投递基准测试
+
+模拟大量会话同时等待Q Chat响应，测量：
+- 读取线程放入响应块到read_response取到之间的延迟
+- 所有会话空闲等待时的CPU占用
+
+--mode legacy 使用原先每0.1秒轮询一次的读取方式作为对照。
+"""
+
+import sys
+import os
+import argparse
+import statistics
+import threading
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from qcli_api_service.services.session_process_manager import SessionProcess
+from qcli_api_service.services.completion_detector import REASON_PROMPT
+
+
+class _IdleProcess:
+    """代替Popen的空闲进程对象"""
+    pid = 0
+
+    def poll(self):
+        return None
+
+
+def legacy_read_response(process: SessionProcess):
+    """原先的轮询读取方式：每0.1秒检查一次队列"""
+    while True:
+        with process.response_lock:
+            if process.response_queue:
+                yield process.response_queue.popleft()
+                continue
+            if process.turn_complete.is_set():
+                return
+        time.sleep(0.1)
+
+
+def run(sessions: int, idle_seconds: float, mode: str) -> dict:
+    processes = []
+    for i in range(sessions):
+        process = SessionProcess(f"bench-{i}")
+        process.process = _IdleProcess()
+        processes.append(process)
+
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def consume(process: SessionProcess):
+        reader = legacy_read_response(process) if mode == "legacy" else process.read_response()
+        for chunk in reader:
+            received_at = time.perf_counter()
+            with latencies_lock:
+                latencies.append(received_at - float(chunk))
+
+    threads = [threading.Thread(target=consume, args=(p,), daemon=True) for p in processes]
+    for thread in threads:
+        thread.start()
+
+    # 空闲阶段：所有会话都在等待响应
+    time.sleep(0.5)
+    cpu_start = time.process_time()
+    time.sleep(idle_seconds)
+    idle_cpu = time.process_time() - cpu_start
+
+    # 投递阶段：每个会话放入一个响应块，然后结束本轮
+    for process in processes:
+        with process.response_lock:
+            process._enqueue_response(repr(time.perf_counter()))
+        time.sleep(0.001)
+    time.sleep(0.5)
+    for process in processes:
+        process._mark_turn_complete(REASON_PROMPT)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "sessions": sessions,
+        "idle_cpu_percent": round(idle_cpu / idle_seconds * 100, 2),
+        "chunks": len(latencies),
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 3) if latencies else None,
+        "latency_p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应块投递基准测试")
+    parser.add_argument("--sessions", type=int, default=500, help="模拟的会话数量")
+    parser.add_argument("--idle-seconds", type=float, default=5.0, help="测量空闲CPU的时长")
+    parser.add_argument("--mode", choices=["condition", "legacy", "both"], default="both")
+    args = parser.parse_args()
+
+    modes = ["legacy", "condition"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        result = run(args.sessions, args.idle_seconds, mode)
+        print(" ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+输出去重基准测试
+
+生成不同大小（默认1/4/8MB）的模拟回复：正常段落中混有整段重复输出，
+比较：
+- legacy：原先只能处理完整输出的三行块集合 + 关键字/哈希取模规则
+- stream：基于行窗口滚动哈希的增量去重（utils/deduplicator），逐行输入
+
+输出耗时、吞吐量和删除的行数；stream模式每MB耗时应基本不随输出大小变化（线性）。
+"""
+
+import sys
+import os
+import argparse
+import random
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from qcli_api_service.utils.deduplicator import StreamDeduplicator
+
+
+def legacy_deduplicate(text: str) -> str:
+    """原实现（QCLIService._remove_duplicate_content）"""
+    lines = text.split('\n')
+    seen_blocks = set()
+    unique_lines = []
+    i = 0
+    while i < len(lines):
+        if i + 2 < len(lines):
+            block = '\n'.join([lines[i].strip(), lines[i + 1].strip(), lines[i + 2].strip()])
+            if block in seen_blocks and block.strip():
+                i += 3
+                continue
+            elif block.strip():
+                seen_blocks.add(block)
+        unique_lines.append(lines[i])
+        i += 1
+
+    help_keywords = {"帮助", "help", "可以帮助"}
+    service_keywords = {"AWS", "资源", "代码", "文件", "命令"}
+    result = []
+    seen_patterns = set()
+    for line in unique_lines:
+        line_stripped = line.strip()
+        if not line_stripped:
+            result.append(line)
+            continue
+        if any(keyword in line_stripped for keyword in help_keywords):
+            pattern_key = "help_line"
+        elif line_stripped.startswith('•') or any(keyword in line_stripped for keyword in service_keywords):
+            pattern_key = f"service_{hash(line_stripped.replace('•', '').strip()) % 1000}"
+        else:
+            pattern_key = line_stripped
+        if pattern_key not in seen_patterns:
+            result.append(line)
+            seen_patterns.add(pattern_key)
+    return '\n'.join(result)
+
+
+def generate_output(size_mb: float, seed: int = 0) -> str:
+    """生成模拟回复，约10%的段落是之前某段的重复输出"""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    paragraphs = []
+    size = 0
+    index = 0
+    while size < target:
+        if paragraphs and rng.random() < 0.1:
+            paragraph = rng.choice(paragraphs)
+        else:
+            paragraph = "\n".join(
+                f"第{index}段第{line}行：使用AWS资源部署应用时需要注意的事项 {rng.randrange(10 ** 6)}"
+                for line in range(rng.randint(3, 8))
+            )
+            index += 1
+        paragraphs.append(paragraph)
+        size += len(paragraph.encode("utf-8")) + 2
+    return "\n\n".join(paragraphs)
+
+
+def run(mode: str, text: str) -> dict:
+    lines_in = text.count("\n") + 1
+    start = time.perf_counter()
+    if mode == "legacy":
+        lines_out = legacy_deduplicate(text).count("\n") + 1
+    else:
+        deduplicator = StreamDeduplicator(window=3)
+        lines_out = 0
+        for line in text.split("\n"):
+            lines_out += len(deduplicator.feed(line))
+        lines_out += len(deduplicator.flush())
+    elapsed = time.perf_counter() - start
+    size_mb = len(text.encode("utf-8")) / 1024 / 1024
+    return {
+        "mode": mode,
+        "size_mb": round(size_mb, 1),
+        "lines": lines_in,
+        "removed": lines_in - lines_out,
+        "elapsed_s": round(elapsed, 3),
+        "s_per_mb": round(elapsed / size_mb, 4),
+        "mb_per_s": round(size_mb / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="输出去重基准测试")
+    parser.add_argument("--sizes", default="1,4,8", help="模拟输出大小列表（MB，逗号分隔）")
+    parser.add_argument("--mode", choices=["legacy", "stream", "both"], default="both")
+    args = parser.parse_args()
+
+    modes = ["legacy", "stream"] if args.mode == "both" else [args.mode]
+    for size in args.sizes.split(","):
+        text = generate_output(float(size))
+        for mode in modes:
+            result = run(mode, text)
+            print(" ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
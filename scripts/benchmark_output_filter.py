@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+输出行过滤基准测试
+
+对一份Q CLI输出记录（默认生成约10MB的模拟记录：启动横幅、ANSI颜色代码、
+提示符回显和中文回复）逐行清理和过滤，比较：
+- legacy：每行重新编译ANSI正则、每次判断重建15个lambda（原实现）
+- shared：共用的预编译过滤规则 filter_line（utils/output_filter），QCLIService 和飞书机器人
+  逐行调用它；会话进程（SessionProcess）对 StreamDecoder 解码后的行调用同一组规则 should_skip_line
+
+吞吐量低于 --min-mbps 时以非零状态退出，可用于CI。
+"""
+
+import sys
+import os
+import argparse
+import random
+import re
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from qcli_api_service.utils.output_filter import filter_line
+
+
+BANNER = [
+    "\x1b[38;5;141m╭──────────────────────────────── Did you know? ────────────────────────────────╮\x1b[0m",
+    "\x1b[38;5;141m│\x1b[0m   Get notified whenever Q CLI finishes responding. Just run q settings        \x1b[38;5;141m│\x1b[0m",
+    "\x1b[38;5;141m│\x1b[0m   chat.enableNotifications true                                               \x1b[38;5;141m│\x1b[0m",
+    "\x1b[38;5;141m╰───────────────────────────────────────────────────────────────────────────────╯\x1b[0m",
+    "/help all commands  •  ctrl + j new lines  •  ctrl + s fuzzy search",
+    "\x1b[2m━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\x1b[0m",
+    "\x1b[1m🤖 You are chatting with claude-sonnet-4\x1b[0m",
+    "",
+]
+
+REPLY = [
+    "\x1b[32m> \x1b[0m要在AWS上部署Flask应用，推荐以下步骤：",
+    "1. 使用 \x1b[1mElastic Beanstalk\x1b[0m 创建Python平台环境",
+    "2. 配置 requirements.txt 和 Procfile，指定 gunicorn 启动命令",
+    "   - 建议设置 workers = 2 * CPU + 1",
+    "3. 通过 eb deploy 发布新版本，并在控制台查看健康状态",
+    "```python",
+    "from flask import Flask",
+    "app = Flask(__name__)",
+    "```",
+    "如果需要更细粒度的控制，也可以使用ECS Fargate部署容器镜像。",
+    "",
+]
+
+
+def legacy_filter_line(line: str):
+    """原实现：每行编译正则，每次判断重建跳过规则列表"""
+    ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+    line = ansi_escape.sub('', line).strip()
+    if not line:
+        return None
+    if line.startswith(">"):
+        content = line[1:].strip()
+        if content.startswith("请用中文回答") or content.startswith("以下是我们之前的对话历史") or not content:
+            return None
+        return line
+    skip_patterns = [
+        lambda l: "/quit" in l,
+        lambda l: l.startswith("q chat"),
+        lambda l: "Welcome to" in l,
+        lambda l: "Type /quit" in l,
+        lambda l: "Did you know?" in l,
+        lambda l: "Get notified whenever" in l,
+        lambda l: "chat.enableNotifications" in l,
+        lambda l: "/help all commands" in l,
+        lambda l: "ctrl + j new lines" in l,
+        lambda l: "You are chatting with" in l,
+        lambda l: "Thinking..." in l,
+        lambda l: l.startswith("━"),
+        lambda l: l.startswith("╭"),
+        lambda l: l.startswith("│"),
+        lambda l: l.startswith("╰"),
+    ]
+    return None if any(pattern(line) for pattern in skip_patterns) else line
+
+
+def generate_transcript(size_mb: float, seed: int = 0) -> str:
+    """生成模拟的Q CLI输出记录"""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    parts = []
+    size = 0
+    turn = 0
+    while size < target:
+        block = []
+        if turn % 20 == 0:
+            block.extend(BANNER)
+        block.append(f"\x1b[32m> \x1b[0m请用中文回答以下问题：第{turn}个问题")
+        block.append("\x1b[38;5;8mThinking...\x1b[0m")
+        block.extend(rng.sample(REPLY, len(REPLY)))
+        text = "\n".join(block) + "\n"
+        parts.append(text)
+        size += len(text.encode("utf-8"))
+        turn += 1
+    return "".join(parts)
+
+
+def run(mode: str, lines, size_bytes: int) -> dict:
+    filter_function = legacy_filter_line if mode == "legacy" else filter_line
+    start = time.perf_counter()
+    kept = 0
+    for line in lines:
+        if filter_function(line) is not None:
+            kept += 1
+    elapsed = time.perf_counter() - start
+    return {
+        "mode": mode,
+        "lines": len(lines),
+        "kept": kept,
+        "elapsed_s": round(elapsed, 3),
+        "mb_per_s": round(size_bytes / 1024 / 1024 / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="输出行过滤基准测试")
+    parser.add_argument("--transcript", help="录制的Q CLI输出文件（默认生成模拟记录）")
+    parser.add_argument("--size-mb", type=float, default=10, help="模拟记录大小（MB）")
+    parser.add_argument("--min-mbps", type=float, default=20, help="shared模式的最低吞吐量（MB/s）")
+    parser.add_argument("--mode", choices=["legacy", "shared", "both"], default="both")
+    args = parser.parse_args()
+
+    if args.transcript:
+        with open(args.transcript, encoding="utf-8", errors="replace") as transcript_file:
+            transcript = transcript_file.read()
+    else:
+        transcript = generate_transcript(args.size_mb)
+    size_bytes = len(transcript.encode("utf-8"))
+    lines = transcript.split("\n")
+
+    modes = ["legacy", "shared"] if args.mode == "both" else [args.mode]
+    results = {}
+    for mode in modes:
+        results[mode] = run(mode, lines, size_bytes)
+        print(" ".join(f"{key}={value}" for key, value in results[mode].items()))
+
+    if "legacy" in results and "shared" in results and results["legacy"]["kept"] != results["shared"]["kept"]:
+        print("error=过滤结果与原实现不一致")
+        sys.exit(1)
+    if "shared" in results and results["shared"]["mb_per_s"] < args.min_mbps:
+        print(f"error=吞吐量低于阈值 {args.min_mbps} MB/s")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+进程输出读取方式基准测试
+
+启动N个子进程（cat，代替Q Chat），比较：
+- thread：每个进程一个阻塞readline的读取线程（原实现）
+- mux：共享的selectors/epoll多路复用线程
+
+输出线程数、RSS内存、上下文切换次数和全部输出送达的耗时。
+"""
+
+import sys
+import os
+import argparse
+import resource
+import subprocess
+import threading
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from qcli_api_service.services.output_multiplexer import output_multiplexer
+
+
+def _rss_kb() -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _context_switches() -> int:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_nvcsw + usage.ru_nivcsw
+
+
+def run(processes: int, rounds: int, mode: str) -> dict:
+    rss_before = _rss_kb()
+    threads_before = threading.active_count()
+
+    received = 0
+    received_lock = threading.Condition()
+
+    def on_line():
+        nonlocal received
+        with received_lock:
+            received += 1
+            received_lock.notify_all()
+
+    children = []
+    for _ in range(processes):
+        child = subprocess.Popen(["cat"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+        children.append(child)
+
+        if mode == "thread":
+            def read_lines(stream=child.stdout):
+                for _line in iter(stream.readline, b""):
+                    on_line()
+            threading.Thread(target=read_lines, daemon=True).start()
+        else:
+            pending = {"data": b""}
+
+            def on_data(data, pending=pending):
+                pending["data"] += data
+                *lines, pending["data"] = pending["data"].split(b"\n")
+                for _line in lines:
+                    on_line()
+            output_multiplexer.register(child.stdout.fileno(), on_data)
+
+    time.sleep(0.5)
+    switches_before = _context_switches()
+    start = time.perf_counter()
+
+    for round_index in range(rounds):
+        for child in children:
+            child.stdin.write(f"round {round_index} 中文输出\n".encode("utf-8"))
+        with received_lock:
+            received_lock.wait_for(lambda: received >= processes * (round_index + 1), timeout=30)
+
+    elapsed = time.perf_counter() - start
+    result = {
+        "mode": mode,
+        "processes": processes,
+        "threads": threading.active_count() - threads_before,
+        "rss_delta_mb": round((_rss_kb() - rss_before) / 1024, 1),
+        "context_switches": _context_switches() - switches_before,
+        "lines": received,
+        "elapsed_s": round(elapsed, 3),
+    }
+
+    for child in children:
+        if mode == "mux":
+            output_multiplexer.unregister(child.stdout.fileno())
+        child.stdin.close()
+        child.wait()
+        child.stdout.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="进程输出读取方式基准测试")
+    parser.add_argument("--processes", type=int, default=500, help="子进程数量")
+    parser.add_argument("--rounds", type=int, default=20, help="每个进程输出的行数")
+    parser.add_argument("--mode", choices=["thread", "mux"], required=True,
+                        help="读取方式（分别运行以免互相影响内存统计）")
+    args = parser.parse_args()
+
+    result = run(args.processes, args.rounds, args.mode)
+    print(" ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
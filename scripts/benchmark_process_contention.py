@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+会话进程管理器锁竞争基准测试
+
+大量新会话同时创建进程、旧会话同时被移除时，测量已有会话获取进程
+（get_or_create_process命中路径）的延迟。使用模拟的q命令：
+启动时有初始化延迟，收到 /quit 后需要一段时间才退出。
+
+--mode legacy 使用原先在全局锁内启动和终止进程的实现作为对照。
+"""
+
+import sys
+import os
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from qcli_api_service.services.session_process_manager import SessionProcess, SessionProcessManager
+
+
+FAKE_Q = '''#!{python}
+import sys, time
+time.sleep({startup})
+sys.stdout.write("!> ")
+sys.stdout.flush()
+for line in sys.stdin:
+    if line.strip() == "/quit":
+        time.sleep({quit_delay})
+        break
+'''
+
+
+class LegacySessionProcessManager(SessionProcessManager):
+    """原实现：在全局锁内启动和终止进程"""
+
+    def get_or_create_process(self, session_id, work_directory=None, timeout=120):
+        with self.lock:
+            if session_id not in self.processes:
+                process = SessionProcess(session_id, work_directory)
+                if not process.start():
+                    raise RuntimeError(f"无法为会话 {session_id} 启动Q Chat进程")
+                self.processes[session_id] = process
+            return self.processes[session_id]
+
+    def remove_process(self, session_id):
+        with self.lock:
+            process = self.processes.pop(session_id, None)
+            if process:
+                process.terminate()
+
+
+def run(mode: str, sessions: int, hot_readers: int) -> dict:
+    manager_cls = LegacySessionProcessManager if mode == "legacy" else SessionProcessManager
+    manager = manager_cls(max_processes=0)
+    work_directory = tempfile.mkdtemp(prefix="qcli-bench-")
+
+    manager.get_or_create_process("hot", work_directory)
+    old_sessions = [f"old-{i}" for i in range(sessions)]
+    for session_id in old_sessions:
+        manager.get_or_create_process(session_id, work_directory)
+
+    latencies = []
+    stop = threading.Event()
+
+    def hot_reader():
+        while not stop.is_set():
+            start = time.perf_counter()
+            manager.get_or_create_process("hot", work_directory)
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.005)
+
+    readers = [threading.Thread(target=hot_reader, daemon=True) for _ in range(hot_readers)]
+    for reader in readers:
+        reader.start()
+
+    # 新会话创建与旧会话移除同时进行
+    workers = []
+    for i in range(sessions):
+        workers.append(threading.Thread(
+            target=manager.get_or_create_process, args=(f"new-{i}", work_directory), daemon=True))
+        workers.append(threading.Thread(
+            target=manager.remove_process, args=(old_sessions[i],), daemon=True))
+    churn_start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    churn_elapsed = time.perf_counter() - churn_start
+
+    stop.set()
+    for reader in readers:
+        reader.join()
+    manager.shutdown_all()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "sessions": sessions,
+        "churn_s": round(churn_elapsed, 2),
+        "hot_lookups": len(latencies),
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话进程管理器锁竞争基准测试")
+    parser.add_argument("--sessions", type=int, default=50, help="同时创建和移除的会话数量")
+    parser.add_argument("--hot-readers", type=int, default=8, help="访问已有会话的并发线程数")
+    parser.add_argument("--startup", type=float, default=0.2, help="模拟q启动初始化耗时（秒）")
+    parser.add_argument("--quit-delay", type=float, default=1.0, help="模拟q收到 /quit 后的退出耗时（秒）")
+    parser.add_argument("--mode", choices=["legacy", "current", "both"], default="both")
+    args = parser.parse_args()
+
+    # 把模拟的q放到PATH最前面
+    bin_dir = tempfile.mkdtemp(prefix="qcli-bench-bin-")
+    script_path = os.path.join(bin_dir, "q")
+    with open(script_path, "w") as script:
+        script.write(FAKE_Q.format(python=sys.executable, startup=args.startup, quit_delay=args.quit_delay))
+    os.chmod(script_path, 0o755)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+
+    modes = ["legacy", "current"] if args.mode == "both" else [args.mode]
+    for mode in modes:
+        result = run(mode, args.sessions, args.hot_readers)
+        print(" ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
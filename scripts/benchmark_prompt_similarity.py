@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+近似重复问题索引基准测试
+
+生成N个模拟问题建立索引（utils/prompt_similarity），再用三类查询测量：
+- variant：同一问题只改空白、标点，或在开头加上“请问”“你好，”等说法，应命中原问题
+- changed：替换问题中的关键词（例如“创建”换成“删除”），不应命中
+- unrelated：索引中不存在的新问题，不应命中
+
+输出单次查找耗时（p50/p99，微秒）、候选数量，以及三类查询的命中率。
+"""
+
+import sys
+import os
+import argparse
+import random
+import statistics
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from qcli_api_service.utils.prompt_similarity import PromptSimilarityIndex
+
+ACTIONS = ["创建", "删除", "配置", "监控", "备份", "迁移", "扩容", "加密"]
+SERVICES = ["S3存储桶", "EC2实例", "Lambda函数", "RDS数据库", "EKS集群", "DynamoDB表", "VPC子网", "CloudFront分发"]
+TOPICS = ["最佳实践是什么", "需要哪些IAM权限", "费用如何计算", "有哪些常见错误", "如何用CLI完成", "需要注意什么"]
+PREFIXES = ["请问", "你好，", "麻烦问一下，", "我想知道"]
+
+
+def generate_prompt(rng: random.Random, index: int) -> str:
+    return f"在{rng.choice(['us-east-1', 'us-west-2', 'ap-northeast-1'])}区域{rng.choice(ACTIONS)}" \
+           f"第{index}个{rng.choice(SERVICES)}时{rng.choice(TOPICS)}？"
+
+
+def make_variant(rng: random.Random, prompt: str) -> str:
+    choice = rng.randrange(3)
+    if choice == 0:
+        return "  ".join(prompt.split("区域")) + "\n"
+    if choice == 1:
+        return prompt.rstrip("？") + "!!"
+    return rng.choice(PREFIXES) + prompt
+
+
+def make_changed(rng: random.Random, prompt: str) -> str:
+    for action in ACTIONS:
+        if action in prompt:
+            return prompt.replace(action, rng.choice([a for a in ACTIONS if a != action]), 1)
+    return prompt
+
+
+def run(entries: int, queries: int, threshold: float, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    prompts = [generate_prompt(rng, index) for index in range(entries)]
+    index = PromptSimilarityIndex()
+    start = time.perf_counter()
+    for key, prompt in enumerate(prompts):
+        index.add(str(key), prompt)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    result = {"entries": entries, "threshold": threshold, "build_ms": round(build_ms, 1)}
+    timings = []
+    for kind in ("variant", "changed", "unrelated"):
+        hits = 0
+        for _ in range(queries):
+            key = rng.randrange(entries)
+            if kind == "variant":
+                query = make_variant(rng, prompts[key])
+            elif kind == "changed":
+                query = make_changed(rng, prompts[key])
+            else:
+                query = generate_prompt(rng, entries + rng.randrange(entries))
+            start = time.perf_counter()
+            match = index.query(query, threshold)
+            timings.append((time.perf_counter() - start) * 1e6)
+            if match is not None and (kind != "variant" or match[0] == str(key)):
+                hits += 1
+        result[f"{kind}_hit_rate"] = round(hits / queries, 3)
+
+    timings.sort()
+    result["query_p50_us"] = round(statistics.median(timings), 1)
+    result["query_p99_us"] = round(timings[int(len(timings) * 0.99) - 1], 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近似重复问题索引基准测试")
+    parser.add_argument("--entries", default="1000,10000", help="索引中的问题数量列表（逗号分隔）")
+    parser.add_argument("--queries", type=int, default=2000, help="每类查询的次数")
+    parser.add_argument("--threshold", type=float, default=0.8, help="相似度阈值")
+    args = parser.parse_args()
+
+    for entries in (int(value) for value in args.entries.split(",")):
+        result = run(entries, args.queries, args.threshold)
+        print(" ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+SSE事件合并基准测试
+
+模拟N个会话同时流式输出（每个会话按固定间隔输出几个字的片段，每隔若干片段换行），
+每个流由一个线程运行 read_response + SSE事件序列化，比较不同的合并时间预算：
+- 首个事件延迟（time-to-first-token）
+- 每秒发出的事件数和平均事件大小
+- 进程CPU时间
+
+--coalesce-ms 0 表示不合并（每个响应块一个事件）。
+"""
+
+import sys
+import os
+import argparse
+import json
+import statistics
+import threading
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from qcli_api_service.services.session_process_manager import SessionProcess
+from qcli_api_service.services.chunk_coalescer import ChunkCoalescer
+from qcli_api_service.services.completion_detector import REASON_PROMPT
+
+
+class _IdleProcess:
+    """代替Popen的空闲进程对象"""
+    pid = 0
+
+    def poll(self):
+        return None
+
+
+def run(streams: int, tokens: int, interval: float, coalesce_ms: int, coalesce_bytes: int) -> dict:
+    processes = []
+    for i in range(streams):
+        process = SessionProcess(f"bench-{i}")
+        process.process = _IdleProcess()
+        process.stream_latency_budget = 0.0  # 部分行立即可读，只比较合并阶段
+        processes.append(process)
+
+    first_event = []
+    events = []
+    event_bytes = []
+    stats_lock = threading.Lock()
+    start = time.perf_counter()
+
+    def consume(process: SessionProcess):
+        coalescer = ChunkCoalescer(coalesce_ms, coalesce_bytes)
+        count = 0
+        size = 0
+        first = None
+        for chunk in process.read_response(coalescer):
+            payload = f"data: {json.dumps({'message': chunk, 'type': 'chunk'}, ensure_ascii=False)}\n\n"
+            first = first or time.perf_counter()
+            count += 1
+            size += len(payload.encode("utf-8"))
+        with stats_lock:
+            first_event.append((first or time.perf_counter()) - start)
+            events.append(count)
+            event_bytes.append(size)
+
+    def produce(process: SessionProcess):
+        for index in range(tokens):
+            token = "模型输出" + ("\n" if index % 15 == 14 else "")
+            process._on_stdout_data(token.encode("utf-8"))
+            time.sleep(interval)
+        process._on_stdout_data(b"\n")
+        process._mark_turn_complete(REASON_PROMPT)
+
+    cpu_start = time.process_time()
+    consumers = [threading.Thread(target=consume, args=(p,)) for p in processes]
+    producers = [threading.Thread(target=produce, args=(p,)) for p in processes]
+    for thread in consumers + producers:
+        thread.start()
+    for thread in consumers + producers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    ordered = sorted(first_event)
+    total_events = sum(events)
+    return {
+        "coalesce_ms": coalesce_ms,
+        "streams": streams,
+        "ttft_p50_ms": round(statistics.median(ordered) * 1000, 1),
+        "ttft_p99_ms": round(ordered[int(len(ordered) * 0.99) - 1] * 1000, 1),
+        "events": total_events,
+        "events_per_s": round(total_events / elapsed, 1),
+        "avg_event_bytes": round(sum(event_bytes) / total_events, 1),
+        "cpu_s": round(cpu, 2),
+        "elapsed_s": round(elapsed, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE事件合并基准测试")
+    parser.add_argument("--streams", type=int, default=200, help="并发流数量")
+    parser.add_argument("--tokens", type=int, default=150, help="每个流输出的片段数")
+    parser.add_argument("--interval", type=float, default=0.01, help="片段输出间隔（秒）")
+    parser.add_argument("--coalesce-ms", default="0,30,50,80", help="合并时间预算列表（毫秒，逗号分隔）")
+    parser.add_argument("--coalesce-bytes", type=int, default=4096, help="合并字节预算")
+    args = parser.parse_args()
+
+    for coalesce_ms in args.coalesce_ms.split(","):
+        result = run(args.streams, args.tokens, args.interval, int(coalesce_ms), args.coalesce_bytes)
+        print(" ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+进程连接方式基准测试
+
+比较 pipe 与 pty 两种连接方式下：
+- 首个响应块到达时间（time-to-first-chunk）
+- 判定本轮回复结束的时间及判定方式
+
+使用模拟的q命令，行为与常见CLI一致：stdout不是终端时整块缓冲输出，
+只在终端中显示交互提示符。管道模式下无法识别提示符，只能等待空闲超时兜底（约35秒）。
+"""
+
+import sys
+import os
+import argparse
+import tempfile
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from qcli_api_service.services.session_process_manager import SessionProcess
+
+
+FAKE_Q = '''#!{python}
+import os, sys, time
+tty = os.isatty(1)
+# 终端中行缓冲，管道中64KB块缓冲（每轮结束时才flush）
+out = open(1, "w", buffering=1 if tty else 65536, encoding="utf-8", closefd=False)
+def prompt():
+    if tty:
+        out.write("\\x1b[32m!>\\x1b[0m ")
+    out.flush()
+prompt()
+for line in sys.stdin:
+    if line.strip() == "/quit":
+        break
+    for i in range({lines}):
+        out.write(f"第{{i}}行 模型输出的中文内容\\n")
+        time.sleep({delay})
+    prompt()
+'''
+
+
+def run(transport: str, turns: int) -> dict:
+    work_directory = tempfile.mkdtemp(prefix="qcli-bench-")
+    process = SessionProcess(f"bench-{transport}", work_directory)
+    process.transport = transport
+    if not process.start():
+        raise RuntimeError("启动模拟进程失败")
+    process.warm_up(timeout=5)
+
+    first_chunk = []
+    end_of_turn = []
+    reasons = []
+    try:
+        for turn in range(turns):
+            start = time.perf_counter()
+            process.send_message(f"第{turn}轮")
+            first = None
+            for _chunk in process.read_response():
+                if first is None:
+                    first = time.perf_counter() - start
+            first_chunk.append(first or 0.0)
+            end_of_turn.append(time.perf_counter() - start)
+            reasons.append(process.turn_completion_reason or "idle_timeout")
+    finally:
+        process.terminate()
+
+    return {
+        "transport": transport,
+        "turns": turns,
+        "first_chunk_ms": round(sum(first_chunk) / turns * 1000, 1),
+        "end_of_turn_ms": round(sum(end_of_turn) / turns * 1000, 1),
+        "reasons": ",".join(sorted(set(reasons))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="进程连接方式基准测试")
+    parser.add_argument("--turns", type=int, default=2, help="每种连接方式的对话轮数")
+    parser.add_argument("--lines", type=int, default=20, help="每轮模拟输出的行数")
+    parser.add_argument("--delay", type=float, default=0.05, help="模拟每行输出的间隔（秒）")
+    parser.add_argument("--transport", choices=["pipe", "pty", "both"], default="both")
+    args = parser.parse_args()
+
+    # 把模拟的q放到PATH最前面
+    bin_dir = tempfile.mkdtemp(prefix="qcli-bench-bin-")
+    script_path = os.path.join(bin_dir, "q")
+    with open(script_path, "w") as script:
+        script.write(FAKE_Q.format(python=sys.executable, lines=args.lines, delay=args.delay))
+    os.chmod(script_path, 0o755)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+
+    transports = ["pty", "pipe"] if args.transport == "both" else [args.transport]
+    for transport in transports:
+        result = run(transport, args.turns)
+        print(" ".join(f"{key}={value}" for key, value in result.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,10 @@ from lark_oapi.api.im.v1 import (
     ReplyMessageResponse,
 )
 
+# 与API服务共用Q CLI输出过滤规则：在仓库根目录启动（python -m src.python_flask 或 gunicorn src.python_flask:app），
+# 或把仓库根目录加入PYTHONPATH
+from qcli_api_service.utils.output_filter import filter_line
+
 app = Flask(__name__)
 
 # 对话历史存储
@@ -227,16 +231,11 @@ def run_q_chat(message: str, app_id: str, message_id: str, user_id: str) -> str:
         buffer = []
         last_send_time = time.time()
         
-        # ANSI颜色代码正则表达式
-        ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-        
         # 逐行读取输出并处理
         for line in iter(q_process.stdout.readline, ''):
-            # 清理行（移除ANSI颜色代码）
-            cleaned_line = ansi_escape.sub('', line).strip()
-            
-            # 跳过命令提示符和退出命令
-            if cleaned_line.startswith(">") or "/quit" in cleaned_line or not cleaned_line:
+            # 清理行（移除ANSI颜色代码），跳过命令提示符、退出命令和启动横幅
+            cleaned_line = filter_line(line)
+            if cleaned_line is None or cleaned_line.startswith(">"):
                 continue
                 
             # 添加到缓冲区
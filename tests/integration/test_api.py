@@ -3,9 +3,26 @@ API接口集成测试
 """
 
 import json
+import time
 import pytest
 from unittest.mock import patch, Mock
 from qcli_api_service.app import create_app
+from qcli_api_service.config import config
+
+
+def _parse_sse(body: str):
+    """解析SSE响应体为 (事件ID, 数据) 列表，忽略心跳注释"""
+    events = []
+    for block in body.split("\n\n"):
+        event_id, data = None, None
+        for line in block.split("\n"):
+            if line.startswith("id: "):
+                event_id = int(line[4:])
+            elif line.startswith("data: "):
+                data = json.loads(line[6:])
+        if data is not None:
+            events.append((event_id, data))
+    return events
 
 
 @pytest.fixture
@@ -198,6 +215,34 @@ class TestAPI:
         data = response.get_json()
         assert 'AI处理失败' in data['error']
     
+    def test_get_session_stderr(self, client):
+        """测试获取会话stderr调试信息"""
+        response = client.post('/api/v1/sessions')
+        session_id = response.get_json()['session_id']
+        
+        response = client.get(f'/api/v1/sessions/{session_id}/stderr')
+        
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data['session_id'] == session_id
+        assert data['lines'] == []
+        
+        response = client.get('/api/v1/sessions/nonexistent/stderr')
+        assert response.status_code == 404
+    
+    def test_chat_session_queue_full(self, client):
+        """测试同一会话排队请求过多时返回429"""
+        from qcli_api_service.services.turn_scheduler import TurnQueueFullError
+        
+        with patch('qcli_api_service.services.turn_scheduler.turn_scheduler.acquire',
+                   side_effect=TurnQueueFullError("s1", 4, 30)):
+            response = client.post('/api/v1/chat', json={'message': '你好'})
+        
+        assert response.status_code == 429
+        assert response.headers.get('Retry-After') == '30'
+        data = response.get_json()
+        assert data['code'] == 'RATE_LIMIT_EXCEEDED'
+    
     @patch('qcli_api_service.services.qcli_service.qcli_service.stream_chat')
     def test_stream_chat(self, mock_stream_chat, client):
         """测试流式聊天接口"""
@@ -214,6 +259,282 @@ class TestAPI:
         assert response.headers.get('Cache-Control') == 'no-cache'
         assert response.headers.get('Connection') == 'keep-alive'
     
+    def test_stream_chat_heartbeat_and_disconnect(self, client):
+        """测试流式响应发送心跳，客户端断开且未重新连接时取消本轮对话"""
+        def read_response(*args, **kwargs):
+            yield "第一块"
+            while True:
+                time.sleep(0.01)
+                yield ""
+        
+        process = Mock()
+        process.send_message.return_value = True
+        process.read_response.side_effect = read_response
+        
+        with patch('qcli_api_service.services.session_process_manager.session_process_manager.get_or_create_process',
+                   return_value=process), \
+             patch.object(config, 'SSE_HEARTBEAT_INTERVAL', 0.05), \
+             patch.object(config, 'STREAM_RESUME_GRACE', 0):
+            response = client.post('/api/v1/chat/stream', json={'message': '你好'}, buffered=False)
+            events = iter(response.response)
+            received = [next(events) for _ in range(3)]
+            response.close()
+            
+            deadline = time.time() + 2
+            while not process.cancel_turn.called and time.time() < deadline:
+                time.sleep(0.01)
+        
+        received = b"".join(part if isinstance(part, bytes) else part.encode() for part in received).decode()
+        assert "第一块" in received
+        assert ": heartbeat\n\n" in received
+        process.cancel_turn.assert_called_once()
+    
+    def test_resume_stream_with_last_event_id(self, client):
+        """测试断线后带Last-Event-ID恢复流式回复，不重新生成"""
+        process = Mock()
+        process.send_message.return_value = True
+        process.read_response.return_value = iter(["第一块", "第二块", "第三块"])
+        
+        with patch('qcli_api_service.services.session_process_manager.session_process_manager.get_or_create_process',
+                   return_value=process):
+            response = client.post('/api/v1/chat/stream', json={'message': '你好'})
+            events = _parse_sse(response.get_data(as_text=True))
+            session_id = events[0][1]['session_id']
+            first_id = events[1][0]
+            
+            response = client.get(f'/api/v1/sessions/{session_id}/stream',
+                                  headers={'Last-Event-ID': str(first_id)})
+            assert response.status_code == 200
+            resumed = _parse_sse(response.get_data(as_text=True))
+        
+        assert [event['message'] for _, event in resumed if event['type'] == 'chunk'] == ["第二块", "第三块"]
+        assert resumed[0][0] == first_id + 1
+        assert resumed[-1][1]['type'] == 'done'
+        process.send_message.assert_called_once()
+    
+    def test_resume_stream_errors(self, client):
+        """测试无法恢复流式回复时的错误"""
+        response = client.get('/api/v1/sessions/nonexistent/stream')
+        assert response.status_code == 404
+        
+        session_id = client.post('/api/v1/sessions').get_json()['session_id']
+        response = client.get(f'/api/v1/sessions/{session_id}/stream')
+        assert response.status_code == 410
+        assert response.get_json()['code'] == 'SESSION_STREAM_EXPIRED'
+        
+        response = client.get(f'/api/v1/sessions/{session_id}/stream', headers={'Last-Event-ID': 'abc'})
+        assert response.status_code == 400
+    
+    def test_job_lifecycle(self, client):
+        """测试提交任务后立即返回，长轮询得到结果，并可订阅任务事件"""
+        process = Mock()
+        process.send_message.return_value = True
+        process.read_response.return_value = iter(["第一块\n", "第二块\n"])
+        
+        with patch('qcli_api_service.services.session_process_manager.session_process_manager.get_or_create_process',
+                   return_value=process):
+            response = client.post('/api/v1/jobs', json={'message': '你好'})
+            assert response.status_code == 202
+            job = response.get_json()
+            assert job['status'] in ('queued', 'running', 'completed')
+            assert response.headers['Location'] == f"/api/v1/jobs/{job['job_id']}"
+            
+            result = client.get(f"/api/v1/jobs/{job['job_id']}?wait=5").get_json()
+            assert result['status'] == 'completed'
+            assert result['response'] == "第一块\n第二块"
+            assert result['session_id'] == job['session_id']
+            
+            response = client.get(f"/api/v1/jobs/{job['job_id']}/stream", headers={'Last-Event-ID': '1'})
+            events = _parse_sse(response.get_data(as_text=True))
+        
+        assert [event['type'] for _, event in events] == ['chunk', 'done']
+        assert events[0][0] == 2
+        history = client.get(f"/api/v1/sessions/{job['session_id']}").get_json()
+        assert history['message_count'] == 2
+    
+    def test_job_errors(self, client):
+        """测试任务不存在、参数错误和排队已满"""
+        response = client.get('/api/v1/jobs/nonexistent')
+        assert response.status_code == 404
+        assert response.get_json()['code'] == 'JOB_NOT_FOUND'
+        assert client.get('/api/v1/jobs/nonexistent/stream').status_code == 404
+        assert client.post('/api/v1/jobs', json={'message': ''}).status_code == 400
+        
+        with patch('qcli_api_service.services.job_manager.job_manager.max_pending', 0):
+            response = client.post('/api/v1/jobs', json={'message': '你好'})
+        assert response.status_code == 429
+        assert 'Retry-After' in response.headers
+    
+    def test_chat_admission_rejected(self, client):
+        """测试服务繁忙时返回503和Retry-After，会话执行权随之释放"""
+        from qcli_api_service.services.admission_control import AdmissionController
+        
+        controller = AdmissionController(max_concurrent=1, max_queue=0, max_per_client=1, queue_timeout=1)
+        holder = controller.acquire("other-client")
+        process = Mock()
+        process.send_message.return_value = True
+        process.read_response.return_value = iter(["回复\n"])
+        
+        with patch('qcli_api_service.api.controllers.admission_controller', controller), \
+                patch('qcli_api_service.services.session_process_manager.session_process_manager.get_or_create_process',
+                      return_value=process):
+            response = client.post('/api/v1/chat', json={'message': '你好', 'priority': 'high'})
+            assert response.status_code == 503
+            data = response.get_json()
+            assert data['code'] == 'SERVICE_OVERLOADED'
+            assert int(response.headers['Retry-After']) >= 1
+            
+            controller.release(holder)
+            session_id = client.post('/api/v1/sessions').get_json()['session_id']
+            response = client.post('/api/v1/chat', json={'message': '你好', 'session_id': session_id})
+            assert response.status_code == 200
+        
+        assert controller.get_stats()['rejected']['queue_full'] == 1
+        assert controller.get_stats()['active'] == 0
+    
+    def test_idempotency_key(self, client):
+        """测试相同Idempotency-Key的重试不再运行模型，流式接口重放同一轮回复，换消息复用键返回422"""
+        process = Mock()
+        process.send_message.return_value = True
+        process.read_response.side_effect = lambda *args, **kwargs: iter(["回复\n"])
+        
+        with patch('qcli_api_service.services.session_process_manager.session_process_manager.get_or_create_process',
+                   return_value=process):
+            session_id = client.post('/api/v1/sessions').get_json()['session_id']
+            body = {'message': '你好', 'session_id': session_id}
+            headers = {'Idempotency-Key': 'chat-retry-1'}
+            first = client.post('/api/v1/chat', json=body, headers=headers)
+            second = client.post('/api/v1/chat', json=body, headers=headers)
+            assert first.status_code == second.status_code == 200
+            assert second.get_json() == first.get_json()
+            assert second.headers['Idempotent-Replayed'] == 'true'
+            assert 'Idempotent-Replayed' not in first.headers
+            
+            response = client.post('/api/v1/chat', json={'message': '再见', 'session_id': session_id}, headers=headers)
+            assert response.status_code == 422
+            assert response.get_json()['code'] == 'IDEMPOTENCY_KEY_REUSED'
+            
+            headers = {'Idempotency-Key': 'stream-retry-1'}
+            first = client.post('/api/v1/chat/stream', json=body, headers=headers)
+            second = client.post('/api/v1/chat/stream', json=body, headers=headers)
+            assert second.headers['Idempotent-Replayed'] == 'true'
+            assert _parse_sse(second.get_data(as_text=True)) == _parse_sse(first.get_data(as_text=True))
+            
+            response = client.post('/api/v1/chat', json=body, headers={'Idempotency-Key': ' '})
+            assert response.status_code == 400
+        
+        assert process.send_message.call_count == 2
+        session = client.get(f'/api/v1/sessions/{session_id}').get_json()
+        assert session['message_count'] == 4
+        stats = client.get('/health').get_json()['idempotency']
+        assert stats['suppressed'] >= 2
+    
+    def test_idempotency_key_wait_timeout(self, client):
+        """测试第一次请求卡住时，相同Idempotency-Key的重试等待超时后返回409和Retry-After"""
+        from qcli_api_service.services.idempotency import idempotency_store, IdempotencyStore
+        
+        key = IdempotencyStore.make_key("ip:127.0.0.1", "/api/v1/chat", "stuck-1")
+        entry, owner = idempotency_store.begin(key, IdempotencyStore.fingerprint(None, "你好"))
+        assert owner
+        try:
+            with patch.object(idempotency_store, 'wait_timeout', 0.05):
+                response = client.post('/api/v1/chat', json={'message': '你好'}, headers={'Idempotency-Key': 'stuck-1'})
+            assert response.status_code == 409
+            assert response.get_json()['code'] == 'IDEMPOTENCY_KEY_IN_PROGRESS'
+            assert int(response.headers['Retry-After']) >= 1
+        finally:
+            idempotency_store.finish(entry, 500, {})
+    
+    def test_one_shot_chat_cached(self, client):
+        """测试不带会话ID的相同问题命中回复缓存，不再运行q；继续对话时新进程按保存的消息恢复历史"""
+        from qcli_api_service.services.response_cache import ResponseCache
+        from qcli_api_service.services.session_process_manager import session_process_manager
+        
+        process = Mock()
+        process.send_message.return_value = True
+        process.read_response.side_effect = lambda *args, **kwargs: iter(["S3是对象存储服务\n"])
+        cache = ResponseCache(enabled=True, ttl=60, max_entries=10, max_bytes=0, similarity=0)
+        
+        with patch('qcli_api_service.api.controllers.response_cache', cache), \
+             patch('qcli_api_service.services.session_process_manager.session_process_manager.get_or_create_process',
+                   return_value=process):
+            first = client.post('/api/v1/chat', json={'message': '什么是S3？'})
+            second = client.post('/api/v1/chat', json={'message': ' 什么是s3？ '})
+            
+            assert first.status_code == second.status_code == 200
+            assert 'cached' not in first.get_json()
+            data = second.get_json()
+            assert data['cached'] is True
+            assert data['response'] == first.get_json()['response'] == "S3是对象存储服务"
+            assert data['session_id'] != first.get_json()['session_id']
+            assert process.send_message.call_count == 1
+            
+            # 命中缓存的会话保存了这一问一答，指定会话的对话不经过缓存
+            assert client.get(f"/api/v1/sessions/{data['session_id']}").get_json()['message_count'] == 2
+            assert data['session_id'] in session_process_manager.restore_sessions
+            response = client.post('/api/v1/chat', json={'message': '什么是S3？', 'session_id': data['session_id']})
+            assert response.status_code == 200 and 'cached' not in response.get_json()
+            assert process.send_message.call_count == 2
+        
+        stats = cache.get_stats()
+        assert stats['hits'] == 1 and stats['misses'] == 1
+        for body in (first.get_json(), data):
+            client.delete(f"/api/v1/sessions/{body['session_id']}")
+        assert data['session_id'] not in session_process_manager.restore_sessions
+    
+    def test_near_duplicate_chat_cached(self, client):
+        """测试只差标点或开头说法的一次性问题命中已缓存问题的回复，不相似的问题照常运行q"""
+        from qcli_api_service.services.response_cache import ResponseCache
+        
+        process = Mock()
+        process.send_message.return_value = True
+        process.read_response.side_effect = lambda *args, **kwargs: iter(["回复\n"])
+        cache = ResponseCache(enabled=True, ttl=60, max_entries=10, max_bytes=0, similarity=0.8)
+        
+        with patch('qcli_api_service.api.controllers.response_cache', cache), \
+             patch('qcli_api_service.services.session_process_manager.session_process_manager.get_or_create_process',
+                   return_value=process):
+            bodies = [
+                client.post('/api/v1/chat', json={'message': message}).get_json()
+                for message in ('请问如何创建S3存储桶？', '你好，请问如何创建S3存储桶', '如何删除EC2实例？')
+            ]
+        
+        assert [body.get('cached', False) for body in bodies] == [False, True, False]
+        assert bodies[1]['response'] == bodies[0]['response']
+        assert process.send_message.call_count == 2
+        stats = cache.get_stats()
+        assert stats['near_hits'] == 1 and stats['misses'] == 2
+        for body in bodies:
+            client.delete(f"/api/v1/sessions/{body['session_id']}")
+    
+    def test_rate_limited(self, client):
+        """测试超出限额返回429，受限接口带RateLimit-*头，其他接口不受影响"""
+        from qcli_api_service.services.rate_limiter import RateLimiter, MemoryBackend, parse_rules
+        
+        limiter = RateLimiter(enabled=True, rules=parse_rules("POST /api/v1/sessions=1/60"), backend=MemoryBackend())
+        with patch('qcli_api_service.app.rate_limiter', limiter):
+            response = client.post('/api/v1/sessions')
+            assert response.status_code == 201
+            assert response.headers['RateLimit-Limit'] == '1'
+            assert response.headers['RateLimit-Remaining'] == '0'
+            
+            response = client.post('/api/v1/sessions')
+            assert response.status_code == 429
+            assert response.get_json()['code'] == 'RATE_LIMIT_EXCEEDED'
+            assert int(response.headers['Retry-After']) >= 1
+            assert response.headers['RateLimit-Policy'] == '1;w=60'
+            
+            # 直接连接时伪造的X-Forwarded-For无效；对端是可信代理时按其中的客户端IP各自计数
+            response = client.post('/api/v1/sessions', headers={'X-Forwarded-For': '10.0.0.2'})
+            assert response.status_code == 429
+            with patch.object(config, 'TRUSTED_PROXIES', '127.0.0.1'):
+                response = client.post('/api/v1/sessions', headers={'X-Forwarded-For': '10.0.0.2'})
+            assert response.status_code == 201
+            
+            # 未配置规则的接口不带限流头
+            response = client.get('/health')
+            assert 'RateLimit-Limit' not in response.headers
+    
     def test_404_error(self, client):
         """测试404错误处理"""
         response = client.get('/nonexistent-endpoint')
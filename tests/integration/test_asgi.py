@@ -0,0 +1,235 @@
+"""
+ASGI服务模式集成测试
+
+直接调用ASGI应用（模拟receive/send），聊天接口使用模拟的q命令脚本。
+"""
+
+import asyncio
+import json
+import pytest
+from qcli_api_service.asgi import ASGIApp
+from qcli_api_service.services.async_session_process import async_process_manager
+from qcli_api_service.services.session_manager import session_manager
+from tests.integration.test_api import _parse_sse
+from tests.unit.test_session_process_manager import fake_q
+
+
+async def _request(app, method: str, path: str, body: dict = None, headers=None):
+    """发送一个请求，返回 (状态码, 响应头, 响应体)"""
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "path": path,
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json")] + [
+            (name.encode(), value.encode()) for name, value in (headers or {}).items()
+        ],
+    }
+    requests = [{"type": "http.request", "body": payload, "more_body": False}]
+    finished = asyncio.Event()
+    response = {"body": b""}
+
+    async def receive():
+        if requests:
+            return requests.pop(0)
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode(): v.decode() for k, v in message["headers"]}
+        else:
+            response["body"] += message.get("body", b"")
+            if not message.get("more_body"):
+                finished.set()
+
+    await asyncio.wait_for(app(scope, receive, send), 10)
+    return response["status"], response["headers"], response["body"].decode("utf-8")
+
+
+@pytest.fixture
+def asgi_app(fake_q):
+    app = ASGIApp(wsgi_threads=2)
+    yield app
+    app._executor.shutdown(wait=False)
+
+
+class TestASGIApp:
+    """ASGI应用测试"""
+
+    def test_stream_chat_and_resume(self, asgi_app):
+        """测试流式聊天由asyncio进程回复，并可用Last-Event-ID恢复"""
+        async def scenario():
+            async_process_manager.bind_loop()
+            status, headers, body = await _request(
+                asgi_app, "POST", "/api/v1/chat/stream", {"message": "你好"}
+            )
+            assert status == 200
+            assert headers["content-type"].startswith("text/event-stream")
+
+            events = _parse_sse(body)
+            session_id = events[0][1]["session_id"]
+            chunks = "".join(data["message"] for _, data in events if data.get("type") == "chunk")
+            assert "你好" in chunks
+            assert events[-1][1]["type"] == "done"
+
+            # 从第一个回复事件之后恢复，只收到剩余事件
+            first_id = events[1][0]
+            status, _, body = await _request(
+                asgi_app, "GET", f"/api/v1/sessions/{session_id}/stream",
+                headers={"Last-Event-ID": str(first_id)}
+            )
+            assert status == 200
+            assert [event_id for event_id, _ in _parse_sse(body)] == [
+                event_id for event_id, _ in events[2:]
+            ]
+            await async_process_manager.shutdown_all_async(timeout=2)
+            session_manager.delete_session(session_id)
+
+        asyncio.run(scenario())
+
+    def test_chat(self, asgi_app):
+        """测试标准聊天接口"""
+        async def scenario():
+            async_process_manager.bind_loop()
+            status, _, body = await _request(asgi_app, "POST", "/api/v1/chat", {"message": "第一条"})
+            data = json.loads(body)
+            assert status == 200
+            assert "第一条" in data["response"]
+            await async_process_manager.shutdown_all_async(timeout=2)
+            session_manager.delete_session(data["session_id"])
+
+        asyncio.run(scenario())
+
+    def test_cached_one_shot_chat(self, asgi_app):
+        """测试同时到达的相同一次性问题只运行一轮q，其余请求得到缓存的回复"""
+        from unittest.mock import patch
+        from qcli_api_service.services.response_cache import ResponseCache
+
+        cache = ResponseCache(enabled=True, ttl=60, max_entries=10, max_bytes=0, similarity=0)
+
+        async def scenario():
+            async_process_manager.bind_loop()
+            results = await asyncio.gather(*[
+                _request(asgi_app, "POST", "/api/v1/chat", {"message": "只算一次"}) for _ in range(3)
+            ])
+            bodies = [json.loads(body) for _, _, body in results]
+            assert [status for status, _, _ in results] == [200] * 3
+            assert len({body["response"] for body in bodies}) == 1
+            assert sum(1 for body in bodies if body.get("cached")) == 2
+            assert async_process_manager.get_active_process_count() == 1
+            await async_process_manager.shutdown_all_async(timeout=2)
+            for body in bodies:
+                session_manager.delete_session(body["session_id"])
+
+        with patch('qcli_api_service.asgi.response_cache', cache):
+            asyncio.run(scenario())
+        assert cache.get_stats()['coalesced'] == 2
+
+    def test_idempotent_chat(self, asgi_app):
+        """测试同时到达的相同Idempotency-Key请求只执行一次，重复请求得到同一个回复"""
+        async def scenario():
+            async_process_manager.bind_loop()
+            headers = {"Idempotency-Key": "asgi-retry-1"}
+            results = await asyncio.gather(*[
+                _request(asgi_app, "POST", "/api/v1/chat", {"message": "只执行一次"}, headers) for _ in range(3)
+            ])
+            bodies = [json.loads(body) for _, _, body in results]
+            assert [status for status, _, _ in results] == [200] * 3
+            assert bodies[1] == bodies[0] and bodies[2] == bodies[0]
+            assert sum(1 for _, response_headers, _ in results if response_headers.get("idempotent-replayed")) == 2
+            assert len(session_manager.get_session(bodies[0]["session_id"]).messages) == 2
+            await async_process_manager.shutdown_all_async(timeout=2)
+            session_manager.delete_session(bodies[0]["session_id"])
+
+        asyncio.run(scenario())
+
+    def test_idempotent_wait_timeout(self, asgi_app):
+        """测试第一次请求卡住时重复请求不会一直等待，超时返回409和Retry-After"""
+        from unittest.mock import patch
+        from qcli_api_service.services.idempotency import idempotency_store, IdempotencyStore
+
+        key = IdempotencyStore.make_key("ip:unknown", "/api/v1/chat/stream", "asgi-stuck-1")
+        entry, _ = idempotency_store.begin(key, IdempotencyStore.fingerprint(None, "你好"))
+
+        async def scenario():
+            status, headers, body = await _request(
+                asgi_app, "POST", "/api/v1/chat/stream", {"message": "你好"}, {"Idempotency-Key": "asgi-stuck-1"}
+            )
+            assert status == 409
+            assert json.loads(body)["code"] == "IDEMPOTENCY_KEY_IN_PROGRESS"
+            assert int(headers["retry-after"]) >= 1
+
+        try:
+            with patch.object(idempotency_store, 'wait_timeout', 0.05):
+                asyncio.run(scenario())
+        finally:
+            idempotency_store.finish(entry, 500, {})
+
+    def test_errors_and_delegated_routes(self, asgi_app):
+        """测试请求错误返回统一错误格式，其他接口交给Flask处理"""
+        async def scenario():
+            status, _, body = await _request(asgi_app, "POST", "/api/v1/chat", {"message": ""})
+            assert status == 400
+            assert "error" in json.loads(body)
+
+            status, _, _ = await _request(asgi_app, "GET", "/api/v1/sessions/missing/stream")
+            assert status == 404
+
+            status, _, body = await _request(asgi_app, "POST", "/api/v1/sessions")
+            assert status == 201
+            session_id = json.loads(body)["session_id"]
+            status, _, body = await _request(asgi_app, "GET", f"/api/v1/sessions/{session_id}")
+            assert status == 200
+            assert json.loads(body)["session_id"] == session_id
+            status, _, _ = await _request(asgi_app, "DELETE", f"/api/v1/sessions/{session_id}")
+            assert status == 200
+
+        asyncio.run(scenario())
+
+    def test_rate_limited(self, asgi_app):
+        """测试事件循环处理的接口同样限流，429响应带Retry-After和RateLimit-*头"""
+        from unittest.mock import patch
+        from qcli_api_service.services.rate_limiter import RateLimiter, MemoryBackend, parse_rules
+
+        limiter = RateLimiter(enabled=True, rules=parse_rules("POST /api/v1/chat=1/60"), backend=MemoryBackend())
+
+        async def scenario():
+            status, headers, _ = await _request(asgi_app, "POST", "/api/v1/chat", {"message": ""})
+            assert status == 400
+            assert headers["ratelimit-remaining"] == "0"
+
+            status, headers, body = await _request(asgi_app, "POST", "/api/v1/chat", {"message": "你好"})
+            assert status == 429
+            assert json.loads(body)["code"] == "RATE_LIMIT_EXCEEDED"
+            assert int(headers["retry-after"]) >= 1
+            assert headers["ratelimit-limit"] == "1"
+
+        with patch('qcli_api_service.asgi.rate_limiter', limiter):
+            asyncio.run(scenario())
+
+    def test_lifespan_shutdown(self, asgi_app):
+        """测试应用关闭时与Flask模式一样关闭后台服务，之后不再创建Q CLI进程"""
+        from unittest.mock import patch
+
+        async def scenario():
+            messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+            sent = []
+
+            async def receive():
+                return messages.pop(0)
+
+            async def send(message):
+                sent.append(message["type"])
+
+            await asyncio.wait_for(asgi_app({"type": "lifespan"}, receive, send), 10)
+            assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+            with pytest.raises(RuntimeError, match="服务正在关闭"):
+                await async_process_manager.get_or_create_process_async("s1")
+
+        with patch('qcli_api_service.asgi.shutdown_services') as shutdown_services:
+            asyncio.run(scenario())
+        shutdown_services.assert_called_once()
@@ -0,0 +1,148 @@
+"""
+全局准入控制单元测试
+"""
+
+import asyncio
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from qcli_api_service.services.admission_control import (
+    AdmissionController, AdmissionRejectedError, derive_concurrency_limit,
+    REJECT_CLIENT_QUEUE_FULL, REJECT_QUEUE_FULL, REJECT_DEADLINE
+)
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    assert predicate()
+
+
+class TestAdmissionController:
+    """准入控制测试"""
+
+    def test_limit(self):
+        """测试不超过并发上限，归还名额后放行等待的请求"""
+        controller = AdmissionController(max_concurrent=2, max_queue=10, max_per_client=10, queue_timeout=5)
+        first = controller.acquire("a")
+        second = controller.acquire("b")
+        assert controller.get_stats()['active'] == 2
+
+        granted = []
+        waiter = threading.Thread(target=lambda: granted.append(controller.acquire("c")))
+        waiter.start()
+        _wait_until(lambda: controller.get_stats()['waiting'] == 1)
+        assert not granted
+
+        controller.release(first)
+        waiter.join(5)
+        assert granted and granted[0].queue_wait > 0
+        controller.release(first)  # 重复归还无效
+        assert controller.get_stats()['active'] == 2
+        controller.release(second)
+        controller.release(granted[0])
+        assert controller.get_stats()['active'] == 0
+
+    def _grant_order(self, controller, requests):
+        """占满唯一名额后按顺序加入等待，再逐个归还，返回放行顺序"""
+        holder = controller.acquire("holder")
+        order = []
+        threads = []
+        for client_id, priority in requests:
+            def run(client_id=client_id, priority=priority):
+                slot = controller.acquire(client_id, priority)
+                order.append(client_id)
+                controller.release(slot)
+            thread = threading.Thread(target=run)
+            thread.start()
+            threads.append(thread)
+            _wait_until(lambda count=len(threads): controller.get_stats()['waiting'] == count)
+        controller.release(holder)
+        for thread in threads:
+            thread.join(5)
+        return order
+
+    def test_fair_between_clients(self):
+        """测试同一优先级内按客户端轮流放行，突发的客户端不会挤占其他客户端"""
+        controller = AdmissionController(max_concurrent=1, max_queue=10, max_per_client=10, queue_timeout=5)
+        order = self._grant_order(controller, [("burst", "normal")] * 3 + [("other", "normal")])
+        assert order == ["burst", "other", "burst", "burst"]
+
+    def test_priority(self):
+        """测试高优先级先于低优先级放行"""
+        controller = AdmissionController(max_concurrent=1, max_queue=10, max_per_client=10, queue_timeout=5)
+        order = self._grant_order(controller, [("low", "low"), ("normal", "normal"), ("high", "high")])
+        assert order == ["high", "normal", "low"]
+        assert controller.get_stats()['wait_histogram_ms']['+Inf'] == 0
+
+    def test_rejections(self):
+        """测试单个客户端排队过多返回429，全局排队已满和等待超时返回503"""
+        controller = AdmissionController(max_concurrent=1, max_queue=2, max_per_client=1, queue_timeout=0.1)
+        holder = controller.acquire("holder")
+
+        with pytest.raises(AdmissionRejectedError) as exc_info:
+            controller.acquire("a")
+        assert exc_info.value.reason == REJECT_DEADLINE
+        assert exc_info.value.http_status == 503
+        assert exc_info.value.retry_after >= 1
+
+        controller.queue_timeout = 5
+        threads = [threading.Thread(target=lambda c=c: controller.release(controller.acquire(c))) for c in "ab"]
+        for thread in threads:
+            thread.start()
+        _wait_until(lambda: controller.get_stats()['waiting'] == 2)
+
+        with pytest.raises(AdmissionRejectedError) as exc_info:
+            controller.acquire("a")
+        assert exc_info.value.reason == REJECT_CLIENT_QUEUE_FULL
+        assert exc_info.value.http_status == 429
+        with pytest.raises(AdmissionRejectedError) as exc_info:
+            controller.acquire("c")
+        assert exc_info.value.reason == REJECT_QUEUE_FULL
+
+        controller.release(holder)
+        for thread in threads:
+            thread.join(5)
+        stats = controller.get_stats()
+        assert stats['rejected'] == {REJECT_CLIENT_QUEUE_FULL: 1, REJECT_QUEUE_FULL: 1, REJECT_DEADLINE: 1}
+        assert stats['active'] == 0 and stats['waiting'] == 0
+        assert sum(stats['queue_depth_histogram'].values()) == 6
+
+    def test_acquire_async(self):
+        """测试asyncio等待不占用线程，取消等待时退出排队"""
+        controller = AdmissionController(max_concurrent=1, max_queue=10, max_per_client=10, queue_timeout=5)
+
+        async def scenario():
+            holder = await controller.acquire_async("a")
+            waiter = asyncio.ensure_future(controller.acquire_async("b"))
+            cancelled = asyncio.ensure_future(controller.acquire_async("c"))
+            await asyncio.sleep(0.05)
+            assert controller.get_stats()['waiting'] == 2
+
+            cancelled.cancel()
+            await asyncio.sleep(0.05)
+            assert controller.get_stats()['waiting'] == 1
+
+            controller.release(holder)
+            slot = await asyncio.wait_for(waiter, 5)
+            controller.release(slot)
+
+        asyncio.run(scenario())
+        assert controller.get_stats()['active'] == 0
+
+    def test_derive_limit(self):
+        """测试按CPU和内存计算并发上限"""
+        with patch('qcli_api_service.services.admission_control.available_cpus', return_value=2), \
+                patch('qcli_api_service.services.admission_control.available_memory_mb', return_value=100000), \
+                patch('qcli_api_service.services.admission_control.config.ADMISSION_TURNS_PER_CPU', 4), \
+                patch('qcli_api_service.services.admission_control.config.QCLI_PROCESS_MEMORY_MB', 150):
+            assert derive_concurrency_limit() == 8
+        with patch('qcli_api_service.services.admission_control.available_cpus', return_value=8), \
+                patch('qcli_api_service.services.admission_control.available_memory_mb', return_value=600), \
+                patch('qcli_api_service.services.admission_control.config.QCLI_PROCESS_MEMORY_MB', 150):
+            assert derive_concurrency_limit() == 4
+        with patch('qcli_api_service.services.admission_control.available_cpus', return_value=1), \
+                patch('qcli_api_service.services.admission_control.available_memory_mb', return_value=10):
+            assert derive_concurrency_limit() == 1
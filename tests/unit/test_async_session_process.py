@@ -0,0 +1,136 @@
+"""
+asyncio会话进程单元测试
+
+复用线程版测试的模拟q命令脚本，验证asyncio版本的进程交互结果与线程版一致。
+"""
+
+import asyncio
+import sys
+import pytest
+from qcli_api_service.services.async_session_process import (
+    AsyncSessionProcess, AsyncSessionProcessManager
+)
+from qcli_api_service.services.chunk_coalescer import ChunkCoalescer
+from tests.unit.test_session_process_manager import (
+    fake_q, INTERRUPTIBLE_Q_SCRIPT, TOKEN_STREAM_Q_SCRIPT
+)
+
+
+async def _read_all(process, coalescer=None):
+    return [chunk async for chunk in process.read_response_async(coalescer)]
+
+
+class TestAsyncSessionProcess:
+    """asyncio会话进程测试"""
+
+    def test_multiple_turns(self, fake_q, tmp_path):
+        """测试提示符结束本轮，同一进程连续多轮对话"""
+        async def scenario():
+            process = AsyncSessionProcess("async-session", str(tmp_path))
+            assert await process.start_async()
+            try:
+                assert await process.warm_up_async(timeout=5)
+                assert len(process.response_queue) == 0
+
+                for message in ["第一条", "第二条"]:
+                    assert await process.send_message_async(message)
+                    response = "".join(await _read_all(process))
+                    assert message in response
+                    assert "第二行 中文内容" in response
+                    assert process.turn_completion_reason == "prompt"
+            finally:
+                await process.terminate_async(timeout=2)
+            assert not process.is_alive()
+
+        asyncio.run(scenario())
+
+    def test_read_response_coalesces_chunks(self, fake_q, tmp_path):
+        """测试合并逻辑与线程版相同"""
+        fake_q.write_text(TOKEN_STREAM_Q_SCRIPT.format(python=sys.executable), encoding="utf-8")
+
+        async def scenario():
+            process = AsyncSessionProcess("async-coalesce", str(tmp_path))
+            assert await process.start_async()
+            try:
+                await process.warm_up_async(timeout=5)
+                assert await process.send_message_async("你好")
+                chunks = await _read_all(process, ChunkCoalescer(max_delay_ms=100, max_bytes=4096))
+
+                assert "".join(chunks) == "".join(f"第{i}行\n" for i in range(20)) + "\n"
+                assert len(chunks) <= 5
+            finally:
+                await process.terminate_async(timeout=2)
+
+        asyncio.run(scenario())
+
+    def test_cancel_turn_interrupts_generation(self, fake_q, tmp_path):
+        """测试取消本轮后进程可继续处理下一条消息"""
+        fake_q.write_text(INTERRUPTIBLE_Q_SCRIPT.format(python=sys.executable), encoding="utf-8")
+
+        async def scenario():
+            process = AsyncSessionProcess("async-cancel", str(tmp_path))
+            assert await process.start_async()
+            try:
+                await process.warm_up_async(timeout=5)
+                assert await process.send_message_async("长任务")
+
+                reader = process.read_response_async()
+                assert "仍在生成" in await reader.__anext__()
+                await reader.aclose()
+                assert await process.cancel_turn_async(timeout=2)
+                assert process.turn_completion_reason == "cancelled"
+
+                assert await process.send_message_async("第二条")
+                response = "".join(await _read_all(process))
+                assert "第二条" in response
+                assert "仍在生成" not in response
+            finally:
+                await process.terminate_async(timeout=2)
+
+        asyncio.run(scenario())
+
+
+class TestAsyncSessionProcessManager:
+    """asyncio会话进程管理器测试"""
+
+    def test_concurrent_creation_spawns_once(self, fake_q, tmp_path):
+        """测试同一会话并发创建只启动一个进程，删除会话时在事件循环中终止"""
+        async def scenario():
+            manager = AsyncSessionProcessManager(max_processes=4)
+            manager.bind_loop()
+            processes = await asyncio.gather(*[
+                manager.get_or_create_process_async("s1", str(tmp_path)) for _ in range(5)
+            ])
+            assert len({id(process) for process in processes}) == 1
+            assert manager.get_stats()["active"] == 1
+
+            manager.remove_process("s1")
+            for _ in range(100):
+                if not processes[0].is_alive():
+                    break
+                await asyncio.sleep(0.05)
+            assert not processes[0].is_alive()
+
+            stats = await manager.shutdown_all_async(timeout=2)
+            assert stats["remaining"] == 0
+
+        asyncio.run(scenario())
+
+    def test_shutdown_refuses_new_processes(self, fake_q, tmp_path):
+        """测试关闭时等待正在创建的进程并终止，之后不再创建进程"""
+        async def scenario():
+            manager = AsyncSessionProcessManager(max_processes=4)
+            manager.bind_loop()
+            creating = asyncio.ensure_future(manager.get_or_create_process_async("s1", str(tmp_path)))
+            while not manager._pending:
+                await asyncio.sleep(0)
+
+            stats = await manager.shutdown_all_async(timeout=5)
+            assert stats["pending"] == 1 and stats["pending_remaining"] == 0
+            with pytest.raises(RuntimeError, match="服务正在关闭"):
+                await creating
+            with pytest.raises(RuntimeError, match="服务正在关闭"):
+                await manager.get_or_create_process_async("s2", str(tmp_path))
+            assert manager.get_stats()["active"] == 0
+
+        asyncio.run(scenario())
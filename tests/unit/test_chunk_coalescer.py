@@ -0,0 +1,51 @@
+"""
+流式响应块合并单元测试
+"""
+
+from qcli_api_service.services.chunk_coalescer import ChunkCoalescer
+
+
+class TestChunkCoalescer:
+    """响应块合并测试"""
+
+    def test_first_chunk_immediate(self):
+        """测试第一块立即发出，不增加首字延迟"""
+        coalescer = ChunkCoalescer(max_delay_ms=50, max_bytes=4096)
+        coalescer.add("你", now=100.0)
+
+        assert coalescer.ready(now=100.0)
+        assert coalescer.take() == "你"
+
+    def test_time_budget(self):
+        """测试后续小片段在时间预算内合并"""
+        coalescer = ChunkCoalescer(max_delay_ms=50, max_bytes=4096)
+        coalescer.add("第一块", now=100.0)
+        coalescer.take()
+
+        coalescer.add("好", now=100.01)
+        coalescer.add("的", now=100.03)
+        assert not coalescer.ready(now=100.05)
+        assert coalescer.deadline == 100.06
+        assert coalescer.ready(now=100.06)
+        assert coalescer.take() == "好的"
+        assert coalescer.get_stats() == {"chunks_in": 3, "events_out": 2}
+
+    def test_byte_budget(self):
+        """测试累积达到字节预算时立即发出"""
+        coalescer = ChunkCoalescer(max_delay_ms=50, max_bytes=12)
+        coalescer.add("开始", now=100.0)
+        coalescer.take()
+
+        coalescer.add("中文", now=100.0)  # 6字节
+        assert not coalescer.ready(now=100.0)
+        coalescer.add("内容", now=100.0)
+        assert coalescer.ready(now=100.0)
+
+    def test_disabled(self):
+        """测试时间预算为0时逐块发出"""
+        coalescer = ChunkCoalescer(max_delay_ms=0, max_bytes=4096)
+        coalescer.add("第一块", now=100.0)
+        coalescer.take()
+        coalescer.add("第二块", now=100.0)
+
+        assert coalescer.ready(now=100.0)
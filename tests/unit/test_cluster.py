@@ -0,0 +1,116 @@
+"""
+多worker路由单元测试
+"""
+
+import asyncio
+import json
+import pytest
+from qcli_api_service.cluster import SessionRouter, route_key
+from qcli_api_service.utils.session_routing import generate_session_id
+
+
+async def _fake_worker(index: int, received: list):
+    """模拟worker：返回自己的编号和收到的请求头"""
+    async def handle(reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        received.append((index, head.decode("latin-1")))
+        body = json.dumps({"worker": index}).encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+        await writer.drain()
+        writer.close()
+
+    return await asyncio.start_server(handle, "127.0.0.1", 0)
+
+
+async def _request(port: int, raw: bytes) -> bytes:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(raw)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def _post(path: str, data: dict) -> bytes:
+    body = json.dumps(data).encode()
+    return (f"POST {path} HTTP/1.1\r\nHost: x\r\nConnection: keep-alive\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+
+
+class TestRouteKey:
+    """会话ID提取测试"""
+
+    def test_route_key(self):
+        assert route_key("/api/v1/sessions/abc/stream", b"") == "abc"
+        assert route_key("/api/v1/jobs/job1", b"") == "job1"
+        assert route_key("/api/v1/chat", b'{"session_id": "abc", "message": "hi"}') == "abc"
+        assert route_key("/api/v1/chat", b'{"message": "hi"}') is None
+        assert route_key("/api/v1/chat", b"not json") is None
+        assert route_key("/health", b"") is None
+
+
+class TestSessionRouter:
+    """路由转发测试"""
+
+    def test_idempotency_key_routing(self):
+        """测试不带会话ID的重试按幂等键回到同一个worker，会话ID优先"""
+        router = SessionRouter([1, 2, 3, 4])
+        body = b'{"message": "hi"}'
+        workers = {router.select_worker("/api/v1/chat", body, "retry-key") for _ in range(8)}
+        assert len(workers) == 1
+        session_id = generate_session_id(2, 4)
+        assert router.select_worker("/api/v1/chat", json.dumps({"session_id": session_id}).encode(), "retry-key") == 2
+
+    def test_requests_reach_owner_worker(self):
+        """测试带会话ID的请求转发到拥有该会话的worker，其余请求轮流转发"""
+        async def scenario():
+            received = []
+            servers = [await _fake_worker(index, received) for index in range(3)]
+            ports = [server.sockets[0].getsockname()[1] for server in servers]
+            router = SessionRouter(ports)
+            front = await asyncio.start_server(router.handle, "127.0.0.1", 0)
+            port = front.sockets[0].getsockname()[1]
+
+            for index in range(3):
+                session_id = generate_session_id(index, 3)
+                response = await _request(port, _post("/api/v1/chat", {"session_id": session_id, "message": "hi"}))
+                assert json.loads(response.split(b"\r\n\r\n", 1)[1]) == {"worker": index}
+                response = await _request(port, f"GET /api/v1/sessions/{session_id} HTTP/1.1\r\n\r\n".encode())
+                assert json.loads(response.split(b"\r\n\r\n", 1)[1]) == {"worker": index}
+
+            for _ in range(3):
+                await _request(port, b"GET /health HTTP/1.1\r\n\r\n")
+            assert sorted(index for index, _ in received[-3:]) == [0, 1, 2]
+
+            # 逐跳请求头被替换为 Connection: close
+            head = received[0][1]
+            assert "Connection: close" in head
+            assert "keep-alive" not in head
+            assert "X-Forwarded-For: 127.0.0.1" in head
+            assert router.get_stats()["routed_by_session"] == 6
+
+            front.close()
+            for server in servers:
+                server.close()
+
+        asyncio.run(scenario())
+
+    def test_worker_unavailable(self):
+        """测试worker不可用时返回503和统一错误格式"""
+        async def scenario():
+            probe = await asyncio.start_server(lambda r, w: None, "127.0.0.1", 0)
+            closed_port = probe.sockets[0].getsockname()[1]
+            probe.close()
+            await probe.wait_closed()
+
+            router = SessionRouter([closed_port])
+            front = await asyncio.start_server(router.handle, "127.0.0.1", 0)
+            response = await _request(front.sockets[0].getsockname()[1], b"GET /health HTTP/1.1\r\n\r\n")
+            status_line, body = response.split(b"\r\n", 1)[0], response.split(b"\r\n\r\n", 1)[1]
+
+            assert b" 503 " in status_line
+            assert json.loads(body)["code"] == "WORKER_UNAVAILABLE"
+            assert router.get_stats()["upstream_errors"] == 1
+            front.close()
+
+        asyncio.run(scenario())
@@ -0,0 +1,89 @@
+"""
+回复结束检测单元测试
+"""
+
+import pytest
+from qcli_api_service.services.completion_detector import (
+    CompletionDetector, TurnLatencyStats, REASON_PROMPT, REASON_SENTINEL
+)
+
+
+class TestCompletionDetector:
+    """回复结束检测器测试"""
+
+    def test_prompt_recognition(self):
+        """测试识别Q Chat提示符"""
+        detector = CompletionDetector(sentinel="")
+
+        assert detector.is_prompt(">") is True
+        assert detector.is_prompt("!>") is True
+        assert detector.is_prompt("[default] !>") is True
+        assert detector.is_prompt("> 这是回复内容") is False
+        assert detector.is_prompt("a > b") is False
+
+    def test_prompt_requires_content(self):
+        """测试没有回复内容时提示符不表示结束"""
+        detector = CompletionDetector(sentinel="")
+
+        assert detector.match_pending("!>") is None
+
+        detector.note_content()
+        assert detector.match_pending("!>") == REASON_PROMPT
+        assert detector.match_line(">") == REASON_PROMPT
+
+    def test_reset(self):
+        """测试新一轮对话重置状态"""
+        detector = CompletionDetector(sentinel="")
+        detector.note_content()
+        detector.reset()
+
+        assert detector.match_pending("!>") is None
+
+    def test_strip_echo(self):
+        """测试只丢弃本轮消息的回显，提示符后面的回复内容保留"""
+        detector = CompletionDetector(sentinel="")
+        detector.reset("请用中文回答：你好")
+
+        assert detector.strip_echo("[default] !> 请用中文回答：你好") is None
+        assert detector.strip_echo("!> 回复: 你好") == "回复: 你好"
+        assert detector.strip_echo("普通回复") == "普通回复"
+
+    def test_sentinel(self):
+        """测试结束标记"""
+        detector = CompletionDetector(sentinel="<<END>>")
+
+        assert detector.match_line("<<END>>") == REASON_SENTINEL
+        assert detector.match_line("普通回复") is None
+        assert "<<END>>" in detector.format_message("你好")
+
+    def test_may_complete(self):
+        """测试识别可能继续变成提示符或结束标记的尾部输出"""
+        detector = CompletionDetector(sentinel="<<END>>")
+
+        assert detector.may_complete("!") is True
+        assert detector.may_complete("[default] !") is True
+        assert detector.may_complete("<<E") is True
+        assert detector.may_complete("正在生成") is False
+        assert detector.may_complete("[链接](http") is False
+
+    def test_format_message_without_sentinel(self):
+        """测试未配置结束标记时消息保持不变"""
+        detector = CompletionDetector(sentinel="")
+
+        assert detector.format_message("你好") == "你好"
+
+
+class TestTurnLatencyStats:
+    """完成延迟统计测试"""
+
+    def test_record(self):
+        """测试记录每轮延迟"""
+        stats = TurnLatencyStats()
+        stats.record("s1", "prompt", 100.0, 100.05)
+        stats.record("s1", "idle_timeout", 100.0, 135.0)
+
+        result = stats.get_stats()
+        assert result["turns"] == 2
+        assert result["by_reason"] == {"prompt": 1, "idle_timeout": 1}
+        assert result["max_return_delay_ms"] == pytest.approx(35000.0)
+        assert result["avg_return_delay_ms"] == pytest.approx(17525.0)
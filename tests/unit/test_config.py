@@ -78,4 +78,12 @@ class TestConfig:
         config = Config(QCLI_TIMEOUT=4)
         
         with pytest.raises(ValueError, match="Q CLI超时时间不能少于5秒"):
-            config.validate()
\ No newline at end of file
+            config.validate()
+    
+    def test_validate_invalid_rate_limit(self):
+        """测试限流后端和可信代理验证"""
+        with pytest.raises(ValueError, match="限流后端必须是memory或redis"):
+            Config(RATE_LIMIT_BACKEND="memcached").validate()
+        
+        with pytest.raises(ValueError, match="可信代理地址格式错误"):
+            Config(TRUSTED_PROXIES="10.0.0.0/8, proxy.local").validate()
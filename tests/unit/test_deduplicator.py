@@ -0,0 +1,95 @@
+"""
+输出增量去重单元测试
+"""
+
+from qcli_api_service.utils.deduplicator import StreamDeduplicator, deduplicate_text
+
+
+REPLY = "\n".join([
+    "你好！我是Amazon Q。",
+    "1. 管理和排查AWS资源",
+    "2. 编写和审查代码",
+    "3. 解释架构设计",
+])
+
+
+class TestStreamDeduplicator:
+    """增量去重测试"""
+
+    def test_repeated_block_removed(self):
+        """测试整段重复的回复只保留一次"""
+        text = REPLY + "\n\n" + REPLY + "\n后续内容"
+
+        assert deduplicate_text(text, window=3) == REPLY + "\n\n后续内容"
+
+    def test_streaming_matches_full_text(self):
+        """测试逐行输入与整段去重结果一致"""
+        text = REPLY + "\n" + REPLY + "\n" + REPLY
+        deduplicator = StreamDeduplicator(window=3)
+        released = []
+        for line in text.split("\n"):
+            released.extend(deduplicator.feed(line))
+        released.extend(deduplicator.flush())
+
+        assert "\n".join(released) == deduplicate_text(text, window=3) == REPLY
+        assert deduplicator.get_stats() == {"lines_in": 12, "lines_out": 4, "suppressed": 8}
+
+    def test_new_lines_released_immediately(self):
+        """测试未出现过的行立即放行，只有可能开始重复块的行才暂缓"""
+        deduplicator = StreamDeduplicator(window=3)
+
+        assert deduplicator.feed("第一行内容") == ["第一行内容"]
+        assert deduplicator.feed("第二行内容") == ["第二行内容"]
+        assert deduplicator.feed("第一行内容") == []
+        assert deduplicator.holding
+        assert deduplicator.feed("不同的内容") == ["第一行内容", "不同的内容"]
+        assert not deduplicator.holding
+
+    def test_short_repeats_kept(self):
+        """测试代码块标记等短行的重复不被删除"""
+        text = "```\nx = 1\n```\n说明\n```\nx = 1\n```"
+
+        assert deduplicate_text(text, window=3) == text
+
+    def test_repeated_single_lines_kept(self):
+        """测试不构成重复块的单行重复保留（例如代码中的相同语句）"""
+        text = "for item in items:\n    print(item)\nfor key in keys:\n    print(item)"
+
+        assert deduplicate_text(text, window=3) == text
+
+    def test_hash_collision_verified(self, monkeypatch):
+        """测试滚动哈希冲突时逐行比较确认，不会误删内容"""
+        monkeypatch.setattr(StreamDeduplicator, "_hash_line", staticmethod(lambda text: 1))
+        text = "第一行较长的内容\n第二行较长的内容\n第三行较长的内容\n完全不同的甲\n完全不同的乙\n完全不同的丙"
+
+        assert deduplicate_text(text, window=3) == text
+
+    def test_help_and_service_lines(self):
+        """测试重复的帮助提示和同义的能力列表项只保留第一次"""
+        text = "\n".join([
+            "有什么我可以帮助您的吗？",
+            "• 管理和查询 AWS 资源",
+            "• AWS 服务管理和配置",
+            "• 代码编写和调试",
+            "请问有什么我可以帮助你的？",
+        ])
+
+        assert deduplicate_text(text, window=3) == "\n".join([
+            "有什么我可以帮助您的吗？",
+            "• 管理和查询 AWS 资源",
+            "• 代码编写和调试",
+        ])
+
+    def test_commit_bypasses_check(self):
+        """测试已部分发出的行直接放行"""
+        deduplicator = StreamDeduplicator(window=3)
+        deduplicator.feed("第一行内容")
+
+        assert deduplicator.commit("第一行内容") == ["第一行内容"]
+        assert not deduplicator.holding
+
+    def test_disabled(self):
+        """测试窗口为0时不去重"""
+        text = REPLY + "\n" + REPLY
+
+        assert deduplicate_text(text, window=0) == text
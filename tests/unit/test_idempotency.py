@@ -0,0 +1,109 @@
+"""
+聊天请求幂等键单元测试
+"""
+
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from qcli_api_service.services.idempotency import IdempotencyStore, IdempotencyKeyMismatchError
+from qcli_api_service.services.stream_replay import TurnStream
+
+
+class TestIdempotencyStore:
+    """幂等键存储测试"""
+
+    def test_replay_completed(self):
+        """测试相同的键直接得到第一次请求的结果"""
+        store = IdempotencyStore(ttl=60, max_entries=10)
+        fingerprint = IdempotencyStore.fingerprint("s1", "你好")
+        entry, owner = store.begin("k", fingerprint)
+        assert owner
+        store.finish(entry, 200, {"response": "回复"})
+
+        again, owner = store.begin("k", fingerprint)
+        assert again is entry and not owner
+        assert again.done.is_set() and again.body == {"response": "回复"}
+
+        stats = store.get_stats()
+        assert stats['started'] == 1 and stats['replayed'] == 1 and stats['suppressed'] == 1
+
+    def test_attach_in_flight(self):
+        """测试执行中收到的重复请求等待同一个结果"""
+        store = IdempotencyStore(ttl=60, max_entries=10)
+        entry, _ = store.begin("k", "f")
+        results = []
+
+        def duplicate():
+            waiting, owner = store.begin("k", "f")
+            assert not owner
+            waiting.done.wait(5)
+            results.append(waiting.body)
+
+        threads = [threading.Thread(target=duplicate) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while store.get_stats()['attached'] < 3:
+            time.sleep(0.01)
+        assert store.get_stats()['in_flight'] == 1
+
+        notified = []
+        entry.add_listener(lambda: notified.append(1))
+        store.finish(entry, 200, {"response": "回复"})
+        for thread in threads:
+            thread.join(5)
+        assert results == [{"response": "回复"}] * 3
+        assert notified == [1]
+        entry.add_listener(lambda: notified.append(2))  # 已有结果时立即调用
+        assert notified == [1, 2]
+
+    def test_wait_timeout(self):
+        """测试第一次请求卡住时重复请求的等待有上限"""
+        store = IdempotencyStore(ttl=60, max_entries=10, wait_timeout=0.05)
+        entry, _ = store.begin("k", "f")
+        start = time.time()
+        assert not store.wait(store.begin("k", "f")[0])
+        assert time.time() - start < 1
+        assert store.get_stats()['wait_timeouts'] == 1
+
+        store.finish(entry, 200, {})
+        assert store.wait(entry)
+
+    def test_mismatched_fingerprint(self):
+        """测试同一个键用于不同的消息时报错"""
+        store = IdempotencyStore(ttl=60, max_entries=10)
+        store.begin("k", IdempotencyStore.fingerprint(None, "你好"))
+        with pytest.raises(IdempotencyKeyMismatchError):
+            store.begin("k", IdempotencyStore.fingerprint(None, "再见"))
+        assert store.get_stats()['mismatched'] == 1
+
+    def test_failures_not_kept(self):
+        """测试失败的结果不保留，流式回复以错误结束后同一个键可以重新执行"""
+        store = IdempotencyStore(ttl=60, max_entries=10)
+        entry, _ = store.begin("k", "f")
+        store.finish(entry, 503, {"code": "SERVICE_OVERLOADED"})
+        assert entry.status == 503
+        assert store.begin("k", "f")[1]
+
+        stream = TurnStream("s1", 1, 10)
+        entry, _ = store.begin("stream", "f")
+        store.finish(entry, 200, stream=stream)
+        assert not store.begin("stream", "f")[1]  # 回复进行中：订阅同一轮
+        stream.append({'type': 'error', 'code': 'TURN_CANCELLED'})
+        stream.finish()
+        assert store.begin("stream", "f")[1]
+
+    def test_ttl_and_eviction(self):
+        """测试过期和超出上限的已完成条目被删除，执行中的条目不淘汰"""
+        store = IdempotencyStore(ttl=60, max_entries=2)
+        in_flight, _ = store.begin("a", "f")
+        for key in ("b", "c"):
+            store.finish(store.begin(key, "f")[0], 200, {})
+        assert store.get_stats()['entries'] == 2
+        assert store.get_stats()['evictions'] == 1
+        assert not store.begin("a", "f")[1]
+
+        store.finish(in_flight, 200, {})
+        with patch('qcli_api_service.services.idempotency.time.time', return_value=time.time() + 61):
+            assert store.cleanup_expired() == 2
+            assert store.begin("c", "f")[1]
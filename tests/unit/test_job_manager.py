@@ -0,0 +1,113 @@
+"""
+异步任务管理器单元测试
+"""
+
+import threading
+import time
+import pytest
+from qcli_api_service.services.job_manager import (
+    JobManager, JobQueueFullError, JOB_COMPLETED, JOB_FAILED, JOB_RUNNING
+)
+
+
+def _reply(*chunks):
+    """生成写入回复片段和done事件的任务函数"""
+    def runner(job):
+        for chunk in chunks:
+            job.append({'message': chunk, 'type': 'chunk'})
+        job.append({'type': 'done', 'timing': {'queue_wait_ms': 0.0, 'generation_ms': 1.0}})
+    return runner
+
+
+class TestJobManager:
+    """任务管理器测试"""
+
+    def test_job_completes(self):
+        """测试任务执行完成后返回拼接的回复"""
+        manager = JobManager(workers=2, max_pending=10, result_ttl=60)
+        job = manager.submit("s1", _reply("第一块\n", "第二块\n"))
+
+        assert job.wait(5)
+        data = job.to_dict()
+        assert data['status'] == JOB_COMPLETED
+        assert data['response'] == "第一块\n第二块"
+        assert data['timing']['generation_ms'] == 1.0
+        assert data['finished_at'] >= data['started_at'] >= data['created_at']
+        assert manager.get(job.job_id) is job
+        assert manager.get_stats()['completed'] == 1
+        manager.shutdown()
+
+    def test_job_failure(self):
+        """测试error事件和异常都使任务失败"""
+        manager = JobManager(workers=1, max_pending=10, result_ttl=60)
+
+        def error_runner(job):
+            job.append({'error': "处理失败", 'code': "CHAT_ERROR", 'suggestions': ["重试"], 'type': 'error'})
+
+        def raising_runner(job):
+            raise RuntimeError("boom")
+
+        errored = manager.submit("s1", error_runner)
+        raised = manager.submit("s1", raising_runner)
+        assert errored.wait(5) and raised.wait(5)
+
+        assert errored.to_dict()['status'] == JOB_FAILED
+        assert errored.to_dict()['error']['code'] == "CHAT_ERROR"
+        assert raised.to_dict()['error']['code'] == "JOB_FAILED"
+        assert manager.get_stats()['failed'] == 2
+        manager.shutdown()
+
+    def test_queue_full(self):
+        """测试等待执行的任务达到上限时拒绝提交"""
+        manager = JobManager(workers=1, max_pending=1, result_ttl=60)
+        release = threading.Event()
+        running = manager.submit("s1", lambda job: release.wait(5))
+
+        deadline = time.time() + 5
+        while running.status != JOB_RUNNING and time.time() < deadline:
+            time.sleep(0.01)
+        queued = manager.submit("s1", _reply("排队"))
+
+        with pytest.raises(JobQueueFullError) as exc_info:
+            manager.submit("s1", _reply("拒绝"))
+        assert exc_info.value.retry_after >= 1
+        assert manager.get_stats()['rejected'] == 1
+
+        release.set()
+        assert queued.wait(5)
+        manager.shutdown()
+
+    def test_events_can_be_replayed(self):
+        """测试任务事件可以从任意事件ID之后读取"""
+        manager = JobManager(workers=1, max_pending=10, result_ttl=60)
+        job = manager.submit("s1", _reply("a", "b"))
+        assert job.wait(5)
+
+        events, finished = job.read(1, timeout=0)
+        assert [event['type'] for _, event in events] == ['chunk', 'done']
+        assert not finished
+        assert job.read(3, timeout=0) == ([], True)
+        manager.shutdown()
+
+    def test_cleanup_expired_and_remove_session(self):
+        """测试过期任务清理，以及删除会话时只丢弃已结束的任务"""
+        manager = JobManager(workers=1, max_pending=10, result_ttl=60)
+        old = manager.submit("s1", _reply("旧"))
+        other = manager.submit("s2", _reply("其他"))
+        assert old.wait(5) and other.wait(5)
+
+        old.finished_at -= 120
+        assert manager.cleanup_expired() == 1
+        assert manager.get(old.job_id) is None
+        assert manager.get(other.job_id) is other
+
+        release = threading.Event()
+        running = manager.submit("s2", lambda job: release.wait(5))
+        manager.remove_session("s2")
+        assert manager.get(other.job_id) is None
+        assert manager.get(running.job_id) is running
+
+        release.set()
+        assert running.wait(5)
+        assert manager.get_stats()['expired'] == 1
+        manager.shutdown()
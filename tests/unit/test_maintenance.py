@@ -0,0 +1,41 @@
+"""
+后台维护调度器单元测试
+"""
+
+from unittest.mock import patch
+from qcli_api_service.services.maintenance import MaintenanceScheduler
+
+
+class TestMaintenanceScheduler:
+    """维护调度器测试"""
+
+    def test_next_delay_within_jitter(self):
+        """测试下一次执行间隔在抖动范围内"""
+        scheduler = MaintenanceScheduler(interval=60, jitter=0.1)
+
+        for _ in range(100):
+            assert 54 <= scheduler.next_delay() <= 66
+
+    def test_disabled_scheduler(self):
+        """测试间隔为0时不启动"""
+        scheduler = MaintenanceScheduler(interval=0, jitter=0.1)
+        scheduler.start()
+
+        assert scheduler.get_stats()["running"] is False
+
+    @patch('qcli_api_service.services.session_process_manager.session_process_manager.cleanup_expired_processes')
+    @patch('qcli_api_service.services.session_manager.session_manager.cleanup_expired_sessions')
+    def test_run_once(self, mock_sessions, mock_processes):
+        """测试执行一次维护任务"""
+        mock_sessions.return_value = 2
+        mock_processes.return_value = 1
+        scheduler = MaintenanceScheduler(interval=60, jitter=0.1)
+
+        result = scheduler.run_once()
+
+        assert result["sessions"] == 2
+        assert result["processes"] == 1
+        stats = scheduler.get_stats()
+        assert stats["runs"] == 1
+        assert stats["sessions_cleaned"] == 2
+        assert stats["processes_cleaned"] == 1
@@ -0,0 +1,69 @@
+"""
+输出行过滤单元测试
+"""
+
+from qcli_api_service.utils.output_filter import (
+    clean_line, should_skip_line, is_prompt_echo, filter_line, filter_lines
+)
+
+
+class TestOutputFilter:
+    """输出行过滤测试"""
+
+    def test_clean_line(self):
+        """测试去除ANSI颜色代码和首尾空白"""
+        assert clean_line("\x1b[32m这是绿色文本\x1b[0m") == "这是绿色文本"
+        assert clean_line("  \t 文本内容  \n  ") == "文本内容"
+
+    def test_should_skip_line(self):
+        """测试横幅、提示信息和边框被跳过"""
+        skip_lines = [
+            "包含/quit的行",
+            "q chat 开始",
+            "Welcome to Q CLI",
+            "Did you know?",
+            "Get notified whenever Q CLI finishes",
+            "🤖 You are chatting with claude-sonnet-4",
+            "Thinking...",
+            "━━━━━━━━",
+            "╭─── Did you know? ───╮",
+            "│ 边框内容 │",
+            "╰────╯",
+        ]
+        for line in skip_lines:
+            assert should_skip_line(line) is True
+
+        keep_lines = [
+            "这是正常的回复",
+            "使用 q chat 启动对话",  # q chat 只在行首时跳过
+            "1. 使用 Elastic Beanstalk 部署",
+        ]
+        for line in keep_lines:
+            assert should_skip_line(line) is False
+
+    def test_is_prompt_echo(self):
+        """测试提示符后的用户输入回显"""
+        assert is_prompt_echo(">") is True
+        assert is_prompt_echo("> 请用中文回答以下问题：你好") is True
+        assert is_prompt_echo("> 以下是我们之前的对话历史") is True
+        assert is_prompt_echo("> 你好！有什么可以帮您？") is False
+
+    def test_filter_line(self):
+        """测试单次清理并过滤"""
+        assert filter_line("\x1b[32m> \x1b[0m请用中文回答以下问题：你好") is None
+        assert filter_line("\x1b[32m> \x1b[0m你好！") == "> 你好！"
+        assert filter_line("\x1b[38;5;8mThinking...\x1b[0m") is None
+        assert filter_line("   ") is None
+        assert filter_line("\x1b[1m回复内容\x1b[0m\n") == "回复内容"
+
+    def test_filter_lines(self):
+        """测试逐行过滤只保留回复内容"""
+        output = [
+            "Welcome to Q CLI",
+            "> 请用中文回答以下问题：你好",
+            "你好！",
+            "",
+            "有什么可以帮您？",
+            "/quit",
+        ]
+        assert list(filter_lines(output)) == ["你好！", "有什么可以帮您？"]
@@ -0,0 +1,51 @@
+"""
+进程输出多路复用器单元测试
+"""
+
+import os
+import threading
+from qcli_api_service.services.output_multiplexer import OutputMultiplexer
+
+
+class TestOutputMultiplexer:
+    """输出多路复用器测试"""
+
+    def setup_method(self):
+        """每个测试方法前的设置"""
+        self.mux = OutputMultiplexer()
+
+    def test_dispatch_data_and_eof(self):
+        """测试数据分发和EOF回调"""
+        read_fd, write_fd = os.pipe()
+        chunks = []
+        closed = threading.Event()
+
+        self.mux.register(read_fd, chunks.append, closed.set)
+        os.write(write_fd, "第一块\n".encode("utf-8"))
+        os.close(write_fd)
+
+        assert closed.wait(timeout=5)
+        assert b"".join(chunks).decode("utf-8") == "第一块\n"
+        assert self.mux.get_stats()["registered_fds"] == 0
+        os.close(read_fd)
+
+    def test_single_thread_for_many_fds(self):
+        """测试多个描述符共用一个读取线程"""
+        pipes = [os.pipe() for _ in range(20)]
+        received = threading.Semaphore(0)
+        threads_before = threading.active_count()
+
+        for read_fd, _ in pipes:
+            self.mux.register(read_fd, lambda data: received.release())
+        for _, write_fd in pipes:
+            os.write(write_fd, b"x")
+
+        for _ in pipes:
+            assert received.acquire(timeout=5)
+        assert threading.active_count() - threads_before <= 1
+
+        for read_fd, write_fd in pipes:
+            self.mux.unregister(read_fd)
+            os.close(read_fd)
+            os.close(write_fd)
+        assert self.mux.get_stats()["registered_fds"] == 0
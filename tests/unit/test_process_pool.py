@@ -0,0 +1,95 @@
+"""
+预热进程池单元测试
+"""
+
+import os
+import time
+import pytest
+from unittest.mock import patch
+from qcli_api_service.services.process_pool import ProcessPool
+
+
+def _fake_start(self):
+    """模拟进程启动，不真正运行q命令"""
+    self.process = type("FakePopen", (), {"pid": 12345, "poll": lambda _self: None})()
+    return True
+
+
+def _wait_for_idle(pool, count, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if pool.get_stats()["idle"] >= count:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def pool(tmp_path):
+    with patch("qcli_api_service.services.session_process_manager.SessionProcess.start", _fake_start), \
+         patch("qcli_api_service.services.session_process_manager.SessionProcess.warm_up", return_value=True), \
+         patch("qcli_api_service.services.session_process_manager.SessionProcess.terminate"):
+        pool = ProcessPool(size=2, low_water=1, refill_concurrency=2, base_dir=str(tmp_path))
+        yield pool
+        pool.shutdown(timeout=0.1)
+
+
+class TestProcessPool:
+    """预热进程池测试"""
+
+    def test_disabled_pool(self, tmp_path):
+        """测试禁用的预热池"""
+        pool = ProcessPool(size=0, low_water=0, refill_concurrency=1, base_dir=str(tmp_path))
+        pool.start()
+
+        assert pool.acquire("session-1", str(tmp_path / "session-1")) is None
+        assert pool.get_stats()["enabled"] is False
+
+    def test_start_fills_pool(self, pool):
+        """测试启动后填充到目标大小"""
+        pool.start()
+
+        assert _wait_for_idle(pool, 2)
+        assert pool.get_stats()["spawned"] == 2
+
+    def test_acquire_binds_work_directory(self, pool, tmp_path):
+        """测试取出的进程绑定到会话目录"""
+        pool.start()
+        assert _wait_for_idle(pool, 2)
+
+        work_directory = tmp_path / "session-1"
+        work_directory.mkdir()
+        process = pool.acquire("session-1", str(work_directory))
+
+        assert process is not None
+        assert process.session_id == "session-1"
+        assert process.work_directory == str(work_directory)
+        assert os.path.isdir(work_directory)
+        assert pool.get_stats()["hits"] == 1
+
+    def test_acquire_miss_when_directory_not_empty(self, pool, tmp_path):
+        """测试会话目录已有文件时未命中"""
+        pool.start()
+        assert _wait_for_idle(pool, 2)
+
+        work_directory = tmp_path / "session-1"
+        work_directory.mkdir()
+        (work_directory / "existing.txt").write_text("data")
+
+        assert pool.acquire("session-1", str(work_directory)) is None
+        stats = pool.get_stats()
+        assert stats["misses"] == 1
+        assert stats["idle"] == 2
+
+    def test_refill_after_acquire(self, pool, tmp_path):
+        """测试低于低水位后后台补充"""
+        pool.start()
+        assert _wait_for_idle(pool, 2)
+
+        for i in range(2):
+            work_directory = tmp_path / f"session-{i}"
+            work_directory.mkdir()
+            assert pool.acquire(f"session-{i}", str(work_directory)) is not None
+
+        assert _wait_for_idle(pool, 2)
+        assert pool.get_stats()["spawned"] >= 3
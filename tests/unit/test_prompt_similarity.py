@@ -0,0 +1,53 @@
+"""
+问题近似重复检测单元测试
+"""
+
+from qcli_api_service.utils.prompt_similarity import (
+    PromptSimilarityIndex, jaccard, minhash, normalize_prompt, shingles
+)
+
+
+class TestPromptSimilarity:
+    """近似重复检测测试"""
+
+    def test_normalize_ignores_whitespace_punctuation_case(self):
+        """测试规范化忽略空白、标点和大小写"""
+        assert normalize_prompt("  What is  S3? ") == normalize_prompt("what is s3")
+        assert normalize_prompt("如何创建一个 S3 存储桶？") == "如何创建一个s3存储桶"
+
+    def test_signature_stable(self):
+        """测试相同集合得到相同签名，空集合没有3-gram"""
+        first = shingles("如何创建一个S3存储桶")
+        assert minhash(first) == minhash(shingles("如何创建一个 S3 存储桶！"))
+        assert shingles("？？") == frozenset()
+        assert len(shingles("s3")) == 1
+
+    def test_jaccard(self):
+        """测试Jaccard相似度"""
+        assert jaccard(frozenset([1, 2, 3]), frozenset([2, 3, 4])) == 0.5
+        assert jaccard(frozenset(), frozenset([1])) == 0.0
+
+    def test_query_finds_near_duplicates(self):
+        """测试只差标点或开头说法的问题命中，不相关的问题不命中"""
+        index = PromptSimilarityIndex()
+        index.add("bucket", "如何创建一个S3存储桶？")
+        index.add("lambda", "请解释Lambda的冷启动问题以及如何优化")
+
+        assert index.query("如何创建一个 S3 存储桶!!", 0.8) == ("bucket", 1.0)
+        key, similarity = index.query("请问，如何创建一个S3存储桶？", 0.8)
+        assert key == "bucket" and 0.8 <= similarity < 1.0
+        assert index.query("请详细解释Lambda的冷启动问题以及如何优化", 0.8)[0] == "lambda"
+        assert index.query("如何删除一个S3存储桶？", 0.8) is None
+        assert index.query("EC2实例的费用如何计算", 0.8) is None
+        assert index.query("", 0.8) is None
+
+    def test_remove(self):
+        """测试删除后不再命中"""
+        index = PromptSimilarityIndex()
+        index.add("a", "如何创建一个S3存储桶")
+        index.add("a", "如何创建一个S3存储桶")
+        assert len(index) == 1
+        index.remove("a")
+        index.remove("a")
+        assert len(index) == 0
+        assert index.query("如何创建一个S3存储桶", 0.5) is None
@@ -202,6 +202,26 @@ Welcome to Q CLI
         assert "第一行回复" in full_output
         assert "第二行回复" in full_output
     
+    @patch('tempfile.NamedTemporaryFile')
+    @patch('subprocess.Popen')
+    @patch('builtins.open', new_callable=mock_open)
+    def test_stream_chat_removes_duplicates(self, mock_file, mock_popen, mock_temp):
+        """测试流式输出与非流式清理的去重结果一致"""
+        mock_temp.return_value.__enter__.return_value.name = "/tmp/test.txt"
+        reply = ["第一行回复内容\n", "第二行回复内容\n", "第三行回复内容\n"]
+        raw_output = reply + reply + ["最后一行\n"]
+        mock_process = Mock()
+        mock_process.stdout.readline.side_effect = raw_output + [""]
+        mock_process.returncode = 0
+        mock_popen.return_value = mock_process
+        
+        results = list(self.service.stream_chat("你好"))
+        
+        # 前两块为进度提示
+        streamed = "\n".join(results[2:])
+        assert streamed == self.service._clean_output("".join(raw_output))
+        assert streamed.count("第一行回复内容") == 1
+    
     @patch('tempfile.NamedTemporaryFile')
     @patch('subprocess.Popen')
     @patch('builtins.open', new_callable=mock_open)
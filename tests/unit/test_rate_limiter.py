@@ -0,0 +1,143 @@
+"""
+请求频率限制单元测试
+"""
+
+import threading
+import pytest
+from unittest.mock import patch
+from qcli_api_service.services.rate_limiter import (
+    MemoryBackend, RateLimiter, RateLimitRule, create_backend, parse_rules
+)
+
+
+def _limiter(rules: str) -> RateLimiter:
+    return RateLimiter(enabled=True, rules=parse_rules(rules), backend=MemoryBackend(shards=4))
+
+
+class TestParseRules:
+    """限流规则解析测试"""
+
+    def test_parse_and_order(self):
+        """测试精确路径优先于前缀，较长的前缀优先"""
+        rules = parse_rules("/api/*=100/60, POST /api/v1/chat=30/60,/api/v1/sessions*=60/30")
+        assert [rule.name for rule in rules] == ["POST /api/v1/chat", "/api/v1/sessions*", "/api/*"]
+        assert rules[0] == RateLimitRule("POST", "/api/v1/chat", 30, 60)
+        assert parse_rules("") == []
+
+    @pytest.mark.parametrize("text", ["/api/v1/chat", "/api/v1/chat=30", "api=1/1", "/a=0/60", "/a=1/0"])
+    def test_invalid(self, text):
+        """测试格式错误或次数、秒数为0时报错"""
+        with pytest.raises(ValueError):
+            parse_rules(text)
+
+
+class TestRateLimiter:
+    """令牌桶限流测试"""
+
+    def test_bucket_and_headers(self):
+        """测试用满限额后拒绝并给出Retry-After，令牌按速率补充"""
+        limiter = _limiter("POST /api/v1/chat=2/10")
+        first = limiter.check("POST", "/api/v1/chat", None, None, "1.2.3.4")
+        assert first.allowed and first.remaining == 1
+        assert first.headers() == {
+            "RateLimit-Limit": "2", "RateLimit-Remaining": "1", "RateLimit-Reset": "5", "RateLimit-Policy": "2;w=10"
+        }
+        assert limiter.check("POST", "/api/v1/chat", None, None, "1.2.3.4").remaining == 0
+
+        denied = limiter.check("POST", "/api/v1/chat", None, None, "1.2.3.4")
+        assert not denied.allowed
+        assert 1 <= denied.retry_after <= 5
+        assert denied.headers()["Retry-After"] == str(denied.retry_after)
+
+        # 其他客户端不受影响，未配置的接口和方法不限制
+        assert limiter.check("POST", "/api/v1/chat", None, None, "5.6.7.8").allowed
+        assert limiter.check("GET", "/api/v1/chat", None, None, "1.2.3.4") is None
+        assert limiter.check("POST", "/health", None, None, "1.2.3.4") is None
+
+        with patch('qcli_api_service.services.rate_limiter.time.monotonic', return_value=1e12):
+            assert limiter.check("POST", "/api/v1/chat", None, None, "1.2.3.4").allowed
+        stats = limiter.get_stats()
+        assert stats['allowed'] == 4 and stats['limited'] == 1
+        assert stats['rules'] == ["POST /api/v1/chat=2/10"]
+
+    def test_api_key_and_ip(self):
+        """测试更换API密钥不能绕过IP限制，同一个密钥换地址也不能超过密钥的限额"""
+        limiter = _limiter("/api/v1/chat=1/60")
+        assert limiter.check("POST", "/api/v1/chat", "key-a", None, "1.1.1.1").allowed
+        assert not limiter.check("POST", "/api/v1/chat", "key-b", None, "1.1.1.1").allowed
+        assert not limiter.check("POST", "/api/v1/chat", "key-a", None, "2.2.2.2").allowed
+
+    def test_denied_request_takes_no_tokens(self):
+        """测试被一个桶拒绝的请求不消耗另一个桶的令牌"""
+        limiter = _limiter("/api/v1/chat=1/60")
+        assert limiter.check("POST", "/api/v1/chat", "key-a", None, "1.1.1.1").allowed
+        # IP桶已用完：key-b的令牌不被扣除
+        assert not limiter.check("POST", "/api/v1/chat", "key-b", None, "1.1.1.1").allowed
+        assert limiter.check("POST", "/api/v1/chat", "key-b", None, "3.3.3.3").allowed
+        # 密钥桶已用完：2.2.2.2的令牌不被扣除
+        assert not limiter.check("POST", "/api/v1/chat", "key-a", None, "2.2.2.2").allowed
+        assert limiter.check("POST", "/api/v1/chat", None, None, "2.2.2.2").allowed
+
+    def test_spoofed_forwarded_for(self):
+        """测试直接连接的客户端伪造X-Forwarded-For不能换到新的桶，经过可信代理时按真实客户端计数"""
+        limiter = _limiter("/api/v1/chat=1/60")
+        with patch('qcli_api_service.utils.client_identity.config.TRUSTED_PROXIES', ""), \
+                patch('qcli_api_service.utils.client_identity.config.WORKERS', 1):
+            assert limiter.check("POST", "/api/v1/chat", None, "10.0.0.1", "1.1.1.1").allowed
+            assert not limiter.check("POST", "/api/v1/chat", None, "10.0.0.2", "1.1.1.1").allowed
+            assert not limiter.check("POST", "/api/v1/chat", None, "10.0.0.3, 127.0.0.1", "1.1.1.1").allowed
+
+        with patch('qcli_api_service.utils.client_identity.config.TRUSTED_PROXIES', "192.168.0.0/24"), \
+                patch('qcli_api_service.utils.client_identity.config.WORKERS', 1):
+            # 从右向左跳过可信代理，客户端自己在最左边添加的地址不会被采用
+            assert limiter.check("POST", "/api/v1/chat", None, "9.9.9.9, 3.3.3.3, 192.168.0.7", "192.168.0.8").allowed
+            assert not limiter.check("POST", "/api/v1/chat", None, "8.8.8.8, 3.3.3.3", "192.168.0.8").allowed
+
+        # 多worker部署时本机的路由进程可信
+        with patch('qcli_api_service.utils.client_identity.config.TRUSTED_PROXIES', ""), \
+                patch('qcli_api_service.utils.client_identity.config.WORKERS', 4):
+            assert limiter.check("POST", "/api/v1/chat", None, "4.4.4.4", "127.0.0.1").allowed
+            assert not limiter.check("POST", "/api/v1/chat", None, "6.6.6.6, 4.4.4.4", "127.0.0.1").allowed
+
+    def test_invalid_rules_from_config(self):
+        """测试配置的限流规则格式错误时创建限流器报错"""
+        with patch('qcli_api_service.services.rate_limiter.config.RATE_LIMIT_RULES', "/api/v1/chat=30"):
+            with pytest.raises(ValueError, match="限流规则格式错误"):
+                RateLimiter(enabled=True)
+
+    def test_disabled(self):
+        """测试未开启时不检查"""
+        limiter = RateLimiter(enabled=False, rules=parse_rules("/api/v1/chat=1/60"), backend=MemoryBackend())
+        assert limiter.check("POST", "/api/v1/chat", None, None, "1.1.1.1") is None
+        assert limiter.get_stats() == {"enabled": False, "rules": ["/api/v1/chat=1/60"]}
+
+    def test_concurrent_consume(self):
+        """测试多线程同时请求时放行的数量不超过容量"""
+        backend = MemoryBackend(shards=4)
+        results = []
+
+        def run():
+            for _ in range(50):
+                results.append(backend.consume("client", 100, 0.001)[0])
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        assert results.count(True) == 100
+
+    def test_cleanup(self):
+        """测试清理已补满的桶"""
+        backend = MemoryBackend(shards=2)
+        backend.consume("a", 10, 1.0)
+        backend.consume("b", 10, 1.0)
+        assert backend.cleanup() == 0
+        with patch('qcli_api_service.services.rate_limiter.time.monotonic', return_value=1e12):
+            assert backend.cleanup() == 2
+        assert backend.size() == 0
+
+    def test_redis_backend_falls_back_without_client(self):
+        """测试未安装redis客户端时退回内存后端"""
+        with patch.dict('sys.modules', {'redis': None}):
+            assert isinstance(create_backend("redis", "redis://localhost:6379/0"), MemoryBackend)
@@ -0,0 +1,148 @@
+"""
+回复缓存单元测试
+"""
+
+import threading
+import time
+import pytest
+from unittest.mock import patch
+from qcli_api_service.services.response_cache import ResponseCache
+from qcli_api_service.services.qcli_service import QCLIService
+
+
+class TestResponseCache:
+    """回复缓存测试"""
+
+    def test_hit_after_miss(self):
+        """测试规范化后相同的消息命中缓存"""
+        cache = ResponseCache(enabled=True, ttl=60, max_entries=10, max_bytes=0, similarity=0)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return "回复"
+
+        assert cache.get_or_compute("什么是  S3？", compute) == ("回复", False)
+        assert cache.get_or_compute(" 什么是 s3？\n", compute) == ("回复", True)
+        assert len(calls) == 1
+
+        stats = cache.get_stats()
+        assert stats['hits'] == 1 and stats['misses'] == 1
+        assert stats['hit_ratio'] == 0.5
+        assert stats['bytes'] == len("回复".encode("utf-8"))
+
+    def test_force_chinese_in_key(self):
+        """测试是否强制中文影响缓存键"""
+        with patch('qcli_api_service.services.response_cache.config.FORCE_CHINESE', True):
+            chinese = ResponseCache.make_key("hello")
+        with patch('qcli_api_service.services.response_cache.config.FORCE_CHINESE', False):
+            english = ResponseCache.make_key("hello")
+        assert chinese != english
+
+    def test_disabled(self):
+        """测试关闭时每次都重新计算"""
+        cache = ResponseCache(enabled=False, ttl=60, max_entries=10, max_bytes=0)
+        assert cache.get_or_compute("a", lambda: "1") == ("1", False)
+        assert cache.get_or_compute("a", lambda: "2") == ("2", False)
+        assert cache.get_stats()['entries'] == 0
+
+    def test_ttl_expiry(self):
+        """测试条目过期后重新计算"""
+        cache = ResponseCache(enabled=True, ttl=60, max_entries=10, max_bytes=0)
+        cache.get_or_compute("a", lambda: "旧")
+
+        with patch('qcli_api_service.services.response_cache.time.time', return_value=time.time() + 61):
+            assert cache.get_or_compute("a", lambda: "新") == ("新", False)
+            cache.get_or_compute("b", lambda: "b")
+        with patch('qcli_api_service.services.response_cache.time.time', return_value=time.time() + 200):
+            assert cache.cleanup_expired() == 2
+        assert cache.get_stats()['expired'] == 3
+        assert cache.get_stats()['bytes'] == 0
+
+    def test_lru_and_byte_limit(self):
+        """测试超出条目数或字节上限时淘汰最久未使用的条目"""
+        cache = ResponseCache(enabled=True, ttl=60, max_entries=2, max_bytes=10)
+        cache.get_or_compute("a", lambda: "aaaa")
+        cache.get_or_compute("b", lambda: "bbbb")
+        cache.get_or_compute("a", lambda: "x")  # a成为最近使用
+        cache.get_or_compute("c", lambda: "cccc")
+
+        assert cache.get_or_compute("a", lambda: "x") == ("aaaa", True)
+        assert cache.get_or_compute("b", lambda: "新b") == ("新b", False)
+
+        cache.get_or_compute("big", lambda: "x" * 11)  # 超过总上限的回复不缓存
+        stats = cache.get_stats()
+        assert stats['bytes'] <= 10
+        assert stats['entries'] <= 2
+        assert stats['evictions'] >= 2
+
+    def test_singleflight(self):
+        """测试相同的并发请求只计算一次"""
+        cache = ResponseCache(enabled=True, ttl=60, max_entries=10, max_bytes=0)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "回复"
+
+        results = []
+        owner = threading.Thread(target=lambda: results.append(cache.get_or_compute("q", compute)))
+        owner.start()
+        assert started.wait(5)
+        waiters = [threading.Thread(target=lambda: results.append(cache.get_or_compute("q", compute)))
+                   for _ in range(3)]
+        for thread in waiters:
+            thread.start()
+        while cache.get_stats()['coalesced'] < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in [owner] + waiters:
+            thread.join(5)
+
+        assert len(calls) == 1
+        assert sorted(results) == [("回复", False)] + [("回复", True)] * 3
+
+    def test_near_duplicate_hit(self):
+        """测试设置相似度阈值后近似重复的问题命中，淘汰的条目不再命中"""
+        cache = ResponseCache(enabled=True, ttl=60, max_entries=1, max_bytes=0, similarity=0.8)
+        cache.get_or_compute("如何创建一个S3存储桶？", lambda: "创建方法")
+
+        assert cache.get_or_compute("请问，如何创建一个S3存储桶", lambda: "新回复") == ("创建方法", True)
+        assert cache.get_or_compute("如何删除一个S3存储桶？", lambda: "删除方法") == ("删除方法", False)
+        assert cache.get_or_compute("请问，如何创建一个S3存储桶", lambda: "新回复") == ("新回复", False)
+        assert cache.get_stats()['near_hits'] == 1
+
+        exact = ResponseCache(enabled=True, ttl=60, max_entries=10, max_bytes=0, similarity=0)
+        exact.get_or_compute("如何创建一个S3存储桶？", lambda: "创建方法")
+        assert exact.get_or_compute("请问，如何创建一个S3存储桶", lambda: "新回复") == ("新回复", False)
+
+    def test_errors_not_cached(self):
+        """测试失败时等待的请求收到同一个异常，且不缓存"""
+        cache = ResponseCache(enabled=True, ttl=60, max_entries=10, max_bytes=0)
+
+        def fail():
+            raise RuntimeError("Q CLI执行失败")
+
+        with pytest.raises(RuntimeError):
+            cache.get_or_compute("a", fail)
+        assert cache.get_or_compute("a", lambda: "成功") == ("成功", False)
+
+
+class TestQCLIServiceCache:
+    """QCLIService 使用回复缓存的测试"""
+
+    def test_stateless_chat_uses_cache(self):
+        """测试无状态调用命中缓存，带上下文的调用不经过缓存"""
+        service = QCLIService()
+        cache = ResponseCache(enabled=True, ttl=60, max_entries=10, max_bytes=0)
+        with patch('qcli_api_service.services.qcli_service.response_cache', cache), \
+                patch.object(service, '_run_chat', return_value="回复") as run_chat:
+            assert service.chat_with_cache_status("你好") == ("回复", False)
+            assert service.chat_with_cache_status("你好") == ("回复", True)
+            assert service.chat("你好") == "回复"
+            assert service.chat_with_cache_status("你好", context="用户: 早") == ("回复", False)
+        assert run_chat.call_count == 2
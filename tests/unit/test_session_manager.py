@@ -2,9 +2,13 @@
 会话管理器单元测试
 """
 
+import os
+import threading
 import time
 import pytest
+from unittest.mock import MagicMock, patch
 from qcli_api_service.services.session_manager import SessionManager
+from qcli_api_service.services.session_process_manager import session_process_manager
 from qcli_api_service.models.core import Message
 
 
@@ -191,4 +195,48 @@ class TestSessionManager:
     def test_get_session_info_nonexistent(self):
         """测试获取不存在会话的信息"""
         info = self.manager.get_session_info("nonexistent-id")
-        assert info is None
\ No newline at end of file
+        assert info is None
+    
+    def test_cleanup_keeps_recently_active_sessions(self):
+        """测试活跃时间更新后不会被过期索引误清理"""
+        session = self.manager.create_session()
+        
+        # 先过期，再有新的活动
+        session.last_activity = time.time() - 7200
+        self.manager.add_message(session.session_id, Message.create_user_message("新消息"))
+        
+        cleaned_count = self.manager.cleanup_expired_sessions()
+        
+        assert cleaned_count == 0
+        assert self.manager.get_session(session.session_id) is not None
+    
+    def test_directory_removed_after_process_exits(self):
+        """测试进程退出较慢时，工作目录在进程终止后才删除"""
+        session = self.manager.create_session()
+        work_dir = session.work_directory
+        assert os.path.exists(work_dir)
+        
+        quitting = threading.Event()
+        release = threading.Event()
+        seen = []
+        
+        def slow_terminate():
+            quitting.set()
+            release.wait(5)
+            seen.append(os.path.exists(work_dir))
+        
+        process = MagicMock()
+        process.terminate.side_effect = slow_terminate
+        with patch.dict(session_process_manager.processes, {session.session_id: process}):
+            assert self.manager.delete_session(session.session_id)
+            assert quitting.wait(5)
+            # 进程仍在退出，目录保留
+            assert os.path.exists(work_dir)
+            release.set()
+            
+            deadline = time.time() + 5
+            while os.path.exists(work_dir) and time.time() < deadline:
+                time.sleep(0.01)
+        
+        assert seen == [True]
+        assert not os.path.exists(work_dir)
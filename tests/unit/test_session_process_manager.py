@@ -0,0 +1,596 @@
+"""
+会话进程管理器单元测试
+
+使用模拟的q命令脚本验证进程交互，不依赖真实的Amazon Q CLI。
+"""
+
+import os
+import stat
+import sys
+import time
+import pytest
+from qcli_api_service.services.session_process_manager import SessionProcess, SessionProcessManager
+from qcli_api_service.services.chunk_coalescer import ChunkCoalescer
+from qcli_api_service.services.completion_detector import turn_cancellation_stats
+
+
+FAKE_Q_SCRIPT = '''#!{python}
+import sys, time
+out = sys.stdout
+out.write("\\x1b[32mWelcome to Amazon Q!\\x1b[0m\\n")
+out.write("You are chatting with claude\\n\\n!> ")
+out.flush()
+for line in sys.stdin:
+    line = line.strip()
+    if line == "/quit":
+        break
+    time.sleep(0.05)
+    out.write("回复: " + line + "\\n第二行 中文内容\\n\\n!> ")
+    out.flush()
+'''
+
+
+@pytest.fixture
+def fake_q(tmp_path, monkeypatch):
+    """在PATH中放置模拟的q命令"""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "q"
+    script.write_text(FAKE_Q_SCRIPT.format(python=sys.executable), encoding="utf-8")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    return script
+
+
+STUBBORN_Q_SCRIPT = '''#!{python}
+import signal, sys, time
+signal.signal(signal.SIGTERM, signal.SIG_IGN)
+sys.stdout.write("!> ")
+sys.stdout.flush()
+for line in sys.stdin:
+    if line.strip() == "/quit":
+        time.sleep(30)
+'''
+
+
+SLOW_STREAM_Q_SCRIPT = '''#!{python}
+import sys, time
+out = sys.stdout
+out.write("!> ")
+out.flush()
+for line in sys.stdin:
+    if line.strip() == "/quit":
+        break
+    out.write("\\n正在")
+    out.flush()
+    time.sleep(0.5)
+    out.write("生成回复\\n完成\\n\\n!> ")
+    out.flush()
+'''
+
+
+TTY_ONLY_PROMPT_Q_SCRIPT = '''#!{python}
+import sys
+tty = sys.stdout.isatty()
+def prompt():
+    # 与真实CLI一样，只在终端中显示带颜色的提示符；输出不主动flush
+    if tty:
+        sys.stdout.write("\\x1b]0;q chat\\x07\\x1b[32m!>\\x1b[0m ")
+        sys.stdout.flush()
+prompt()
+for line in sys.stdin:
+    line = line.strip()
+    if line == "/quit":
+        break
+    print("回复: " + line)
+    print("第二行 中文内容")
+    prompt()
+'''
+
+
+STDERR_ERROR_Q_SCRIPT = '''#!{python}
+import sys
+sys.stdout.write("!> ")
+sys.stdout.flush()
+for line in sys.stdin:
+    if line.strip() == "/quit":
+        break
+    sys.stdout.write("正在处理\\n")
+    sys.stdout.flush()
+    # 报错后不输出提示符，只能依靠stderr判断本轮结束
+    sys.stderr.write("ERROR ThrottlingException: Rate exceeded\\n")
+    sys.stderr.flush()
+'''
+
+
+REPEATED_REPLY_Q_SCRIPT = '''#!{python}
+import sys
+sys.stdout.write("!> ")
+sys.stdout.flush()
+reply = "第一段 介绍内容\\n第二段 详细说明\\n第三段 总结\\n"
+for line in sys.stdin:
+    if line.strip() == "/quit":
+        break
+    # 整段回复被重复输出一次
+    sys.stdout.write(reply + "\\n" + reply + "新的内容\\n\\n!> ")
+    sys.stdout.flush()
+'''
+
+
+TOKEN_STREAM_Q_SCRIPT = '''#!{python}
+import sys, time
+out = sys.stdout
+out.write("!> ")
+out.flush()
+for line in sys.stdin:
+    if line.strip() == "/quit":
+        break
+    for i in range(20):
+        out.write(f"第{{i}}行\\n")
+        out.flush()
+        time.sleep(0.01)
+    out.write("\\n!> ")
+    out.flush()
+'''
+
+
+INTERRUPTIBLE_Q_SCRIPT = '''#!{python}
+import signal, sys, time
+interrupted = False
+def on_interrupt(signum, frame):
+    global interrupted
+    interrupted = True
+signal.signal(signal.SIGINT, on_interrupt)
+out = sys.stdout
+out.write("!> ")
+out.flush()
+for line in sys.stdin:
+    if line.strip() == "/quit":
+        break
+    interrupted = False
+    if "长任务" in line:
+        # 持续输出直到收到中断
+        while not interrupted:
+            out.write("仍在生成\\n")
+            out.flush()
+            time.sleep(0.05)
+        out.write("^C\\n")
+    else:
+        out.write("回复: " + line.strip() + "\\n")
+    out.write("\\n!> ")
+    out.flush()
+'''
+
+
+@pytest.fixture
+def session_process(fake_q, tmp_path):
+    work_directory = tmp_path / "session"
+    work_directory.mkdir()
+    process = SessionProcess("test-session", str(work_directory))
+    assert process.start()
+    yield process
+    process.terminate()
+
+
+class TestSessionProcess:
+    """会话进程测试"""
+
+    def test_warm_up_consumes_banner(self, session_process):
+        """测试预热后启动横幅被丢弃"""
+        assert session_process.warm_up(timeout=5)
+        assert session_process.prompt_seen.is_set()
+        assert len(session_process.response_queue) == 0
+
+    def test_prompt_ends_turn(self, session_process):
+        """测试提示符出现后立即结束本轮，而不是等待空闲超时"""
+        session_process.warm_up(timeout=5)
+
+        start = time.time()
+        assert session_process.send_message("你好")
+        response = "\n".join(session_process.read_response())
+
+        assert "你好" in response
+        assert "第二行 中文内容" in response
+        assert time.time() - start < 5
+        assert session_process.turn_completion_reason == "prompt"
+
+    def test_multiple_turns(self, session_process):
+        """测试同一进程连续多轮对话"""
+        session_process.warm_up(timeout=5)
+
+        for message in ["第一条", "第二条"]:
+            assert session_process.send_message(message)
+            response = "\n".join(session_process.read_response())
+            assert message in response
+
+    def test_reply_after_banner_prompt_kept(self, session_process):
+        """测试未预热时，接在横幅提示符后面的回复第一行不被当作回显丢弃"""
+        assert session_process.send_message("你好")
+        response = "".join(session_process.read_response()).strip()
+
+        assert response.startswith("回复: ") and "你好" in response
+        assert response.endswith("第二行 中文内容")
+
+    def test_partial_line_streamed_within_latency_budget(self, fake_q, tmp_path):
+        """测试未换行的部分输出在延迟预算内发出，不等待整行"""
+        fake_q.write_text(SLOW_STREAM_Q_SCRIPT.format(python=sys.executable), encoding="utf-8")
+        process = SessionProcess("stream-session", str(tmp_path))
+        assert process.start()
+        try:
+            process.warm_up(timeout=5)
+            start = time.time()
+            assert process.send_message("你好")
+
+            chunks = []
+            first_chunk_at = None
+            for chunk in process.read_response():
+                first_chunk_at = first_chunk_at or time.time()
+                chunks.append(chunk)
+
+            assert first_chunk_at - start < 0.4
+            assert chunks[0] == "正在"
+            assert "".join(chunks) == "正在生成回复\n完成\n\n"
+        finally:
+            process.terminate()
+
+
+    def test_repeated_block_suppressed(self, fake_q, tmp_path):
+        """测试流式输出中重复的整段回复只保留一次"""
+        fake_q.write_text(REPEATED_REPLY_Q_SCRIPT.format(python=sys.executable), encoding="utf-8")
+        process = SessionProcess("dedup-session", str(tmp_path))
+        assert process.start()
+        try:
+            process.warm_up(timeout=5)
+            assert process.send_message("你好")
+            response = "".join(process.read_response())
+
+            assert response == "第一段 介绍内容\n第二段 详细说明\n第三段 总结\n\n新的内容\n\n"
+        finally:
+            process.terminate()
+
+    def test_read_response_coalesces_chunks(self, fake_q, tmp_path):
+        """测试按时间预算合并逐行到达的小片段"""
+        fake_q.write_text(TOKEN_STREAM_Q_SCRIPT.format(python=sys.executable), encoding="utf-8")
+        process = SessionProcess("coalesce-session", str(tmp_path))
+        assert process.start()
+        try:
+            process.warm_up(timeout=5)
+            assert process.send_message("你好")
+            coalescer = ChunkCoalescer(max_delay_ms=100, max_bytes=4096)
+            chunks = list(process.read_response(coalescer))
+
+            assert "".join(chunks) == "".join(f"第{i}行\n" for i in range(20)) + "\n"
+            assert chunks[0] == "第0行\n"
+            assert len(chunks) <= 5
+            assert coalescer.get_stats()["events_out"] == len(chunks)
+        finally:
+            process.terminate()
+
+    def test_cancel_turn_interrupts_generation(self, fake_q, tmp_path):
+        """测试取消本轮时中断生成，丢弃剩余输出，进程可继续处理下一条消息"""
+        fake_q.write_text(INTERRUPTIBLE_Q_SCRIPT.format(python=sys.executable), encoding="utf-8")
+        process = SessionProcess("cancel-session", str(tmp_path))
+        assert process.start()
+        try:
+            process.warm_up(timeout=5)
+            cancelled_before = turn_cancellation_stats.cancelled_turns
+            assert process.send_message("长任务")
+
+            # 读到部分输出后客户端断开
+            reader = process.read_response()
+            assert "仍在生成" in next(reader)
+            reader.close()
+            assert process.cancel_turn(timeout=2)
+            assert process.turn_completion_reason == "cancelled"
+            assert turn_cancellation_stats.cancelled_turns == cancelled_before + 1
+            # 本轮已结束，重复取消不生效
+            assert not process.cancel_turn(timeout=2)
+
+            assert process.send_message("第二条")
+            response = "".join(process.read_response())
+            assert "第二条" in response
+            assert "仍在生成" not in response
+        finally:
+            process.terminate()
+
+    def test_read_response_heartbeat(self, fake_q, tmp_path):
+        """测试长时间没有输出时返回心跳（空字符串）"""
+        fake_q.write_text(SLOW_STREAM_Q_SCRIPT.format(python=sys.executable), encoding="utf-8")
+        process = SessionProcess("heartbeat-session", str(tmp_path))
+        process.stream_latency_budget = 10.0  # 部分行不提前发出，制造空闲间隔
+        assert process.start()
+        try:
+            process.warm_up(timeout=5)
+            assert process.send_message("你好")
+            chunks = list(process.read_response(heartbeat=0.1))
+
+            assert chunks.count("") >= 2
+            assert "".join(chunks) == "正在生成回复\n完成\n\n"
+        finally:
+            process.terminate()
+
+    def test_pty_transport(self, fake_q, tmp_path):
+        """测试伪终端连接：行缓冲输出、识别终端提示符并过滤控制序列"""
+        fake_q.write_text(TTY_ONLY_PROMPT_Q_SCRIPT.format(python=sys.executable), encoding="utf-8")
+        process = SessionProcess("pty-session", str(tmp_path))
+        process.transport = "pty"
+        assert process.start()
+        try:
+            assert process.warm_up(timeout=5)
+            assert process.prompt_seen.is_set()
+
+            start = time.time()
+            assert process.send_message("你好")
+            response = "".join(process.read_response())
+
+            assert time.time() - start < 5
+            assert process.turn_completion_reason == "prompt"
+            assert "回复: " in response and "你好" in response
+            assert "第二行 中文内容" in response
+            assert "\x1b" not in response and "\r" not in response
+        finally:
+            process.terminate()
+        assert process._pty_master is None
+
+
+    def test_stderr_error_ends_turn(self, fake_q, tmp_path):
+        """测试对话中stderr报告限流时立即结束本轮并返回明确错误"""
+        from qcli_api_service.services.stderr_monitor import QCLIProcessError, EVENT_THROTTLED
+
+        fake_q.write_text(STDERR_ERROR_Q_SCRIPT.format(python=sys.executable), encoding="utf-8")
+        process = SessionProcess("stderr-session", str(tmp_path))
+        assert process.start()
+        try:
+            process.warm_up(timeout=5)
+            start = time.time()
+            assert process.send_message("你好")
+
+            with pytest.raises(QCLIProcessError) as exc_info:
+                list(process.read_response())
+
+            assert exc_info.value.event == EVENT_THROTTLED
+            assert time.time() - start < 5
+            assert process.stderr.snapshot()["events"][0]["type"] == EVENT_THROTTLED
+        finally:
+            process.terminate()
+
+
+class TestSessionProcessManager:
+    """会话进程管理器测试"""
+
+    def test_lru_eviction_and_respawn(self, fake_q, tmp_path):
+        """测试达到上限时驱逐最久未活跃的进程，再次访问时重建"""
+        manager = SessionProcessManager(max_processes=2)
+        directories = {}
+        for session_id in ["s1", "s2", "s3"]:
+            directories[session_id] = tmp_path / session_id
+            directories[session_id].mkdir()
+
+        try:
+            manager.get_or_create_process("s1", str(directories["s1"]))
+            manager.get_or_create_process("s2", str(directories["s2"]))
+            # 访问s1使其成为最近活跃，s2成为最久未活跃
+            manager.get_or_create_process("s1", str(directories["s1"]))
+            manager.get_or_create_process("s3", str(directories["s3"]))
+
+            assert set(manager.processes) == {"s1", "s3"}
+            assert manager.get_stats()["evictions"] == 1
+
+            process = manager.get_or_create_process("s2", str(directories["s2"]))
+            assert process.resume is True
+            assert process.work_directory == str(directories["s2"])
+
+            stats = manager.get_stats()
+            assert stats["respawns"] == 1
+            assert stats["evictions"] == 2
+            assert stats["active"] == 2
+        finally:
+            manager.shutdown_all()
+
+    def test_cold_started_process_is_warmed_up(self, fake_q, tmp_path):
+        """测试预热池未命中时冷启动的进程已输出完启动横幅，第一轮只返回回复"""
+        manager = SessionProcessManager(max_processes=10)
+        try:
+            process = manager.get_or_create_process("s1", str(tmp_path))
+            assert process.prompt_seen.is_set()
+            assert len(process.response_queue) == 0
+
+            assert process.send_message("你好")
+            reply = "".join(process.read_response()).strip()
+            assert reply.startswith("回复: ") and reply.endswith("你好\n第二行 中文内容")
+        finally:
+            manager.shutdown_all()
+
+    def test_respawned_process_replies_in_turn(self, fake_q, tmp_path):
+        """测试重建的进程等待启动输出完毕再处理消息，每一轮读到的都是本轮的回复"""
+        manager = SessionProcessManager(max_processes=1)
+        try:
+            manager.get_or_create_process("s1", str(tmp_path))
+            manager.get_or_create_process("s2", str(tmp_path))
+            assert "s1" in manager.evicted_sessions
+
+            process = manager.get_or_create_process("s1", str(tmp_path))
+            for message in ("c", "d"):
+                assert process.send_message(message)
+                reply = "".join(process.read_response()).strip()
+                assert reply.startswith("回复: ") and reply.endswith(f"{message}\n第二行 中文内容")
+                assert reply.count("回复: ") == 1
+        finally:
+            manager.shutdown_all()
+
+    def test_restore_from_history(self, tmp_path):
+        """测试对话不在任何进程中的会话创建进程时按保存的消息恢复历史，不使用 --resume"""
+        from unittest.mock import patch
+        from qcli_api_service.models.core import Message
+        from qcli_api_service.services.session_manager import session_manager
+
+        session = session_manager.create_session()
+        session_manager.add_message(session.session_id, Message.create_user_message("什么是S3？"))
+        session_manager.add_message(session.session_id, Message.create_assistant_message("对象存储服务"))
+
+        manager = SessionProcessManager(max_processes=10)
+        manager.restore_from_history(session.session_id)
+        with patch.object(SessionProcess, "start", return_value=True), \
+             patch.object(SessionProcess, "warm_up", return_value=True), \
+             patch.object(SessionProcess, "terminate"):
+            process = manager.get_or_create_process(session.session_id, str(tmp_path))
+            manager.shutdown_all(timeout=0.1)
+        session_manager.delete_session(session.session_id)
+
+        assert process.resume is False
+        assert "什么是S3？" in process.restore_context and "对象存储服务" in process.restore_context
+        assert manager.restore_sessions == set()
+        assert manager.get_stats()["respawns"] == 0
+
+    def test_busy_processes_are_not_evicted(self, fake_q, tmp_path):
+        """测试正在处理请求的进程不会被驱逐"""
+        manager = SessionProcessManager(max_processes=1)
+        try:
+            process = manager.get_or_create_process("s1", str(tmp_path))
+            process.in_turn = True
+
+            with pytest.raises(RuntimeError, match="进程数量已达上限"):
+                manager.get_or_create_process("s2", str(tmp_path))
+            process.in_turn = False
+        finally:
+            manager.shutdown_all()
+
+    def test_leased_processes_are_not_evicted(self, fake_q, tmp_path):
+        """测试已交给请求、本轮尚未开始的进程不会被驱逐，结束占用后可以驱逐"""
+        manager = SessionProcessManager(max_processes=1)
+        try:
+            process = manager.get_or_create_process("s1", str(tmp_path), lease=True)
+            assert process.leases == 1 and not process.in_turn
+
+            with pytest.raises(RuntimeError, match="进程数量已达上限"):
+                manager.get_or_create_process("s2", str(tmp_path))
+            assert manager.get_or_create_process("s1", str(tmp_path), lease=True) is process
+            assert process.leases == 2
+
+            manager.release_process(process)
+            manager.release_process(process)
+            assert process.leases == 0
+            manager.get_or_create_process("s2", str(tmp_path))
+            assert "s1" not in manager.processes
+        finally:
+            manager.shutdown_all()
+
+    def test_concurrent_creation_spawns_once(self, tmp_path):
+        """测试同一会话的并发请求只启动一个进程"""
+        import threading
+        from unittest.mock import patch
+
+        start_calls = []
+
+        def slow_start(process):
+            start_calls.append(process.session_id)
+            time.sleep(0.2)
+            process.process = type("FakePopen", (), {"pid": 1, "poll": lambda _self: None})()
+            return True
+
+        manager = SessionProcessManager(max_processes=10)
+        results = []
+        with patch.object(SessionProcess, "start", slow_start), \
+             patch.object(SessionProcess, "warm_up", return_value=True), \
+             patch.object(SessionProcess, "terminate"):
+            threads = [
+                threading.Thread(target=lambda: results.append(
+                    manager.get_or_create_process("s1", str(tmp_path))))
+                for _ in range(5)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            manager.shutdown_all(timeout=0.1)
+
+        assert len(start_calls) == 1
+        assert len({id(process) for process in results}) == 1
+
+    def test_remove_process_does_not_block(self, tmp_path):
+        """测试移除进程时终止操作在后台执行"""
+        from unittest.mock import patch
+
+        def slow_terminate(process):
+            time.sleep(0.5)
+
+        manager = SessionProcessManager(max_processes=10)
+        with patch.object(SessionProcess, "start", return_value=True), \
+             patch.object(SessionProcess, "warm_up", return_value=True), \
+             patch.object(SessionProcess, "terminate", slow_terminate):
+            manager.get_or_create_process("s1", str(tmp_path))
+
+            start = time.time()
+            future = manager.remove_process("s1")
+            assert time.time() - start < 0.2
+            assert manager.get_active_process_count() == 0
+
+            future.result(timeout=5)
+
+    def test_shutdown_all_is_parallel_and_bounded(self, fake_q, tmp_path):
+        """测试关闭所有进程时并行处理，并在总时限内强制结束不响应的进程"""
+        fake_q.write_text(STUBBORN_Q_SCRIPT.format(python=sys.executable), encoding="utf-8")
+
+        manager = SessionProcessManager(max_processes=10)
+        processes = [manager.get_or_create_process(f"s{i}", str(tmp_path)) for i in range(5)]
+        popens = [process.process for process in processes]
+
+        start = time.time()
+        stats = manager.shutdown_all(timeout=2)
+
+        assert time.time() - start < 3
+        assert stats["total"] == 5
+        assert stats["sigkill"] == 5
+        assert stats["remaining"] == 0
+        assert all(popen.poll() is not None for popen in popens)
+        assert manager.get_active_process_count() == 0
+
+    def test_shutdown_all_includes_reaping_and_pending(self, fake_q, tmp_path):
+        """测试关闭时一并终止已移交回收线程的进程，并等待正在创建的进程"""
+        import threading
+        from unittest.mock import patch
+
+        fake_q.write_text(STUBBORN_Q_SCRIPT.format(python=sys.executable), encoding="utf-8")
+
+        manager = SessionProcessManager(max_processes=10, reaper_workers=1)
+        popens = []
+        for session_id in ("s1", "s2"):
+            popens.append(manager.get_or_create_process(session_id, str(tmp_path)).process)
+            manager.remove_process(session_id)
+        assert manager.get_stats()["reaping"] == 2
+
+        # 关闭期间仍在创建的进程
+        started = threading.Event()
+        terminated = []
+        errors = []
+
+        def slow_start(process):
+            started.set()
+            time.sleep(0.3)
+            process.process = type("FakePopen", (), {"pid": 1, "poll": lambda _self: None})()
+            return True
+
+        def create():
+            try:
+                manager.get_or_create_process("s3", str(tmp_path))
+            except RuntimeError as e:
+                errors.append(e)
+
+        with patch.object(SessionProcess, "start", slow_start), \
+             patch.object(SessionProcess, "warm_up", return_value=True), \
+             patch.object(SessionProcess, "terminate", lambda process: terminated.append(process.session_id)):
+            thread = threading.Thread(target=create)
+            thread.start()
+            assert started.wait(5)
+
+            start = time.time()
+            stats = manager.shutdown_all(timeout=2)
+            thread.join(5)
+
+        assert time.time() - start < 3
+        assert stats["total"] == 2 and stats["remaining"] == 0
+        assert stats["pending"] == 1 and stats["pending_remaining"] == 0
+        assert all(popen.poll() is not None for popen in popens)
+        assert "s3" in terminated and len(errors) == 1
+        with pytest.raises(RuntimeError, match="服务正在关闭"):
+            manager.get_or_create_process("s4", str(tmp_path))
@@ -0,0 +1,33 @@
+"""
+会话路由工具单元测试
+"""
+
+import uuid
+from qcli_api_service.utils.session_routing import worker_for_session, generate_session_id
+
+
+class TestSessionRouting:
+    """会话路由测试"""
+
+    def test_single_worker(self):
+        """测试单worker时所有会话都属于worker 0"""
+        assert worker_for_session(str(uuid.uuid4()), 1) == 0
+        assert uuid.UUID(generate_session_id())
+
+    def test_generated_ids_route_to_owner(self):
+        """测试worker生成的会话ID总是哈希到自己"""
+        for index in range(4):
+            for _ in range(20):
+                session_id = generate_session_id(index, 4)
+                assert uuid.UUID(session_id).version == 4
+                assert worker_for_session(session_id, 4) == index
+
+    def test_hash_is_stable_and_spread(self):
+        """测试同一ID的映射固定，随机ID大致均匀分布"""
+        session_id = str(uuid.uuid4())
+        assert worker_for_session(session_id, 8) == worker_for_session(session_id, 8)
+
+        counts = [0] * 4
+        for _ in range(4000):
+            counts[worker_for_session(str(uuid.uuid4()), 4)] += 1
+        assert min(counts) > 800
@@ -0,0 +1,49 @@
+"""
+stderr监控单元测试
+"""
+
+from qcli_api_service.services.stderr_monitor import (
+    StderrMonitor, QCLIProcessError, classify_stderr_line,
+    EVENT_AUTH_EXPIRED, EVENT_THROTTLED
+)
+from qcli_api_service.utils.errors import handle_qcli_error, RateLimitError, ServiceError
+
+
+class TestStderrMonitor:
+    """stderr监控测试"""
+
+    def test_classify_known_failures(self):
+        """测试识别认证过期和限流信息"""
+        assert classify_stderr_line("error: Your token has expired, run q login") == EVENT_AUTH_EXPIRED
+        assert classify_stderr_line("ThrottlingException: Rate exceeded") == EVENT_THROTTLED
+        assert classify_stderr_line("DEBUG loading tools") is None
+
+    def test_ring_buffer_is_bounded(self):
+        """测试环形缓冲只保留最近的行"""
+        monitor = StderrMonitor(max_lines=3)
+        monitor.feed("".join(f"第{i}行\n" for i in range(10)).encode("utf-8"))
+
+        snapshot = monitor.snapshot()
+        assert [entry["line"] for entry in snapshot["lines"]] == ["第7行", "第8行", "第9行"]
+        assert snapshot["total_lines"] == 10
+
+    def test_lines_split_across_reads(self):
+        """测试跨读取边界的行和ANSI颜色"""
+        monitor = StderrMonitor(max_lines=10)
+
+        assert monitor.feed(b"\x1b[31mThrottling") == []
+        events = monitor.feed(b"Exception\x1b[0m\n")
+
+        assert len(events) == 1
+        assert events[0]["type"] == EVENT_THROTTLED
+        assert events[0]["line"] == "ThrottlingException"
+
+    def test_process_error_maps_to_api_error(self):
+        """测试进程错误映射为明确的API错误"""
+        throttled = handle_qcli_error(QCLIProcessError(EVENT_THROTTLED, "Rate exceeded"))
+        auth = handle_qcli_error(QCLIProcessError(EVENT_AUTH_EXPIRED, "token expired"))
+
+        assert isinstance(throttled, RateLimitError)
+        assert throttled.http_status == 429
+        assert isinstance(auth, ServiceError)
+        assert auth.code == "QCLI_AUTH_ERROR"
@@ -0,0 +1,77 @@
+"""
+进程输出流解码单元测试
+"""
+
+from qcli_api_service.services.stream_decoder import StreamDecoder
+
+
+class TestStreamDecoder:
+    """输出流解码器测试"""
+
+    def test_complete_lines(self):
+        """测试按换行拆分完整行"""
+        decoder = StreamDecoder()
+
+        assert decoder.feed("第一行\n第二行\n第三".encode("utf-8")) == [("第一行", 0), ("第二行", 0)]
+        assert decoder.pending == "第三"
+
+    def test_multibyte_character_split_across_reads(self):
+        """测试中文字符的UTF-8字节被拆到两次读取中"""
+        decoder = StreamDecoder()
+        data = "中文回复\n".encode("utf-8")
+
+        assert decoder.feed(data[:4]) == []
+        assert decoder.pending == "中"
+        assert decoder.feed(data[4:]) == [("中文回复", 0)]
+
+    def test_ansi_sequence_split_across_reads(self):
+        """测试ANSI转义序列被拆到两次读取中"""
+        decoder = StreamDecoder()
+
+        assert decoder.feed(b"\x1b[3") == []
+        assert decoder.pending == ""
+        assert decoder.feed(b"2m\xe7\xbb\xbf\x1b[0m\n") == [("绿", 0)]
+
+    def test_take_partial(self):
+        """测试部分行只发出新增内容，并跳过行首空白"""
+        decoder = StreamDecoder()
+        decoder.feed("  正在".encode("utf-8"))
+
+        assert decoder.take_partial() == "正在"
+        assert decoder.take_partial() == ""
+
+        decoder.feed("生成".encode("utf-8"))
+        assert decoder.take_partial() == "生成"
+
+    def test_partial_emitted_offset(self):
+        """测试完整行携带已发出的字符数"""
+        decoder = StreamDecoder()
+        decoder.feed("正在".encode("utf-8"))
+        decoder.take_partial()
+
+        assert decoder.feed("生成\n下一行\n".encode("utf-8")) == [("正在生成", 2), ("下一行", 0)]
+
+    def test_final_flushes_tail(self):
+        """测试流结束时尾部作为最后一行"""
+        decoder = StreamDecoder()
+        decoder.feed("没有换行".encode("utf-8"))
+
+        assert decoder.feed(b"", final=True) == [("没有换行", 0)]
+        assert decoder.pending == ""
+
+    def test_terminal_mode_filters_control_sequences(self):
+        """测试终端模式过滤OSC标题、字符集切换并统一CRLF换行"""
+        decoder = StreamDecoder(terminal=True)
+
+        lines = decoder.feed(b"\x1b]0;q chat\x07\x1b(B\x1b[1m\xe5\x9b\x9e\xe5\xa4\x8d\x1b[0m\r")
+        assert lines == []
+        assert decoder.feed(b"\n") == [("回复", 0)]
+
+    def test_terminal_mode_carriage_return_redraw(self):
+        """测试终端模式下回车重绘只保留最后一次绘制的内容"""
+        decoder = StreamDecoder(terminal=True)
+        decoder.feed("⠋ Thinking...\r\x1b[2K".encode("utf-8"))
+
+        assert decoder.partial_available() is False
+        assert decoder.visible_pending() == ""
+        assert decoder.feed("回复内容\r\n".encode("utf-8")) == [("回复内容", 0)]
@@ -0,0 +1,100 @@
+"""
+流式回复重放缓冲单元测试
+"""
+
+import threading
+import time
+from qcli_api_service.services.stream_replay import StreamReplayBuffer
+
+
+class TestStreamReplayBuffer:
+    """重放缓冲测试"""
+
+    def test_ids_monotonic_across_turns(self):
+        """测试事件ID在同一会话的多轮之间连续递增"""
+        buffer = StreamReplayBuffer(max_turns=2, max_events=100)
+        first = buffer.start_turn("s1")
+        assert [first.append({"n": i}) for i in range(3)] == [1, 2, 3]
+        first.finish()
+
+        second = buffer.start_turn("s1")
+        assert second.append({"n": 3}) == 4
+        assert buffer.start_turn("s2").append({}) == 1
+
+    def test_resume_after_last_event_id(self):
+        """测试从Last-Event-ID之后继续读取"""
+        buffer = StreamReplayBuffer(max_turns=2, max_events=100)
+        stream = buffer.start_turn("s1")
+        for i in range(4):
+            stream.append({"n": i})
+        stream.finish()
+
+        found, after_id = buffer.find("s1", 2)
+        events, finished = found.read(after_id, timeout=0)
+        assert [event_id for event_id, _ in events] == [3, 4]
+        assert not finished
+        assert found.read(4, timeout=0) == ([], True)
+
+    def test_resume_previous_turn(self):
+        """测试恢复较早一轮；超出保留轮数后返回None"""
+        buffer = StreamReplayBuffer(max_turns=2, max_events=100)
+        turns = []
+        for _ in range(3):
+            stream = buffer.start_turn("s1")
+            stream.append({})
+            stream.append({})
+            stream.finish()
+            turns.append(stream)
+
+        assert buffer.find("s1", 3)[0] is turns[1]
+        assert buffer.find("s1", 1) is None
+        assert buffer.find("s1")[0] is turns[2]
+        assert buffer.get_stats()["expired"] == 1
+
+    def test_evicted_events_not_resumable(self):
+        """测试所需事件已被丢弃时不能恢复"""
+        buffer = StreamReplayBuffer(max_turns=1, max_events=2)
+        stream = buffer.start_turn("s1")
+        for i in range(5):
+            stream.append({"n": i})
+
+        assert buffer.find("s1", 1) is None
+        assert buffer.find("s1", 3) is not None
+
+    def test_read_waits_for_new_events(self):
+        """测试订阅者等待正在生成的新事件"""
+        buffer = StreamReplayBuffer(max_turns=1, max_events=100)
+        stream = buffer.start_turn("s1")
+
+        def produce():
+            time.sleep(0.05)
+            stream.append({"message": "块"})
+
+        thread = threading.Thread(target=produce)
+        thread.start()
+        events, finished = stream.read(0, timeout=2)
+        thread.join()
+
+        assert events == [(1, {"message": "块"})]
+        assert not finished
+        assert stream.read(1, timeout=0.01) == ([], False)
+
+    def test_abandoned(self):
+        """测试没有订阅者超过等待时间后判定为已放弃"""
+        buffer = StreamReplayBuffer(max_turns=1, max_events=100)
+        stream = buffer.start_turn("s1")
+        stream.attach()
+        assert not stream.abandoned(0)
+
+        stream.detach()
+        assert stream.abandoned(0)
+        assert not stream.abandoned(60)
+
+    def test_remove_session(self):
+        """测试删除会话后不能恢复"""
+        buffer = StreamReplayBuffer(max_turns=1, max_events=100)
+        buffer.start_turn("s1").append({})
+        buffer.remove_session("s1")
+
+        assert buffer.find("s1", 0) is None
+        assert buffer.get_stats()["sessions"] == 0
@@ -0,0 +1,146 @@
+"""
+会话轮次调度器单元测试
+"""
+
+import asyncio
+import threading
+import time
+import pytest
+from qcli_api_service.services.turn_scheduler import (
+    TurnScheduler, TurnQueueFullError, TurnQueueTimeoutError
+)
+
+
+class TestTurnScheduler:
+    """轮次调度器测试"""
+
+    def test_first_turn_runs_immediately(self):
+        """测试空闲会话的请求无需排队"""
+        scheduler = TurnScheduler(max_depth=2, queue_timeout=5)
+
+        with scheduler.turn("s1") as ticket:
+            assert ticket.queue_wait < 0.01
+
+        stats = scheduler.get_stats()
+        assert stats["turns"] == 1
+        assert stats["active_sessions"] == 0
+
+    def test_turns_run_in_fifo_order(self):
+        """测试同一会话的请求按到达顺序依次执行，互不交错"""
+        scheduler = TurnScheduler(max_depth=5, queue_timeout=5)
+        events = []
+
+        def worker(index):
+            with scheduler.turn("s1"):
+                events.append(("start", index))
+                time.sleep(0.02)
+                events.append(("end", index))
+
+        first = scheduler.acquire("s1")
+        threads = []
+        for index in range(3):
+            thread = threading.Thread(target=worker, args=(index,))
+            thread.start()
+            threads.append(thread)
+            # 保证到达顺序
+            while scheduler.get_queue_length("s1") < index + 1:
+                time.sleep(0.001)
+        scheduler.release(first)
+        for thread in threads:
+            thread.join()
+
+        assert events == [(kind, index) for index in range(3) for kind in ("start", "end")]
+
+    def test_sessions_do_not_block_each_other(self):
+        """测试不同会话互不影响"""
+        scheduler = TurnScheduler(max_depth=0, queue_timeout=5)
+
+        first = scheduler.acquire("s1")
+        second = scheduler.acquire("s2")
+        scheduler.release(first)
+        scheduler.release(second)
+
+        assert scheduler.get_stats()["turns"] == 2
+
+    def test_queue_full_rejected(self):
+        """测试排队深度超过上限时立即拒绝"""
+        scheduler = TurnScheduler(max_depth=1, queue_timeout=5)
+        active = scheduler.acquire("s1")
+        waiter = threading.Thread(target=lambda: scheduler.release(scheduler.acquire("s1")))
+        waiter.start()
+        while scheduler.get_queue_length("s1") < 1:
+            time.sleep(0.001)
+
+        with pytest.raises(TurnQueueFullError) as exc_info:
+            scheduler.acquire("s1")
+        assert exc_info.value.retry_after >= 1
+
+        scheduler.release(active)
+        waiter.join()
+        assert scheduler.get_stats()["rejected"] == 1
+
+    def test_queue_timeout(self):
+        """测试排队超时后退出队列"""
+        scheduler = TurnScheduler(max_depth=1, queue_timeout=0.1)
+        active = scheduler.acquire("s1")
+
+        with pytest.raises(TurnQueueTimeoutError):
+            scheduler.acquire("s1")
+
+        assert scheduler.get_queue_length("s1") == 0
+        scheduler.release(active)
+        assert scheduler.get_stats()["timeouts"] == 1
+
+    def test_queue_wait_reported_separately(self):
+        """测试排队时间与执行时间分开统计"""
+        scheduler = TurnScheduler(max_depth=1, queue_timeout=5)
+        active = scheduler.acquire("s1")
+        tickets = []
+        waiter = threading.Thread(target=lambda: tickets.append(scheduler.acquire("s1")))
+        waiter.start()
+
+        time.sleep(0.1)
+        scheduler.release(active)
+        waiter.join()
+        time.sleep(0.05)
+        scheduler.release(tickets[0])
+
+        timing = tickets[0].get_timing()
+        assert timing["queue_wait_ms"] >= 90
+        assert 40 <= timing["generation_ms"] < timing["queue_wait_ms"]
+
+    def test_release_is_idempotent(self):
+        """测试重复释放不影响下一轮"""
+        scheduler = TurnScheduler(max_depth=1, queue_timeout=5)
+        ticket = scheduler.acquire("s1")
+        scheduler.release(ticket)
+        scheduler.release(ticket)
+
+        next_ticket = scheduler.acquire("s1")
+        assert next_ticket.queue_wait < 0.01
+        scheduler.release(next_ticket)
+
+    def test_acquire_async_waits_without_thread(self):
+        """测试asyncio排队：前一轮释放后获得执行权，排队期间取消不占用执行权"""
+        scheduler = TurnScheduler(max_depth=2, queue_timeout=5)
+
+        async def scenario():
+            first = await scheduler.acquire_async("s1")
+            waiter = asyncio.ensure_future(scheduler.acquire_async("s1"))
+            cancelled = asyncio.ensure_future(scheduler.acquire_async("s1"))
+            await asyncio.sleep(0.05)
+            assert not waiter.done()
+
+            cancelled.cancel()
+            await asyncio.sleep(0)
+            scheduler.release(first)
+            second = await asyncio.wait_for(waiter, 1)
+            assert second.queue_wait >= 0.04
+            scheduler.release(second)
+
+            # 取消的请求已退出队列，下一轮无需排队
+            third = await scheduler.acquire_async("s1")
+            assert third.queue_wait < 0.01
+            scheduler.release(third)
+
+        asyncio.run(scenario())
@@ -85,6 +85,9 @@ class TestInputValidator:
             ({"message": ""}, "消息内容不能为空"),
             ({"message": "你好", "session_id": "invalid"}, "会话ID格式无效"),
             ({"message": "你好", "stream": "not_bool"}, "stream字段必须为布尔值"),
+            ({"message": "你好", "coalesce_ms": 5000}, "coalesce_ms必须为0到1000之间的整数"),
+            ({"message": "你好", "coalesce_bytes": "4096"}, "coalesce_bytes必须为"),
+            ({"message": "你好", "priority": "urgent"}, "priority必须为high、normal或low"),
         ]
         
         for data, expected_error in invalid_cases: